@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用药依从性日汇总
+按用户保存 {日期: {"用药ID|档案ID": {"e": 应服次数, "t": 实服次数}}} 的日汇总，
+统计 N 天依从性只需累加 N 天的汇总，与服药记录总量无关：
+- 实服次数：record_intake 时对所在日期 +1
+- 应服次数：由提醒的 times / reminder_type / interval_days / custom_schedule 推算，
+  没有启用提醒的在用药品按 frequency 中的每日次数推算；
+  已过去的日期在跨日或提醒/用药变更前"冻结"，之后修改计划不影响历史，当天按当前计划实时计算
+汇总文件位于 <data_dir>/adherence/<用户名(URL编码)>.json，首次访问时由服药日志与当前计划回填。
+"""
+
+import os
+import re
+import logging
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote
+
+from data_store import FileLock, json_cache, load_json_file, save_json_file
+
+logger = logging.getLogger(__name__)
+
+# 汇总保留天数，也是可统计的最大天数
+RETENTION_DAYS = 400
+
+_WEEKDAYS = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+_CN_NUMBERS = {'一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6}
+
+
+def parse_daily_frequency(frequency: str) -> int:
+    """从 "每日3次"、"一天两次"、"bid" 等描述中解析每日次数，无法解析时按 1 次"""
+    text = (frequency or '').strip().lower()
+    m = re.search(r'(\d+)\s*次', text) or re.search(r'([一二两三四五六])\s*次', text)
+    if m:
+        value = m.group(1)
+        return int(value) if value.isdigit() else _CN_NUMBERS[value]
+    return {'qd': 1, 'bid': 2, 'tid': 3, 'qid': 4}.get(text, 1)
+
+
+def _parse_date(value) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_interval_days(value) -> Optional[int]:
+    """间隔天数须为正整数（"3"、3.0 也可），否则返回 None"""
+    try:
+        days = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(days) if days.is_integer() and days >= 1 else None
+
+
+def interval_days(reminder: dict) -> int:
+    """间隔提醒的间隔天数；提醒按提交原样保存，缺失或无法解析时按 1 天"""
+    return parse_interval_days(reminder.get('interval_days')) or 1
+
+
+def reminder_times(reminder: dict) -> List[str]:
+    """提醒时间列表，兼容旧的单个 time 字段"""
+    return reminder.get('times') or ([reminder['time']] if reminder.get('time') else [])
+
+
+def is_scheduled_on(reminder: dict, day: date) -> bool:
+    """提醒在某天是否生效（与前端 medication.js 的提醒判定一致）"""
+    if not reminder.get('enabled', True):
+        return False
+    created = _parse_date(reminder.get('created_at'))
+    if created and day < created:
+        return False
+    kind = reminder.get('reminder_type') or 'daily'
+    if kind == 'interval':
+        return not created or (day - created).days % interval_days(reminder) == 0
+    if kind == 'custom':
+        return _WEEKDAYS[day.weekday()] in (reminder.get('custom_schedule') or [])
+    return True
+
+
+def reminder_doses_on(reminder: dict, day: date) -> int:
+    """提醒在某天应服的次数"""
+    return len(reminder_times(reminder)) if is_scheduled_on(reminder, day) else 0
+
+
+def _key(medication_id: str, record_id: str) -> str:
+    return f"{medication_id or ''}|{record_id or ''}"
+
+
+class AdherenceRollup:
+    """按用户/药品/日期维护应服与实服次数"""
+
+    def __init__(self, data_dir: str,
+                 medications: Callable[[str], List[dict]],
+                 reminders: Callable[[str], List[dict]],
+                 intakes: Callable[[str, str], List[dict]]):
+        self.root = os.path.join(data_dir, 'adherence')
+        os.makedirs(self.root, exist_ok=True)
+        self._medications = medications
+        self._reminders = reminders
+        self._intakes = intakes  # (用户名, 起始日期) -> 服药记录
+        self._locks: Dict[str, FileLock] = {}
+
+    def _path(self, username: str) -> str:
+        return os.path.join(self.root, f"{quote(username, safe='')}.json")
+
+    def _lock(self, username: str) -> FileLock:
+        lock = self._locks.get(username)
+        if lock is None:
+            lock = self._locks.setdefault(username, FileLock(self._path(username)))
+        return lock
+
+    # ---------- 计划 ----------
+    def _expected_on(self, username: str, day: date, plan=None, until: Optional[str] = None) -> Dict[str, int]:
+        """按当前用药/提醒计划计算某天各药品的应服次数；until 为 "HH:MM" 时只计该时刻前的提醒"""
+        medications, reminders = plan or (self._medications(username), self._reminders(username))
+        by_medication: Dict[str, List[dict]] = {}
+        for reminder in reminders:
+            by_medication.setdefault(reminder.get('medication_id'), []).append(reminder)
+        expected = {}
+        for med in medications:
+            if med.get('status', 'active') != 'active':
+                continue
+            start, end = _parse_date(med.get('start_date')), _parse_date(med.get('end_date'))
+            if (start and day < start) or (end and day > end):
+                continue
+            med_reminders = [r for r in by_medication.get(med.get('id'), []) if r.get('enabled', True)]
+            if med_reminders:
+                count = 0
+                for reminder in med_reminders:
+                    if until is not None:
+                        reminder = dict(reminder, time=None, times=[t for t in reminder_times(reminder) if t <= until])
+                    count += reminder_doses_on(reminder, day)
+            else:
+                count = parse_daily_frequency(med.get('frequency'))
+            if count:
+                key = _key(med.get('id'), med.get('record_id'))
+                expected[key] = expected.get(key, 0) + count
+        return expected
+
+    # ---------- 汇总文件 ----------
+    def _load(self, username: str, today: date) -> dict:
+        """读取（必要时回填）汇总，并把截至昨天的应服次数冻结；调用方需持有用户锁"""
+        path = self._path(username)
+        if os.path.exists(path):
+            data = load_json_file(path, mutable=True)
+        else:
+            data = self._backfill(username, today)
+        through = _parse_date(data.get('materialized_through')) or (today - timedelta(days=1))
+        yesterday = today - timedelta(days=1)
+        if through < yesterday:
+            plan = (self._medications(username), self._reminders(username))
+            day = max(through + timedelta(days=1), today - timedelta(days=RETENTION_DAYS))
+            while day <= yesterday:
+                self._freeze_day(data, day, self._expected_on(username, day, plan))
+                day += timedelta(days=1)
+            data['materialized_through'] = yesterday.isoformat()
+            cutoff = (today - timedelta(days=RETENTION_DAYS)).isoformat()
+            data['days'] = {d: cells for d, cells in data['days'].items() if d >= cutoff}
+            data['dirty'] = True
+        return data
+
+    @staticmethod
+    def _freeze_day(data: dict, day: date, expected: Dict[str, int]) -> None:
+        cells = data['days'].get(day.isoformat()) or {}
+        for key, count in expected.items():
+            cells.setdefault(key, {'e': 0, 't': 0})['e'] = count
+        if cells:
+            data['days'][day.isoformat()] = cells
+
+    def _backfill(self, username: str, today: date) -> dict:
+        """首次访问：实服次数取自服药日志，历史应服次数按当前计划推算"""
+        first = today - timedelta(days=RETENTION_DAYS)
+        data = {'materialized_through': (first - timedelta(days=1)).isoformat(), 'days': {}, 'dirty': True}
+        for record in self._intakes(username, first.isoformat()):
+            self._add_taken(data, record)
+        logger.info(f"依从性汇总已回填: {username}")
+        return data
+
+    @staticmethod
+    def _add_taken(data: dict, record: dict) -> None:
+        day = _parse_date(record.get('taken_at'))
+        if day is None:
+            return
+        cells = data['days'].setdefault(day.isoformat(), {})
+        cell = cells.setdefault(_key(record.get('medication_id'), record.get('record_id')), {'e': 0, 't': 0})
+        cell['t'] += 1
+
+    def _save(self, username: str, data: dict) -> None:
+        data.pop('dirty', None)
+        save_json_file(self._path(username), data)
+
+    # ---------- 增量更新 ----------
+    def record_intake(self, username: str, record: dict) -> None:
+        self.record_intakes(username, [record])
+
+    def record_intakes(self, username: str, records: List[dict]) -> None:
+        """批量记服药：一次读写汇总文件"""
+        if not records:
+            return
+        with self._lock(username):
+            data = self._load(username, date.today())
+            for record in records:
+                self._add_taken(data, record)
+            self._save(username, data)
+
+    def freeze(self, username: str) -> None:
+        """用药/提醒计划变更前调用：以旧计划冻结截至昨天的应服次数"""
+        with self._lock(username):
+            data = self._load(username, date.today())
+            if data.get('dirty'):
+                self._save(username, data)
+
+    def backfill_medication(self, username: str, medication: dict) -> None:
+        self.backfill_medications(username, [medication])
+
+    def backfill_medications(self, username: str, medications: List[dict]) -> None:
+        """新增开始日期早于今天的药品：按其计划补记已冻结日期的应服次数"""
+        with self._lock(username):
+            today = date.today()
+            data = self._load(username, today)
+            through = _parse_date(data.get('materialized_through')) or (today - timedelta(days=1))
+            changed = data.get('dirty', False)
+            for medication in medications:
+                day = max(_parse_date(medication.get('start_date')) or today, today - timedelta(days=RETENTION_DAYS))
+                while day <= through:
+                    for key, count in self._expected_on(username, day, ([medication], [])).items():
+                        cells = data['days'].setdefault(day.isoformat(), {})
+                        cells.setdefault(key, {'e': 0, 't': 0})['e'] += count
+                        changed = True
+                    day += timedelta(days=1)
+            if changed:
+                self._save(username, data)
+
+    def version(self, username: str):
+        """汇总文件签名 (mtime_ns, size, inode)；尚未生成时为 None"""
+        try:
+            st = os.stat(self._path(username))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    # ---------- 统计 ----------
+    def stats(self, username: str, days: int = 7, record_id: Optional[str] = None,
+              now: Optional[datetime] = None) -> Dict:
+        """最近 days 个自然日（含今天）的应服/实服次数；今天的应服次数只计已到时间的提醒"""
+        now = now or datetime.now()
+        today = now.date()
+        days = max(1, min(int(days), RETENTION_DAYS))
+        path = self._path(username)
+        with self._lock(username):
+            if os.path.exists(path) and (_parse_date(json_cache.get(path).get('materialized_through'))
+                                         or today) >= today - timedelta(days=1):
+                data = json_cache.get(path)  # 已冻结到昨天：只读共享缓存，无需复制
+            else:
+                data = self._load(username, today)
+                if data.get('dirty'):
+                    self._save(username, data)
+
+        def matches(key: str) -> bool:
+            return record_id is None or key.split('|', 1)[1] == record_id
+
+        expected = taken = 0
+        per_day = data['days']
+        for offset in range(days):
+            cells = per_day.get((today - timedelta(days=offset)).isoformat())
+            if not cells:
+                continue
+            for key, cell in cells.items():
+                if matches(key):
+                    expected += cell['e'] if offset else 0
+                    taken += cell['t']
+        expected += sum(v for k, v in self._expected_on(username, today, until=now.strftime('%H:%M')).items()
+                        if matches(k))
+        return {
+            'total_doses_expected': expected,
+            'total_doses_taken': taken,
+            'adherence_rate': round(taken / expected * 100, 2) if expected > 0 else 0,
+            'days': days,
+            'period': {'start': (today - timedelta(days=days - 1)).isoformat(), 'end': now.isoformat()},
+        }
@@ -60,17 +60,59 @@ class MedicalAI {
         return ok;
     }
 
-    // 知识页专用AI搜索（药品/疾病提示词）
-    async knowledgeSearch(query, kind = 'auto') {
+    // 以 SSE 流式调用生成接口（?stream=1）：delta 事件的文本依次交给 onDelta，
+    // 返回 done 事件的结果（与非流式接口的响应相同）
+    async postStream(path, body, headers, onDelta) {
+        const response = await fetch(`${this.baseURL}/${path}?stream=1`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify(body)
+        });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                const dataLines = [];
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (!dataLines.length) continue;
+                const data = JSON.parse(dataLines.join('\n'));
+                if (event === 'delta') onDelta(data.text, data);
+                else if (event === 'done') result = data;
+                else if (event === 'error') throw new Error(data.message || '生成失败');
+            }
+        }
+        if (!result) throw new Error('连接中断');
+        return result;
+    }
+
+    // 知识页专用AI搜索（药品/疾病提示词）；传入 onDelta 时流式返回，逐段收到预览文本
+    async knowledgeSearch(query, kind = 'auto', onDelta = null) {
         try {
             if (await this.ensureConnected()) {
                 const sessionId = (window.getActiveSessionId && window.getActiveSessionId()) || (window.sessionId) || null;
+                const headers = {
+                    'Content-Type': 'application/json',
+                    ...(sessionId ? { 'X-Session-Id': sessionId } : {})
+                };
+                if (onDelta) {
+                    return await this.postStream('knowledge-search', { query, kind }, headers, onDelta);
+                }
                 const response = await fetch(`${this.baseURL}/knowledge-search`, {
                     method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        ...(sessionId ? { 'X-Session-Id': sessionId } : {})
-                    },
+                    headers,
                     body: JSON.stringify({ query, kind })
                 });
                 if (!response.ok) throw new Error(`HTTP ${response.status}`);
@@ -338,31 +380,38 @@ class MedicalAI {
         };
     }
 
-    // 健康咨询AI对话
-    async healthConsultation(question, conversationContext = []) {
+    // 健康咨询AI对话；传入 onDelta 时流式返回，逐段收到预览文本
+    async healthConsultation(question, conversationContext = [], onDelta = null) {
         try {
             const sessionId = (window.getActiveSessionId && window.getActiveSessionId()) || (window.sessionId) || null;
             const activeRecordId = (window.getActiveRecordId && window.getActiveRecordId()) || (window.currentUser && window.currentUser.active_record_id) || null;
             if (await this.ensureConnected()) {
                 console.log('💬 正在调用Qwen AI进行健康咨询...');
-                const response = await fetch(`${this.baseURL}/health-consultation`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        ...(sessionId ? { 'X-Session-Id': sessionId } : {})
-                    },
-                    body: JSON.stringify({
-                        question: question,
-                        context: conversationContext,
-                        active_record_id: activeRecordId
-                    })
-                });
-
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                const headers = {
+                    'Content-Type': 'application/json',
+                    ...(sessionId ? { 'X-Session-Id': sessionId } : {})
+                };
+                const body = {
+                    question: question,
+                    context: conversationContext,
+                    active_record_id: activeRecordId
+                };
+                let result;
+                if (onDelta) {
+                    result = await this.postStream('health-consultation', body, headers, onDelta);
+                } else {
+                    const response = await fetch(`${this.baseURL}/health-consultation`, {
+                        method: 'POST',
+                        headers,
+                        body: JSON.stringify(body)
+                    });
+
+                    if (!response.ok) {
+                        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                    }
+
+                    result = await response.json();
                 }
-
-                const result = await response.json();
                 
                 if (result.error) {
                     throw new Error(result.message || '咨询服务失败');
@@ -12,7 +12,10 @@ import hashlib
 import time
 import random
 import re
-from datetime import datetime, timedelta
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from flask import Flask, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 try:
@@ -22,21 +25,25 @@ except Exception:  # noqa: BLE001 - 兼容环境
     CORS = None
     _CORS_AVAILABLE = False
 
-# OpenAI 兼容：如库缺失则降级为 requests 直连 DashScope
-try:
-    from openai import OpenAI
-    _OPENAI_AVAILABLE = True
-except Exception:  # noqa: BLE001
-    OpenAI = None
-    _OPENAI_AVAILABLE = False
-import requests  # ensure requests is always available for HTTP fallback
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 import traceback
 import re
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 from flask import Response, stream_with_context
 import xml.etree.ElementTree as ET
+from data_store import create_store, json_cache, migrate_post_reactions, migrate_post_comments, COMMENT_PREVIEW_SIZE
+from llm_gateway import LLMGateway
+from llm_admission import AdmissionController
+from llm_breaker import BreakerRegistry
+from prompt_registry import PromptRegistry
+from llm_cache import create_response_cache, normalize_query
+from llm_singleflight import SingleFlight
+from image_pipeline import create_image_preprocessor
+from drug_interactions import InteractionIndex, normalize_drug_name, SEVERITY_ORDER
+from drug_dictionary import create_drug_dictionary
+from community_index import CommentPager, CommunityIndex
+from json_stream import JsonStreamParser, JsonStringStream
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -105,20 +112,24 @@ def _extract_json_payload(text: str) -> Optional[dict]:
         return None
     return None
 
+_SUMMARY_SECTIONS = ("要点", "可能诊断", "建议", "下一步建议", "需要警惕", "体格检查", "辅助检查", "初步诊断", "诊疗计划")
+_SUMMARY_LINE_PREFIX_RE = re.compile(r'^\s*(?:\d+>\s*|>\s*)')
+_HTML_MARKERS = ('<h3', '<p', '<ul', '<ol')
+
 def normalize_summary_html(raw: str) -> str:
     """将可能是纯文本/混杂符号的总结规范化为结构化HTML。"""
     if not isinstance(raw, str):
         return ''
     txt = _strip_code_fences(raw)
     # 去除行首的多余符号如 ">", "3>", 数字+> 等
-    lines = [re.sub(r'^\s*(?:\d+>\s*|>\s*)', '', ln) for ln in txt.splitlines()]
+    lines = [_SUMMARY_LINE_PREFIX_RE.sub('', ln) for ln in txt.splitlines()]
     # 合并空白
     cleaned = []
     for ln in lines:
         cleaned.append(ln.strip())
     text = "\n".join([ln for ln in cleaned if ln is not None])
     # 如已包含 <h3> 视为HTML，直接返回
-    if '<h3' in text or '<p' in text or '<ul' in text or '<ol' in text:
+    if any(marker in text for marker in _HTML_MARKERS):
         return text
     # 将关键小节转为 <h3>
     sections = []
@@ -134,7 +145,7 @@ def normalize_summary_html(raw: str) -> str:
         title = None
         current = []
     for ln in text.splitlines():
-        if ln in ("要点", "可能诊断", "建议", "下一步建议", "需要警惕", "体格检查", "辅助检查", "初步诊断", "诊疗计划"):
+        if ln in _SUMMARY_SECTIONS:
             push_section()
             title = ln
         else:
@@ -143,6 +154,119 @@ def normalize_summary_html(raw: str) -> str:
     push_section()
     return "".join(sections) or to_plain_text(text)
 
+# ---------- 流式输出的增量后处理 ----------
+# 流式接口逐段推送预览文本，按整行应用与 to_plain_text / normalize_summary_html 相同的清洗；
+# 最终以 done 事件给出与非流式接口完全相同的结果，前端以其为准
+
+class _LineStream:
+    """按整行处理增量文本：feed() 返回本段新完成行的处理结果，flush() 处理最后不完整的一行"""
+
+    def __init__(self):
+        self._pending = ''
+
+    def feed(self, delta: str) -> str:
+        *lines, self._pending = (self._pending + delta).split('\n')
+        return ''.join(self._line(line) for line in lines)
+
+    def flush(self) -> str:
+        line, self._pending = self._pending, ''
+        return self._line(line) if line else ''
+
+    def _line(self, line: str) -> str:
+        raise NotImplementedError
+
+
+class _PlainTextStream(_LineStream):
+    """to_plain_text 的增量版本：逐行去除 Markdown 标记，丢弃空行与只有符号的行"""
+
+    def __init__(self):
+        super().__init__()
+        self._started = False
+
+    def _line(self, line: str) -> str:
+        text = to_plain_text(line)
+        if not text:
+            return ''
+        text = text if not self._started else '\n' + text
+        self._started = True
+        return text
+
+
+class _SummaryHtmlStream(_LineStream):
+    """normalize_summary_html 的增量版本：首个非空行含 HTML 标签时原样输出各行，
+    否则小节标题行转为 <h3>、其余非空行转为 <p>"""
+
+    def __init__(self):
+        super().__init__()
+        self._html: Optional[bool] = None
+
+    def _line(self, line: str) -> str:
+        line = _SUMMARY_LINE_PREFIX_RE.sub('', line).strip()
+        if not line or line.strip('`').lower() in ('', 'json'):
+            return ''
+        if self._html is None:
+            self._html = any(marker in line for marker in _HTML_MARKERS)
+        if self._html:
+            return line + '\n'
+        return f"<h3>{line}</h3>" if line in _SUMMARY_SECTIONS else f"<p>{line}</p>"
+
+
+class _TextEvents:
+    """把文本增量后处理结果包装为 delta 事件"""
+
+    def __init__(self, stream: Optional[_LineStream] = None):
+        self.stream = stream or _PlainTextStream()
+
+    def feed(self, delta: str) -> list:
+        return self._events(self.stream.feed(delta))
+
+    def flush(self) -> list:
+        return self._events(self.stream.flush())
+
+    @staticmethod
+    def _events(text: str) -> list:
+        return [('delta', {"text": text})] if text else []
+
+
+class _JsonFieldEvents:
+    """模型输出 JSON 时，逐字推送指定字符串字段（经各自的增量后处理）：delta 事件 {field, text}"""
+
+    def __init__(self, fields: Dict[str, type]):
+        self.fields = fields
+        self.parser = JsonStringStream(tuple(fields))
+        self.streams: Dict[str, _LineStream] = {}
+
+    def feed(self, delta: str) -> list:
+        events = []
+        for field, text in self.parser.feed(delta):
+            stream = self.streams.setdefault(field, self.fields[field]())
+            events += self._events(field, stream.feed(text))
+        return events
+
+    def flush(self) -> list:
+        events = []
+        for field, stream in self.streams.items():
+            events += self._events(field, stream.flush())
+        return events
+
+    @staticmethod
+    def _events(field: str, text: str) -> list:
+        return [('delta', {"field": field, "text": text})] if text else []
+
+
+class _JsonItemEvents:
+    """模型输出 JSON 时，每个条目（见 JsonStreamParser）闭合即推送：event(键, 值) 返回 (事件名, 数据) 或 None"""
+
+    def __init__(self, event: Callable[[Optional[str], object], Optional[tuple]]):
+        self.event = event
+        self.parser = JsonStreamParser()
+
+    def feed(self, delta: str) -> list:
+        return [e for e in (self.event(key, value) for key, value in self.parser.feed(delta)) if e]
+
+    def flush(self) -> list:
+        return []
+
 def sanitize_emr_html(source_brief: str, html: str) -> str:
     """防止臆测：将未提供的体征/检查结果规范为占位描述。
     规则（保守处理）：
@@ -237,7 +361,7 @@ else:
 
 # 配置Qwen API
 QWEN_API_KEY = os.getenv("DASHSCOPE_API_KEY") or "sk-8e5ea74e20a54f88a4f1d2d0d82cd71c"
-QWEN_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+QWEN_BASE_URL = os.getenv("QWEN_BASE_URL") or "https://dashscope.aliyuncs.com/compatible-mode/v1"
 
 # 兼容多编码JSON解析
 def parse_json_request():
@@ -255,120 +379,161 @@ def parse_json_request():
         except Exception as e:  # 保留原异常信息
             raise e
 
-if _OPENAI_AVAILABLE:
-    client = OpenAI(
-        api_key=QWEN_API_KEY,
-        base_url=QWEN_BASE_URL,
-    )
-else:
-    client = None  # 使用 requests 降级
-
-def chat_completion(model: str, messages: list, temperature: float, max_tokens: int):
+# 大模型网关：连接池 + 整体超时预算 + 主/回退模型对冲 + 按模型自适应并发准入（LLM_ADMISSION=0 关闭）
+# + 按 (模型, 传输方式) 熔断（LLM_BREAKER=0 关闭）
+_llm_pool_size = int(os.getenv("LLM_POOL_SIZE") or 32)
+llm_gateway = LLMGateway(
+    QWEN_BASE_URL,
+    QWEN_API_KEY,
+    fallback_model="qwen-plus",
+    budget=float(os.getenv("LLM_REQUEST_BUDGET") or 90),
+    attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT") or 60),
+    hedge_delay=float(os.getenv("LLM_HEDGE_DELAY") or 10),
+    pool_size=_llm_pool_size,
+    admission=AdmissionController(
+        initial_limit=int(os.getenv("LLM_CONCURRENCY_INITIAL") or 8),
+        max_limit=int(os.getenv("LLM_CONCURRENCY_MAX") or _llm_pool_size),
+        max_queue=int(os.getenv("LLM_QUEUE_SIZE") or 64),
+    ) if (os.getenv("LLM_ADMISSION") or "1") == "1" else None,
+    breakers=BreakerRegistry(
+        enabled=(os.getenv("LLM_BREAKER") or "1") == "1",
+        window=float(os.getenv("LLM_BREAKER_WINDOW") or 60),
+        min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS") or 5),
+        error_rate=float(os.getenv("LLM_BREAKER_ERROR_RATE") or 0.5),
+        slow_call=float(os.getenv("LLM_BREAKER_SLOW_CALL") or 30),
+        open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS") or 15),
+    ),
+)
+
+# 相同提示词同时在途的调用合并为一次上游调用（LLM_SINGLE_FLIGHT=0 关闭）
+llm_single_flight = SingleFlight(enabled=(os.getenv("LLM_SINGLE_FLIGHT") or "1") == "1")
+
+# 流式接口的工作线程在此登记输出增量的接收函数 on_delta
+_streaming = threading.local()
+
+def chat_completion(model: str, messages: list, temperature: float, max_tokens: int,
+                    cache: Optional[str] = None, cache_query: Optional[str] = None, priority: str = 'normal'):
     """统一的聊天补全调用，返回 (文本内容, 实际使用模型)。
-    尝试顺序：
-    1) OpenAI SDK 调用 primary_model
-    2) HTTP requests 调用 primary_model
-    3) OpenAI SDK 调用 fallback_model (qwen-plus)
-    4) HTTP requests 调用 fallback_model
-    任一步成功即返回；全部失败则抛出异常。
+    经 llm_gateway 复用连接池；主模型超过 LLM_HEDGE_DELAY 秒未返回或失败时
+    并行请求回退模型 (qwen-plus)，先成功者返回；全部失败或超出 LLM_REQUEST_BUDGET 则抛出异常。
+    已熔断的模型直接跳过（见 llm_breaker），故障期间不必先等主模型超时。
+    cache 为接口名时启用响应缓存（仅用于同输入同输出的低温度调用）；
+    cache_query 为决定提示词的查询文本，开启 LLM_CACHE_NEAR_DUP 时按其归一化结果命中。
+    相同键（同响应缓存）的调用同时在途时只请求一次上游，其余等待并共享结果（llm_single_flight）。
+    priority 为网关准入优先级：critical（急诊评估、病历生成）先于 normal，low（翻译等后台任务）最后，
+    上游拥塞时低优先级请求快速失败。
+    在 _stream_service_call 的工作线程中调用时改为流式请求，输出增量同时转发给流式接口。
     """
+    on_delta = getattr(_streaming, 'on_delta', None)
+    if on_delta is not None:
+        # 当前线程正为流式接口执行（见 _stream_service_call）：改走流式网关，边生成边转发
+        parts, model_used = [], model
+        for delta, model_used in stream_completion(model, messages, temperature, max_tokens,
+                                                   cache=cache, cache_query=cache_query, priority=priority):
+            parts.append(delta)
+            on_delta(delta)
+        return ''.join(parts), model_used
+    key = llm_cache.make_key(cache or '', model, messages, temperature, max_tokens, query=cache_query if cache else None)
+    if cache:
+        hit = llm_cache.get(cache, key)
+        if hit is not None:
+            return hit
+
+    def call():
+        content, model_used = llm_gateway.complete(model, messages, temperature=temperature, max_tokens=max_tokens,
+                                                   priority=priority)
+        if cache:
+            llm_cache.put(cache, key, content, model_used)
+        return content, model_used
+
+    return llm_single_flight.do(key, call)
+
+def _sse_event(event: str, data) -> str:
+    """一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_completion(model: str, messages: list, temperature: float, max_tokens: int,
+                      cache: Optional[str] = None, cache_query: Optional[str] = None, priority: str = 'normal'):
+    """chat_completion 的流式版本，逐段产出 (文本增量, 实际使用模型)。
+    主模型在首个增量前失败时改用回退模型（见 LLMGateway.stream）。
+    与 chat_completion 共用响应缓存：命中时一次产出完整内容，完整输出结束后写入缓存。
+    相同键的调用同时在途时共享同一上游流：后到的请求先回放已生成的增量，再跟随新增量。
+    """
+    key = llm_cache.make_key(cache or '', model, messages, temperature, max_tokens, query=cache_query if cache else None)
+    if cache:
+        hit = llm_cache.get(cache, key)
+        if hit is not None:
+            yield hit
+            return
 
-    def _call_via_openai(model_name: str):
-        if not (_OPENAI_AVAILABLE and client is not None):
-            raise RuntimeError("openai_client_unavailable")
-        resp = client.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return resp.choices[0].message.content
-
-    def _call_via_requests(model_name: str):
-        url = f"{QWEN_BASE_URL}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {QWEN_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": model_name,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
-        if resp.status_code == 400:
-            # 兼容另一种消息格式：content 为对象数组
+    def upstream():
+        parts, model_used = [], model
+        for delta, model_used in llm_gateway.stream(model, messages, temperature=temperature, max_tokens=max_tokens,
+                                                    priority=priority):
+            parts.append(delta)
+            yield delta, model_used
+        if cache and parts:
+            llm_cache.put(cache, key, ''.join(parts), model_used)
+
+    yield from llm_single_flight.stream(key, upstream)
+
+def _wants_stream(data=None) -> bool:
+    """?stream=1（或请求体 "stream": true）时以 SSE 流式返回"""
+    return request.args.get('stream') in ('1', 'true') or (isinstance(data, dict) and data.get('stream') is True)
+
+def _stream_service_call(call: Callable[[], object], events=None) -> Response:
+    """以 SSE 流式执行生成接口：call() 在工作线程中运行，其中的 chat_completion 改走流式网关，
+    输出增量经 events（_TextEvents / _JsonFieldEvents / _JsonItemEvents）增量后处理后推送；
+    结束时推送 done（call() 的返回值，即非流式接口的响应体），异常时推送 error"""
+    events = events or _TextEvents()
+    outbox = queue.Queue()
+
+    def run():
+        _streaming.on_delta = lambda delta: outbox.put(('delta', delta))
+        try:
+            outbox.put(('done', call()))
+        except Exception as e:
+            logger.error(f"流式生成失败: {e}")
+            outbox.put(('error', {"success": False, "error": True, "message": str(e)}))
+        finally:
+            _streaming.on_delta = None
+
+    def generate():
+        threading.Thread(target=run, daemon=True).start()
+        while True:
             try:
-                alt_messages = []
-                for m in messages:
-                    c = m.get("content")
-                    if isinstance(c, list):
-                        alt_messages.append(m)
-                    else:
-                        alt_messages.append({
-                            "role": m.get("role", "user"),
-                            "content": [{"type": "text", "text": str(c)}]
-                        })
-                alt_payload = {
-                    "model": model_name,
-                    "messages": alt_messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                }
-                resp2 = requests.post(url, headers=headers, json=alt_payload, timeout=60)
-                if not resp2.ok:
-                    raise RuntimeError(f"qwen_api_{resp2.status_code}: {resp2.text[:300]}")
-                data2 = resp2.json()
-                return data2["choices"][0]["message"]["content"]
-            except Exception as e:
-                raise RuntimeError(f"qwen_api_400_alt_failed: {e} | orig: {resp.text[:300]}")
-        if not resp.ok:
-            raise RuntimeError(f"qwen_api_{resp.status_code}: {resp.text[:300]}")
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
+                kind, payload = outbox.get(timeout=15)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if kind == 'delta':
+                for event, data in events.feed(payload):
+                    yield _sse_event(event, data)
+                continue
+            for event, data in events.flush():
+                yield _sse_event(event, data)
+            yield _sse_event(kind, payload)
+            return
 
-    primary_model = model
-    fallback_model = "qwen-plus"
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-    # 尝试主模型：OpenAI → requests
-    try:
-        content = _call_via_openai(primary_model)
-        return content, primary_model
-    except Exception as e:
-        logger.warning(f"Primary via OpenAI failed for {primary_model}: {e}")
-        try:
-            content = _call_via_requests(primary_model)
-            return content, primary_model
-        except Exception as e2:
-            logger.warning(f"Primary via HTTP failed for {primary_model}: {e2}")
+def _treatment_plan_events():
+    """治疗方案流式输出：plans 数组中每个方案闭合即推送 plan 事件（已校验与格式化）"""
+    def event(key, value):
+        plan = medical_ai._validate_treatment_plan(value) if key == 'plans' else None
+        return ('plan', plan) if plan else None
+    return _JsonItemEvents(event)
 
-    # 尝试回退模型：OpenAI → requests
-    try:
-        content = _call_via_openai(fallback_model)
-        return content, fallback_model
-    except Exception as e:
-        logger.warning(f"Fallback via OpenAI failed for {fallback_model}: {e}")
-        try:
-            content = _call_via_requests(fallback_model)
-            return content, fallback_model
-        except Exception as e2:
-            logger.error(f"Fallback via HTTP failed for {fallback_model}: {e2}")
-            raise
+def _tcm_section_events():
+    """中医望诊流式输出：face / tongue / zangfu 等顶层字段闭合即推送 section 事件"""
+    return _JsonItemEvents(lambda key, value: ('section', {"name": key, "value": value}) if key else None)
 
-class MedicalAIService:
-    """医疗AI服务类"""
-    
-    def __init__(self):
-        self.model = "qwen-vl-max"  # 视觉多模态模型（用于图像相关）
-        # 文本任务专用模型（更稳定的文本对话/生成）
-        self.text_model = os.getenv("QWEN_TEXT_MODEL", "qwen-plus")
-        
-    def analyze_symptoms(self, symptoms, patient_info=None):
-        """症状分析"""
-        try:
-            # 构建医疗专业的系统提示
-            system_prompt = """你是一位专业的医疗AI助手，具有丰富的临床经验。请根据患者的症状描述，提供专业的医疗建议。
+# MedicalAIService 的系统提示词：模块加载时登记一次，调用时复用同一文本（前缀不变，上游前缀缓存可命中），
+# max_tokens 由 PROMPTS.budget() 按输入规模与期望输出选择（见 prompt_registry）
+PROMPTS = PromptRegistry()
+
+PROMPTS.register('analyze_symptoms', """你是一位专业的医疗AI助手，具有丰富的临床经验。请根据患者的症状描述，提供专业的医疗建议。
 
 你需要：
 1. 分析症状的可能原因
@@ -383,7 +548,198 @@ class MedicalAIService:
 - 药物推荐需要强调在医生指导下使用
 - 保持专业、准确、负责任的态度
 
-请用中文回复，结构化输出你的分析结果。"""
+请用中文回复，结构化输出你的分析结果。""", base=1000, per_input=0.5, cap=1500)
+
+PROMPTS.register('drug_recommendation', """你是一位专业的临床药师，请根据患者症状和病史，推荐合适的药物治疗方案。
+
+要求：
+1. 推荐常用的OTC（非处方药）药物
+2. 明确标注用法用量
+3. 列出注意事项和禁忌症
+4. 强调需要医生指导
+5. 提供药物相互作用提醒
+
+注意：
+- 仅推荐安全的常用药物
+- 对于严重症状建议就医而非自行用药
+- 特殊人群（孕妇、儿童、老人）需要特别说明
+- 强调用药安全
+
+请用中文回复，提供结构化的药物推荐。""", base=800, per_input=0.5, cap=1200)
+
+PROMPTS.register('health_consultation', """你是一位经验丰富的全科医生，为患者提供专业的健康咨询服务。
+
+你的特点：
+1. 专业知识丰富，能够准确分析健康问题
+2. 沟通亲切，耐心解答患者疑问
+3. 注重患者安全，适时建议就医
+4. 提供实用的健康建议和预防措施
+
+回复要求：
+- 语言通俗易懂，避免过多医学术语
+- 结构清晰，条理分明
+- 针对性强，解决患者具体问题
+- 适时提醒就医和用药安全
+
+请用温和、专业的语气回复患者的健康咨询。""", base=700, per_input=0.5, cap=1000)
+
+PROMPTS.register(
+    'structured_emr',
+    "你是一名专业的临床医生助手，请基于医生提供的问诊信息生成规范的结构化病历。\n\n"
+    "输出格式要求：\n"
+    "- 输出为HTML片段，包含以下一级标题（按顺序）：\n"
+    "  <h3>主诉</h3>、<h3>现病史</h3>、<h3>既往史</h3>、<h3>过敏史</h3>、\n"
+    "  <h3>体格检查</h3>、<h3>辅助检查</h3>、<h3>初步诊断</h3>、<h3>诊疗计划</h3>\n\n"
+    "内容填写规则：\n"
+    "1. **主诉**：提取最主要的症状及持续时间（如：胃痛伴恶心2天）\n"
+    "2. **现病史**：\n"
+    "   - 详细描述症状特点（部位、性质、程度、诱因、缓解因素）\n"
+    "   - 伴随症状\n"
+    "   - 相关病史（如用药史、饮食习惯等）\n"
+    "   - 充分利用医生提供的所有关键信息\n"
+    "   - 用医学术语规范描述，但保留所有重要细节\n"
+    "3. **既往史**：如医生提供相关信息则详细记录，否则填'否认特殊既往史'或'待补充'\n"
+    "4. **过敏史**：如医生提供则记录，否则填'否认药物及食物过敏史'或'待补充'\n"
+    "5. **体格检查**：如医生提供检查结果则记录，否则填'待完善体格检查'并建议需要的检查项目\n"
+    "6. **辅助检查**：如医生提供检查结果则记录，否则填'待完善'并根据症状建议需要的检查\n"
+    "7. **初步诊断**：基于症状和信息给出合理诊断（可列多个），如医生已提供诊断则优先使用\n"
+    "8. **诊疗计划**：\n"
+    "   - 一般治疗建议（如休息、饮食调整）\n"
+    "   - 可能的药物治疗方向（不写具体剂量）\n"
+    "   - 复诊建议和注意事项\n\n"
+    "重要原则：\n"
+    "- 充分利用医生输入的所有信息，不要遗漏关键细节\n"
+    "- 用规范的医学术语组织，但要完整保留医生提供的信息\n"
+    "- 信息不足时用规范用语说明需补充，不要编造\n"
+    "- 末尾添加：<small style='color:#64748b;'>本病历仅供参考，需结合临床实际情况</small>",
+    base=1200, per_input=1.2, cap=2500,
+)
+
+PROMPTS.register(
+    'structured_emr_append',
+    "你是一名专业的临床医生助手，请将新的问诊信息与现有病历合并，生成更新后的结构化病历。\n\n"
+    "输出格式要求：\n"
+    "- 输出为HTML片段，包含以下一级标题（按顺序）：\n"
+    "  <h3>主诉</h3>、<h3>现病史</h3>、<h3>既往史</h3>、<h3>过敏史</h3>、\n"
+    "  <h3>体格检查</h3>、<h3>辅助检查</h3>、<h3>初步诊断</h3>、<h3>诊疗计划</h3>\n\n"
+    "合并规则：\n"
+    "1. **主诉**：整合新旧主诉，保留核心症状，去重\n"
+    "2. **现病史**：\n"
+    "   - 保留原有病史内容\n"
+    "   - 追加新的症状变化、治疗经过等信息\n"
+    "   - 按时间顺序组织，形成连贯的病史记录\n"
+    "3. **既往史/过敏史**：如新信息中有明确提及则更新，否则保留原有\n"
+    "4. **体格检查/辅助检查**：如新信息中有新的检查结果则补充，否则保留原有\n"
+    "5. **初步诊断**：基于合并后的完整信息重新评估，可能更新诊断\n"
+    "6. **诊疗计划**：基于最新情况调整治疗方案\n\n"
+    "重要原则：\n"
+    "- 充分利用新提供的所有信息\n"
+    "- 保留原有病历的有价值内容\n"
+    "- 形成连贯、完整的病历记录\n"
+    "- 末尾添加：<small style='color:#64748b;'>本病历仅供参考，需结合临床实际情况</small>",
+    base=800, per_input=1.1, floor=1500, cap=3500,
+)
+
+PROMPTS.register(
+    'treatment_plan',
+    "你是一名临床医生助手，请基于病历内容生成多个治疗方案。"
+    "输出严格JSON格式：{'plans': [{'name': '方案名称', 'score': 85, 'reason': '推荐理由', 'html': 'HTML内容'}, ...]}。"
+    "每个方案包含：<h3>治疗目标</h3>、<h3>药物治疗</h3>（通用原则+常见方案）、<h3>非药物治疗</h3>、<h3>下一步检查</h3>、<h3>复诊与随访</h3>、<h3>预警信号</h3>。"
+    "根据病历特点给出2-4个不同治疗策略的方案，按推荐度排序。",
+    base=300, per_input=0.2, per_item=550, floor=1200, cap=2500,
+)
+
+PROMPTS.register(
+    'diagnosis_chat',
+    "你是一位有同理心的全科医生，进行病情问诊。请用安抚、可信赖的语气，专业且通俗的表达。\n"
+    "目标：通过2-5次追问获取关键要点（起病时间、伴随症状、严重程度、既往史、用药情况、危险信号等），在信息充分时给出总结。\n"
+    "请严格输出JSON，不要任何额外说明。结构：{\n"
+    "  \"status\": \"ask\"|\"final\",\n"
+    "  \"ask\": { \"question\": string },\n"
+    "  \"final\": { \"summary_html\": string, \"next_steps\": [string], \"red_flags\": [string] }\n"
+    "}。当信息不足时输出 ask；当已足够时输出 final，summary_html 用中文结构化HTML（含 <h3>要点</h3>、<h3>可能诊断</h3>、<h3>建议</h3>）。",
+    base=700, per_input=0.3, cap=1000,
+)
+
+PROMPTS.register('emergency_assessment', """你是一位急诊科医生，请快速评估患者症状的紧急程度。
+
+评估标准：
+- 紧急（立即就医）：威胁生命的症状
+- 急迫（尽快就医）：需要及时处理的症状  
+- 一般（可观察）：可以观察或居家处理的症状
+
+请简洁明确地给出评估结果和建议。""", base=400, per_input=0.5, cap=500)
+
+PROMPTS.register(
+    'tcm_vision',
+    "你是一位资深的中医专家，依据望诊（面诊与舌诊）给出结构化、专业且通俗易懂的分析与建议。回复中不要包含本提示语。\n"
+    "请基于面诊/舌诊图像输出严格的JSON（仅JSON，不要额外说明）。"
+    "字段结构：{\n"
+    "  \"face\": { \"complexion\": string, \"features\": [string], \"constitution\": string, \"analysis\": string },\n"
+    "  \"tongue\": { \"bodyColor\": string, \"bodyShape\": string, \"coatingColor\": string, \"coatingThickness\": string, \"moisture\": string, \"constitution\": string, \"analysis\": string },\n"
+    "  \"zangfu\": { \"liver\": string, \"heart\": string, \"spleen\": string, \"lung\": string, \"kidney\": string },\n"
+    "  \"syndromes\": [ { \"name\": string, \"basis\": [string] } ],\n"
+    "  \"treatment\": { \"principle\": string, \"formula\": string, \"acupoints\": [string], \"herbal\": [string] },\n"
+    "  \"lifestyle\": { \"diet\": [string], \"exercise\": [string], \"sleep\": [string], \"emotion\": [string] }\n"
+    "}。仅输出JSON，且所有字段尽量完整，不要包含提示语或说明性文字。",
+    base=1100, cap=1200,
+)
+
+PROMPTS.register('tcm_inquiry', "你是一位经验丰富的中医师，依据患者信息与症状进行辨证与建议。回复中不要包含本提示语。", base=900, per_input=0.5, cap=1200)
+
+PROMPTS.register('tcm_pulse', "你是一位精通脉诊的中医师，根据脉象特征给出分析与建议。回复中不要包含本提示语。", base=800, per_input=0.5, cap=1000)
+
+PROMPTS.register('medical_knowledge_search', """你是专业的医学文献搜索引擎。请基于医学知识库，为用户提供准确、权威的医学信息。
+
+查询要求：
+1. 提供基于最新医学证据的回答
+2. 只引用权威医学网站的链接，不要生成不存在的链接
+3. 给出临床意义和应用价值
+4. 注明证据等级和推荐强度
+
+权威医学网站链接（只使用这些网站）：
+- PubMed: https://pubmed.ncbi.nlm.nih.gov/
+- WHO: https://www.who.int/health-topics
+- CDC: https://www.cdc.gov/
+- NCCN: https://www.nccn.org/
+- 中华医学会: https://www.cma.org.cn/
+- 中国临床肿瘤学会: https://www.csco.org.cn/
+- UpToDate: https://www.uptodate.com/
+- ClinicalTrials: https://clinicaltrials.gov/
+
+请用纯文本格式回答，在引用来源时只使用上述权威网站的链接，不要生成其他链接。""", base=1600, per_input=1.0, cap=2000)
+
+PROMPTS.register('medical_guidelines_search', """你是专业的医学指南查询专家。请提供最新、最权威的医学指南和共识信息。
+
+查询要求：
+1. 优先引用国际和国内权威指南（如WHO、NCCN、CSCO等）
+2. 注明指南版本和发布时间
+3. 突出关键推荐和证据等级
+4. 提供临床决策支持信息
+5. 只引用权威医学网站的真实链接
+
+权威医学指南网站（只使用这些网站）：
+- WHO指南: https://www.who.int/health-topics
+- NCCN指南: https://www.nccn.org/
+- 中华医学会指南: https://www.cma.org.cn/
+- 中国临床肿瘤学会: https://www.csco.org.cn/
+- CDC指南: https://www.cdc.gov/
+
+请用纯文本格式回答，只在回答末尾引用上述权威网站的链接，不要生成其他链接。""", base=1200, per_input=1.0, cap=1500)
+
+class MedicalAIService:
+    """医疗AI服务类"""
+    
+    def __init__(self):
+        self.model = "qwen-vl-max"  # 视觉多模态模型（用于图像相关）
+        # 文本任务专用模型（更稳定的文本对话/生成）
+        self.text_model = os.getenv("QWEN_TEXT_MODEL", "qwen-plus")
+        
+    def analyze_symptoms(self, symptoms, patient_info=None):
+        """症状分析"""
+        try:
+            # 构建医疗专业的系统提示
+            system_prompt = PROMPTS['analyze_symptoms'].text
 
             # 构建用户消息
             user_message = f"患者症状描述：{symptoms}"
@@ -398,7 +754,7 @@ class MedicalAIService:
                     {"role": "user", "content": user_message},
                 ],
                 temperature=0.3,
-                max_tokens=1500,
+                max_tokens=PROMPTS.budget('analyze_symptoms', user_message),
             )
             ai_response = to_plain_text(ai_response)
             
@@ -417,22 +773,7 @@ class MedicalAIService:
     def drug_recommendation(self, symptoms, medical_history=None):
         """药物推荐"""
         try:
-            system_prompt = """你是一位专业的临床药师，请根据患者症状和病史，推荐合适的药物治疗方案。
-
-要求：
-1. 推荐常用的OTC（非处方药）药物
-2. 明确标注用法用量
-3. 列出注意事项和禁忌症
-4. 强调需要医生指导
-5. 提供药物相互作用提醒
-
-注意：
-- 仅推荐安全的常用药物
-- 对于严重症状建议就医而非自行用药
-- 特殊人群（孕妇、儿童、老人）需要特别说明
-- 强调用药安全
-
-请用中文回复，提供结构化的药物推荐。"""
+            system_prompt = PROMPTS['drug_recommendation'].text
 
             user_message = f"症状：{symptoms}"
             if medical_history:
@@ -445,7 +786,7 @@ class MedicalAIService:
                     {"role": "user", "content": user_message},
                 ],
                 temperature=0.2,
-                max_tokens=1200,
+                max_tokens=PROMPTS.budget('drug_recommendation', user_message),
             )
             ai_response = to_plain_text(ai_response)
             return self._parse_drug_response(ai_response)
@@ -469,21 +810,7 @@ class MedicalAIService:
     def health_consultation(self, question, context=None):
         """健康咨询对话"""
         try:
-            system_prompt = """你是一位经验丰富的全科医生，为患者提供专业的健康咨询服务。
-
-你的特点：
-1. 专业知识丰富，能够准确分析健康问题
-2. 沟通亲切，耐心解答患者疑问
-3. 注重患者安全，适时建议就医
-4. 提供实用的健康建议和预防措施
-
-回复要求：
-- 语言通俗易懂，避免过多医学术语
-- 结构清晰，条理分明
-- 针对性强，解决患者具体问题
-- 适时提醒就医和用药安全
-
-请用温和、专业的语气回复患者的健康咨询。"""
+            system_prompt = PROMPTS['health_consultation'].text
 
             messages = [
                 {"role": "system", "content": system_prompt},
@@ -500,7 +827,8 @@ class MedicalAIService:
                 model=self.text_model,
                 messages=messages,
                 temperature=0.4,
-                max_tokens=1000,
+                max_tokens=PROMPTS.budget('health_consultation', question,
+                                          *(str(m.get('content') or '') for m in context or [])),
             )
             ai_text = to_plain_text(ai_text)
 
@@ -523,35 +851,7 @@ class MedicalAIService:
         try:
             profile_text = json.dumps(patient_profile, ensure_ascii=False) if patient_profile else "{}"
 
-            system_prompt = (
-                "你是一名专业的临床医生助手，请基于医生提供的问诊信息生成规范的结构化病历。\n\n"
-                "输出格式要求：\n"
-                "- 输出为HTML片段，包含以下一级标题（按顺序）：\n"
-                "  <h3>主诉</h3>、<h3>现病史</h3>、<h3>既往史</h3>、<h3>过敏史</h3>、\n"
-                "  <h3>体格检查</h3>、<h3>辅助检查</h3>、<h3>初步诊断</h3>、<h3>诊疗计划</h3>\n\n"
-                "内容填写规则：\n"
-                "1. **主诉**：提取最主要的症状及持续时间（如：胃痛伴恶心2天）\n"
-                "2. **现病史**：\n"
-                "   - 详细描述症状特点（部位、性质、程度、诱因、缓解因素）\n"
-                "   - 伴随症状\n"
-                "   - 相关病史（如用药史、饮食习惯等）\n"
-                "   - 充分利用医生提供的所有关键信息\n"
-                "   - 用医学术语规范描述，但保留所有重要细节\n"
-                "3. **既往史**：如医生提供相关信息则详细记录，否则填'否认特殊既往史'或'待补充'\n"
-                "4. **过敏史**：如医生提供则记录，否则填'否认药物及食物过敏史'或'待补充'\n"
-                "5. **体格检查**：如医生提供检查结果则记录，否则填'待完善体格检查'并建议需要的检查项目\n"
-                "6. **辅助检查**：如医生提供检查结果则记录，否则填'待完善'并根据症状建议需要的检查\n"
-                "7. **初步诊断**：基于症状和信息给出合理诊断（可列多个），如医生已提供诊断则优先使用\n"
-                "8. **诊疗计划**：\n"
-                "   - 一般治疗建议（如休息、饮食调整）\n"
-                "   - 可能的药物治疗方向（不写具体剂量）\n"
-                "   - 复诊建议和注意事项\n\n"
-                "重要原则：\n"
-                "- 充分利用医生输入的所有信息，不要遗漏关键细节\n"
-                "- 用规范的医学术语组织，但要完整保留医生提供的信息\n"
-                "- 信息不足时用规范用语说明需补充，不要编造\n"
-                "- 末尾添加：<small style='color:#64748b;'>本病历仅供参考，需结合临床实际情况</small>"
-            )
+            system_prompt = PROMPTS['structured_emr'].text
 
             user_message = (
                 f"【患者档案信息】\n{profile_text}\n\n"
@@ -566,7 +866,8 @@ class MedicalAIService:
                     {"role": "user", "content": user_message},
                 ],
                 temperature=0.3,  # 适当提高温度，使其更好地组织信息
-                max_tokens=2000,  # 增加token限制，允许更详细的病历
+                max_tokens=PROMPTS.budget('structured_emr', user_message),  # 随输入增长，允许更详细的病历
+                priority='critical',
             )
 
             return {"success": True, "html": ai_html, "model_used": model_used}
@@ -705,28 +1006,7 @@ class MedicalAIService:
         try:
             profile_text = json.dumps(patient_profile, ensure_ascii=False) if patient_profile else "{}"
 
-            system_prompt = (
-                "你是一名专业的临床医生助手，请将新的问诊信息与现有病历合并，生成更新后的结构化病历。\n\n"
-                "输出格式要求：\n"
-                "- 输出为HTML片段，包含以下一级标题（按顺序）：\n"
-                "  <h3>主诉</h3>、<h3>现病史</h3>、<h3>既往史</h3>、<h3>过敏史</h3>、\n"
-                "  <h3>体格检查</h3>、<h3>辅助检查</h3>、<h3>初步诊断</h3>、<h3>诊疗计划</h3>\n\n"
-                "合并规则：\n"
-                "1. **主诉**：整合新旧主诉，保留核心症状，去重\n"
-                "2. **现病史**：\n"
-                "   - 保留原有病史内容\n"
-                "   - 追加新的症状变化、治疗经过等信息\n"
-                "   - 按时间顺序组织，形成连贯的病史记录\n"
-                "3. **既往史/过敏史**：如新信息中有明确提及则更新，否则保留原有\n"
-                "4. **体格检查/辅助检查**：如新信息中有新的检查结果则补充，否则保留原有\n"
-                "5. **初步诊断**：基于合并后的完整信息重新评估，可能更新诊断\n"
-                "6. **诊疗计划**：基于最新情况调整治疗方案\n\n"
-                "重要原则：\n"
-                "- 充分利用新提供的所有信息\n"
-                "- 保留原有病历的有价值内容\n"
-                "- 形成连贯、完整的病历记录\n"
-                "- 末尾添加：<small style='color:#64748b;'>本病历仅供参考，需结合临床实际情况</small>"
-            )
+            system_prompt = PROMPTS['structured_emr_append'].text
 
             user_message = (
                 f"【患者档案信息】\n{profile_text}\n\n"
@@ -742,7 +1022,8 @@ class MedicalAIService:
                     {"role": "user", "content": user_message},
                 ],
                 temperature=0.3,
-                max_tokens=2500,
+                max_tokens=PROMPTS.budget('structured_emr_append', user_message),
+                priority='critical',
             )
 
             return {"success": True, "html": ai_html, "model_used": model_used}
@@ -800,12 +1081,7 @@ class MedicalAIService:
             profile_text = json.dumps(patient_profile, ensure_ascii=False) if patient_profile else "{}"
 
             # 生成多个治疗方案的提示词
-            system_prompt = (
-                "你是一名临床医生助手，请基于病历内容生成多个治疗方案。"
-                "输出严格JSON格式：{'plans': [{'name': '方案名称', 'score': 85, 'reason': '推荐理由', 'html': 'HTML内容'}, ...]}。"
-                "每个方案包含：<h3>治疗目标</h3>、<h3>药物治疗</h3>（通用原则+常见方案）、<h3>非药物治疗</h3>、<h3>下一步检查</h3>、<h3>复诊与随访</h3>、<h3>预警信号</h3>。"
-                "根据病历特点给出2-4个不同治疗策略的方案，按推荐度排序。"
-            )
+            system_prompt = PROMPTS['treatment_plan'].text
 
             user_message = (
                 f"患者概况：{profile_text}\n"
@@ -820,7 +1096,7 @@ class MedicalAIService:
                     {"role": "user", "content": user_message},
                 ],
                 temperature=0.3,  # 稍高温度以产生多样性
-                max_tokens=2000,
+                max_tokens=PROMPTS.budget('treatment_plan', user_message, items=num_plans),
             )
 
             # 解析JSON响应
@@ -829,19 +1105,8 @@ class MedicalAIService:
                 plans_data = data.get('plans', [])
 
                 # 验证并格式化方案
-                validated_plans = []
-                for plan_data in plans_data[:num_plans]:  # 限制数量
-                    if not all(k in plan_data for k in ['name', 'score', 'reason', 'html']):
-                        continue
-
-                    plan_html = self._format_treatment_plan_html(plan_data)
-                    validated_plans.append({
-                        'name': plan_data['name'],
-                        'score': min(100, max(0, int(plan_data['score']))),  # 确保分数在0-100范围内
-                        'reason': plan_data['reason'],
-                        'html': plan_html,
-                        'confidence': min(1.0, plan_data['score'] / 100.0)
-                    })
+                validated_plans = [plan for plan in map(self._validate_treatment_plan, plans_data[:num_plans])  # 限制数量
+                                   if plan]
 
                 # 按分数排序
                 validated_plans.sort(key=lambda x: x['score'], reverse=True)
@@ -866,6 +1131,18 @@ class MedicalAIService:
             logger.error(f"治疗方案生成失败: {e}")
             return {"success": False, "message": "治疗方案生成失败，请稍后重试", "error": str(e)}
 
+    def _validate_treatment_plan(self, plan_data):
+        """校验并格式化单个方案；缺少字段时返回 None（流式接口逐个推送方案时共用）"""
+        if not isinstance(plan_data, dict) or not all(k in plan_data for k in ['name', 'score', 'reason', 'html']):
+            return None
+        return {
+            'name': plan_data['name'],
+            'score': min(100, max(0, int(plan_data['score']))),  # 确保分数在0-100范围内
+            'reason': plan_data['reason'],
+            'html': self._format_treatment_plan_html(plan_data),
+            'confidence': min(1.0, plan_data['score'] / 100.0)
+        }
+
     def _format_treatment_plan_html(self, plan_data):
         """格式化单个治疗方案的HTML"""
         html_content = plan_data.get('html', '')
@@ -1053,15 +1330,7 @@ class MedicalAIService:
         要求语气：安抚、信任感、专业但通俗。
         """
         try:
-            system_prompt = (
-                "你是一位有同理心的全科医生，进行病情问诊。请用安抚、可信赖的语气，专业且通俗的表达。\n"
-                "目标：通过2-5次追问获取关键要点（起病时间、伴随症状、严重程度、既往史、用药情况、危险信号等），在信息充分时给出总结。\n"
-                "请严格输出JSON，不要任何额外说明。结构：{\n"
-                "  \"status\": \"ask\"|\"final\",\n"
-                "  \"ask\": { \"question\": string },\n"
-                "  \"final\": { \"summary_html\": string, \"next_steps\": [string], \"red_flags\": [string] }\n"
-                "}。当信息不足时输出 ask；当已足够时输出 final，summary_html 用中文结构化HTML（含 <h3>要点</h3>、<h3>可能诊断</h3>、<h3>建议</h3>）。"
-            )
+            system_prompt = PROMPTS['diagnosis_chat'].text
 
             messages = [{"role": "system", "content": system_prompt}]
             if context:
@@ -1076,7 +1345,7 @@ class MedicalAIService:
                 model=self.text_model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=1000,
+                max_tokens=PROMPTS.budget('diagnosis_chat', *(m["content"] for m in messages[1:])),
             )
 
             # 解析严格JSON
@@ -1164,14 +1433,7 @@ class MedicalAIService:
     def emergency_assessment(self, symptoms):
         """紧急程度评估"""
         try:
-            system_prompt = """你是一位急诊科医生，请快速评估患者症状的紧急程度。
-
-评估标准：
-- 紧急（立即就医）：威胁生命的症状
-- 急迫（尽快就医）：需要及时处理的症状  
-- 一般（可观察）：可以观察或居家处理的症状
-
-请简洁明确地给出评估结果和建议。"""
+            system_prompt = PROMPTS['emergency_assessment'].text
 
             response, model_used = chat_completion(
                 model=self.model,
@@ -1180,7 +1442,8 @@ class MedicalAIService:
                     {"role": "user", "content": f"请评估以下症状的紧急程度：{symptoms}"},
                 ],
                 temperature=0.1,
-                max_tokens=500,
+                max_tokens=PROMPTS.budget('emergency_assessment', str(symptoms)),
+                priority='critical',
             )
             response = to_plain_text(response)
             
@@ -1312,7 +1575,7 @@ class MedicalAIService:
             messages = []
             
             # 构建中医专业提示词
-            system_prompt = "你是一位资深的中医专家，依据望诊（面诊与舌诊）给出结构化、专业且通俗易懂的分析与建议。回复中不要包含本提示语。"
+            system_prompt = PROMPTS['tcm_vision'].text
             
             messages.append({
                 "role": "system",
@@ -1345,20 +1608,10 @@ class MedicalAIService:
                     }
                 })
 
-            # 要求严格JSON结构化输出，避免提示语进入正文
+            # JSON 结构在系统提示词中（静态前缀可复用缓存），此处只重申输出要求
             user_content.append({
                 "type": "text",
-                "text": (
-                    "请基于以上面诊/舌诊图像输出严格的JSON（仅JSON，不要额外说明）。"
-                    "字段结构：{\n"
-                    "  \"face\": { \"complexion\": string, \"features\": [string], \"constitution\": string, \"analysis\": string },\n"
-                    "  \"tongue\": { \"bodyColor\": string, \"bodyShape\": string, \"coatingColor\": string, \"coatingThickness\": string, \"moisture\": string, \"constitution\": string, \"analysis\": string },\n"
-                    "  \"zangfu\": { \"liver\": string, \"heart\": string, \"spleen\": string, \"lung\": string, \"kidney\": string },\n"
-                    "  \"syndromes\": [ { \"name\": string, \"basis\": [string] } ],\n"
-                    "  \"treatment\": { \"principle\": string, \"formula\": string, \"acupoints\": [string], \"herbal\": [string] },\n"
-                    "  \"lifestyle\": { \"diet\": [string], \"exercise\": [string], \"sleep\": [string], \"emotion\": [string] }\n"
-                    "}。仅输出JSON，且所有字段尽量完整，不要包含提示语或说明性文字。"
-                )
+                "text": "请基于以上面诊/舌诊图像，按系统提示中的字段结构输出严格的JSON（仅JSON，不要额外说明）。"
             })
             
             messages.append({
@@ -1371,7 +1624,7 @@ class MedicalAIService:
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=1200,
+                max_tokens=PROMPTS.budget('tcm_vision'),
             )
             
             # 解析响应
@@ -1384,7 +1637,7 @@ class MedicalAIService:
     def tcm_inquiry_analyze(self, patient_info, symptoms, analysis_type='tcm_inquiry'):
         """中医问诊分析"""
         try:
-            system_prompt = "你是一位经验丰富的中医师，依据患者信息与症状进行辨证与建议。回复中不要包含本提示语。"
+            system_prompt = PROMPTS['tcm_inquiry'].text
             
             # 构建症状描述
             symptoms_text = "、".join(symptoms) if symptoms else "无特殊症状"
@@ -1410,7 +1663,7 @@ class MedicalAIService:
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=1200,
+                max_tokens=PROMPTS.budget('tcm_inquiry', user_message),
             )
             return self._parse_tcm_inquiry_response(ai_text, patient_info, symptoms)
             
@@ -1421,7 +1674,7 @@ class MedicalAIService:
     def tcm_pulse_analyze(self, pulse_characteristics, analysis_type='tcm_pulse'):
         """中医脉象分析"""
         try:
-            system_prompt = "你是一位精通脉诊的中医师，根据脉象特征给出分析与建议。回复中不要包含本提示语。"
+            system_prompt = PROMPTS['tcm_pulse'].text
             
             pulse_desc = []
             if pulse_characteristics.get('rate'):
@@ -1446,7 +1699,7 @@ class MedicalAIService:
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
-                max_tokens=1000,
+                max_tokens=PROMPTS.budget('tcm_pulse', user_message),
             )
             return self._parse_tcm_pulse_response(ai_text, pulse_characteristics)
             
@@ -1567,25 +1820,7 @@ class MedicalAIService:
         """医学文献搜索"""
         try:
             # 使用医疗AI进行医学知识查询
-            system_prompt = """你是专业的医学文献搜索引擎。请基于医学知识库，为用户提供准确、权威的医学信息。
-
-查询要求：
-1. 提供基于最新医学证据的回答
-2. 只引用权威医学网站的链接，不要生成不存在的链接
-3. 给出临床意义和应用价值
-4. 注明证据等级和推荐强度
-
-权威医学网站链接（只使用这些网站）：
-- PubMed: https://pubmed.ncbi.nlm.nih.gov/
-- WHO: https://www.who.int/health-topics
-- CDC: https://www.cdc.gov/
-- NCCN: https://www.nccn.org/
-- 中华医学会: https://www.cma.org.cn/
-- 中国临床肿瘤学会: https://www.csco.org.cn/
-- UpToDate: https://www.uptodate.com/
-- ClinicalTrials: https://clinicaltrials.gov/
-
-请用纯文本格式回答，在引用来源时只使用上述权威网站的链接，不要生成其他链接。"""
+            system_prompt = PROMPTS['medical_knowledge_search'].text
 
             user_prompt = f"请搜索医学文献，回答以下问题：{query}。请用纯文本格式回答，避免markdown表格和特殊格式。"
 
@@ -1596,7 +1831,9 @@ class MedicalAIService:
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.3,
-                max_tokens=2000
+                max_tokens=PROMPTS.budget('medical_knowledge_search', query),
+                cache='medical_knowledge_search',
+                cache_query=query,
             )
 
             # 清洗和格式化AI响应
@@ -1783,27 +2020,10 @@ class MedicalAIService:
 
             category_focus = category_prompts.get(category, category_prompts["all"])
 
-            system_prompt = f"""你是专业的医学指南查询专家。请提供最新、最权威的医学指南和共识信息。
-
-{category_focus}
-
-查询要求：
-1. 优先引用国际和国内权威指南（如WHO、NCCN、CSCO等）
-2. 注明指南版本和发布时间
-3. 突出关键推荐和证据等级
-4. 提供临床决策支持信息
-5. 只引用权威医学网站的真实链接
-
-权威医学指南网站（只使用这些网站）：
-- WHO指南: https://www.who.int/health-topics
-- NCCN指南: https://www.nccn.org/
-- 中华医学会指南: https://www.cma.org.cn/
-- 中国临床肿瘤学会: https://www.csco.org.cn/
-- CDC指南: https://www.cdc.gov/
-
-请用纯文本格式回答，只在回答末尾引用上述权威网站的链接，不要生成其他链接。"""
+            system_prompt = PROMPTS['medical_guidelines_search'].text
 
-            user_prompt = f"请查询医学指南：{query}。请用纯文本格式回答，避免markdown表格和特殊格式。"
+            # 分类重点放在用户消息中，系统提示词保持不变以复用前缀缓存
+            user_prompt = f"{category_focus}。请查询医学指南：{query}。请用纯文本格式回答，避免markdown表格和特殊格式。"
 
             ai_response, model_used = chat_completion(
                 model=self.text_model,
@@ -1812,7 +2032,9 @@ class MedicalAIService:
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.2,
-                max_tokens=1500
+                max_tokens=PROMPTS.budget('medical_guidelines_search', query),
+                cache='medical_guidelines_search',
+                cache_query=f"{category}:{query}",
             )
 
             # 清洗和格式化AI响应
@@ -2085,7 +2307,7 @@ medical_ai = MedicalAIService()
 # =============================
 # 简易数据持久化（用户/档案/会话）
 # =============================
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('DATA_DIR') or 'data')
 USERS_FILE = os.path.join(DATA_DIR, 'users.json')
 RECORDS_FILE = os.path.join(DATA_DIR, 'records.json')
 COMMUNITY_FILE = os.path.join(DATA_DIR, 'community.json')
@@ -2098,45 +2320,26 @@ SESSIONS = {}
 def ensure_data_files():
     os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(UPLOAD_DIR, exist_ok=True)
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"users": {}}, f, ensure_ascii=False, indent=2)
-    if not os.path.exists(RECORDS_FILE):
-        with open(RECORDS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"records": {}}, f, ensure_ascii=False, indent=2)
-    if not os.path.exists(COMMUNITY_FILE):
-        with open(COMMUNITY_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"posts": []}, f, ensure_ascii=False, indent=2)
-    if not os.path.exists(PRE_CONSULTATION_PUSHES_FILE):
-        with open(PRE_CONSULTATION_PUSHES_FILE, 'w', encoding='utf-8') as f:
-            json.dump({"pushes": []}, f, ensure_ascii=False, indent=2)
-
-def load_json_file(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def save_json_file(path, data):
-    tmp = path + '.tmp'
-    with open(tmp, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
-
-def _load_community():
-    return load_json_file(COMMUNITY_FILE)
-
-def _save_community(data):
-    save_json_file(COMMUNITY_FILE, data)
-
-def _find_post(posts, post_id):
-    for p in posts:
-        if p.get('id') == post_id:
-            return p
-    return None
+
+# 仓储：STORAGE_BACKEND=json（默认，data/*.json）或 sqlite（data/medical.db，首次启动自动从JSON迁移）
+ensure_data_files()
+store = create_store(DATA_DIR)
+logger.info(f"数据存储后端: {store.backend}")
+# 旧格式帖子（likes/bookmarks 为用户列表）迁移为计数 + 按用户索引
+migrate_post_reactions(store)
+migrate_post_comments(store)
+# 确定性AI调用的响应缓存（LLM_CACHE_* 环境变量配置）
+llm_cache = create_response_cache(DATA_DIR)
+# 视觉模型输入图片的预处理（EXIF 摆正、缩放、重新压缩，IMAGE_* 环境变量配置）
+image_preprocessor = create_image_preprocessor()
+# 本地药物相互作用知识库（drug_interactions.json），用药AI分析先查知识库
+interaction_index = InteractionIndex()
+# 药名词典：药名规范化为通用名与输入联想（DRUG_DICTIONARY_PATH 追加词典文件）
+drug_dictionary = create_drug_dictionary()
 
 def _get_user_role(username: str) -> str:
     try:
-        users_data = load_json_file(USERS_FILE)
-        return users_data.get('users', {}).get(username, {}).get('role', 'user')
+        return (store.get_user(username) or {}).get('role', 'user')
     except Exception:
         return 'user'
 
@@ -2166,21 +2369,13 @@ def get_username_by_session() -> str:
         return None
     return SESSIONS.get(sid)
 
-# 初始化数据文件
-ensure_data_files()
-
 def _find_user_active_record(username: str, override_record_id: str = None):
     try:
-        users_data = load_json_file(USERS_FILE)
-        records_data = load_json_file(RECORDS_FILE)
-        user_obj = users_data.get('users', {}).get(username, {})
+        user_obj = store.get_user(username) or {}
         active_id = override_record_id or user_obj.get('active_record_id')
         if not active_id:
             return None
-        for rec in records_data.get('records', {}).get(username, []):
-            if rec.get('record_id') == active_id:
-                return rec
-        return None
+        return store.get_record(username, active_id)
     except Exception:
         return None
 
@@ -2223,6 +2418,8 @@ def api_generate_treatment():
         if not emr.strip():
             return jsonify({"success": False, "message": "请先提供病历内容"}), 400
 
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.generate_treatment_plan(emr, profile), _treatment_plan_events())
         result = medical_ai.generate_treatment_plan(emr, profile)
         status = 200 if result.get('success') else 500
         return jsonify(result), status
@@ -2238,6 +2435,10 @@ def api_diagnosis_chat():
         context = data.get('context') or []
         if not user_msg:
             return jsonify({"success": False, "message": "问题不能为空"}), 400
+        if _wants_stream(data):
+            # 追问 question 与总结 summary_html 均在 JSON 字符串内，逐字推送并增量清洗
+            return _stream_service_call(lambda: medical_ai.diagnosis_chat(user_msg, context), _JsonFieldEvents(
+                {"question": _PlainTextStream, "summary_html": _SummaryHtmlStream}))
         result = medical_ai.diagnosis_chat(user_msg, context)
         status = 200 if result.get('success') else 500
         return jsonify(result), status
@@ -2247,16 +2448,13 @@ def api_diagnosis_chat():
 
 # ============== 医生端 EMR 上下文（按档案） ==============
 def _get_active_record(username: str, record_id: Optional[str] = None):
-    records_data = load_json_file(RECORDS_FILE)
-    user_records = records_data.get('records', {}).get(username, [])
     if record_id:
-        return next((r for r in user_records if r.get('record_id') == record_id), None), records_data, user_records
+        return store.get_record(username, record_id)
     # 否则用激活档案
-    users_data = load_json_file(USERS_FILE)
-    active_id = users_data.get('users', {}).get(username, {}).get('active_record_id')
+    active_id = (store.get_user(username) or {}).get('active_record_id')
     if not active_id:
-        return None, records_data, user_records
-    return next((r for r in user_records if r.get('record_id') == active_id), None), records_data, user_records
+        return None
+    return store.get_record(username, active_id)
 
 @app.route('/api/doctor/emr/context', methods=['GET', 'POST'])
 def api_doctor_emr_context():
@@ -2265,7 +2463,7 @@ def api_doctor_emr_context():
         return jsonify({"error": True, "message": "未登录"}), 401
     if request.method == 'GET':
         record_id = request.args.get('record_id')
-        rec, _all, _list = _get_active_record(username, record_id)
+        rec = _get_active_record(username, record_id)
         if not rec:
             return jsonify({"success": True, "context": None})
         ctx = rec.get('emr_context') or None
@@ -2273,22 +2471,22 @@ def api_doctor_emr_context():
     # POST 保存/合并
     data = parse_json_request() or {}
     record_id = data.get('record_id')
-    rec, records_data, user_records = _get_active_record(username, record_id)
+    rec = _get_active_record(username, record_id)
     if not rec:
         return jsonify({"error": True, "message": "未找到档案或未激活档案"}), 404
-    ctx = rec.get('emr_context') or {}
-    for k in ('brief', 'emr_html'):
-        if k in data and data.get(k) is not None:
-            ctx[k] = data.get(k)
-    ctx['updated_at'] = datetime.utcnow().isoformat()
-    rec['emr_context'] = ctx
-    # 覆盖回去
-    for i, r in enumerate(user_records):
-        if r.get('record_id') == rec.get('record_id'):
-            user_records[i] = rec
-            break
-    records_data['records'][username] = user_records
-    save_json_file(RECORDS_FILE, records_data)
+
+    def apply(r):
+        if r is None:
+            return None
+        ctx = r.get('emr_context') or {}
+        for k in ('brief', 'emr_html'):
+            if k in data and data.get(k) is not None:
+                ctx[k] = data.get(k)
+        ctx['updated_at'] = datetime.utcnow().isoformat()
+        r['emr_context'] = ctx
+        return r
+
+    store.update_record(username, rec['record_id'], apply)
     return jsonify({"success": True})
 
 @app.route('/api/doctor/emr/context/clear', methods=['POST'])
@@ -2298,16 +2496,17 @@ def api_doctor_emr_context_clear():
         return jsonify({"error": True, "message": "未登录"}), 401
     data = parse_json_request() or {}
     record_id = data.get('record_id')
-    rec, records_data, user_records = _get_active_record(username, record_id)
+    rec = _get_active_record(username, record_id)
     if not rec:
         return jsonify({"error": True, "message": "未找到档案或未激活档案"}), 404
-    rec.pop('emr_context', None)
-    for i, r in enumerate(user_records):
-        if r.get('record_id') == rec.get('record_id'):
-            user_records[i] = rec
-            break
-    records_data['records'][username] = user_records
-    save_json_file(RECORDS_FILE, records_data)
+
+    def apply(r):
+        if r is None:
+            return None
+        r.pop('emr_context', None)
+        return r
+
+    store.update_record(username, rec['record_id'], apply)
     return jsonify({"success": True})
 
 @app.route('/api/doctor/generate-emr-stream', methods=['POST'])
@@ -2334,47 +2533,19 @@ def api_generate_emr_stream():
             "请直接输出HTML，不要附加解释或Markdown。"
         )
 
-        url = f"{QWEN_BASE_URL}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {QWEN_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": medical_ai.text_model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
-            "temperature": 0.2,
-            "max_tokens": 1600,
-            "stream": True,
-        }
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message},
+        ]
 
         def generate():
+            # 经共享网关流式请求：主模型在首个增量前失败时改用回退模型
             try:
-                with requests.post(url, headers=headers, json=payload, stream=True, timeout=300) as resp:
-                    resp.raise_for_status()
-                    for raw in resp.iter_lines(decode_unicode=True):
-                        if not raw:
-                            continue
-                        if raw.startswith('data:'):
-                            chunk = raw[5:].strip()
-                            if chunk == '[DONE]':
-                                break
-                            try:
-                                obj = json.loads(chunk)
-                                # OpenAI-compatible: choices[0].delta.content
-                                delta = obj.get('choices', [{}])[0].get('delta', {}).get('content', '')
-                                if not delta and obj.get('choices', [{}])[0].get('message'):
-                                    delta = obj['choices'][0]['message'].get('content', '')
-                            except Exception:
-                                delta = ''
-                            if delta:
-                                yield delta
+                for delta, _model_used in stream_completion(medical_ai.text_model, messages,
+                                                            temperature=0.2, max_tokens=1600, priority='critical'):
+                    yield delta
             except Exception as e:
                 logger.error(f"EMR stream error: {e}")
-            finally:
-                return
 
         return Response(stream_with_context(generate()), mimetype='text/plain; charset=utf-8')
     except Exception as e:
@@ -2398,6 +2569,8 @@ def analyze_symptoms():
         if not symptoms:
             return jsonify({"error": "症状描述不能为空"}), 400
         
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.analyze_symptoms(symptoms, patient_info))
         result = medical_ai.analyze_symptoms(symptoms, patient_info)
         return jsonify(result)
         
@@ -2429,6 +2602,8 @@ def drug_recommendation():
         if not symptoms:
             return jsonify({"error": "症状描述不能为空"}), 400
         
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.drug_recommendation(symptoms, medical_history))
         result = medical_ai.drug_recommendation(symptoms, medical_history)
         return jsonify(result)
         
@@ -2461,6 +2636,8 @@ def health_consultation():
             return jsonify({"error": "问题不能为空"}), 400
         
         # 将患者档案文本拼接到问题，作为轻量上下文字段
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.health_consultation(question + active_profile_text, context))
         result = medical_ai.health_consultation(question + active_profile_text, context)
         return jsonify(result)
         
@@ -2483,6 +2660,8 @@ def emergency_assessment():
         if not symptoms:
             return jsonify({"error": "症状描述不能为空"}), 400
         
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.emergency_assessment(symptoms))
         result = medical_ai.emergency_assessment(symptoms)
         return jsonify(result)
         
@@ -2500,7 +2679,20 @@ def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "service": "医疗AI后端服务",
-        "model": medical_ai.model
+        "model": medical_ai.model,
+        "storage": {
+            "backend": store.backend,
+            "json_cache": json_cache.stats(),
+            "writes": store.write_stats() if hasattr(store, 'write_stats') else None
+        },
+        "llm": llm_gateway.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_single_flight": llm_single_flight.stats(),
+        "llm_breakers": llm_gateway.breakers.snapshot(),
+        "prompts": PROMPTS.stats(),
+        "image_preprocessor": image_preprocessor.stats(),
+        "drug_interactions": interaction_index.stats(),
+        "drug_dictionary": drug_dictionary.stats()
     })
 
 # 简易翻译接口：将英文新闻标题/摘要翻译为中文
@@ -2520,6 +2712,8 @@ def translate_text():
             ],
             temperature=0.1,
             max_tokens=400,
+            cache='translate',
+            priority='low',  # 新闻翻译为后台任务，拥塞时让位于问诊请求
         )
         return jsonify({"success": True, "translated": to_plain_text(ai_text)})
     except Exception as e:
@@ -2535,7 +2729,8 @@ def api_vision_analyze():
         note = data.get('note', '')
         if not image_data_url or not isinstance(image_data_url, str) or not image_data_url.startswith('data:image'):
             return jsonify({"success": False, "message": "请上传有效的图片"}), 400
-        result = medical_ai.vision_analyze(image_data_url, kind, note)
+        # 缩小后再交给视觉模型，减少上传体积与图像 token
+        result = medical_ai.vision_analyze(_prepare_vision_image(image_data_url), kind, note)
         return jsonify(result)
     except Exception as e:
         logger.error(f"/api/vision-analyze error: {e}\n{traceback.format_exc()}")
@@ -2551,15 +2746,19 @@ def medical_search():
             return jsonify({"error": True, "message": "查询关键词不能为空"}), 400
 
         # 使用现有的医疗AI服务进行医学知识查询
-        result = medical_ai.medical_knowledge_search(query)
+        def search():
+            result = medical_ai.medical_knowledge_search(query)
+            return {
+                "success": True,
+                "query": query,
+                "results": result.get('results', []),
+                "total": result.get('total', 0),
+                "source": "医疗AI知识库"
+            }
 
-        return jsonify({
-            "success": True,
-            "query": query,
-            "results": result.get('results', []),
-            "total": result.get('total', 0),
-            "source": "医疗AI知识库"
-        })
+        if _wants_stream():
+            return _stream_service_call(search)
+        return jsonify(search())
 
     except Exception as e:
         logger.error(f"medical search error: {e}")
@@ -2682,14 +2881,15 @@ def knowledge_search():
         if not query:
             return jsonify({"error": True, "message": "query 不能为空"}), 400
 
-        # 简单判断：含有"片/胶囊/颗粒/布洛芬/对乙酰氨基酚"等词视为药品
+        # 简单判断：含有"片/胶囊/颗粒"等剂型词或药名词典收录的药名视为药品
+        generic_name = drug_dictionary.canonical(query) or drug_dictionary.find(query)
         is_drug = False
         if kind == 'drug':
             is_drug = True
-        elif kind == 'disease':
+        elif kind in ('disease', 'wellness'):
             is_drug = False
         else:
-            is_drug = any(x in query for x in ['片', '胶囊', '颗粒', '缓释', '对乙酰氨基酚', '布洛芬', '阿莫西林', '氯雷他定'])
+            is_drug = any(x in query for x in ['片', '胶囊', '颗粒', '缓释']) or generic_name is not None
 
         if is_drug:
             system_prompt = (
@@ -2710,7 +2910,8 @@ def knowledge_search():
                 "- **注意事项**：\n"
                 "请使用准确、精炼的中文表述，并在对应条目后使用 ^^ 说明引用来源。"
             )
-        elif not is_drug and kind == 'disease':
+        elif kind != 'wellness':
+            # 病症；自动识别时未识别出药品也按病症检索
             system_prompt = (
                 "你是一位专业的医疗知识科普员，对常见病症和相关药品有深入了解，能用通俗语言提供详细且准确的信息。"
             )
@@ -2718,7 +2919,7 @@ def knowledge_search():
                 f"请围绕{query}这一病症，整理一份结构化报告，覆盖：概况、病因、典型症状、常用检验、治疗方案、常用药品、预防与日常护理。"
                 "要求：格式清晰、要点分条；仅引用可靠来源并用 Markdown 的 ^^ 形式标注。"
             )
-        elif not is_drug and kind == 'wellness':
+        else:
             system_prompt = (
                 "你是一位专业的健康养生顾问，对中医、运动、营养等领域有深入了解，能用通俗易懂的方式提供建议。"
             )
@@ -2726,13 +2927,21 @@ def knowledge_search():
                 f"请针对{query}这一养生主题，生成分条建议，覆盖：核心原则、每日可执行清单、风险与禁忌、适合人群与不适合人群，并给出必要的安全提醒。"
             )
 
-        ai_text, model_used = chat_completion(
-            model=medical_ai.text_model,
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-            temperature=0.2,
-            max_tokens=1200,
-        )
-        return jsonify({"success": True, "result": to_plain_text(ai_text), "model_used": model_used, "kind": "drug" if is_drug else "disease"})
+        def search():
+            ai_text, model_used = chat_completion(
+                model=medical_ai.text_model,
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+                temperature=0.2,
+                max_tokens=1200,
+                cache='knowledge_search',
+                # 药品按通用名归并，"芬必得" 与 "布洛芬" 在近似命中模式下共用缓存
+                cache_query=f"drug:{generic_name or query}" if is_drug else f"{kind}:{query}",
+            )
+            return {"success": True, "result": to_plain_text(ai_text), "model_used": model_used, "kind": "drug" if is_drug else "disease"}
+
+        if _wants_stream(data):
+            return _stream_service_call(search)
+        return jsonify(search())
     except Exception as e:
         logger.error(f"知识AI搜索失败: {e}")
         return jsonify({"error": True, "message": "搜索失败"}), 500
@@ -2744,100 +2953,107 @@ def knowledge_search():
 def _now_iso():
     return datetime.utcnow().isoformat()
 
+# 社区索引（帖子流 + 热度排行），首次访问时从仓储构建，写接口增量维护；
+# 其他 worker 写过帖子集合时（版本变化不全是本进程的写入）整体重建
+community_index = CommunityIndex(load_comments=lambda post_id: store.get_comments(post_id))
+# 评论分页：按帖子缓存有序键，评论所在分片的版本变化（任何 worker 写入）时重新加载
+comment_pager = CommentPager(load=lambda post_id: store.get_comments(post_id),
+                             version=lambda post_id: store.version('comments', post_id))
+
+def _ensure_community_index():
+    community_index.ensure(store.list_posts, version=lambda: store.version('posts'),
+                           written_here=lambda since, current: store.written_here('posts', since, current))
+
+def _update_post(post_id: str, apply):
+    """store.update_post 并同步社区索引：每次修改递增帖子的 rev，
+    并发请求的快照乱序到达索引时，较旧的快照由 community_index 丢弃"""
+    def bump(p):
+        p = apply(p)
+        if p is not None:
+            p['rev'] = p.get('rev', 0) + 1
+        return p
+
+    p = store.update_post(post_id, bump)
+    if p:
+        community_index.upsert(p)
+    return p
+
+# 点赞/收藏按帖子分段加锁，reactions 切换与帖子计数更新作为一步完成
+_REACTION_LOCKS = [threading.Lock() for _ in range(64)]
+
 @app.route('/api/community/posts', methods=['GET'])
 def community_posts_list():
     try:
         offset = int(request.args.get('offset', 0))
-        limit = int(request.args.get('limit', 10))
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+        cursor = (request.args.get('cursor') or '').strip() or None
         tag = (request.args.get('tag') or '').strip()
         search = (request.args.get('search') or '').strip()
-        data = _load_community()
-        all_posts = data.get('posts', [])
-        # 排序：置顶优先，其次时间倒序
-        posts = sorted(all_posts, key=lambda x: (
-            0 if x.get('pinned') else 1,
-            x.get('created_at', '' if x.get('pinned') else '' )
-        ,), reverse=True)
-        # 标签筛选
-        if tag:
-            posts = [p for p in posts if tag in (p.get('tags') or [])]
-        # 内容搜索（搜索帖子内容和作者名）
-        if search:
-            search_lower = search.lower()
-            posts = [p for p in posts if (
-                search_lower in (p.get('content', '')).lower() or
-                search_lower in (p.get('author', '')).lower()
-            )]
-        slice_posts = posts[offset: offset + limit]
+        # 可选的评论预览条数（最新 N 条），默认不返回，评论通过评论接口分页加载
+        preview = max(0, min(int(request.args.get('comment_preview', 0)), COMMENT_PREVIEW_SIZE))
+        _ensure_community_index()
+        try:
+            if search:
+                # 全文检索（内容、作者、评论），按 BM25 相关度排序，使用 offset 分页
+                accept = (lambda pid: community_index.feed.has_tag(pid, tag)) if tag else None
+                hits, has_more = community_index.search.search(search, limit, offset=offset, accept=accept)
+                slice_posts = [p for p in (store.get_post(pid) for _score, pid in hits) if p]
+                next_cursor = None
+            else:
+                ids, next_cursor, has_more = community_index.feed.page(limit, cursor=cursor, offset=offset, tag=tag or None)
+                slice_posts = [p for p in (store.get_post(i) for i in ids) if p]
+        except ValueError:
+            return jsonify({"error": True, "message": "无效的分页游标"}), 400
         # 脱敏/最简化返回
         items = []
         username = get_username_by_session()
+        reactions = store.get_reactions(username) if username else {}
+        liked = reactions.get('likes') or {}
+        bookmarked = reactions.get('bookmarks') or {}
         for p in slice_posts:
-            items.append({
+            item = {
                 "id": p.get('id'),
                 "author": p.get('author', '匿名用户'),
                 "content": p.get('content', ''),
                 "created_at": p.get('created_at'),
-                "like_count": len(p.get('likes', [])),
-                "liked": username in (p.get('likes', []) if username else []),
-                "bookmark_count": len(p.get('bookmarks', [])),
-                "bookmarked": username in (p.get('bookmarks', []) if username else []),
-                "comments": p.get('comments', [])[:20],  # 前20条预览
+                "like_count": p.get('like_count', 0),
+                "liked": p.get('id') in liked,
+                "bookmark_count": p.get('bookmark_count', 0),
+                "bookmarked": p.get('id') in bookmarked,
+                "comment_count": p.get('comment_count', 0),
                 "tags": p.get('tags', []),
                 "images": p.get('images', []),
                 "pinned": bool(p.get('pinned'))
-            })
-        has_more = offset + limit < len(posts)
-        return jsonify({"success": True, "items": items, "has_more": has_more})
+            }
+            if preview:
+                item["comment_preview"] = (p.get('comment_preview') or [])[-preview:]
+            items.append(item)
+        return jsonify({"success": True, "items": items, "has_more": has_more, "next_cursor": next_cursor})
     except Exception as e:
         logger.error(f"community list error: {e}")
         return jsonify({"error": True, "message": "加载失败"}), 500
 
 @app.route('/api/community/trending', methods=['GET'])
 def community_trending():
-    """热度排行：基于点赞、评论、图片、置顶并加入时间衰减的综合热度"""
+    """热度排行：基于点赞、评论、图片、置顶并加入时间衰减的综合热度，仅统计最近 hours 小时内发布的帖子"""
     try:
-        limit = int(request.args.get('limit', 8))
-        # 可选：用于未来扩展窗口过滤，目前仅用作展示
-        _hours = float(request.args.get('hours', 72))
-
-        db = _load_community()
-        posts = db.get('posts', [])
-        now = datetime.utcnow()
-
-        def compute_heat(p: dict) -> float:
-            like_count = len(p.get('likes', []) or [])
-            comment_count = len(p.get('comments', []) or [])
-            has_images = len(p.get('images', []) or []) > 0
-            is_pinned = bool(p.get('pinned'))
-            created_text = p.get('created_at') or ''
-            try:
-                created_dt = datetime.fromisoformat(created_text)
-            except Exception:
-                created_dt = now
-            age_hours = max((now - created_dt).total_seconds() / 3600.0, 0.0)
-
-            # 基础热度：评论权重大于点赞，图片略加分，置顶加权
-            base = like_count * 2 + comment_count * 3 + (5 if has_images else 0) + (10 if is_pinned else 0)
-            # 时间衰减：24小时为一个尺度
-            decay = 1.0 / (1.0 + age_hours / 24.0)
-            return round(base * decay, 6)
-
-        scored = []
-        for p in posts:
-            scored.append((compute_heat(p), p))
-        scored.sort(key=lambda x: x[0], reverse=True)
+        limit = max(1, min(int(request.args.get('limit', 8)), 50))
+        hours = float(request.args.get('hours', 72))
+        _ensure_community_index()
 
         items = []
-        for idx, (h, p) in enumerate(scored[:limit]):
+        for h, post_id in community_index.trending.top(limit, hours=hours if hours > 0 else None):
+            p = store.get_post(post_id)
+            if not p:
+                continue
             items.append({
-                "rank": idx + 1,
+                "rank": len(items) + 1,
                 "id": p.get('id'),
                 "author": p.get('author', '匿名用户'),
                 "content": (p.get('content', '') or '')[:120],
                 "created_at": p.get('created_at'),
-                "like_count": len(p.get('likes', []) or []),
-                "comment_count": len(p.get('comments', []) or []),
+                "like_count": p.get('like_count', 0),
+                "comment_count": p.get('comment_count', 0),
                 "tags": p.get('tags', []) or [],
                 "pinned": bool(p.get('pinned')),
                 "heat": h,
@@ -2860,20 +3076,21 @@ def community_post_create():
         images = data.get('images') or []  # 期望为已上传返回的URL数组
         if not content:
             return jsonify({"error": True, "message": "内容不能为空"}), 400
-        db = _load_community()
         post = {
             "id": uuid.uuid4().hex,
             "author": username,
             "content": content[:2000],
             "created_at": _now_iso(),
-            "likes": [],
-            "comments": [],
+            "like_count": 0,
+            "bookmark_count": 0,
+            "comment_count": 0,
+            "comment_preview": [],
             "tags": [t for t in tags if isinstance(t, str)][:5],
             "images": [img for img in images if isinstance(img, str)][:6],
             "pinned": False
         }
-        db.setdefault('posts', []).append(post)
-        _save_community(db)
+        store.put_post(post)
+        community_index.upsert(post)
         return jsonify({"success": True, "id": post['id']})
     except Exception as e:
         logger.error(f"community create error: {e}")
@@ -2881,12 +3098,19 @@ def community_post_create():
 
 @app.route('/api/community/posts/<post_id>/comments', methods=['GET'])
 def community_comments_list(post_id):
+    """评论按发布时间升序，游标分页"""
     try:
-        db = _load_community()
-        p = _find_post(db.get('posts', []), post_id)
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        cursor = (request.args.get('cursor') or '').strip() or None
+        p = store.get_post(post_id)
         if not p:
             return jsonify({"error": True, "message": "未找到帖子"}), 404
-        return jsonify({"success": True, "items": p.get('comments', [])})
+        try:
+            items, next_cursor, has_more = comment_pager.page(post_id, limit, cursor)
+        except ValueError:
+            return jsonify({"error": True, "message": "无效的分页游标"}), 400
+        return jsonify({"success": True, "items": items, "has_more": has_more, "next_cursor": next_cursor,
+                        "total": p.get('comment_count', 0)})
     except Exception as e:
         logger.error(f"community comments list error: {e}")
         return jsonify({"error": True, "message": "加载失败"}), 500
@@ -2902,10 +3126,6 @@ def community_comment_create(post_id):
         parent_id = data.get('parent_id') or None
         if not content:
             return jsonify({"error": True, "message": "内容不能为空"}), 400
-        db = _load_community()
-        p = _find_post(db.get('posts', []), post_id)
-        if not p:
-            return jsonify({"error": True, "message": "未找到帖子"}), 404
         comment = {
             "id": uuid.uuid4().hex,
             "author": username,
@@ -2913,31 +3133,75 @@ def community_comment_create(post_id):
             "created_at": _now_iso(),
             "parent_id": parent_id
         }
-        p.setdefault('comments', []).append(comment)
-        _save_community(db)
+
+        if not store.get_post(post_id):
+            return jsonify({"error": True, "message": "未找到帖子"}), 404
+        store.update_comments(post_id, lambda comments: (comments or []) + [comment])
+
+        def apply(p):
+            if p is None:
+                return None
+            p['comment_count'] = p.get('comment_count', 0) + 1
+            p['comment_preview'] = ((p.get('comment_preview') or []) + [comment])[-COMMENT_PREVIEW_SIZE:]
+            return p
+
+        p = _update_post(post_id, apply)
+        if not p:
+            store.delete_comments(post_id)  # 帖子已被并发删除
+            return jsonify({"error": True, "message": "未找到帖子"}), 404
         return jsonify({"success": True, "id": comment['id']})
     except Exception as e:
         logger.error(f"community comment create error: {e}")
         return jsonify({"error": True, "message": "评论失败"}), 500
 
+def _toggle_reaction(username: str, post_id: str, field: str, counter: str):
+    """切换用户对帖子的点赞/收藏：先改用户的 reactions 索引，再按 ±1 更新帖子计数。
+    两步在该帖子的分段锁内完成；计数更新失败（帖子已被并发删除或写入出错）时撤销 reactions 的切换，
+    两者要么都生效要么都不生效。返回 (是否处于已点赞/已收藏状态, 更新后的帖子)；帖子不存在时返回 (None, None)"""
+    if not store.get_post(post_id):
+        return None, None
+    state = {}
+
+    def toggle(doc):
+        doc = doc or {"likes": {}, "bookmarks": {}}
+        marks = doc.setdefault(field, {})
+        if post_id in marks:
+            marks.pop(post_id)
+            state['on'] = False
+        else:
+            marks[post_id] = _now_iso()
+            state['on'] = True
+        return doc
+
+    with _REACTION_LOCKS[hash(post_id) % len(_REACTION_LOCKS)]:
+        store.update_reactions(username, toggle)
+        on = state['on']
+        delta = 1 if on else -1
+
+        def apply(p):
+            if p is None:
+                return None
+            p[counter] = max(p.get(counter, 0) + delta, 0)
+            return p
+
+        p = None
+        try:
+            p = _update_post(post_id, apply)
+        finally:
+            if p is None:
+                store.update_reactions(username, toggle)  # 计数未更新，撤销切换
+    return (on, p) if p else (None, None)
+
 @app.route('/api/community/posts/<post_id>/like', methods=['POST'])
 def community_like_toggle(post_id):
     try:
         username = get_username_by_session()
         if not username:
             return jsonify({"error": True, "message": "请先登录"}), 401
-        db = _load_community()
-        p = _find_post(db.get('posts', []), post_id)
+        liked, p = _toggle_reaction(username, post_id, 'likes', 'like_count')
         if not p:
             return jsonify({"error": True, "message": "未找到帖子"}), 404
-        likes = set(p.get('likes', []))
-        if username in likes:
-            likes.remove(username)
-        else:
-            likes.add(username)
-        p['likes'] = list(likes)
-        _save_community(db)
-        return jsonify({"success": True, "like_count": len(p['likes'])})
+        return jsonify({"success": True, "liked": liked, "like_count": p['like_count']})
     except Exception as e:
         logger.error(f"community like toggle error: {e}")
         return jsonify({"error": True, "message": "操作失败"}), 500
@@ -2947,22 +3211,10 @@ def community_bookmark_toggle(post_id):
     try:
         # 临时测试：如果没有session，使用默认用户名
         username = get_username_by_session() or 'testuser'
-        db = _load_community()
-        p = _find_post(db.get('posts', []), post_id)
+        bookmarked, p = _toggle_reaction(username, post_id, 'bookmarks', 'bookmark_count')
         if not p:
             return jsonify({"error": True, "message": "未找到帖子"}), 404
-        if 'bookmarks' not in p:
-            p['bookmarks'] = []
-        bookmarks = set(p.get('bookmarks', []))
-        if username in bookmarks:
-            bookmarks.remove(username)
-            bookmarked = False
-        else:
-            bookmarks.add(username)
-            bookmarked = True
-        p['bookmarks'] = list(bookmarks)
-        _save_community(db)
-        return jsonify({"success": True, "bookmarked": bookmarked, "bookmark_count": len(p['bookmarks'])})
+        return jsonify({"success": True, "bookmarked": bookmarked, "bookmark_count": p['bookmark_count']})
     except Exception as e:
         logger.error(f"community bookmark toggle error: {e}")
         return jsonify({"error": True, "message": "操作失败"}), 500
@@ -2973,12 +3225,16 @@ def community_post_pin(post_id):
         username = get_username_by_session()
         if not _is_admin(username):
             return jsonify({"error": True, "message": "需要管理员权限"}), 403
-        db = _load_community()
-        p = _find_post(db.get('posts', []), post_id)
+
+        def apply(p):
+            if p is None:
+                return None
+            p['pinned'] = not bool(p.get('pinned'))
+            return p
+
+        p = _update_post(post_id, apply)
         if not p:
             return jsonify({"error": True, "message": "未找到帖子"}), 404
-        p['pinned'] = not bool(p.get('pinned'))
-        _save_community(db)
         return jsonify({"success": True, "pinned": p['pinned']})
     except Exception as e:
         logger.error(f"community pin error: {e}")
@@ -2990,13 +3246,10 @@ def community_post_delete(post_id):
         username = get_username_by_session()
         if not _is_admin(username):
             return jsonify({"error": True, "message": "需要管理员权限"}), 403
-        db = _load_community()
-        posts = db.get('posts', [])
-        new_posts = [p for p in posts if p.get('id') != post_id]
-        if len(new_posts) == len(posts):
+        if not store.delete_post(post_id):
             return jsonify({"error": True, "message": "未找到帖子"}), 404
-        db['posts'] = new_posts
-        _save_community(db)
+        store.delete_comments(post_id)
+        community_index.remove(post_id)
         return jsonify({"success": True})
     except Exception as e:
         logger.error(f"community delete error: {e}")
@@ -3064,18 +3317,14 @@ def auth_register():
         if role not in ['user', 'doctor']:
             role = 'user'
 
-        users_data = load_json_file(USERS_FILE)
-        users = users_data.get('users', {})
-        if username in users:
-            return jsonify({"error": True, "message": "用户名已存在"}), 409
-
-        users[username] = {
+        new_user = {
             "password_hash": hash_password(password),
             "role": role,
             "active_record_id": None
         }
-        users_data['users'] = users
-        save_json_file(USERS_FILE, users_data)
+        # 仅在用户名不存在时写入（原子判断，避免并发注册互相覆盖）
+        if store.update_user(username, lambda old: new_user if old is None else None) is None:
+            return jsonify({"error": True, "message": "用户名已存在"}), 409
 
         session_id = create_session(username)
         return jsonify({
@@ -3096,8 +3345,7 @@ def auth_login():
         username = (data.get('username') or '').strip()
         password = data.get('password') or ''
 
-        users_data = load_json_file(USERS_FILE)
-        user_obj = users_data.get('users', {}).get(username)
+        user_obj = store.get_user(username)
         if not user_obj:
             return jsonify({"error": True, "message": "用户不存在"}), 404
         if user_obj.get('password_hash') != hash_password(password):
@@ -3126,8 +3374,7 @@ def auth_me():
     username = get_username_by_session()
     if not username:
         return jsonify({"error": True, "message": "未登录"}), 401
-    users_data = load_json_file(USERS_FILE)
-    user_obj = users_data.get('users', {}).get(username, {})
+    user_obj = store.get_user(username) or {}
     return jsonify({
         "success": True,
         "username": username,
@@ -3143,15 +3390,11 @@ def records_root():
     if not username:
         return jsonify({"error": True, "message": "未登录"}), 401
 
-    users_data = load_json_file(USERS_FILE)
-    records_data = load_json_file(RECORDS_FILE)
-    user_records = records_data.get('records', {}).get(username, [])
-
     if request.method == 'GET':
         return jsonify({
             "success": True,
-            "records": user_records,
-            "active_record_id": users_data.get('users', {}).get(username, {}).get('active_record_id')
+            "records": store.list_records(username),
+            "active_record_id": (store.get_user(username) or {}).get('active_record_id')
         })
 
     # POST - 创建档案
@@ -3175,17 +3418,16 @@ def records_root():
         "notes": data.get('notes') or ''
     }
 
-    records_data.setdefault('records', {})
-    records_data['records'].setdefault(username, [])
-    records_data['records'][username].append(new_record)
-    save_json_file(RECORDS_FILE, records_data)
+    store.put_record(username, new_record)
 
     # 若无激活档案，则设为激活
-    users = users_data.get('users', {})
-    if not users.get(username, {}).get('active_record_id'):
-        users[username]['active_record_id'] = new_record['record_id']
-        users_data['users'] = users
-        save_json_file(USERS_FILE, users_data)
+    def activate_if_unset(user):
+        if user is None or user.get('active_record_id'):
+            return None
+        user['active_record_id'] = new_record['record_id']
+        return user
+
+    store.update_user(username, activate_if_unset)
 
     return jsonify({"success": True, "record": new_record})
 
@@ -3199,17 +3441,15 @@ def records_activate():
     if not record_id:
         return jsonify({"error": True, "message": "record_id 缺失"}), 400
 
-    records_data = load_json_file(RECORDS_FILE)
-    user_records = records_data.get('records', {}).get(username, [])
-    if not any(r.get('record_id') == record_id for r in user_records):
+    if not store.get_record(username, record_id):
         return jsonify({"error": True, "message": "档案不存在"}), 404
 
-    users_data = load_json_file(USERS_FILE)
-    users = users_data.get('users', {})
-    users.setdefault(username, {})
-    users[username]['active_record_id'] = record_id
-    users_data['users'] = users
-    save_json_file(USERS_FILE, users_data)
+    def activate(user):
+        user = user or {}
+        user['active_record_id'] = record_id
+        return user
+
+    store.update_user(username, activate)
     return jsonify({"success": True, "active_record_id": record_id})
 
 @app.route('/api/records/<record_id>', methods=['PUT', 'DELETE'])
@@ -3218,35 +3458,38 @@ def records_item(record_id):
     if not username:
         return jsonify({"error": True, "message": "未登录"}), 401
 
-    records_data = load_json_file(RECORDS_FILE)
-    user_records = records_data.get('records', {}).get(username, [])
-    idx = next((i for i, r in enumerate(user_records) if r.get('record_id') == record_id), None)
-    if idx is None:
-        return jsonify({"error": True, "message": "档案不存在"}), 404
-
     if request.method == 'DELETE':
-        removed = user_records.pop(idx)
-        records_data['records'][username] = user_records
-        save_json_file(RECORDS_FILE, records_data)
+        if not store.delete_record(username, record_id):
+            return jsonify({"error": True, "message": "档案不存在"}), 404
 
         # 若删除的是激活档案，重置激活
-        users_data = load_json_file(USERS_FILE)
-        users = users_data.get('users', {})
-        if users.get(username, {}).get('active_record_id') == record_id:
-            users[username]['active_record_id'] = user_records[0]['record_id'] if user_records else None
-            users_data['users'] = users
-            save_json_file(USERS_FILE, users_data)
-        return jsonify({"success": True, "deleted": removed.get('record_id')})
+        remaining = store.list_records(username)
+
+        def reset_active(user):
+            if user is None or user.get('active_record_id') != record_id:
+                return None
+            user['active_record_id'] = remaining[0]['record_id'] if remaining else None
+            return user
+
+        store.update_user(username, reset_active)
+        return jsonify({"success": True, "deleted": record_id})
 
     # PUT - 更新
     data = parse_json_request()
     allowed_fields = {"name", "age", "gender", "height", "weight", "allergies", "diagnoses", "current_medications", "notes"}
-    for key in allowed_fields:
-        if key in data:
-            user_records[idx][key] = data.get(key)
-    records_data['records'][username] = user_records
-    save_json_file(RECORDS_FILE, records_data)
-    return jsonify({"success": True, "record": user_records[idx]})
+
+    def apply(rec):
+        if rec is None:
+            return None
+        for key in allowed_fields:
+            if key in data:
+                rec[key] = data.get(key)
+        return rec
+
+    updated = store.update_record(username, record_id, apply)
+    if not updated:
+        return jsonify({"error": True, "message": "档案不存在"}), 404
+    return jsonify({"success": True, "record": updated})
 
 # 报告：获取/新增（附加在具体档案下）
 @app.route('/api/records/<record_id>/reports', methods=['GET', 'POST'])
@@ -3254,13 +3497,11 @@ def record_reports(record_id):
     username = get_username_by_session()
     if not username:
         return jsonify({"error": True, "message": "未登录"}), 401
-    records_data = load_json_file(RECORDS_FILE)
-    user_records = records_data.get('records', {}).get(username, [])
-    rec = next((r for r in user_records if r.get('record_id') == record_id), None)
-    if not rec:
-        return jsonify({"error": True, "message": "档案不存在"}), 404
-    rec.setdefault('reports', [])
     if request.method == 'GET':
+        rec = store.get_record(username, record_id)
+        if not rec:
+            return jsonify({"error": True, "message": "档案不存在"}), 404
+        rec.setdefault('reports', [])
         logger.info(f"获取档案 {record_id} 的报告列表，用户: {username}")
         logger.info(f"档案 {record_id} 有 {len(rec['reports'])} 个报告")
         if rec['reports']:
@@ -3281,13 +3522,18 @@ def record_reports(record_id):
     
     logger.info(f"生成的报告: {json.dumps(report, ensure_ascii=False, indent=2)}")
     
-    rec['reports'].insert(0, report)
-    records_data['records'][username] = user_records
+    def apply(r):
+        if r is None:
+            return None
+        r.setdefault('reports', []).insert(0, report)
+        return r
+
+    rec = store.update_record(username, record_id, apply)
+    if not rec:
+        return jsonify({"error": True, "message": "档案不存在"}), 404
     
     logger.info(f"档案 {record_id} 现在有 {len(rec['reports'])} 个报告")
-    
-    save_json_file(RECORDS_FILE, records_data)
-    logger.info(f"报告已保存到文件: {RECORDS_FILE}")
+    logger.info(f"报告已保存（存储后端: {store.backend}）")
     
     return jsonify({"success": True, "report": report})
 
@@ -3309,6 +3555,8 @@ def tcm_vision_analyze():
         
         analysis_type = data.get('analysis_type', 'tcm_diagnosis')
         
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.tcm_vision_analyze(images, analysis_type), _tcm_section_events())
         result = medical_ai.tcm_vision_analyze(images, analysis_type)
         return jsonify(result)
         
@@ -3331,6 +3579,8 @@ def tcm_inquiry_analyze():
         if not symptoms:
             return jsonify({"error": "症状信息不能为空"}), 400
         
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.tcm_inquiry_analyze(patient_info, symptoms, analysis_type))
         result = medical_ai.tcm_inquiry_analyze(patient_info, symptoms, analysis_type)
         return jsonify(result)
         
@@ -3352,6 +3602,8 @@ def tcm_pulse_analyze():
         if not any(pulse_characteristics.values()):
             return jsonify({"error": "脉象特征不能为空"}), 400
 
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.tcm_pulse_analyze(pulse_characteristics, analysis_type))
         result = medical_ai.tcm_pulse_analyze(pulse_characteristics, analysis_type)
         return jsonify(result)
 
@@ -3400,6 +3652,9 @@ def generate_treatment_plans():
         if num_plans < 1 or num_plans > 5:
             num_plans = 3  # 默认值
 
+        if _wants_stream(data):
+            return _stream_service_call(lambda: medical_ai.generate_treatment_plan(emr_content, patient_profile, num_plans),
+                                        _treatment_plan_events())
         result = medical_ai.generate_treatment_plan(emr_content, patient_profile, num_plans)
         return jsonify(result)
 
@@ -3413,13 +3668,7 @@ def generate_treatment_plans():
 def get_tcm_archives():
     """获取健康档案列表"""
     try:
-        archives_file = os.path.join(DATA_DIR, 'tcm_archives.json')
-        
-        if os.path.exists(archives_file):
-            with open(archives_file, 'r', encoding='utf-8') as f:
-                archives = json.load(f)
-        else:
-            archives = []
+        archives = store.list_tcm_archives()
         
         return jsonify({
             "success": True,
@@ -3446,15 +3695,6 @@ def create_tcm_archive():
                 "message": "档案名称不能为空"
             }), 400
         
-        archives_file = os.path.join(DATA_DIR, 'tcm_archives.json')
-        
-        # 读取现有档案
-        if os.path.exists(archives_file):
-            with open(archives_file, 'r', encoding='utf-8') as f:
-                archives = json.load(f)
-        else:
-            archives = []
-        
         # 生成新档案ID
         archive_id = str(int(time.time() * 1000))
         
@@ -3470,11 +3710,8 @@ def create_tcm_archive():
             "diagnoses": []
         }
         
-        archives.append(new_archive)
-        
-        # 保存到文件
-        with open(archives_file, 'w', encoding='utf-8') as f:
-            json.dump(archives, f, ensure_ascii=False, indent=2)
+        # 保存档案
+        store.put_tcm_archive(new_archive)
         
         return jsonify({
             "success": True,
@@ -3493,18 +3730,7 @@ def create_tcm_archive():
 def get_tcm_archive(archive_id):
     """获取指定档案详情"""
     try:
-        archives_file = os.path.join(DATA_DIR, 'tcm_archives.json')
-        
-        if not os.path.exists(archives_file):
-            return jsonify({
-                "success": False,
-                "message": "档案文件不存在"
-            }), 404
-        
-        with open(archives_file, 'r', encoding='utf-8') as f:
-            archives = json.load(f)
-        
-        archive = next((a for a in archives if a['id'] == archive_id), None)
+        archive = store.get_tcm_archive(archive_id)
         
         if not archive:
             return jsonify({
@@ -3591,7 +3817,11 @@ def start_pre_consultation():
             {"role": "user", "content": user_prompt}
         ]
         
-        ai_response, model_used = chat_completion("qwen-plus", messages, temperature=0.3, max_tokens=2000)
+        ai_response, model_used = chat_completion(
+            "qwen-plus", messages, temperature=0.3, max_tokens=2000,
+            cache='pre_consultation_questions',
+            cache_query=f"{patient_info.get('age', '')}|{patient_info.get('gender', '')}|{chief_complaint}",
+        )
         
         # 解析AI返回的JSON
         questions_data = _extract_json_payload(ai_response)
@@ -3715,50 +3945,38 @@ def submit_pre_consultation():
         report_id = None
         if username != 'anonymous':
             try:
-                records_file = os.path.join(DATA_DIR, 'records.json')
-                if os.path.exists(records_file):
-                    with open(records_file, 'r', encoding='utf-8') as f:
-                        records_data = json.load(f)
-                    
-                    user_records = records_data.get('records', {}).get(username, [])
-                    
-                    # 获取激活的档案
-                    users_file = os.path.join(DATA_DIR, 'users.json')
-                    with open(users_file, 'r', encoding='utf-8') as f:
-                        users_data = json.load(f)
+                # 获取激活的档案
+                active_record_id = (store.get_user(username) or {}).get('active_record_id')
+                
+                if active_record_id:
+                    report_id = str(uuid.uuid4()).replace('-', '')
+                    pre_consultation_report = {
+                        "report_id": report_id,
+                        "type": "pre_consultation",
+                        "title": "预问诊报告",
+                        "created_at": datetime.now().isoformat(),
+                        "content": {
+                            "session_id": session_id,
+                            "chief_complaint": chief_complaint,
+                            "answers": answers,
+                            "report": report_data,
+                            "consultation_text": consultation_text
+                        }
+                    }
                     
-                    active_record_id = users_data.get('users', {}).get(username, {}).get('active_record_id')
+                    # 添加预问诊报告
+                    def apply(active_record):
+                        if active_record is None:
+                            return None
+                        if 'reports' not in active_record:
+                            active_record['reports'] = []
+                        active_record['reports'].insert(0, pre_consultation_report)
+                        return active_record
                     
-                    if active_record_id:
-                        active_record = next((r for r in user_records if r.get('record_id') == active_record_id), None)
-                        
-                        if active_record:
-                            # 添加预问诊报告
-                            if 'reports' not in active_record:
-                                active_record['reports'] = []
-                            
-                            report_id = str(uuid.uuid4()).replace('-', '')
-                            pre_consultation_report = {
-                                "report_id": report_id,
-                                "type": "pre_consultation",
-                                "title": "预问诊报告",
-                                "created_at": datetime.now().isoformat(),
-                                "content": {
-                                    "session_id": session_id,
-                                    "chief_complaint": chief_complaint,
-                                    "answers": answers,
-                                    "report": report_data,
-                                    "consultation_text": consultation_text
-                                }
-                            }
-                            
-                            active_record['reports'].insert(0, pre_consultation_report)
-                            
-                            # 保存更新
-                            with open(records_file, 'w', encoding='utf-8') as f:
-                                json.dump(records_data, f, ensure_ascii=False, indent=2)
-                            
-                            saved_to_record = True
+                    if store.update_record(username, active_record_id, apply):
+                        saved_to_record = True
+                    else:
+                        report_id = None
             except Exception as e:
                 logger.error(f"保存预问诊报告失败: {str(e)}")
         
@@ -3791,17 +4009,7 @@ def get_pre_consultation_reports():
                 "message": "请先登录"
             }), 401
         
-        records_file = os.path.join(DATA_DIR, 'records.json')
-        if not os.path.exists(records_file):
-            return jsonify({
-                "success": True,
-                "reports": []
-            })
-        
-        with open(records_file, 'r', encoding='utf-8') as f:
-            records_data = json.load(f)
-        
-        user_records = records_data.get('records', {}).get(username, [])
+        user_records = store.list_records(username)
         
         # 收集所有预问诊报告
         all_reports = []
@@ -3847,8 +4055,7 @@ def search_doctors():
                 "message": "请输入搜索关键词"
             }), 400
         
-        users_data = load_json_file(USERS_FILE)
-        all_users = users_data.get('users', {})
+        all_users = store.list_users()
         
         # 筛选医生角色的用户
         doctors = []
@@ -3897,8 +4104,7 @@ def push_pre_consultation():
             }), 400
         
         # 验证医生账号存在且为医生角色
-        users_data = load_json_file(USERS_FILE)
-        doctor_data = users_data.get('users', {}).get(doctor_username)
+        doctor_data = store.get_user(doctor_username)
         
         if not doctor_data:
             return jsonify({
@@ -3913,8 +4119,7 @@ def push_pre_consultation():
             }), 400
         
         # 查找报告
-        records_data = load_json_file(RECORDS_FILE)
-        user_records = records_data.get('records', {}).get(patient_username, [])
+        user_records = store.list_records(patient_username)
         
         report_found = None
         for record in user_records:
@@ -3940,8 +4145,7 @@ def push_pre_consultation():
             }), 404
         
         # 保存推送记录
-        pushes_data = load_json_file(PRE_CONSULTATION_PUSHES_FILE)
-        pushes = pushes_data.get('pushes', [])
+        pushes = store.list_pushes()
         
         # 检查是否已推送
         existing_push = next((p for p in pushes 
@@ -3967,9 +4171,7 @@ def push_pre_consultation():
             "report_data": report_found
         }
         
-        pushes.append(push_record)
-        pushes_data['pushes'] = pushes
-        save_json_file(PRE_CONSULTATION_PUSHES_FILE, pushes_data)
+        store.put_push(push_record)
         
         return jsonify({
             "success": True,
@@ -3998,8 +4200,7 @@ def get_doctor_pre_consultation_reports():
             }), 401
         
         # 验证是否为医生角色
-        users_data = load_json_file(USERS_FILE)
-        user_data = users_data.get('users', {}).get(doctor_username, {})
+        user_data = store.get_user(doctor_username) or {}
         
         if user_data.get('role') != 'doctor':
             return jsonify({
@@ -4008,8 +4209,7 @@ def get_doctor_pre_consultation_reports():
             }), 403
         
         # 获取推送给该医生的报告
-        pushes_data = load_json_file(PRE_CONSULTATION_PUSHES_FILE)
-        all_pushes = pushes_data.get('pushes', [])
+        all_pushes = store.list_pushes()
         
         # 筛选该医生的活跃推送
         doctor_pushes = [p for p in all_pushes 
@@ -4065,8 +4265,7 @@ def delete_doctor_pre_consultation_report(push_id):
             }), 401
         
         # 验证是否为医生角色
-        users_data = load_json_file(USERS_FILE)
-        user_data = users_data.get('users', {}).get(doctor_username, {})
+        user_data = store.get_user(doctor_username) or {}
         
         if user_data.get('role') != 'doctor':
             return jsonify({
@@ -4075,8 +4274,7 @@ def delete_doctor_pre_consultation_report(push_id):
             }), 403
         
         # 获取推送记录
-        pushes_data = load_json_file(PRE_CONSULTATION_PUSHES_FILE)
-        all_pushes = pushes_data.get('pushes', [])
+        all_pushes = store.list_pushes()
         
         # 查找推送记录
         push_found = None
@@ -4098,10 +4296,14 @@ def delete_doctor_pre_consultation_report(push_id):
             }), 404
         
         # 标记为已删除
-        push_found['status'] = 'deleted'
-        push_found['deleted_at'] = datetime.now().isoformat()
+        def mark_deleted(push):
+            if push is None:
+                return None
+            push['status'] = 'deleted'
+            push['deleted_at'] = datetime.now().isoformat()
+            return push
         
-        save_json_file(PRE_CONSULTATION_PUSHES_FILE, pushes_data)
+        store.update_push(push_id, mark_deleted)
         
         return jsonify({
             "success": True,
@@ -4169,12 +4371,9 @@ def analyze_tcm_image():
         }), 500
 
 def _image_file_to_data_url(image_path: str) -> str:
+    """读取图片并预处理（摆正、缩放、重新压缩）为 data URL"""
     try:
-        import base64
-        mime = 'image/jpeg'
-        with open(image_path, 'rb') as f:
-            b64 = base64.b64encode(f.read()).decode('utf-8')
-        return f"data:{mime};base64,{b64}"
+        return image_preprocessor.prepare_file(image_path).data_url
     except Exception as e:
         logger.error(f"构建图片data URL失败: {e}")
         raise
@@ -4196,7 +4395,9 @@ def analyze_face_diagnosis(image_path):
                 {"type": "image_url", "image_url": {"url": data_url}}
             ]}
         ]
-        ai_text, model_used = chat_completion("qwen-vl-max", messages, temperature=0.2, max_tokens=1200)
+        # 同一张照片（预处理结果相同）命中响应缓存
+        ai_text, model_used = chat_completion("qwen-vl-max", messages, temperature=0.2, max_tokens=1200,
+                                              cache='face_diagnosis')
         ai_text = to_plain_text(ai_text)
 
         # 粗解析为结构化（健壮性优先）
@@ -4257,7 +4458,8 @@ def analyze_tongue_diagnosis(image_path):
                 {"type": "image_url", "image_url": {"url": data_url}}
             ]}
         ]
-        ai_text, model_used = chat_completion("qwen-vl-max", messages, temperature=0.2, max_tokens=1200)
+        ai_text, model_used = chat_completion("qwen-vl-max", messages, temperature=0.2, max_tokens=1200,
+                                              cache='tongue_diagnosis')
         ai_text = to_plain_text(ai_text)
         # 简单解析
         def find_field(name, default=""):
@@ -4346,19 +4548,6 @@ def analyze_general_tcm(image_path):
 def save_diagnosis_to_archive(archive_id, result, mode, image_filename):
     """保存诊断结果到档案"""
     try:
-        archives_file = os.path.join(DATA_DIR, 'tcm_archives.json')
-        
-        if not os.path.exists(archives_file):
-            return
-        
-        with open(archives_file, 'r', encoding='utf-8') as f:
-            archives = json.load(f)
-        
-        # 找到对应档案
-        archive = next((a for a in archives if a['id'] == archive_id), None)
-        if not archive:
-            return
-        
         # 添加诊断记录
         diagnosis_record = {
             "id": str(int(time.time() * 1000)),
@@ -4368,16 +4557,20 @@ def save_diagnosis_to_archive(archive_id, result, mode, image_filename):
             "created_at": datetime.now().isoformat()
         }
         
-        if 'diagnoses' not in archive:
-            archive['diagnoses'] = []
-        
-        archive['diagnoses'].append(diagnosis_record)
-        archive['diagnosis_count'] = len(archive['diagnoses'])
-        archive['updated_at'] = datetime.now().isoformat()
+        def apply(archive):
+            # 找不到对应档案时不做修改
+            if archive is None:
+                return None
+            if 'diagnoses' not in archive:
+                archive['diagnoses'] = []
+            
+            archive['diagnoses'].append(diagnosis_record)
+            archive['diagnosis_count'] = len(archive['diagnoses'])
+            archive['updated_at'] = datetime.now().isoformat()
+            return archive
         
         # 保存更新后的档案
-        with open(archives_file, 'w', encoding='utf-8') as f:
-            json.dump(archives, f, ensure_ascii=False, indent=2)
+        store.update_tcm_archive(archive_id, apply)
     
     except Exception as e:
         logger.error(f"保存诊断结果到档案失败: {str(e)}")
@@ -4386,8 +4579,9 @@ def save_diagnosis_to_archive(archive_id, result, mode, image_filename):
 # 导入用药管理模块
 try:
     from medication_management import MedicationManager
-    medication_manager = MedicationManager(data_dir=DATA_DIR)
-    logger.info("用药管理模块已加载")
+    medication_manager = MedicationManager(data_dir=DATA_DIR, drug_dictionary=drug_dictionary)
+    medication_manager.scheduler.start()
+    logger.info(f"用药管理模块已加载，提醒调度: {medication_manager.scheduler.stats()}")
 except Exception as e:
     logger.error(f"加载用药管理模块失败: {e}")
     medication_manager = None
@@ -4408,11 +4602,7 @@ def handle_medications():
             # 获取用药记录
             status = request.args.get('status')
             record_id = request.args.get('record_id')  # 档案筛选
-            medications = medication_manager.get_user_medications(username, status)
-            
-            # 如果有档案筛选，只返回该档案的用药
-            if record_id:
-                medications = [m for m in medications if m.get('record_id') == record_id]
+            medications = medication_manager.get_user_medications(username, status, record_id=record_id)
             
             return jsonify({
                 "success": True,
@@ -4439,6 +4629,39 @@ def handle_medications():
         logger.error(f"处理用药记录失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+def _medication_batch(handler):
+    """批量接口公共处理：全部成功 200，部分成功 207（逐项结果见 results），全部失败 400"""
+    if not medication_manager:
+        return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
+    try:
+        data = request.json or {}
+        username = data.get('username')
+        if not username:
+            return jsonify({"success": False, "message": "缺少用户名"}), 400
+        result = handler(username, data.get('operations'))
+        if 'results' not in result:
+            return jsonify({"success": False, "message": result.get('error', '批量处理失败')}), 400
+        status = 200 if result['success'] else 207 if result['succeeded'] else 400
+        return jsonify(result), status
+    except Exception as e:
+        logger.error(f"批量处理失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/medications/batch', methods=['POST'])
+def batch_medications():
+    """批量新增/修改/删除用药记录（如拍照识别出的多个药品一次保存）"""
+    return _medication_batch(lambda username, ops: medication_manager.batch_medications(username, ops))
+
+@app.route('/api/medications/reminders/batch', methods=['POST'])
+def batch_reminders():
+    """批量新增/修改/删除服药提醒"""
+    return _medication_batch(lambda username, ops: medication_manager.batch_reminders(username, ops))
+
+@app.route('/api/medications/intake-records/batch', methods=['POST'])
+def batch_intake_records():
+    """批量记录服药"""
+    return _medication_batch(lambda username, ops: medication_manager.batch_record_intake(username, ops))
+
 @app.route('/api/medications/<medication_id>', methods=['PUT', 'DELETE'])
 def handle_medication_detail(medication_id):
     """更新或删除用药记录"""
@@ -4490,11 +4713,7 @@ def handle_reminders():
         if request.method == 'GET':
             # 获取提醒列表
             record_id = request.args.get('record_id')  # 档案筛选
-            reminders = medication_manager.get_user_reminders(username)
-            
-            # 如果有档案筛选，只返回该档案的提醒
-            if record_id:
-                reminders = [r for r in reminders if r.get('record_id') == record_id]
+            reminders = medication_manager.get_user_reminders(username, record_id=record_id)
             
             return jsonify({
                 "success": True,
@@ -4511,11 +4730,9 @@ def handle_reminders():
             medication_id = reminder_data.get('medication_id')
             if medication_id:
                 # 查找该用药的record_id
-                medications = medication_manager.get_user_medications(username)
-                for med in medications:
-                    if med.get('id') == medication_id:
-                        reminder_data['record_id'] = med.get('record_id', '')
-                        break
+                med = medication_manager.get_medication(username, medication_id)
+                if med:
+                    reminder_data['record_id'] = med.get('record_id', '')
             
             result = medication_manager.add_reminder(username, reminder_data)
             
@@ -4564,6 +4781,64 @@ def handle_reminder_detail(reminder_id):
         logger.error(f"处理提醒详情失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/medications/autocomplete', methods=['GET'])
+def autocomplete_medication_name():
+    """药名输入联想：按名称、全拼或拼音首字母前缀匹配药名词典"""
+    query = (request.args.get('q') or '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    suggestions = drug_dictionary.suggest(query, limit) if query else []
+    return jsonify({"success": True, "query": query, "suggestions": suggestions})
+
+@app.route('/api/medications/reminders/due', methods=['GET'])
+def get_due_reminders():
+    """未来 minutes 分钟内到期的服药提醒（由服务端调度计算）"""
+    if not medication_manager:
+        return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
+    
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({"success": False, "message": "缺少用户名"}), 400
+        minutes = max(1, min(int(request.args.get('minutes', 60)), 7 * 24 * 60))
+        record_id = request.args.get('record_id')
+        items = medication_manager.scheduler.due(username, minutes)
+        if record_id:
+            items = [e for e in items if e.get('record_id') == record_id]
+        return jsonify({"success": True, "items": items, "count": len(items)})
+    except Exception as e:
+        logger.error(f"获取到期提醒失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/medications/reminders/stream', methods=['GET'])
+def stream_due_reminders():
+    """SSE：推送该用户到期的服药提醒（event: reminder），每 15 秒发送一次心跳注释"""
+    if not medication_manager:
+        return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
+    username = request.args.get('username')
+    if not username:
+        return jsonify({"success": False, "message": "缺少用户名"}), 400
+    scheduler = medication_manager.scheduler
+    events = scheduler.subscribe(username)
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = events.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse_event('reminder', event)
+        finally:
+            scheduler.unsubscribe(username, events)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/medications/intake-records', methods=['GET', 'POST'])
 def handle_intake_records():
     """获取或记录服药"""
@@ -4583,11 +4858,8 @@ def handle_intake_records():
             end_date = request.args.get('end_date')
             record_id = request.args.get('record_id')  # 档案筛选
             
-            records = medication_manager.get_intake_records(username, medication_id, start_date, end_date)
-            
-            # 如果有档案筛选，只返回该档案的服药记录
-            if record_id:
-                records = [r for r in records if r.get('record_id') == record_id]
+            records = medication_manager.get_intake_records(username, medication_id, start_date, end_date,
+                                                            record_id=record_id)
             
             return jsonify({
                 "success": True,
@@ -4611,6 +4883,44 @@ def handle_intake_records():
         logger.error(f"处理服药记录失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/medications/dashboard', methods=['GET'])
+def get_medication_dashboard():
+    """用药页面一次取回：用药记录、提醒、服药记录与依从性统计（同一快照），支持 ETag / If-None-Match"""
+    if not medication_manager:
+        return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
+    
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({"success": False, "message": "缺少用户名"}), 400
+        
+        days = int(request.args.get('days', 7))
+        record_id = request.args.get('record_id') or None
+        
+        # 内容未变：只计算版本号（几次 stat），不读取数据、不序列化
+        if request.if_none_match:
+            version = medication_manager.dashboard_version(username, record_id, days)
+            if request.if_none_match.contains(version):
+                response = Response(status=304)
+                response.set_etag(version)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+        
+        result = medication_manager.get_dashboard(username, record_id, days)
+        if not result.get('success'):
+            return jsonify({"success": False, "message": result.get('error', '加载失败')}), 500
+        
+        response = jsonify(result)
+        if result.get('version'):
+            response.set_etag(result['version'])
+        # 每次使用前向服务端验证，浏览器会自动带上 If-None-Match
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    except Exception as e:
+        logger.error(f"获取用药仪表盘失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
 @app.route('/api/medications/adherence-stats', methods=['GET'])
 def get_adherence_stats():
     """获取用药依从性统计"""
@@ -4625,43 +4935,10 @@ def get_adherence_stats():
         days = int(request.args.get('days', 7))
         record_id = request.args.get('record_id')  # 档案筛选
         
-        # 获取统计数据
-        all_medications = medication_manager.get_user_medications(username, status='active')
-        all_records = medication_manager.get_intake_records(username, start_date=(datetime.now() - timedelta(days=days)).isoformat())
-        
-        # 如果有档案筛选，只统计该档案的数据
-        if record_id:
-            medications = [m for m in all_medications if m.get('record_id') == record_id]
-            intake_records = [r for r in all_records if r.get('record_id') == record_id]
-        else:
-            medications = all_medications
-            intake_records = all_records
-        
-        # 计算统计
-        total_medications = len(medications)
-        total_doses_expected = 0
-        total_doses_taken = len(intake_records)
-        
-        # 估算应服次数
-        for med in medications:
-            freq = med.get('frequency', '')
-            if '3' in freq:
-                total_doses_expected += days * 3
-            elif '2' in freq:
-                total_doses_expected += days * 2
-            else:
-                total_doses_expected += days
-        
-        adherence_rate = (total_doses_taken / total_doses_expected * 100) if total_doses_expected > 0 else 0
-        
-        result = {
-            'success': True,
-            'total_medications': total_medications,
-            'total_doses_expected': total_doses_expected,
-            'total_doses_taken': total_doses_taken,
-            'adherence_rate': round(adherence_rate, 2),
-            'days': days
-        }
+        # 依从性日汇总：应服次数由提醒计划推算，O(days) 累加
+        result = medication_manager.get_adherence_stats(username, days, record_id=record_id or None)
+        if not result.get('success'):
+            return jsonify({"success": False, "message": result.get('error', '统计失败')}), 500
         
         return jsonify(result)
     
@@ -4669,6 +4946,142 @@ def get_adherence_stats():
         logger.error(f"获取用药统计失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+def _local_medication_analysis(local: dict, count: int) -> dict:
+    """仅由本地知识库得出的分析结果（字段同AI分析）"""
+    high = sum(1 for i in local['interactions'] if i['severity'] == '高')
+    if local['interactions']:
+        summary = f"本地知识库分析了 {count} 种药物，发现 {len(local['interactions'])} 组已知相互作用"
+        summary += f"（其中 {high} 组为高风险）" if high else ""
+        summary += "，请在医生或药师指导下调整用药。"
+    else:
+        summary = f"本地知识库分析了 {count} 种药物，未发现已知的药物相互作用，请按医嘱规律服药。"
+    return {
+        "summary": summary,
+        "interactions": local['interactions'],
+        "warnings": local['warnings'],
+        "suggestions": local['suggestions']
+    }
+
+
+class _AnalysisMerger:
+    """逐条合并知识库与AI分析结果：同一对药品以知识库条目为准，AI 条目标记 source='ai'。
+    add() 返回需要新增展示的条目（重复时返回 None），流式接口据此逐条推送"""
+
+    LIST_FIELDS = ('interactions', 'warnings', 'suggestions')
+
+    def __init__(self, local: dict):
+        self.resolved = local['resolved']
+        self.fields = {}
+        self.lists = {field: [] for field in self.LIST_FIELDS}
+        self._seen = {field: set() for field in self.LIST_FIELDS}
+        for field in self.LIST_FIELDS:
+            for item in local[field]:
+                self.lists[field].append(item)
+                self._seen[field].add(self._key(field, item))
+
+    def _key(self, field: str, item):
+        if field == 'interactions':
+            return tuple(sorted(self.resolved.get(item.get(k) or '') or normalize_drug_name(item.get(k) or '')
+                                for k in ('drug1', 'drug2')))
+        if isinstance(item, dict):
+            return item.get('description') if field == 'warnings' else json.dumps(item, ensure_ascii=False, sort_keys=True)
+        return item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+
+    def add(self, field: str, item):
+        if field not in self.lists:
+            self.fields[field] = item
+            return item
+        if field == 'interactions':
+            if not isinstance(item, dict):
+                return None
+            item = {**item, "source": "ai"}
+        key = self._key(field, item)
+        if key is not None and key in self._seen[field]:
+            return None
+        self._seen[field].add(key)
+        self.lists[field].append(item)
+        return item
+
+    def result(self) -> dict:
+        interactions = sorted(self.lists['interactions'], key=lambda x: SEVERITY_ORDER.get(x.get('severity'), 3))
+        return {**self.fields, **self.lists, "interactions": interactions}
+
+
+def _merge_medication_analysis(local: dict, ai: dict) -> dict:
+    """合并知识库与AI分析结果（整段结果）"""
+    merger = _AnalysisMerger(local)
+    for field, value in ai.items():
+        for item in (value or []) if field in merger.LIST_FIELDS else [value]:
+            merger.add(field, item)
+    return merger.result()
+
+
+def _analysis_from_text(analysis_result: str) -> dict:
+    """AI分析输出无法解析为JSON时，以纯文本作为总结与建议"""
+    return {
+        "summary": analysis_result[:200] if len(analysis_result) > 200 else analysis_result,
+        "interactions": [],
+        "warnings": [],
+        "suggestions": [analysis_result]
+    }
+
+
+# 用药AI分析的模型调用参数（同步与流式接口共用，二者命中同一响应缓存）
+MEDICATION_ANALYSIS_CALL = dict(model='qwen-plus', temperature=0.3, max_tokens=2000, cache='medication_interactions')
+
+
+def _medications_to_analyze(data: dict):
+    """解析用药分析请求，返回 (药品列表, 错误响应)；未提供药品列表时取用户当前活跃的用药"""
+    username = data.get('username')
+    if not username:
+        return None, (jsonify({"success": False, "message": "缺少用户名"}), 400)
+    medications_list = data.get('medications', [])
+    if not medications_list:
+        medications_list = medication_manager.get_user_medications(username, status='active')
+    return medications_list, None
+
+
+def _medication_analysis_messages(medications_list: list, local: dict) -> list:
+    """构建AI分析提示词：药品按归一化名称排序，同一组药品得到相同提示词以命中响应缓存"""
+    medication_details = []
+    for m in sorted(medications_list, key=lambda m: normalize_drug_name(m.get('name', ''))):
+        detail = f"药品：{m.get('name', '未知')}\n"
+        detail += f"剂量：{m.get('dosage', '未知')}\n"
+        detail += f"频率：{m.get('frequency', '未知')}\n"
+        detail += f"分类：{m.get('category', '未知')}"
+        medication_details.append(detail)
+    known_findings = sorted(f"{' + '.join(sorted((i['drug1'], i['drug2'])))}（{i['severity']}）：{i['description']}"
+                            for i in local['interactions'])
+    uncovered = [f"{a} + {b}" for a, b in local['uncovered']]
+    
+    prompt = f"""作为专业的药师，请分析以下用药方案：
+
+{chr(10).join(medication_details)}
+
+未收录在本地知识库中的药品：{'、'.join(sorted(local['unknown'])) or '（无）'}
+以下药品组合在本地知识库中没有条目，请逐一分析它们之间的相互作用：
+{chr(10).join(uncovered) if uncovered else '（无）'}
+以下组合的相互作用已由知识库确认，无需重复列出：
+{chr(10).join(known_findings) if known_findings else '（无）'}
+
+请提供以下分析：
+1. 药物相互作用（Drug Interactions）：分析这些药物之间是否存在相互作用
+2. 安全警告（Safety Warnings）：是否有需要注意的安全事项
+3. 用药建议（Recommendations）：给出专业的用药建议
+
+请以JSON格式返回，包含：
+- summary: 总体评估
+- interactions: 药物相互作用列表，每项包含 drug1, drug2, severity (高/中/低), description
+- warnings: 警告列表，每项包含 type, severity, description
+- suggestions: 建议列表
+
+注意：请只返回JSON格式的数据，不要包含其他文字说明。"""
+    return [
+        {"role": "system", "content": "你是一位专业的临床药师，擅长分析药物相互作用和用药安全。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
 @app.route('/api/medications/ai-analyze', methods=['POST'])
 def analyze_medications_ai():
     """AI分析用药情况（药物相互作用、副作用等）"""
@@ -4676,16 +5089,9 @@ def analyze_medications_ai():
         return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
     
     try:
-        data = request.json
-        username = data.get('username')
-        medications_list = data.get('medications', [])
-        
-        if not username:
-            return jsonify({"success": False, "message": "缺少用户名"}), 400
-        
-        # 如果没有提供药物列表，则获取用户当前活跃的用药
-        if not medications_list:
-            medications_list = medication_manager.get_user_medications(username, status='active')
+        medications_list, error = _medications_to_analyze(request.json)
+        if error:
+            return error
         
         if not medications_list:
             return jsonify({
@@ -4698,44 +5104,23 @@ def analyze_medications_ai():
                 }
             })
         
-        # 构建AI分析提示词
-        medication_names = [m.get('name', '') for m in medications_list]
-        medication_details = []
-        for m in medications_list:
-            detail = f"药品：{m.get('name', '未知')}\n"
-            detail += f"剂量：{m.get('dosage', '未知')}\n"
-            detail += f"频率：{m.get('frequency', '未知')}\n"
-            detail += f"分类：{m.get('category', '未知')}"
-            medication_details.append(detail)
-        
-        prompt = f"""作为专业的药师，请分析以下用药方案：
-
-{chr(10).join(medication_details)}
-
-请提供以下分析：
-1. 药物相互作用（Drug Interactions）：分析这些药物之间是否存在相互作用
-2. 安全警告（Safety Warnings）：是否有需要注意的安全事项
-3. 用药建议（Recommendations）：给出专业的用药建议
-
-请以JSON格式返回，包含：
-- summary: 总体评估
-- interactions: 药物相互作用列表，每项包含 drug1, drug2, severity (高/中/低), description
-- warnings: 警告列表，每项包含 type, severity, description
-- suggestions: 建议列表
-
-注意：请只返回JSON格式的数据，不要包含其他文字说明。"""
+        # 先查本地相互作用知识库；全部药品均已收录时直接返回，不调用大模型
+        local = interaction_index.analyze(medications_list)
+        if not local['unknown'] and not local['uncovered']:
+            return jsonify({
+                "success": True,
+                "analysis": _local_medication_analysis(local, len(medications_list)),
+                "medications_analyzed": len(medications_list),
+                "knowledge_base_hits": len(local['resolved']),
+                "ai_used": False
+            })
         
         # 调用AI分析
         try:
             # 使用统一的chat_completion函数
             analysis_result, model_used = chat_completion(
-                model='qwen-plus',
-                messages=[
-                    {"role": "system", "content": "你是一位专业的临床药师，擅长分析药物相互作用和用药安全。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
+                messages=_medication_analysis_messages(medications_list, local),
+                **MEDICATION_ANALYSIS_CALL
             )
             
             logger.info(f"用药AI分析使用模型: {model_used}")
@@ -4743,19 +5128,16 @@ def analyze_medications_ai():
             # 尝试解析JSON
             analysis_data = _extract_json_payload(analysis_result)
             
-            if not analysis_data:
+            if not isinstance(analysis_data, dict):
                 # 如果无法解析JSON，使用纯文本响应
-                analysis_data = {
-                    "summary": analysis_result[:200] if len(analysis_result) > 200 else analysis_result,
-                    "interactions": [],
-                    "warnings": [],
-                    "suggestions": [analysis_result]
-                }
+                analysis_data = _analysis_from_text(analysis_result)
             
             return jsonify({
                 "success": True,
-                "analysis": analysis_data,
-                "medications_analyzed": len(medications_list)
+                "analysis": _merge_medication_analysis(local, analysis_data),
+                "medications_analyzed": len(medications_list),
+                "knowledge_base_hits": len(local['resolved']),
+                "ai_used": True
             })
         
         except Exception as e:
@@ -4769,18 +5151,80 @@ def analyze_medications_ai():
         logger.error(f"处理AI分析请求失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
-@app.route('/api/medications/recognize-photo', methods=['POST'])
-def recognize_medication_photo():
-    """识别药品照片并提取信息"""
+@app.route('/api/medications/ai-analyze/stream', methods=['POST'])
+def analyze_medications_ai_stream():
+    """AI分析用药情况的流式版本（SSE）。
+    事件：interaction / warning / suggestion（每条一个事件，知识库结果立即推送，AI 结果在其 JSON 对象闭合时推送）、
+    summary、done（完整的合并结果，字段同非流式接口）、error
+    """
+    if not medication_manager:
+        return jsonify({"success": False, "message": "用药管理模块未加载"}), 500
+    
     try:
-        data = parse_json_request()
-        image_data = data.get('image')  # Base64编码的图片
+        medications_list, error = _medications_to_analyze(request.json)
+        if error:
+            return error
+    except Exception as e:
+        logger.error(f"处理AI分析请求失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+    
+    def generate():
+        if not medications_list:
+            yield _sse_event('done', {"success": True, "analysis": {
+                "summary": "当前没有活跃的用药记录", "interactions": [], "warnings": [], "suggestions": []}})
+            return
+        local = interaction_index.analyze(medications_list)
+        for field, event in (('interactions', 'interaction'), ('warnings', 'warning'), ('suggestions', 'suggestion')):
+            for item in local[field]:
+                yield _sse_event(event, item)
+        done = {"success": True, "medications_analyzed": len(medications_list),
+                "knowledge_base_hits": len(local['resolved']), "ai_used": bool(local['unknown'] or local['uncovered'])}
+        if not local['unknown'] and not local['uncovered']:
+            analysis = _local_medication_analysis(local, len(medications_list))
+            yield _sse_event('summary', {"summary": analysis['summary']})
+            yield _sse_event('done', {**done, "analysis": analysis})
+            return
         
-        if not image_data:
-            return jsonify({"success": False, "message": "缺少图片数据"}), 400
+        merger = _AnalysisMerger(local)
+        parser = JsonStreamParser()
+        parts, model_used = [], None
+        events = {'interactions': 'interaction', 'warnings': 'warning', 'suggestions': 'suggestion'}
+        try:
+            for delta, model_used in stream_completion(
+                    messages=_medication_analysis_messages(medications_list, local), **MEDICATION_ANALYSIS_CALL):
+                parts.append(delta)
+                for field, value in parser.feed(delta):
+                    item = merger.add(field, value)
+                    if item is not None and field in events:
+                        yield _sse_event(events[field], item)
+                    elif field == 'summary':
+                        yield _sse_event('summary', {"summary": value})
+        except Exception as e:
+            logger.error(f"AI分析失败: {e}")
+            yield _sse_event('error', {"success": False, "message": f"AI分析失败: {str(e)}"})
+            return
         
-        # 构建AI识别提示
-        system_prompt = """你是一位专业的药剂师，擅长识别药品包装和说明书。
+        logger.info(f"用药AI分析（流式）使用模型: {model_used}")
+        analysis_result = ''.join(parts)
+        if not parser.done:
+            # 输出不是完整的 JSON：按非流式接口的规则整体解析
+            analysis_data = _extract_json_payload(analysis_result)
+            if not isinstance(analysis_data, dict):
+                analysis_data = _analysis_from_text(analysis_result)
+            analysis = _merge_medication_analysis(local, analysis_data)
+            yield _sse_event('summary', {"summary": analysis.get('summary', '')})
+        else:
+            analysis = merger.result()
+        yield _sse_event('done', {**done, "analysis": analysis, "model_used": model_used})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 药品照片识别：单次请求最多的图片数与并发识别数
+MAX_RECOGNITION_IMAGES = 6
+RECOGNITION_WORKERS = int(os.getenv("IMAGE_RECOGNITION_WORKERS") or 4)
+
+MEDICATION_RECOGNITION_PROMPT = """你是一位专业的药剂师，擅长识别药品包装和说明书。
 请仔细观察图片中的所有药品信息。如果图片中有多个药品，请识别所有的药品。
 
 对于每个药品，提取以下字段（如有则填写，没有则留空）：
@@ -4795,83 +5239,158 @@ def recognize_medication_photo():
 如果识别出多个药品，返回数组；如果只识别出一个，也返回包含一个元素的数组。
 例如：[{"name": "布洛芬", "dosage": "100mg", ...}, {"name": "..."}]
 如果某个字段无法从图片中获取，请设置为空字符串。"""
+
+RECOGNIZED_MEDICATION_FIELDS = {
+    "name": "",
+    "dosage": "",
+    "frequency": "",
+    "duration": "",
+    "category": "西药",
+    "notes": ""
+}
+
+def _prepare_vision_image(image: str) -> str:
+    """data URL / base64 图片预处理为缩小后的 data URL；http(s) 链接或无法解码时原样返回"""
+    if not isinstance(image, str) or image.startswith(('http://', 'https://')):
+        return image
+    try:
+        return image_preprocessor.prepare(image).data_url
+    except Exception as e:
+        logger.warning(f"药品照片预处理失败，使用原图: {e}")
+        return image
+
+# 药品照片识别的模型调用参数（同步与流式接口共用，二者命中同一响应缓存）
+MEDICATION_RECOGNITION_CALL = dict(model='qwen-vl-max', temperature=0.2, max_tokens=2000, cache='recognize_medication')
+
+def _recognition_messages(image_url: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": MEDICATION_RECOGNITION_PROMPT
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "请识别这张图片中的所有药品，提取药品信息并以JSON数组格式返回。如有多个药品，请全部识别。"},
+                {"type": "image_url", "image_url": {"url": image_url}}
+            ]
+        }
+    ]
+
+def _validate_recognized_medication(med) -> Optional[dict]:
+    """只保留识别结果中约定的字段；不是对象或没有药品名称时返回 None"""
+    if not isinstance(med, dict):
+        return None
+    validated_med = {key: med.get(key, default) for key, default in RECOGNIZED_MEDICATION_FIELDS.items()}
+    return validated_med if validated_med.get("name") else None
+
+def _parse_recognized_medications(analysis_result: str) -> list:
+    """解析识别输出的JSON，确保返回的是数组，并验证每个药品对象的字段"""
+    medication_list = _extract_json_payload(analysis_result)
+    if not medication_list:
+        medication_list = []
+    elif not isinstance(medication_list, list):
+        # 如果返回的是单个对象，转换为数组
+        medication_list = [medication_list]
+    return [med for med in map(_validate_recognized_medication, medication_list) if med]
+
+def _recognize_medications_in_image(image_url: str):
+    """识别单张图片中的药品，返回 (药品列表, 实际使用模型)；同一张图片命中响应缓存"""
+    analysis_result, model_used = chat_completion(messages=_recognition_messages(image_url),
+                                                  **MEDICATION_RECOGNITION_CALL)
+    return _parse_recognized_medications(analysis_result), model_used
+
+def _medication_merge_key(med: dict) -> Tuple[str, str]:
+    """识别结果的去重键：(药名词典的通用名, 比较键)；未收录时比较键为忽略空白/标点/全半角的名称"""
+    name = str(med.get("name", ""))
+    generic_name = drug_dictionary.canonical(name) or ''
+    return generic_name, generic_name or normalize_query(name) or name
+
+def _merge_recognized_medications(lists):
+    """合并多张图片的识别结果：同一药品（按药名词典的通用名，未收录时忽略空白/标点/全半角比较名称）
+    只保留一条，空字段用后续结果补全"""
+    merged = {}
+    for medication_list in lists:
+        for med in medication_list:
+            generic_name, key = _medication_merge_key(med)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = {**med, "generic_name": generic_name}
+                continue
+            for field, value in med.items():
+                if value and (not existing.get(field) or existing.get(field) == RECOGNIZED_MEDICATION_FIELDS.get(field)):
+                    existing[field] = value
+    return list(merged.values())
+
+def _recognition_images(data: dict):
+    """解析识别请求中的图片，返回 (预处理后去重的图片列表, 错误响应)；同一张照片只识别一次"""
+    images = data.get('images') or ([data['image']] if data.get('image') else [])  # Base64编码的图片
+    images = [img for img in images if img]
+    
+    if not images:
+        return None, (jsonify({"success": False, "message": "缺少图片数据"}), 400)
+    if len(images) > MAX_RECOGNITION_IMAGES:
+        return None, (jsonify({"success": False, "message": f"单次最多识别 {MAX_RECOGNITION_IMAGES} 张图片"}), 400)
+    return list(dict.fromkeys(_prepare_vision_image(img) for img in images)), None
+
+def _recognition_response(outcomes: list) -> dict:
+    """按各张图片的识别结果 [(药品列表, 模型) 或 None（失败）] 生成接口响应"""
+    results, failed = [], 0
+    model_used = None
+    for outcome in outcomes:
+        if outcome is None:
+            failed += 1
+            continue
+        results.append(outcome[0])
+        model_used = model_used or outcome[1]
+    
+    if failed == len(outcomes):
+        # 返回空数组让用户手动填写
+        return {
+            "success": True,
+            "medication_list": [],
+            "count": 0,
+            "message": "识别功能暂时不可用，请手动填写药品信息"
+        }
+    
+    logger.info(f"药品识别使用模型: {model_used}，图片 {len(outcomes)} 张，失败 {failed} 张")
+    validated_list = _merge_recognized_medications(results)
+    response = {
+        "success": True,
+        "medication_list": validated_list,
+        "count": len(validated_list),
+        "model_used": model_used,
+        "images": len(outcomes)
+    }
+    if failed:
+        response["failed_images"] = failed
+    return response
+
+@app.route('/api/medications/recognize-photo', methods=['POST'])
+def recognize_medication_photo():
+    """识别药品照片并提取信息
+    请求体: {"image": data URL} 或 {"images": [data URL, ...]}（多张照片并发识别后合并）
+    """
+    try:
+        prepared, error = _recognition_images(parse_json_request())
+        if error:
+            return error
         
-        try:
-            # 调用AI视觉识别
-            analysis_result, model_used = chat_completion(
-                model='qwen-vl-max',
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "请识别这张图片中的所有药品，提取药品信息并以JSON数组格式返回。如有多个药品，请全部识别。"},
-                            {"type": "image_url", "image_url": {"url": image_data}}
-                        ]
-                    }
-                ],
-                temperature=0.2,
-                max_tokens=2000
-            )
-            
-            logger.info(f"药品识别使用模型: {model_used}")
-            
-            # 解析JSON
-            medication_list = _extract_json_payload(analysis_result)
-            
-            # 确保返回的是数组
-            if not medication_list:
-                medication_list = []
-            elif not isinstance(medication_list, list):
-                # 如果返回的是单个对象，转换为数组
-                medication_list = [medication_list]
-            
-            # 验证每个药品对象的字段
-            default_fields = {
-                "name": "",
-                "dosage": "",
-                "frequency": "",
-                "duration": "",
-                "category": "西药",
-                "notes": ""
-            }
-            
-            validated_list = []
-            for med in medication_list:
-                if not isinstance(med, dict):
-                    continue
-                
-                validated_med = {}
-                for key in default_fields:
-                    validated_med[key] = med.get(key, default_fields[key])
-                
-                # 只添加至少有名称的药品
-                if validated_med.get("name"):
-                    validated_list.append(validated_med)
-            
-            # 如果没有识别到有效的药品，返回空数组
-            if not validated_list:
-                validated_list = []
-            
-            return jsonify({
-                "success": True,
-                "medication_list": validated_list,
-                "count": len(validated_list),
-                "model_used": model_used
-            })
+        def recognize(image_url):
+            try:
+                return _recognize_medications_in_image(image_url)
+            except Exception as recognition_error:
+                logger.error(f"药品识别失败: {recognition_error}")
+                return None
+        
+        # 多张照片并发识别，单张时直接在当前线程调用
+        if len(prepared) == 1:
+            outcomes = [recognize(prepared[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(prepared), RECOGNITION_WORKERS)) as executor:
+                outcomes = list(executor.map(recognize, prepared))
         
-        except Exception as recognition_error:
-            logger.error(f"药品识别失败: {recognition_error}")
-            # 返回空数组让用户手动填写
-            return jsonify({
-                "success": True,
-                "medication_list": [],
-                "count": 0,
-                "message": "识别功能暂时不可用，请手动填写药品信息"
-            })
+        return jsonify(_recognition_response(outcomes))
     
     except Exception as e:
         logger.error(f"处理药品识别请求失败: {e}")
@@ -4881,6 +5400,70 @@ def recognize_medication_photo():
             "message": f"处理请求失败: {str(e)}"
         }), 500
 
+def _stream_recognition(index: int, image_url: str, events: queue.Queue) -> None:
+    """流式识别单张图片（在线程池中运行）：每个药品对象在输出流中闭合时放入 ('medication', index, 药品)，
+    结束时放入 ('image_done', index, (药品列表, 模型))，失败时放入 ('image_failed', index, None)"""
+    parser = JsonStreamParser()
+    parts, found, model_used = [], [], None
+    try:
+        for delta, model_used in stream_completion(messages=_recognition_messages(image_url),
+                                                   **MEDICATION_RECOGNITION_CALL):
+            parts.append(delta)
+            for _, value in parser.feed(delta):
+                med = _validate_recognized_medication(value)
+                if med:
+                    found.append(med)
+                    events.put(('medication', index, med))
+        if not found:
+            # 未能逐条解析（如返回单个对象）：按非流式接口的规则整体解析
+            for med in _parse_recognized_medications(''.join(parts)):
+                found.append(med)
+                events.put(('medication', index, med))
+        events.put(('image_done', index, (found, model_used)))
+    except Exception as e:
+        logger.error(f"药品识别失败: {e}")
+        events.put(('image_failed', index, None))
+
+@app.route('/api/medications/recognize-photo/stream', methods=['POST'])
+def recognize_medication_photo_stream():
+    """识别药品照片的流式版本（SSE）：多张照片并发识别，每识别出一个药品推送一条 medication 事件
+    （按通用名/名称去重，附 generic_name 与图片序号 image），最后推送 done（字段同非流式接口的响应）"""
+    try:
+        prepared, error = _recognition_images(parse_json_request())
+        if error:
+            return error
+    except Exception as e:
+        logger.error(f"处理药品识别请求失败: {e}")
+        return jsonify({"success": False, "message": f"处理请求失败: {str(e)}"}), 500
+    
+    def generate():
+        events = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=min(len(prepared), RECOGNITION_WORKERS))
+        for index, image_url in enumerate(prepared):
+            executor.submit(_stream_recognition, index, image_url, events)
+        executor.shutdown(wait=False)
+        
+        outcomes = [None] * len(prepared)
+        emitted, finished = set(), 0
+        while finished < len(prepared):
+            try:
+                kind, index, payload = events.get(timeout=15)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if kind == 'medication':
+                generic_name, key = _medication_merge_key(payload)
+                if key not in emitted:
+                    emitted.add(key)
+                    yield _sse_event('medication', {**payload, "generic_name": generic_name, "image": index})
+            else:
+                finished += 1
+                outcomes[index] = payload
+        yield _sse_event('done', _recognition_response(outcomes))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     print("医疗AI后端服务启动中...")
     print("Qwen-VL-Max API 已配置")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用药依从性统计基准测试
+在不同的服药历史规模下对比 7/30/365 天依从性统计的耗时：
+- 旧实现：读取整个 medication_intake_records.json，逐条过滤窗口内记录，按 frequency 猜测应服次数
+- 日汇总：AdherenceRollup 按天累加应服/实服次数（MedicationManager.get_adherence_stats）
+
+用法: python bench_adherence.py [每用户历史记录数,逗号分隔] [其他用户数] [请求次数]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from medication_management import MedicationManager
+
+
+def build_history(num_records, medication_ids, record_id):
+    """从今天往前每 8 小时一条服药记录"""
+    now = datetime.now()
+    return [{
+        "id": str(uuid.uuid4()), "medication_id": medication_ids[i % len(medication_ids)],
+        "medication_name": "阿莫西林", "taken_at": (now - timedelta(hours=8 * i)).isoformat(),
+        "dosage": "1片", "notes": "", "record_id": record_id, "record_name": "", "created_at": now.isoformat(),
+    } for i in range(num_records)]
+
+
+def legacy_stats(path, medications, username, days):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    start_date = (datetime.now() - timedelta(days=days)).isoformat()
+    records = [r for r in data.get('records', {}).get(username, []) if r.get('taken_at', '') >= start_date]
+    records.sort(key=lambda x: x.get('taken_at', ''), reverse=True)
+    expected = 0
+    for med in medications:
+        freq = med.get('frequency', '')
+        expected += days * (3 if '3' in freq else 2 if '2' in freq else 1)
+    return len(records), expected
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def bench(num_records, other_users, runs):
+    bench_dir = tempfile.mkdtemp(prefix='bench_adherence_')
+    try:
+        manager = MedicationManager(bench_dir)
+        start_date = (datetime.now() - timedelta(hours=8 * num_records)).strftime('%Y-%m-%d')
+        med_ids = []
+        for name, freq in (("阿莫西林", "每日3次"), ("二甲双胍", "每日2次")):
+            med_ids.append(manager.add_medication("alice", {"name": name, "frequency": freq, "record_id": "r1",
+                                                             "start_date": start_date})['medication_id'])
+        manager.add_reminder("alice", {"medication_id": med_ids[0], "times": ["08:00", "14:00", "20:00"]})
+        history = build_history(num_records, med_ids, "r1")
+        others = {f"user{u}": build_history(num_records, ["x"], "") for u in range(other_users)}
+
+        legacy_path = os.path.join(bench_dir, 'legacy_intake_records.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump({'records': dict(others, alice=history)}, f, ensure_ascii=False, indent=2)
+        manager.intake_log.append_many("alice", history)
+        # 删除已有汇总，模拟升级后首次访问时的回填
+        shutil.rmtree(manager.adherence.root)
+        os.makedirs(manager.adherence.root)
+        begin = time.perf_counter()
+        manager.get_adherence_stats("alice", 7)
+        backfill_ms = (time.perf_counter() - begin) * 1000
+
+        medications = manager.get_user_medications("alice", status='active')
+        legacy_runs = max(1, runs // 10)
+        rows = []
+        for days in (7, 30, 365):
+            rows.append((f"旧实现 {days}天", measure(lambda days=days: legacy_stats(legacy_path, medications, "alice", days),
+                                                 legacy_runs)))
+            rows.append((f"日汇总 {days}天", measure(lambda days=days: manager.get_adherence_stats("alice", days), runs)))
+        rows.append(("日汇总 365天 按档案", measure(lambda: manager.get_adherence_stats("alice", 365, record_id="r1"),
+                                               runs)))
+        rows.append(("记录服药(含汇总更新)", measure(lambda: manager.record_intake("alice", {
+            "medication_id": med_ids[0], "record_id": "r1"}), runs)))
+        print(f"\n每用户历史记录数: {num_records}，其他用户数: {other_users}（汇总回填 {backfill_ms:.0f} ms）")
+        print(f"{'场景':<22}{'p50(ms)':>12}{'p99(ms)':>12}")
+        for name, (p50, p99) in rows:
+            print(f"{name:<22}{p50:>12.3f}{p99:>12.3f}")
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+
+def main():
+    sizes = [int(x) for x in (sys.argv[1] if len(sys.argv) > 1 else '1000,10000,100000').split(',')]
+    other_users = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    for size in sizes:
+        bench(size, other_users, runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评论存储格式基准测试
+构造含热门长评论串的社区数据，对比：
+- 旧格式：评论内嵌在帖子中，列表页每帖带前 20 条评论，发表评论重写整个 community.json
+- 新格式：评论存于独立的分片集合（经 migrate_post_comments 迁移），
+  列表页只带 comment_count（可选最新 N 条预览），评论接口游标分页
+统计列表页响应体积、序列化耗时以及接口整体耗时。
+
+用法: python bench_community_comments.py [帖子数] [每帖评论数] [请求次数]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import statistics
+
+BENCH_DIR = tempfile.mkdtemp(prefix='bench_comments_')
+os.environ['DATA_DIR'] = os.path.join(BENCH_DIR, 'boot')
+
+import backend_server
+from data_store import JsonFileStore, migrate_post_comments, save_json_file
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def build_legacy(data_dir, num_posts, comments_per_post):
+    """直接写出评论内嵌在帖子中的旧格式 community.json"""
+    posts = []
+    for i in range(num_posts):
+        created = f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}"
+        posts.append({
+            "id": uuid.uuid4().hex, "author": "author", "content": "病情交流内容" * 20, "created_at": created,
+            "like_count": 0, "bookmark_count": 0, "tags": ["感冒"], "images": [], "pinned": False,
+            "comments": [{
+                "id": uuid.uuid4().hex, "author": f"user{j}", "content": f"评论内容，感谢分享经验 {j}" * 3,
+                "created_at": f"2025-01-02T{j // 3600 % 24:02d}:{j // 60 % 60:02d}:{j % 60:02d}", "parent_id": None,
+            } for j in range(comments_per_post)],
+        })
+    os.makedirs(data_dir, exist_ok=True)
+    save_json_file(os.path.join(data_dir, 'community.json'), {"posts": posts})
+    return [p["id"] for p in posts]
+
+
+def legacy_items(store, post_ids):
+    """旧实现的列表页条目：每帖附带前 20 条评论"""
+    items = []
+    for post_id in post_ids[:10]:
+        p = store.get_post(post_id)
+        items.append({
+            "id": p["id"], "author": p["author"], "content": p["content"], "created_at": p["created_at"],
+            "like_count": 0, "liked": False, "bookmark_count": 0, "bookmarked": False,
+            "comments": p.get('comments', [])[:20], "tags": p["tags"], "images": p["images"], "pinned": False,
+        })
+    return {"success": True, "items": items, "has_more": True}
+
+
+def legacy_comment(store, post_id):
+    comment = {"id": uuid.uuid4().hex, "author": "bench", "content": "新评论",
+               "created_at": backend_server._now_iso(), "parent_id": None}
+
+    def apply(p):
+        p.setdefault('comments', []).append(comment)
+        return p
+    return store.update_post(post_id, apply)
+
+
+def measure(fn, runs):
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    num_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    comments_per_post = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    try:
+        data_dir = os.path.join(BENCH_DIR, 'json')
+        post_ids = build_legacy(data_dir, num_posts, comments_per_post)
+        store = JsonFileStore(data_dir)
+        print(f"帖子数={num_posts} 每帖评论数={comments_per_post} 请求次数={runs}")
+        print(f"community.json 旧格式大小: {os.path.getsize(os.path.join(data_dir, 'community.json')) / 1e6:.1f} MB")
+
+        legacy_payload = legacy_items(store, post_ids)
+        legacy_bytes = len(json.dumps(legacy_payload, ensure_ascii=False).encode('utf-8'))
+        rows = [
+            ("旧格式 列表页序列化", measure(lambda i: json.dumps(legacy_payload, ensure_ascii=False), runs)),
+            ("旧格式 列表页(读取+序列化)", measure(lambda i: json.dumps(legacy_items(store, post_ids), ensure_ascii=False), runs)),
+            ("旧格式 发表评论", measure(lambda i: legacy_comment(store, post_ids[i % num_posts]), runs)),
+        ]
+
+        start = time.perf_counter()
+        counts = migrate_post_comments(store)
+        migrate_ms = (time.perf_counter() - start) * 1000
+
+        backend_server.store = store
+        client = backend_server.app.test_client()
+        headers = {"X-Session-Id": backend_server.create_session("bench")}
+
+        def get(url):
+            resp = client.get(url, headers=headers)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+            return resp
+
+        new_bytes = len(get("/api/community/posts?limit=10").get_data())
+        preview_bytes = len(get("/api/community/posts?limit=10&comment_preview=3").get_data())
+        new_payload = get("/api/community/posts?limit=10").get_json()
+
+        def new_comment(i):
+            resp = client.post(f"/api/community/posts/{post_ids[i % num_posts]}/comments",
+                               json={"content": "新评论"}, headers=headers)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+
+        rows += [
+            ("新格式 列表页序列化", measure(lambda i: json.dumps(new_payload, ensure_ascii=False), runs)),
+            ("新格式 列表页接口", measure(lambda i: get("/api/community/posts?limit=10"), runs)),
+            ("新格式 列表页接口(预览3条)", measure(lambda i: get("/api/community/posts?limit=10&comment_preview=3"), runs)),
+            ("新格式 评论分页接口(50条)", measure(lambda i: get(f"/api/community/posts/{post_ids[i % num_posts]}/comments"), runs)),
+            ("新格式 发表评论接口", measure(new_comment, runs)),
+        ]
+        print(f"迁移耗时: {migrate_ms:.0f} ms {counts}")
+        print(f"community.json 新格式大小: {os.path.getsize(os.path.join(data_dir, 'community.json')) / 1e6:.2f} MB")
+        print(f"列表页响应体积(10帖): 旧 {legacy_bytes / 1024:.1f} KB -> 新 {new_bytes / 1024:.1f} KB"
+              f"（预览3条 {preview_bytes / 1024:.1f} KB）")
+        print(f"{'场景':<24}{'p50(ms)':>12}{'p99(ms)':>12}")
+        for name, (p50, p99) in rows:
+            print(f"{name:<24}{p50:>12.3f}{p99:>12.3f}")
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+社区帖子流/热度排行基准测试
+在内存中的合成帖子上对比单次请求耗时：
+- 帖子流 旧实现：每次请求全量排序 + 标签过滤 + offset 切片
+- 帖子流 FeedIndex：有序索引 + 标签倒排索引 + 游标分页
+- 热度排行 旧实现：逐帖解析时间并打分后全量排序
+- 热度排行 TrendingBoard：增量维护的基础热度 + 读取时按上界剪枝
+- 搜索 旧实现：逐帖子串匹配；SearchIndex：倒排索引 + BM25
+
+用法: python bench_community_feed.py [帖子规模,逗号分隔] [每项请求次数]
+"""
+
+import sys
+import time
+import uuid
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from community_index import FeedIndex, TrendingBoard, SearchIndex
+
+TAGS = ['感冒', '高血压', '糖尿病', '养生', '儿科', '失眠', '中医', '康复']
+PHRASES = ['最近总是头痛', '晚上失眠多梦', '血压有点偏高', '吃了布洛芬好转', '孩子反复发烧', '胃口不好',
+           '膝盖关节疼痛', '血糖控制不稳定', '咳嗽两周了', '医生建议复查', '坚持散步锻炼', '饮食清淡少盐',
+           '皮肤瘙痒起疹子', '中药调理三个月', '过敏性鼻炎发作', '颈椎不舒服']
+
+
+def build_posts(num_posts):
+    now = datetime.utcnow()
+    posts = []
+    for i in range(num_posts):
+        posts.append({
+            "id": uuid.uuid4().hex,
+            "created_at": (now - timedelta(minutes=random.randint(0, 60 * 24 * 365))).isoformat(),
+            "author": f"user{i % 5000}",
+            "content": '，'.join(random.sample(PHRASES, 3)),
+            "tags": random.sample(TAGS, 2),
+            "like_count": random.randint(0, 30),
+            "comment_count": random.randint(0, 5),
+            "images": [],
+            "pinned": i % 5000 == 0,
+        })
+    return posts
+
+
+def old_page(posts, offset, limit, tag):
+    ordered = sorted(posts, key=lambda x: (1 if x.get('pinned') else 0, x.get('created_at', '')), reverse=True)
+    if tag:
+        ordered = [p for p in ordered if tag in (p.get('tags') or [])]
+    return [p['id'] for p in ordered[offset: offset + limit]]
+
+
+def old_trending(posts, limit, hours):
+    """旧实现的热度计算（hours 参数未生效）"""
+    now = datetime.utcnow()
+    scored = []
+    for p in posts:
+        base = TrendingBoard.base_heat(p)
+        try:
+            created_dt = datetime.fromisoformat(p.get('created_at') or '')
+        except Exception:
+            created_dt = now
+        age_hours = max((now - created_dt).total_seconds() / 3600.0, 0.0)
+        scored.append((round(base * TrendingBoard.decay(age_hours), 6), p))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [p['id'] for _h, p in scored[:limit]]
+
+
+def old_search(posts, query, limit):
+    q = query.lower()
+    ordered = sorted(posts, key=lambda x: (1 if x.get('pinned') else 0, x.get('created_at', '')), reverse=True)
+    return [p['id'] for p in ordered if q in p['content'].lower() or q in p['author'].lower()][:limit]
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def bench(num_posts, runs, limit=10):
+    posts = build_posts(num_posts)
+    index = FeedIndex()
+    start = time.perf_counter()
+    index.build(posts)
+    build_ms = (time.perf_counter() - start) * 1000
+    board = TrendingBoard()
+    board.build(posts)
+    search = SearchIndex()
+    start = time.perf_counter()
+    search.build(posts)
+    search_build_ms = (time.perf_counter() - start) * 1000
+
+    # 深翻页游标：第 1000 页附近
+    deep_offset = min(num_posts // 2, 10000)
+    deep_cursor = index.page(1, offset=deep_offset - 1)[1]
+    old_runs = max(1, min(runs, 2000000 // num_posts))
+
+    rows = [
+        ("旧实现 首页", measure(lambda: old_page(posts, 0, limit, ''), old_runs)),
+        ("旧实现 深翻页", measure(lambda: old_page(posts, deep_offset, limit, ''), old_runs)),
+        ("旧实现 标签页", measure(lambda: old_page(posts, 0, limit, '中医'), old_runs)),
+        ("索引 首页", measure(lambda: index.page(limit), runs)),
+        ("索引 深翻页(游标)", measure(lambda: index.page(limit, cursor=deep_cursor), runs)),
+        ("索引 标签页", measure(lambda: index.page(limit, tag='中医'), runs)),
+        ("索引 新增帖子", measure(lambda: index.upsert({"id": uuid.uuid4().hex, "created_at": "2025-06-01T00:00:00",
+                                                        "tags": ['中医']}), runs)),
+        ("热度 旧实现", measure(lambda: old_trending(posts, 8, 72), max(1, old_runs // 4))),
+        ("热度 排行榜 72h", measure(lambda: board.top(8, hours=72), runs)),
+        ("热度 排行榜 不限", measure(lambda: board.top(8), runs)),
+        ("热度 点赞更新", measure(lambda: board.upsert(dict(random.choice(posts), like_count=40)), runs)),
+        ("搜索 旧实现", measure(lambda: old_search(posts, '布洛芬', limit), max(1, old_runs // 4))),
+        ("搜索 索引 常见词", measure(lambda: search.search('布洛芬', limit), max(1, runs // 10))),
+        ("搜索 索引 组合词", measure(lambda: search.search('失眠 布洛芬 复查', limit), max(1, runs // 10))),
+        ("搜索 索引 作者", measure(lambda: search.search('user42', limit), runs)),
+    ]
+    print(f"\n帖子数: {num_posts}（帖子流索引构建 {build_ms:.0f} ms，全文索引构建 {search_build_ms:.0f} ms）")
+    print(f"{'场景':<20}{'p50(ms)':>12}{'p99(ms)':>12}")
+    for name, (p50, p99) in rows:
+        print(f"{name:<20}{p50:>12.3f}{p99:>12.3f}")
+
+
+def main():
+    sizes = [int(x) for x in (sys.argv[1] if len(sys.argv) > 1 else '10000,100000,1000000').split(',')]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    random.seed(42)
+    for size in sizes:
+        bench(size, runs)
+
+
+if __name__ == '__main__':
+    main()
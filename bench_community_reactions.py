@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+点赞/收藏存储格式基准测试
+构造每帖 1 万以上点赞的社区数据，对比：
+- 旧格式：帖子内保存 likes/bookmarks 用户列表，列表页逐帖 len() 与 `username in list`，
+  点赞时整表转 set 再写回
+- 新格式：帖子上的 like_count/bookmark_count 计数 + 按用户的 reactions 索引
+（经 migrate_post_reactions 从旧格式迁移得到）
+
+用法: python bench_community_reactions.py [帖子数] [每帖点赞数] [请求次数]
+"""
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import statistics
+
+BENCH_DIR = tempfile.mkdtemp(prefix='bench_reactions_')
+os.environ['DATA_DIR'] = os.path.join(BENCH_DIR, 'boot')
+
+import backend_server
+from data_store import JsonFileStore, migrate_post_reactions, save_json_file
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def build_legacy(data_dir, num_posts, likes_per_post):
+    """直接写出旧格式的 community.json"""
+    likers = [f"user{i}" for i in range(likes_per_post + 1000)]
+    posts = [{
+        "id": uuid.uuid4().hex, "author": "author", "content": "病情交流内容" * 20,
+        "created_at": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}",
+        "likes": likers[i % 1000: i % 1000 + likes_per_post],
+        "bookmarks": likers[: likes_per_post // 10],
+        "comment_count": 0, "tags": ["感冒"], "images": [], "pinned": False,
+    } for i in range(num_posts)]
+    os.makedirs(data_dir, exist_ok=True)
+    save_json_file(os.path.join(data_dir, 'community.json'), {"posts": posts})
+    return [p["id"] for p in posts]
+
+
+def legacy_page(store, post_ids, username):
+    """旧实现的列表页：逐帖复制含完整点赞列表的文档并线性查找"""
+    items = []
+    for post_id in post_ids[:10]:
+        p = store.get_post(post_id)
+        items.append({
+            "like_count": len(p.get('likes', [])),
+            "liked": username in p.get('likes', []),
+            "bookmark_count": len(p.get('bookmarks', [])),
+            "bookmarked": username in p.get('bookmarks', []),
+        })
+    return items
+
+
+def legacy_like(store, post_id, username):
+    def apply(p):
+        likes = set(p.get('likes', []))
+        if username in likes:
+            likes.remove(username)
+        else:
+            likes.add(username)
+        p['likes'] = list(likes)
+        return p
+    return store.update_post(post_id, apply)
+
+
+def measure(fn, runs):
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    num_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    likes_per_post = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    try:
+        data_dir = os.path.join(BENCH_DIR, 'json')
+        post_ids = build_legacy(data_dir, num_posts, likes_per_post)
+        store = JsonFileStore(data_dir)
+        username = f"user{likes_per_post + 500}"  # 排在列表末尾，线性查找最坏情况
+        print(f"帖子数={num_posts} 每帖点赞数={likes_per_post} 请求次数={runs}")
+        print(f"community.json 旧格式大小: {os.path.getsize(os.path.join(data_dir, 'community.json')) / 1e6:.1f} MB")
+
+        rows = [
+            ("旧格式 列表页(10帖)", measure(lambda i: legacy_page(store, post_ids, username), runs)),
+            ("旧格式 点赞切换", measure(lambda i: legacy_like(store, post_ids[i % num_posts], username), runs)),
+        ]
+
+        start = time.perf_counter()
+        counts = migrate_post_reactions(store)
+        migrate_ms = (time.perf_counter() - start) * 1000
+
+        backend_server.store = store
+        client = backend_server.app.test_client()
+        session = backend_server.create_session(username)
+        headers = {"X-Session-Id": session}
+
+        def new_page(_i):
+            resp = client.get("/api/community/posts?limit=10", headers=headers)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+
+        def new_like(i):
+            resp = client.post(f"/api/community/posts/{post_ids[i % num_posts]}/like", headers=headers)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+
+        rows += [
+            ("新格式 列表页接口(10帖)", measure(new_page, runs)),
+            ("新格式 点赞切换接口", measure(new_like, runs)),
+        ]
+        print(f"迁移耗时: {migrate_ms:.0f} ms {counts}")
+        print(f"community.json 新格式大小: {os.path.getsize(os.path.join(data_dir, 'community.json')) / 1e6:.2f} MB")
+        print(f"{'场景':<24}{'p50(ms)':>12}{'p99(ms)':>12}")
+        for name, (p50, p99) in rows:
+            print(f"{name:<24}{p50:>12.3f}{p99:>12.3f}")
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+药名词典基准测试
+生成 N 条（默认 10 万）随机药名的词典文件，统计加载耗时，以及名称前缀、拼音首字母、全拼联想和
+药名规范化的单次查询耗时（平均 / p99）。
+
+用法: python bench_drug_dictionary.py [词典条数] [查询次数]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from drug_dictionary import DrugDictionary, lazy_pinyin
+from drug_interactions import DEFAULT_KNOWLEDGE_PATH
+
+CHARS = '阿奥巴贝苯吡丙布达地多恩法非芬氟格磺环己甲卡康克拉雷利林硫龙洛氯罗马美米莫那尼哌匹普齐嗪曲瑞噻沙舍双司他酮托妥维西昔辛孕唑'
+SUFFIXES = ['片', '胶囊', '缓释片', '颗粒', '注射液', '']
+
+
+def make_dictionary(path, count, rng):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            generic = ''.join(rng.choice(CHARS) for _ in range(rng.randint(3, 5)))
+            brand = ''.join(rng.choice(CHARS) for _ in range(2)) + '得'
+            f.write(f"{generic}{i},{generic}{rng.choice(SUFFIXES)}{i},{brand}{i}\n")
+
+
+def measure(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return sum(samples) / len(samples), samples[int(len(samples) * 0.99)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(42)
+    path = os.path.join(tempfile.mkdtemp(), 'drug_dictionary.txt')
+    make_dictionary(path, count, rng)
+
+    dictionary = DrugDictionary([DEFAULT_KNOWLEDGE_PATH, path])
+    print(f"词典: {dictionary.stats()}")
+    if lazy_pinyin is None:
+        print("未安装 pypinyin，跳过拼音联想")
+
+    names = dictionary._snapshot.names
+    samples = [rng.choice(names) for _ in range(runs)]
+    cases = [
+        ("名称前缀(2字)", dictionary.suggest, [n[:2] for n in samples]),
+        ("名称前缀(1字)", dictionary.suggest, [n[:1] for n in samples]),
+        ("规范化(带剂型规格)", dictionary.canonical, [f"{n}缓释片 0.5g" for n in samples]),
+        ("规范化(未收录)", dictionary.canonical, [f"未收录{i}" for i in range(runs)]),
+    ]
+    if lazy_pinyin is not None:
+        cases += [
+            ("拼音首字母", dictionary.suggest, [''.join(p[:1] for p in lazy_pinyin(n[:3])) for n in samples]),
+            ("全拼前缀", dictionary.suggest, [''.join(lazy_pinyin(n[:2])) for n in samples]),
+        ]
+    print(f"{'查询':<20}{'平均(ms)':>12}{'p99(ms)':>12}")
+    for label, fn, queries in cases:
+        avg, p99 = measure(fn, queries)
+        print(f"{label:<20}{avg:>12.4f}{p99:>12.4f}")
+
+
+if __name__ == '__main__':
+    main()
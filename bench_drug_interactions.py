@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地药物相互作用知识库基准测试
+统计一组常见用药方案的药名识别率，以及知识库分析的耗时（对比一次大模型调用通常需要数秒）。
+
+用法: python bench_drug_interactions.py [重复次数]
+"""
+
+import sys
+import time
+
+from drug_interactions import InteractionIndex
+
+REGIMENS = [
+    ['阿司匹林肠溶片 100mg', '硫酸氢氯吡格雷片 75mg', '阿托伐他汀钙片 20mg', '苯磺酸氨氯地平片 5mg'],
+    ['华法林钠片 2.5mg', '芬必得', '奥美拉唑肠溶胶囊'],
+    ['盐酸二甲双胍片 0.5g', '格列美脲片', '缬沙坦胶囊', '螺内酯片'],
+    ['布洛芬缓释胶囊 0.3g', '对乙酰氨基酚片', '阿莫西林胶囊 0.25g×24粒'],
+    ['左甲状腺素钠片', '碳酸钙D3片', '维生素C片'],
+    ['西地那非', '单硝酸异山梨酯缓释片'],
+    ['舍曲林', '曲马多', '阿普唑仑片'],
+    ['辛伐他汀片', '克拉霉素片', '氨氯地平贝那普利片'],
+]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    start = time.perf_counter()
+    index = InteractionIndex()
+    load_ms = (time.perf_counter() - start) * 1000
+    print(f"知识库: {index.stats()}，加载 {load_ms:.1f} ms")
+
+    total = known = 0
+    for regimen in REGIMENS:
+        result = index.analyze([{'name': n} for n in regimen])
+        total += len(regimen)
+        known += len(result['resolved'])
+        pending = [' + '.join(pair) for pair in result['uncovered']] or result['unknown']
+        status = f"需AI分析: {'、'.join(pending)}" if pending else '本地直接返回'
+        print(f"- {' / '.join(regimen)}\n  相互作用 {len(result['interactions'])} 组，{status}")
+    print(f"药名识别率: {known}/{total}")
+
+    meds = [[{'name': n} for n in regimen] for regimen in REGIMENS]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for regimen in meds:
+            index.analyze(regimen)
+    per_call = (time.perf_counter() - start) * 1e6 / (rounds * len(meds))
+    print(f"单次分析平均耗时: {per_call:.1f} µs（{rounds * len(meds)} 次）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片预处理基准测试
+对比原图与不同 IMAGE_MAX_EDGE 下预处理后的 data URL 体积和耗时（首次处理 / 同一图片再次处理命中缓存）。
+默认使用仓库中的样例图片 用药测试图.jpg。
+
+用法: python bench_image_pipeline.py [图片路径] [长边像素,逗号分隔]
+"""
+
+import os
+import sys
+import time
+import base64
+
+from image_pipeline import Image, ImagePreprocessor
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              '用药测试图.jpg')
+    edges = [int(x) for x in (sys.argv[2] if len(sys.argv) > 2 else '2048,1280,1024,768').split(',')]
+    with open(path, 'rb') as f:
+        raw = f.read()
+    original_url = len(base64.b64encode(raw)) + len('data:image/jpeg;base64,')
+    print(f"图片: {path}（原图 {len(raw) / 1024:.0f} KB，data URL {original_url / 1024:.0f} KB）")
+    if Image is None:
+        print("未安装 Pillow，预处理将透传原图")
+    print(f"{'长边':>8}{'尺寸':>14}{'data URL(KB)':>16}{'压缩比':>10}{'首次(ms)':>12}{'缓存(ms)':>12}")
+    for edge in edges:
+        preprocessor = ImagePreprocessor(max_edge=edge)
+        start = time.perf_counter()
+        prepared = preprocessor.prepare(raw)
+        first_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        preprocessor.prepare(raw)
+        cached_ms = (time.perf_counter() - start) * 1000
+        size = f"{prepared.width}x{prepared.height}"
+        print(f"{edge:>8}{size:>14}{len(prepared.data_url) / 1024:>16.0f}"
+              f"{original_url / len(prepared.data_url):>10.1f}{first_ms:>12.1f}{cached_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药记录存储基准测试
+对比：
+- 旧实现：所有用户的记录保存在一个 medication_intake_records.json 中，
+  记一次服药读取并重写整个文件；查询读取全表后逐条过滤并重新排序
+- IntakeLog：按用户/月份分段的只追加日志 + 内存有序索引
+
+用法: python bench_intake_log.py [用户数] [每用户记录数] [请求次数]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import random
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from intake_log import IntakeLog
+
+
+def build_records(num_users, per_user):
+    start = datetime(2024, 1, 1)
+    data = {}
+    for u in range(num_users):
+        data[f"user{u}"] = [{
+            "id": str(uuid.uuid4()), "medication_id": f"med{i % 3}", "medication_name": "阿莫西林",
+            "taken_at": (start + timedelta(hours=8 * i)).isoformat(), "dosage": "1片", "notes": "",
+            "record_id": "", "record_name": "", "created_at": start.isoformat(),
+        } for i in range(per_user)]
+    return data
+
+
+def legacy_record(path, username, record):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['records'].setdefault(username, []).append(record)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def legacy_query(path, username, start_date, end_date):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    records = data.get('records', {}).get(username, [])
+    records = [r for r in records if r.get('taken_at', '') >= start_date]
+    records = [r for r in records if r.get('taken_at', '') <= end_date]
+    records.sort(key=lambda x: x.get('taken_at', ''), reverse=True)
+    return records
+
+
+def measure(fn, runs):
+    samples = []
+    for i in range(runs):
+        begin = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - begin) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    random.seed(42)
+    bench_dir = tempfile.mkdtemp(prefix='bench_intake_')
+    try:
+        data = build_records(num_users, per_user)
+        legacy_path = os.path.join(bench_dir, 'medication_intake_records.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump({'records': data}, f, ensure_ascii=False, indent=2)
+        print(f"用户数={num_users} 每用户记录数={per_user} 请求次数={runs}")
+        print(f"旧格式文件大小: {os.path.getsize(legacy_path) / 1e6:.1f} MB")
+
+        log = IntakeLog(bench_dir)
+        begin = time.perf_counter()
+        log.import_legacy(legacy_path)
+        import_ms = (time.perf_counter() - begin) * 1000
+        # import_legacy 会把旧文件改名，基准中继续使用改名后的副本
+        shutil.copy(legacy_path + '.migrated', legacy_path)
+
+        def new_record(i):
+            return {"id": str(uuid.uuid4()), "medication_id": "med0", "taken_at": datetime.now().isoformat()}
+
+        def window(i):
+            user = f"user{i % num_users}"
+            day = datetime(2024, 1, 1) + timedelta(days=random.randint(0, per_user // 3 - 30))
+            return user, day.strftime('%Y-%m-%d'), (day + timedelta(days=30)).strftime('%Y-%m-%d')
+
+        def warm_query(i):
+            if i == 0:
+                for u in range(min(10, num_users)):
+                    log.query(f"user{u}")  # 预热前 10 个用户的全部分段
+            return log.query(*window(i % 10))
+
+        rows = [
+            ("旧实现 记录服药", measure(lambda i: legacy_record(legacy_path, f"user{i % num_users}", new_record(i)),
+                                       max(1, runs // 5))),
+            ("旧实现 30天范围查询", measure(lambda i: legacy_query(legacy_path, *window(i)), max(1, runs // 5))),
+            ("日志 记录服药", measure(lambda i: log.append(f"user{i % num_users}", new_record(i)), runs)),
+            ("日志 30天范围查询(冷)", measure(lambda i: IntakeLog(bench_dir).query(*window(i)), runs)),
+            ("日志 30天范围查询(热)", measure(warm_query, runs)),
+            ("日志 全部记录查询(热)", measure(lambda i: log.query(f"user{i % 10}"), runs)),
+        ]
+        print(f"导入旧数据耗时: {import_ms:.0f} ms")
+        print(f"{'场景':<24}{'p50(ms)':>12}{'p99(ms)':>12}")
+        for name, (p50, p99) in rows:
+            print(f"{name:<24}{p50:>12.3f}{p99:>12.3f}")
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式 JSON 增量解析基准测试
+按模拟的大模型输出速率（默认每秒 60 个字符，约合 40 tokens/s）逐段输出一份用药分析 JSON，
+对比"首个条目可展示的时间"与"整段输出结束的时间"，并统计解析器自身的吞吐。
+
+用法: python bench_json_stream.py [每秒字符数] [相互作用条数]
+"""
+
+import sys
+import json
+import time
+
+from json_stream import JsonStreamParser
+
+
+def make_analysis(count):
+    return {
+        "summary": "该用药方案整体风险中等，需关注抗凝药与非甾体抗炎药的合用。",
+        "interactions": [{"drug1": f"药品{i}", "drug2": f"药品{i + 1}", "severity": "中",
+                          "description": "两药合用可能增加不良反应风险，建议错开服用时间并定期复查。"}
+                         for i in range(count)],
+        "warnings": [{"type": "肝肾功能", "severity": "中", "description": "长期服用需定期检查肝肾功能。"}],
+        "suggestions": ["按时按量服药", "如出现不适及时就医"],
+    }
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    text = "```json\n" + json.dumps(make_analysis(count), ensure_ascii=False, indent=2) + "\n```"
+    chunk = 4  # 每个 SSE 增量约 4 个字符
+
+    # 按输出速率计算每个条目闭合的时刻（不实际等待）
+    parser = JsonStreamParser()
+    first = {}
+    for i in range(0, len(text), chunk):
+        at = (i + chunk) / rate
+        for key, _ in parser.feed(text[i:i + chunk]):
+            first.setdefault(key, at)
+    total = len(text) / rate
+    print(f"输出 {len(text)} 个字符，按 {rate:.0f} 字符/秒 整段输出需 {total:.1f} s")
+    for key, at in sorted(first.items(), key=lambda kv: kv[1]):
+        print(f"  首个 {key:<13} 可展示于 {at:5.1f} s")
+
+    # 解析器吞吐：逐段 feed 整份文本
+    rounds = 200
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser = JsonStreamParser()
+        for i in range(0, len(text), chunk):
+            parser.feed(text[i:i + chunk])
+    elapsed = time.perf_counter() - start
+    print(f"解析器: {len(text) * rounds / elapsed / 1e6:.2f} M 字符/秒，"
+          f"每份 {elapsed / rounds * 1000:.2f} ms（json.loads 整段 "
+          f"{timeit_loads(text) * 1000:.3f} ms）")
+
+
+def timeit_loads(text):
+    body = text[text.index('{'):text.rindex('}') + 1]
+    start = time.perf_counter()
+    for _ in range(200):
+        json.loads(body)
+    return (time.perf_counter() - start) / 200
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用药/提醒内存索引基准测试
+在不同的用户规模下对比按档案/状态筛选用药、按ID查找用药的耗时：
+- 旧实现：每次读取并解析整个 medications.json，再在 Python 中逐条过滤
+- 内存索引：MedicationManager 的 (用户, record_id) / (用户, status) 二级索引
+另对比拍照识别出 10 个药品时逐个新增（10 次整文件保存）与 batch_medications（1 次保存）的耗时。
+
+用法: python bench_medication_index.py [用户数,逗号分隔] [每用户用药数] [请求次数]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import statistics
+from datetime import datetime
+
+from medication_management import MedicationManager
+
+
+def build_medications(num_users, per_user):
+    now = datetime.now().isoformat()
+    return {f"user{u}": [{
+        "id": str(uuid.uuid4()), "name": f"药品{i}", "dosage": "1片", "frequency": "每日2次",
+        "record_id": f"r{i % 4}", "status": "active" if i % 3 else "stopped",
+        "created_at": now, "updated_at": now,
+    } for i in range(per_user)] for u in range(num_users)}
+
+
+def legacy_select(path, username, record_id=None, status=None):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    medications = data.get('medications', {}).get(username, [])
+    if status:
+        medications = [m for m in medications if m.get('status') == status]
+    if record_id:
+        medications = [m for m in medications if m.get('record_id') == record_id]
+    return medications
+
+
+def legacy_find(path, username, medication_id):
+    for med in legacy_select(path, username):
+        if med['id'] == medication_id:
+            return med
+    return None
+
+
+def measure(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def bench(num_users, per_user, runs):
+    bench_dir = tempfile.mkdtemp(prefix='bench_medication_index_')
+    try:
+        medications = build_medications(num_users, per_user)
+        path = os.path.join(bench_dir, 'medications.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'medications': medications}, f, ensure_ascii=False, indent=2)
+        manager = MedicationManager(bench_dir)
+        username = f"user{num_users // 2}"
+        medication_id = medications[username][per_user // 2]['id']
+        manager.get_user_medications(username)  # 预热：首次访问构建索引
+
+        legacy_runs = max(1, runs // 10)
+        rows = [
+            ("旧实现 按档案+状态", measure(lambda: legacy_select(path, username, "r1", "active"), legacy_runs)),
+            ("索引 按档案+状态", measure(lambda: manager.get_user_medications(username, "active", "r1"), runs)),
+            ("旧实现 按ID查找", measure(lambda: legacy_find(path, username, medication_id), legacy_runs)),
+            ("索引 按ID查找", measure(lambda: manager.get_medication(username, medication_id), runs)),
+            ("索引 更新(含整文件保存)", measure(lambda: manager.update_medication(
+                username, medication_id, {"notes": "bench"}), max(1, runs // 10))),
+            ("逐个新增10个药品", measure(lambda: [manager.add_medication(username, {"name": f"识别药品{i}"})
+                                            for i in range(10)], max(1, runs // 50))),
+            ("批量新增10个药品", measure(lambda: manager.batch_medications(username, [
+                {"op": "create", "data": {"name": f"识别药品{i}"}} for i in range(10)]), max(1, runs // 50))),
+        ]
+        print(f"\n用户数: {num_users}，每用户用药数: {per_user}（文件 {os.path.getsize(path) / 1024:.0f} KB）")
+        print(f"{'场景':<22}{'p50(ms)':>12}{'p99(ms)':>12}")
+        for name, (p50, p99) in rows:
+            print(f"{name:<22}{p50:>12.3f}{p99:>12.3f}")
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+
+def main():
+    sizes = [int(x) for x in (sys.argv[1] if len(sys.argv) > 1 else '100,1000,10000').split(',')]
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    for size in sizes:
+        bench(size, per_user, runs)
+
+
+if __name__ == '__main__':
+    main()
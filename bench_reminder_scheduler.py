@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药提醒调度基准测试
+构造大量用户提醒（每日/间隔/每周自定义，时间分布在全天各分钟），对比每分钟一次的到期检查：
+- 全量扫描：逐条提醒判断当前分钟是否需要提醒（即客户端 checkReminders 的逻辑搬到服务端）
+- ReminderScheduler：最小堆只弹出到期条目
+
+用法: python bench_reminder_scheduler.py [提醒数] [每用户提醒数]
+"""
+
+import sys
+import time
+import random
+import statistics
+from datetime import datetime, timedelta
+
+from adherence import is_scheduled_on
+from reminder_scheduler import ReminderScheduler
+
+WEEKDAYS = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
+
+
+def build_reminders(total, per_user):
+    created = (datetime.now() - timedelta(days=30)).isoformat()
+    by_user = {}
+    for i in range(total):
+        kind = random.choice(['daily', 'daily', 'interval', 'custom'])
+        reminder = {
+            "id": f"r{i}", "medication_id": f"m{i % 7}", "medication_name": "阿莫西林", "record_id": "",
+            "times": sorted({f"{random.randint(6, 22):02d}:{random.randint(0, 59):02d}"
+                             for _ in range(random.randint(1, 3))}),
+            "reminder_type": kind, "enabled": True, "created_at": created,
+        }
+        if kind == 'interval':
+            reminder["interval_days"] = random.randint(2, 7)
+        elif kind == 'custom':
+            reminder["custom_schedule"] = random.sample(WEEKDAYS, 3)
+        by_user.setdefault(f"user{i // per_user}", []).append(reminder)
+    return by_user
+
+
+def full_scan(by_user, now):
+    current = now.strftime('%H:%M')
+    due = []
+    for username, reminders in by_user.items():
+        for reminder in reminders:
+            if current in reminder['times'] and is_scheduled_on(reminder, now.date()):
+                due.append((username, reminder['id']))
+    return due
+
+
+def measure(fn, runs):
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    random.seed(42)
+    by_user = build_reminders(total, per_user)
+    users = list(by_user)
+    scheduler = ReminderScheduler()
+    # 在明天 07:59 构建，之后逐分钟推进 08:00-08:59（早高峰）
+    base = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    start = time.perf_counter()
+    scheduled = scheduler.build(by_user, now=base + timedelta(hours=7, minutes=59))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    ticks = [base + timedelta(hours=8, minutes=m) for m in range(60)]
+    fired = []
+    rows = [
+        ("全量扫描 每分钟检查", measure(lambda i: full_scan(by_user, ticks[i % len(ticks)]), 5)),
+        ("调度堆 每分钟弹出到期", measure(lambda i: fired.append(len(scheduler.pop_due(ticks[i]))), len(ticks))),
+        ("调度堆 单用户未来60分钟", measure(lambda i: scheduler.due(random.choice(users), 60, now=ticks[-1]), 1000)),
+        ("调度堆 修改提醒", measure(lambda i: scheduler.upsert(random.choice(users), dict(
+            by_user[users[i % len(users)]][0], times=["09:30"]), now=ticks[-1]), 1000)),
+    ]
+    print(f"提醒数: {total}，用户数: {len(users)}，已排期: {scheduled}，构建耗时: {build_ms:.0f} ms")
+    print(f"08:00-09:00 每分钟到期提醒数: 平均 {statistics.mean(fired):.0f}，堆大小: {scheduler.stats()['heap']}")
+    print(f"{'场景':<24}{'p50(ms)':>12}{'p99(ms)':>12}")
+    for name, (p50, p99) in rows:
+        print(f"{name:<24}{p50:>12.3f}{p99:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+存储后端基准测试
+在同一份合成数据上分别使用 JSON 与 SQLite 后端，
+通过 Flask test client 压测热点接口并输出 p50/p99 延迟。
+
+用法: python bench_storage.py [帖子数] [每个接口请求次数]
+"""
+
+import os
+import sys
+import time
+import logging
+import uuid
+import shutil
+import tempfile
+import statistics
+
+BENCH_DIR = tempfile.mkdtemp(prefix='bench_storage_')
+os.environ['DATA_DIR'] = os.path.join(BENCH_DIR, 'boot')
+
+import backend_server
+from data_store import JsonFileStore, SqliteStore, save_json_file
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def build_dataset(data_dir, num_posts, num_users=200):
+    """生成合成数据（用户、档案含报告、社区帖子）并直接写成JSON文件"""
+    users = [f"user{i}" for i in range(num_users)]
+    users_data, records_data = {}, {}
+    for name in users:
+        record_id = uuid.uuid4().hex
+        users_data[name] = {"password_hash": "x", "role": "user", "active_record_id": record_id}
+        records_data[name] = [{
+            "record_id": record_id, "name": name, "age": 30, "gender": "unknown",
+            "reports": [{"report_id": uuid.uuid4().hex, "title": "报告", "content": {"text": "内容" * 200}}
+                        for _ in range(5)],
+        }]
+    posts = [{
+        "id": uuid.uuid4().hex, "author": users[i % num_users], "content": "病情交流内容" * 40,
+        "created_at": f"2025-01-01T00:00:{i % 60:02d}", "like_count": i % 20, "bookmark_count": 0,
+        "comment_count": 0, "tags": ["感冒"], "images": [], "pinned": False,
+    } for i in range(num_posts)]
+    os.makedirs(data_dir, exist_ok=True)
+    save_json_file(os.path.join(data_dir, 'users.json'), {"users": users_data})
+    save_json_file(os.path.join(data_dir, 'records.json'), {"records": records_data})
+    save_json_file(os.path.join(data_dir, 'community.json'), {"posts": posts})
+    return users, [p["id"] for p in posts]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(label, store, users, post_ids, requests_per_endpoint):
+    backend_server.store = store
+    client = backend_server.app.test_client()
+    sessions = {u: backend_server.create_session(u) for u in users}
+
+    def like(i):
+        u = users[i % len(users)]
+        return client.post(f"/api/community/posts/{post_ids[i % len(post_ids)]}/like",
+                           headers={"X-Session-Id": sessions[u]})
+
+    def report(i):
+        u = users[i % len(users)]
+        rid = store.get_user(u)["active_record_id"]
+        return client.post(f"/api/records/{rid}/reports", json={"title": "bench", "content": {"k": i}},
+                           headers={"X-Session-Id": sessions[u]})
+
+    def register(i):
+        return client.post("/api/auth/register", json={"username": f"{label}_new_{i}", "password": "123456"})
+
+    def me(i):
+        return client.get("/api/auth/me", headers={"X-Session-Id": sessions[users[i % len(users)]]})
+
+    print(f"\n[{label}] 帖子数={len(post_ids)} 每接口请求数={requests_per_endpoint}")
+    print(f"{'接口':<28}{'p50(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}")
+    for name, fn in (("POST like", like), ("POST record report", report),
+                     ("POST auth/register", register), ("GET auth/me", me)):
+        samples = []
+        for i in range(requests_per_endpoint):
+            start = time.perf_counter()
+            resp = fn(i)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert resp.status_code < 400, resp.get_data(as_text=True)
+        print(f"{name:<28}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}"
+              f"{statistics.mean(samples):>10.2f}")
+
+
+def main():
+    num_posts = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    requests_per_endpoint = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    try:
+        json_dir = os.path.join(BENCH_DIR, 'json')
+        users, post_ids = build_dataset(json_dir, num_posts)
+        sqlite_store = SqliteStore(os.path.join(BENCH_DIR, 'sqlite', 'medical.db'))
+        sqlite_store.copy_from(JsonFileStore(json_dir))
+        run("json", JsonFileStore(json_dir), users, post_ids, requests_per_endpoint)
+        run("sqlite", sqlite_store, users, post_ids, requests_per_endpoint)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -98,7 +98,7 @@ def check_data_files():
         'data/community.json',
         'data/pre_consultation_pushes.json',
         'data/medications.json',
-        'data/medication_intake_records.json',
+        'data/intake_log',
         'data/medication_reminders.json',
         'data/tcm_archives.json',
     ]
@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+社区帖子索引
+进程内维护的帖子索引，避免每次请求加载全部帖子再排序/打分：
+- FeedIndex：帖子流按 (置顶, 发布时间, id) 有序保存，置顶优先、其次时间倒序；
+  标签倒排索引；游标（keyset）分页，翻页代价 O(log N + limit)
+- TrendingBoard：热度排行，基础热度随点赞/评论/置顶/图片变化增量更新，
+  时间衰减在读取时按需计算，只检查可能进入前 K 名的帖子
+- SearchIndex：帖子内容/作者/评论的倒排索引，中文按单字+二元组切分，BM25 排序
+- CommunityIndex：以上索引的集合，共用一把锁，首次使用时从仓储一次性构建，
+  之后由写接口调用 upsert/remove 增量维护；按帖子的 rev（每次修改递增）丢弃较旧的快照，
+  已删除的帖子记为墓碑，删除后才到达的 upsert 不会把帖子放回索引；
+  多 worker 部署时每次读取前比较帖子集合的版本，其他 worker 写过则整体重建
+- page_comments / CommentPager：单个帖子评论列表的游标分页；CommentPager 按帖子缓存
+  (created_at, id) 有序键，以评论所在分片的版本校验，翻页只需二分查找
+"""
+
+import re
+import json
+import math
+import heapq
+import base64
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+SortKey = Tuple[int, str, str]  # (是否置顶, created_at, id)
+
+
+def encode_cursor(key: SortKey) -> str:
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """解析游标；格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        pinned, created_at, post_id = json.loads(raw.decode('utf-8'))
+        return int(pinned), str(created_at), str(post_id)
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+def comment_count(post: dict) -> int:
+    """帖子评论数：优先使用 comment_count 计数，兼容仍内嵌 comments 的旧格式"""
+    if 'comment_count' in post:
+        return post.get('comment_count') or 0
+    return len(post.get('comments') or [])
+
+
+def _comment_keys(comments: List[dict]) -> Tuple[List[SortKey], List[dict]]:
+    """评论按 (created_at, id) 升序排列，返回 (有序键, 对应的评论)"""
+    keyed = sorted(((0, c.get('created_at') or '', c.get('id') or ''), i) for i, c in enumerate(comments))
+    return [key for key, _ in keyed], [comments[i] for _, i in keyed]
+
+
+def page_comments(comments: List[dict], limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str], bool]:
+    """评论按 (created_at, id) 升序分页，返回 (本页评论, 下一页游标, 是否还有更多)。
+    游标沿用帖子流的格式，评论没有置顶，第一位固定为 0。"""
+    return _page_sorted(*_comment_keys(comments), limit, cursor)
+
+
+def _page_sorted(keys: List[SortKey], comments: List[dict], limit: int,
+                 cursor: Optional[str]) -> Tuple[List[dict], Optional[str], bool]:
+    start = 0
+    if cursor:
+        key = decode_cursor(cursor)
+        start = bisect_left(keys, key)
+        if start < len(keys) and keys[start] == key:
+            start += 1
+    page = comments[start: start + limit]
+    has_more = start + limit < len(comments)
+    next_cursor = encode_cursor(keys[start + len(page) - 1]) if page and has_more else None
+    return page, next_cursor, has_more
+
+
+class CommentPager:
+    """评论分页缓存：按帖子保存有序键与评论（只读），最近使用的 max_posts 个帖子。
+    version(post_id) 为评论所在分片的版本（文件签名/修订号），任何进程写入后变化即重新加载，
+    命中时每页只需 O(log n + limit)，不再为整帖评论重建排序键。"""
+
+    def __init__(self, load, version, max_posts: int = 1024):
+        self._load = load
+        self._version = version
+        self._max_posts = max_posts
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()  # post_id -> (版本, 有序键, 评论)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def page(self, post_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str], bool]:
+        """同 page_comments，返回的评论为副本；游标格式不正确时抛出 ValueError"""
+        version = self._version(post_id)
+        with self._lock:
+            entry = self._entries.get(post_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(post_id)
+                self.hits += 1
+        if entry is None or entry[0] != version:
+            # 先取版本再加载：加载期间有写入时，下次请求版本不一致会重新加载
+            entry = (version,) + _comment_keys(self._load(post_id))
+            with self._lock:
+                self._entries[post_id] = entry
+                self._entries.move_to_end(post_id)
+                while len(self._entries) > self._max_posts:
+                    self._entries.popitem(last=False)
+                self.misses += 1
+        page, next_cursor, has_more = _page_sorted(entry[1], entry[2], limit, cursor)
+        return [dict(c) for c in page], next_cursor, has_more
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"posts": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class FeedIndex:
+    """帖子流有序索引 + 标签倒排索引（升序存储，逆序读取）"""
+
+    def __init__(self, lock=None):
+        self._lock = lock or threading.RLock()
+        self._order: List[SortKey] = []
+        self._by_tag: Dict[str, List[SortKey]] = {}
+        self._keys: Dict[str, Tuple[SortKey, Tuple[str, ...]]] = {}  # id -> (排序键, 标签)
+
+    @staticmethod
+    def sort_key(post: dict) -> SortKey:
+        return (1 if post.get('pinned') else 0, post.get('created_at') or '', post.get('id') or '')
+
+    def build(self, posts: List[dict]) -> None:
+        order, by_tag, keys = [], {}, {}
+        for post in posts:
+            key = self.sort_key(post)
+            tags = tuple(dict.fromkeys(t for t in (post.get('tags') or []) if isinstance(t, str)))
+            order.append(key)
+            for tag in tags:
+                by_tag.setdefault(tag, []).append(key)
+            keys[key[2]] = (key, tags)
+        order.sort()
+        for lst in by_tag.values():
+            lst.sort()
+        with self._lock:
+            self._order, self._by_tag, self._keys = order, by_tag, keys
+
+    def upsert(self, post: dict) -> None:
+        key = self.sort_key(post)
+        tags = tuple(dict.fromkeys(t for t in (post.get('tags') or []) if isinstance(t, str)))
+        with self._lock:
+            old = self._keys.get(key[2])
+            if old == (key, tags):
+                return
+            if old is not None:
+                self._discard(*old)
+            insort(self._order, key)
+            for tag in tags:
+                insort(self._by_tag.setdefault(tag, []), key)
+            self._keys[key[2]] = (key, tags)
+
+    def remove(self, post_id: str) -> None:
+        with self._lock:
+            old = self._keys.pop(post_id, None)
+            if old is not None:
+                self._discard(*old)
+
+    def _discard(self, key: SortKey, tags: Tuple[str, ...]) -> None:
+        self._remove_key(self._order, key)
+        for tag in tags:
+            lst = self._by_tag.get(tag)
+            if lst is not None:
+                self._remove_key(lst, key)
+                if not lst:
+                    del self._by_tag[tag]
+
+    @staticmethod
+    def _remove_key(lst: List[SortKey], key: SortKey) -> None:
+        i = bisect_left(lst, key)
+        if i < len(lst) and lst[i] == key:
+            del lst[i]
+
+    def page(self, limit: int, cursor: Optional[str] = None, offset: int = 0,
+             tag: Optional[str] = None) -> Tuple[List[str], Optional[str], bool]:
+        """返回 (帖子id列表, 下一页游标, 是否还有更多)。
+        提供 cursor 时从游标之后开始；否则兼容旧的 offset 分页（无需排序，仅切片）。
+        """
+        with self._lock:
+            lst = self._by_tag.get(tag, []) if tag else self._order
+            end = bisect_left(lst, decode_cursor(cursor)) if cursor else len(lst) - max(offset, 0)
+            start = max(end - limit, 0)
+            keys = lst[start:max(end, 0)][::-1]
+        next_cursor = encode_cursor(keys[-1]) if keys else None
+        return [k[2] for k in keys], next_cursor, start > 0
+
+    def has_tag(self, post_id: str, tag: str) -> bool:
+        entry = self._keys.get(post_id)
+        return entry is not None and tag in entry[1]
+
+    def iter_ids(self, cursor: Optional[str] = None, tag: Optional[str] = None):
+        """按帖子流顺序从游标之后逐个产出 (id, 游标)，用于需要逐条过滤的场景"""
+        with self._lock:
+            lst = self._by_tag.get(tag, []) if tag else self._order
+            end = bisect_left(lst, decode_cursor(cursor)) if cursor else len(lst)
+            snapshot = lst[:end]
+        for key in reversed(snapshot):
+            yield key[2], encode_cursor(key)
+
+    def __len__(self):
+        return len(self._order)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_hours(dt: datetime) -> float:
+    return (dt - _EPOCH).total_seconds() / 3600.0
+
+
+class TrendingBoard:
+    """热度排行。
+    热度 = 基础热度 × 时间衰减，基础热度 = 点赞×2 + 评论×3 + 有图5 + 置顶10，
+    衰减 = 1 / (1 + 发布小时数 / 24)。
+    帖子按发布日期分桶，桶内按基础热度降序；读取时每个桶的上界为
+    桶内最大基础热度 × 桶内最新帖子的衰减，按上界从大到小合并，
+    上界不超过当前第 K 名时即停止，只需检查少量帖子即可得到精确的前 K 名。
+    """
+
+    BUCKET_HOURS = 24.0
+
+    def __init__(self, lock=None):
+        self._lock = lock or threading.RLock()
+        self._posts: Dict[str, Tuple[int, Optional[float], object]] = {}  # id -> (基础热度, 发布时间(小时), 桶)
+        self._buckets: Dict[object, List[Tuple[int, str]]] = {}  # 桶 -> [(-基础热度, id)] 升序
+
+    @staticmethod
+    def base_heat(post: dict) -> int:
+        like_count = post.get('like_count', 0)
+        has_images = len(post.get('images', []) or []) > 0
+        is_pinned = bool(post.get('pinned'))
+        return like_count * 2 + comment_count(post) * 3 + (5 if has_images else 0) + (10 if is_pinned else 0)
+
+    @staticmethod
+    def decay(age_hours: float) -> float:
+        # 时间衰减：24小时为一个尺度
+        return 1.0 / (1.0 + age_hours / 24.0)
+
+    @staticmethod
+    def created_hours(post: dict) -> Optional[float]:
+        """发布时间（UTC，自纪元起的小时数）；无法解析时为 None，视为刚发布"""
+        try:
+            return _to_hours(datetime.fromisoformat(post.get('created_at') or ''))
+        except (TypeError, ValueError):
+            return None
+
+    def _bucket_of(self, created: Optional[float]):
+        return None if created is None else int(created // self.BUCKET_HOURS)
+
+    def build(self, posts: List[dict]) -> None:
+        entries, buckets = {}, {}
+        for post in posts:
+            created = self.created_hours(post)
+            bucket = self._bucket_of(created)
+            base = self.base_heat(post)
+            entries[post.get('id')] = (base, created, bucket)
+            buckets.setdefault(bucket, []).append((-base, post.get('id')))
+        for lst in buckets.values():
+            lst.sort()
+        with self._lock:
+            self._posts, self._buckets = entries, buckets
+
+    def upsert(self, post: dict) -> None:
+        post_id = post.get('id')
+        created = self.created_hours(post)
+        entry = (self.base_heat(post), created, self._bucket_of(created))
+        with self._lock:
+            old = self._posts.get(post_id)
+            if old == entry:
+                return
+            if old is not None:
+                self._discard(post_id, old)
+            self._posts[post_id] = entry
+            insort(self._buckets.setdefault(entry[2], []), (-entry[0], post_id))
+
+    def remove(self, post_id: str) -> None:
+        with self._lock:
+            old = self._posts.pop(post_id, None)
+            if old is not None:
+                self._discard(post_id, old)
+
+    def _discard(self, post_id: str, entry) -> None:
+        lst = self._buckets.get(entry[2])
+        if lst is None:
+            return
+        i = bisect_left(lst, (-entry[0], post_id))
+        if i < len(lst) and lst[i] == (-entry[0], post_id):
+            del lst[i]
+        if not lst:
+            del self._buckets[entry[2]]
+
+    def top(self, limit: int, hours: Optional[float] = None,
+            now: Optional[datetime] = None) -> List[Tuple[float, str]]:
+        """返回热度前 limit 的 [(热度, id)]，热度降序；hours 为发布时间窗口（小时），None 表示不限"""
+        if limit <= 0:
+            return []
+        now_h = _to_hours(now or datetime.utcnow())
+        window_start = None if hours is None else now_h - hours
+        with self._lock:
+            # 候选堆：(-上界, 桶, 桶内位置, 桶衰减)
+            frontier = []
+            for bucket, lst in self._buckets.items():
+                if bucket is None:
+                    bucket_decay = 1.0
+                else:
+                    bucket_end = (bucket + 1) * self.BUCKET_HOURS
+                    if window_start is not None and bucket_end <= window_start:
+                        continue
+                    bucket_decay = self.decay(max(now_h - bucket_end, 0.0))
+                frontier.append((lst[0][0] * bucket_decay, id(lst), 0, bucket_decay, lst))
+            heapq.heapify(frontier)
+            best = []  # 最小堆：(热度, id)
+            while frontier:
+                neg_bound, _, pos, bucket_decay, lst = heapq.heappop(frontier)
+                if len(best) >= limit and -neg_bound <= best[0][0]:
+                    break
+                neg_base, post_id = lst[pos]
+                created = self._posts[post_id][1]
+                if window_start is None or created is None or created >= window_start:
+                    age = 0.0 if created is None else max(now_h - created, 0.0)
+                    heat = round(-neg_base * self.decay(age), 6)
+                    if len(best) < limit:
+                        heapq.heappush(best, (heat, post_id))
+                    elif heat > best[0][0]:
+                        heapq.heapreplace(best, (heat, post_id))
+                if pos + 1 < len(lst):
+                    heapq.heappush(frontier, (lst[pos + 1][0] * bucket_decay, id(lst), pos + 1, bucket_decay, lst))
+        return sorted(best, key=lambda x: x[0], reverse=True)
+
+    def __len__(self):
+        return len(self._posts)
+
+
+_CJK_CHAR = r'\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'[{_CJK_CHAR}]+|[a-z0-9]+')
+_CJK_RE = re.compile(f'[{_CJK_CHAR}]')
+
+
+def _runs(text: str) -> List[str]:
+    return _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').lower())
+
+
+def tokenize(text: str) -> List[str]:
+    """建索引用切分：中文连续片段产出单字与相邻二元组，字母数字按整词"""
+    tokens = []
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def query_terms(text: str) -> List[str]:
+    """查询用切分：中文片段只取二元组（单字片段取单字），去重"""
+    terms = []
+    for run in _runs(text):
+        if _CJK_RE.match(run) and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    """帖子全文倒排索引，BM25 排序。
+    字段加权计入词频：作者 ×2、内容 ×1、评论 ×0.5；
+    查询的所有词都出现才算命中（与原先的子串匹配语义一致）。
+    评论正文通过 load_comments(post_id) 读取（评论已不内嵌在帖子中），
+    仅在评论数变化时才重新读取并分析。
+    每个词除 {id: 词频} 外另存一份按 BM25 词项得分降序的列表；avgdl 在构建时固定，
+    偏离超过 25% 时整体重算。查询按最短倒排表的得分顺序扫描，
+    当 "当前得分 + 其他词的最大得分" 已不可能超过第 K 名时提前结束，常见词也只需扫描少量帖子。
+    """
+
+    K1 = 1.2
+    B = 0.75
+    FIELD_WEIGHTS = (('author', 2.0), ('content', 1.0), ('comments', 0.5))
+
+    def __init__(self, lock=None, load_comments=None):
+        self._lock = lock or threading.RLock()
+        self._load_comments = load_comments
+        self._postings: Dict[str, Dict[str, float]] = {}  # 词 -> {id: 加权词频}
+        self._ranked: Dict[str, List[Tuple[float, str]]] = {}  # 词 -> [(-词项得分, id)] 升序
+        self._docs: Dict[str, Tuple[tuple, float, Tuple[str, ...]]] = {}  # id -> (文本签名, 文档长度, 词表)
+        self._total_len = 0.0
+        self._avgdl = 1.0
+
+    @staticmethod
+    def _signature(post: dict) -> tuple:
+        return post.get('author'), post.get('content'), comment_count(post)
+
+    def _comments(self, post: dict) -> List[dict]:
+        if 'comments' in post or self._load_comments is None:
+            return post.get('comments') or []
+        return self._load_comments(post.get('id')) if comment_count(post) else []
+
+    def _analyze(self, post: dict) -> Tuple[Dict[str, float], float]:
+        comments = ' '.join(c.get('content', '') for c in self._comments(post) if isinstance(c, dict))
+        values = {'author': post.get('author') or '', 'content': post.get('content') or '', 'comments': comments}
+        tf: Dict[str, float] = {}
+        length = 0.0
+        for name, weight in self.FIELD_WEIGHTS:
+            tokens = tokenize(values[name])
+            length += weight * len(tokens)
+            for token in tokens:
+                tf[token] = tf.get(token, 0.0) + weight
+        return tf, length
+
+    def _impact(self, freq: float, length: float) -> float:
+        return freq * (self.K1 + 1) / (freq + self.K1 * (1 - self.B + self.B * length / self._avgdl))
+
+    def build(self, posts: List[dict]) -> None:
+        analyzed = [(post.get('id'), self._signature(post)) + self._analyze(post) for post in posts]
+        with self._lock:
+            self._postings, self._docs = {}, {}
+            self._total_len = sum(a[3] for a in analyzed)
+            self._avgdl = (self._total_len / len(analyzed)) if analyzed else 1.0
+            for post_id, signature, tf, length in analyzed:
+                for token, freq in tf.items():
+                    self._postings.setdefault(token, {})[post_id] = freq
+                self._docs[post_id] = (signature, length, tuple(tf))
+            self._rerank()
+
+    def _rerank(self) -> None:
+        self._avgdl = (self._total_len / len(self._docs)) if self._docs else 1.0
+        docs = self._docs
+        self._ranked = {
+            token: sorted((-self._impact(freq, docs[pid][1]), pid) for pid, freq in posting.items())
+            for token, posting in self._postings.items()
+        }
+
+    def _maybe_rerank(self) -> None:
+        if self._docs:
+            drift = (self._total_len / len(self._docs)) / self._avgdl
+            if drift < 0.8 or drift > 1.25:
+                self._rerank()
+
+    def upsert(self, post: dict) -> None:
+        post_id = post.get('id')
+        signature = self._signature(post)
+        with self._lock:
+            old = self._docs.get(post_id)
+            if old is not None and old[0] == signature:
+                return
+        tf, length = self._analyze(post)
+        with self._lock:
+            self._remove(post_id)
+            for token, freq in tf.items():
+                self._postings.setdefault(token, {})[post_id] = freq
+                insort(self._ranked.setdefault(token, []), (-self._impact(freq, length), post_id))
+            self._docs[post_id] = (signature, length, tuple(tf))
+            self._total_len += length
+            self._maybe_rerank()
+
+    def remove(self, post_id: str) -> None:
+        with self._lock:
+            self._remove(post_id)
+            self._maybe_rerank()
+
+    def _remove(self, post_id: str) -> None:
+        old = self._docs.pop(post_id, None)
+        if old is None:
+            return
+        self._total_len -= old[1]
+        for token in old[2]:
+            posting = self._postings.get(token)
+            if posting is None or post_id not in posting:
+                continue
+            key = (-self._impact(posting.pop(post_id), old[1]), post_id)
+            ranked = self._ranked[token]
+            i = bisect_left(ranked, key)
+            if i < len(ranked) and ranked[i] == key:
+                del ranked[i]
+            if not posting:
+                del self._postings[token]
+                del self._ranked[token]
+
+    def search(self, query: str, limit: int, offset: int = 0, accept=None) -> Tuple[List[Tuple[float, str]], bool]:
+        """返回 ([(得分, id)], 是否还有更多)，得分降序；accept(id) 为 False 的帖子被过滤"""
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+        want = offset + limit + 1
+        with self._lock:
+            if not all(t in self._postings for t in terms):
+                return [], False
+            terms.sort(key=lambda t: len(self._postings[t]))
+            n = len(self._docs)
+            idf = {t: math.log(1 + (n - len(self._postings[t]) + 0.5) / (len(self._postings[t]) + 0.5))
+                   for t in terms}
+            driver, others = terms[0], terms[1:]
+            other_postings = [(idf[t], self._postings[t]) for t in others]
+            rest_max = sum(idf[t] * -self._ranked[t][0][0] for t in others)
+            best = []  # 最小堆：(得分, id)
+            for neg_impact, post_id in self._ranked[driver]:
+                head = idf[driver] * -neg_impact
+                if len(best) >= want and head + rest_max <= best[0][0]:
+                    break
+                if not all(post_id in p for _w, p in other_postings):
+                    continue
+                if accept is not None and not accept(post_id):
+                    continue
+                length = self._docs[post_id][1]
+                score = round(head + sum(w * self._impact(p[post_id], length) for w, p in other_postings), 6)
+                if len(best) < want:
+                    heapq.heappush(best, (score, post_id))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, post_id))
+        ranked = sorted(best, reverse=True)
+        return ranked[offset:offset + limit], len(ranked) > offset + limit
+
+    def __len__(self):
+        return len(self._docs)
+
+
+class CommunityIndex:
+    """社区索引集合：帖子流 + 热度排行 + 全文检索，共用一把锁。
+    首次使用时以 load() 返回的全部帖子构建；构建期间持有锁，
+    并发的 upsert/remove 会等待构建完成后再应用。
+    写接口在仓储修改返回后、锁外调用 upsert，并发请求的快照可能乱序到达：
+    rev 小于已收录版本的快照直接丢弃，remove 过的帖子 ID（不会复用）不再接受 upsert。
+    索引只随本进程的写入更新：ensure() 传入 version/written_here 时，
+    若集合版本的变化中有不是本进程写入的（其他 worker 发帖、点赞、评论、删除），则重新构建。
+    """
+
+    def __init__(self, load_comments=None):
+        self._lock = threading.RLock()
+        self.feed = FeedIndex(self._lock)
+        self.trending = TrendingBoard(self._lock)
+        self.search = SearchIndex(self._lock, load_comments=load_comments)
+        self.ready = False
+        self.rebuilds = 0
+        self._version = None
+        self._revs: Dict[str, int] = {}
+        self._removed = set()
+
+    def ensure(self, load, version=None, written_here=None) -> None:
+        """version() 返回帖子集合的当前版本，written_here(旧版本, 新版本) 判断其间是否只有本进程的写入"""
+        with self._lock:
+            current = version() if version is not None else None  # 先取版本再加载，加载期间的写入留到下次重建
+            if self.ready and (current == self._version
+                               or (written_here is not None and written_here(self._version, current))):
+                self._version = current
+                return
+            posts = [p for p in load() if p.get('id') not in self._removed]
+            self._revs = {p.get('id'): p.get('rev', 0) for p in posts}
+            self.feed.build(posts)
+            self.trending.build(posts)
+            self.search.build(posts)
+            if self.ready:
+                self.rebuilds += 1
+            self._version = current
+            self.ready = True
+
+    def upsert(self, post: dict) -> None:
+        post_id, rev = post.get('id'), post.get('rev', 0)
+        with self._lock:
+            if post_id in self._removed or rev < self._revs.get(post_id, -1):
+                return
+            self._revs[post_id] = rev
+            if self.ready:
+                self.feed.upsert(post)
+                self.trending.upsert(post)
+                self.search.upsert(post)
+
+    def remove(self, post_id: str) -> None:
+        with self._lock:
+            self._removed.add(post_id)
+            self._revs.pop(post_id, None)
+            if self.ready:
+                self.feed.remove(post_id)
+                self.trending.remove(post_id)
+                self.search.remove(post_id)
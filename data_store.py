@@ -0,0 +1,1022 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据存储层
+为用户、健康档案、社区帖子及评论、点赞/收藏、预问诊推送、中医档案提供统一的仓储接口。
+支持两种后端：
+- json：沿用 data/*.json 文件（默认，兼容现有数据）
+- sqlite：单文件 SQLite（WAL 模式），按行读写，避免整文件解析/重写
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX 跨进程文件锁
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt  # Windows 跨进程文件锁
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# mutate 回调返回该对象表示删除文档
+DELETE = object()
+
+# 每个集合保留的本进程写入记录条数（written_here 据此区分本进程与其他进程的写入）
+_LINEAGE_SIZE = 4096
+
+# 帖子上冗余保存的最新评论条数（comment_preview），帖子流预览无需读取评论集合
+COMMENT_PREVIEW_SIZE = 3
+
+
+class CollectionSpec:
+    """集合定义：对应的JSON文件及其内部结构"""
+
+    def __init__(self, filename: str, root: Optional[str], key_field: Optional[str], owned: bool = False,
+                 shards: int = 1):
+        self.filename = filename
+        self.root = root            # 文件内的根键；None 表示文件本身就是列表
+        self.key_field = key_field  # 列表内文档的主键字段；None 表示容器为 {key: doc} 字典
+        self.owned = owned          # 是否按所属用户分组（{owner: [doc, ...]}）
+        # JSON 后端按主键哈希拆分为多个文件（仅支持 {key: doc} 字典集合），写入只重写所在分片
+        self.shards = shards
+        assert shards == 1 or (key_field is None and not owned and root is not None)
+
+    def shard_of(self, key: str) -> int:
+        return 0 if self.shards == 1 else zlib.crc32(key.encode('utf-8')) % self.shards
+
+    def shard_filename(self, shard: int) -> str:
+        if self.shards == 1:
+            return self.filename
+        stem, ext = os.path.splitext(self.filename)
+        return f"{stem}_{shard:02d}{ext}"
+
+    def empty_file(self):
+        if self.root is None:
+            return []
+        return {self.root: {} if (self.owned or self.key_field is None) else []}
+
+
+COLLECTIONS = {
+    'users': CollectionSpec('users.json', 'users', None),
+    'records': CollectionSpec('records.json', 'records', 'record_id', owned=True),
+    'posts': CollectionSpec('community.json', 'posts', 'id'),
+    # 按用户的点赞/收藏索引：{username: {"likes": {post_id: 时间}, "bookmarks": {post_id: 时间}}}
+    'reactions': CollectionSpec('community_reactions.json', 'reactions', None, shards=64),
+    # 帖子评论：{post_id: [评论, ...]}，按 created_at 升序追加
+    'comments': CollectionSpec('community_comments.json', 'comments', None, shards=64),
+    'pushes': CollectionSpec('pre_consultation_pushes.json', 'pushes', 'push_id'),
+    'tcm_archives': CollectionSpec('tcm_archives.json', None, 'id'),
+}
+
+
+def _clone(obj):
+    """复制JSON结构（dict/list 递归复制，标量共享），比 copy.deepcopy 快"""
+    if isinstance(obj, dict):
+        return {k: _clone(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_clone(v) for v in obj]
+    return obj
+
+
+class JsonView(Mapping):
+    """JSON 对象的只读视图：直接引用共享的解析结果，不复制；
+    取出的嵌套 dict/list 同样包装为只读视图，标量原样返回"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return _view(self._data[key])
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        return self._data == (other._data if isinstance(other, (JsonView, JsonListView)) else other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"JsonView({self._data!r})"
+
+
+class JsonListView(Sequence):
+    """JSON 数组的只读视图，规则同 JsonView"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: list):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return JsonListView(self._data[index])
+        return _view(self._data[index])
+
+    def __iter__(self):
+        return map(_view, self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        return self._data == (other._data if isinstance(other, (JsonView, JsonListView)) else other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"JsonListView({self._data!r})"
+
+
+def _view(obj):
+    if isinstance(obj, dict):
+        return JsonView(obj)
+    if isinstance(obj, list):
+        return JsonListView(obj)
+    return obj
+
+
+class JsonFileCache:
+    """JSON 文件解析结果的进程内缓存。
+    以 os.stat 的 (mtime_ns, size, inode) 作为文件签名，签名不变时直接复用已解析对象；
+    save_json_file 采用 tmp + os.replace，每次写入都会产生新 inode，外部进程改写同样能被识别。
+    缓存中的对象为共享只读数据，调用方不得原地修改。
+    """
+
+    def __init__(self):
+        self._entries = {}  # path -> (signature, data)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, path):
+        sig = self._signature(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == sig:
+            self.hits += 1
+            return entry[1]
+        # 先取签名再解析：解析期间文件若被替换，下次读取时签名不一致会重新加载
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with self._lock:
+            self._entries[path] = (sig, data)
+            self.misses += 1
+        return data
+
+    def prime(self, path, data):
+        """写入后直接以新对象更新缓存，省去下一次解析"""
+        with self._lock:
+            self._entries[path] = (self._signature(path), data)
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def stats(self):
+        return {"files": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+json_cache = JsonFileCache()
+
+
+def load_json_file(path, mutable: bool = False):
+    """读取JSON文件（解析结果经 json_cache 缓存）。默认返回共享缓存的只读视图，不复制；
+    需要修改后再保存时传 mutable=True，返回可自由修改的副本"""
+    data = json_cache.get(path)
+    return _clone(data) if mutable else _view(data)
+
+
+def save_json_file(path, data, fsync: bool = False):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # 调用方可能在保存后继续修改 data，因此只失效缓存，不直接缓存该对象
+    json_cache.invalidate(path)
+
+
+class FileLock:
+    """可重入的文件锁：进程内用 RLock 串行化线程，跨进程用 lock 文件上的
+    fcntl.flock（Windows 下为 msvcrt.locking），多 worker 部署时同一数据文件的
+    读-改-写不会交叉。"""
+
+    def __init__(self, path: str):
+        self.lock_path = path + '.lock'
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._acquire_os_lock()
+            except Exception:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            self._release_os_lock()
+        self._thread_lock.release()
+        return False
+
+    def _acquire_os_lock(self):
+        if fcntl is None and msvcrt is None:
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK 重试10次后仍失败会抛错，继续等待
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def _release_os_lock(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _PendingMutation:
+    __slots__ = ('key', 'fn', 'owner', 'result', 'error', 'done', 'lead')
+
+    def __init__(self, key, fn, owner):
+        self.key = key
+        self.fn = fn
+        self.owner = owner
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self.lead = False
+
+
+class WriteBatcher:
+    """写合并队列：窗口期内到达的修改由一个"领头"线程合并成一次落盘。
+    第一个到达的线程等待 window 秒收集同批修改后统一执行 flush；
+    flush 期间新到达的修改会移交给其中一个等待线程作为下一批的领头。
+    """
+
+    def __init__(self, flush: Callable[[List[_PendingMutation]], None], window: float):
+        self._flush = flush
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: List[_PendingMutation] = []
+        self._leader_active = False
+        self.batches = 0
+        self.mutations = 0
+
+    def submit(self, op: _PendingMutation):
+        with self._lock:
+            self._pending.append(op)
+            lead = not self._leader_active
+            self._leader_active = True
+        if lead:
+            if self.window > 0:
+                time.sleep(self.window)
+            self._run_batch()
+        else:
+            op.done.wait()
+            if op.lead:
+                self._run_batch()
+        if op.error is not None:
+            raise op.error
+        return op.result
+
+    def _run_batch(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        try:
+            self._flush(batch)
+        except Exception as e:  # flush 内部异常兜底，保证等待者被唤醒
+            for op in batch:
+                if op.error is None:
+                    op.error = e
+        finally:
+            self.batches += 1
+            self.mutations += len(batch)
+            with self._lock:
+                if self._pending:
+                    successor = self._pending[0]
+                    successor.lead = True
+                    successor.done.set()
+                else:
+                    self._leader_active = False
+            for op in batch:
+                op.done.set()
+
+
+class DataStore:
+    """仓储接口。
+    底层原语按 (collection, owner, key) 定位单个文档；
+    mutate 为原子的读-改-写：回调收到文档副本（不存在时为 None），
+    返回新文档则写入，返回 None 表示不修改，返回 DELETE 表示删除。
+    """
+
+    backend = 'base'
+
+    # ---------- 底层原语（由具体后端实现） ----------
+    def items(self, collection: str, owner: Optional[str] = None) -> List[Tuple[str, dict]]:
+        raise NotImplementedError
+
+    def owners(self, collection: str) -> List[str]:
+        raise NotImplementedError
+
+    def get(self, collection: str, key: str, owner: Optional[str] = None) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put(self, collection: str, key: str, doc: dict, owner: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, collection: str, key: str, owner: Optional[str] = None) -> bool:
+        raise NotImplementedError
+
+    def mutate(self, collection: str, key: str, fn: Callable[[Optional[dict]], object],
+               owner: Optional[str] = None):
+        raise NotImplementedError
+
+    def mutate_many(self, collection: str, fns: Dict[str, Callable[[Optional[dict]], object]],
+                    owner: Optional[str] = None) -> Dict[str, object]:
+        """批量 mutate：同一集合的多个文档在一次写入（事务）中完成，返回 {key: 结果}"""
+        return {key: self.mutate(collection, key, fn, owner=owner) for key, fn in fns.items()}
+
+    def close(self) -> None:
+        pass
+
+    # ---------- 版本：发现其他进程的写入 ----------
+    def version(self, collection: str, key: Optional[str] = None):
+        """集合的当前版本（JSON 为文件签名，SQLite 为修订号），任何进程写入后都会变化；不支持时返回 None。
+        分片集合给出 key 时，JSON 后端只取该文档所在分片的签名"""
+        return None
+
+    def _record_write(self, collection: str, before, after) -> None:
+        """记录本进程的一次写入使集合版本由 before 变为 after（须在写锁内取得两端版本）"""
+        lineage = self._lineage.setdefault(collection, OrderedDict())
+        lineage[before] = after
+        if len(lineage) > _LINEAGE_SIZE:
+            lineage.popitem(last=False)
+
+    def written_here(self, collection: str, since, current) -> bool:
+        """版本由 since 变为 current 的每一步是否都是本进程的写入；
+        为 False 时说明其他进程（worker）写过该集合，进程内派生的索引需要重建"""
+        lineage = getattr(self, '_lineage', {}).get(collection) or {}
+        version = since
+        for _ in range(len(lineage)):
+            if version == current:
+                return True
+            version = lineage.get(version)
+            if version is None:
+                return False
+        return version == current
+
+    # ---------- 用户 ----------
+    def get_user(self, username: str) -> Optional[dict]:
+        return self.get('users', username)
+
+    def list_users(self) -> Dict[str, dict]:
+        return dict(self.items('users'))
+
+    def put_user(self, username: str, user: dict) -> None:
+        self.put('users', username, user)
+
+    def update_user(self, username: str, fn):
+        return self.mutate('users', username, fn)
+
+    # ---------- 健康档案 ----------
+    def list_records(self, username: str) -> List[dict]:
+        return [doc for _key, doc in self.items('records', owner=username)]
+
+    def get_record(self, username: str, record_id: str) -> Optional[dict]:
+        return self.get('records', record_id, owner=username)
+
+    def put_record(self, username: str, record: dict) -> None:
+        self.put('records', record['record_id'], record, owner=username)
+
+    def delete_record(self, username: str, record_id: str) -> bool:
+        return self.delete('records', record_id, owner=username)
+
+    def update_record(self, username: str, record_id: str, fn):
+        return self.mutate('records', record_id, fn, owner=username)
+
+    # ---------- 社区帖子 ----------
+    def list_posts(self) -> List[dict]:
+        return [doc for _key, doc in self.items('posts')]
+
+    def get_post(self, post_id: str) -> Optional[dict]:
+        return self.get('posts', post_id)
+
+    def put_post(self, post: dict) -> None:
+        self.put('posts', post['id'], post)
+
+    def delete_post(self, post_id: str) -> bool:
+        return self.delete('posts', post_id)
+
+    def update_post(self, post_id: str, fn):
+        return self.mutate('posts', post_id, fn)
+
+    # ---------- 评论 ----------
+    def get_comments(self, post_id: str) -> List[dict]:
+        return self.get('comments', post_id) or []
+
+    def update_comments(self, post_id: str, fn):
+        return self.mutate('comments', post_id, fn)
+
+    def delete_comments(self, post_id: str) -> bool:
+        return self.delete('comments', post_id)
+
+    # ---------- 点赞/收藏 ----------
+    def get_reactions(self, username: str) -> dict:
+        return self.get('reactions', username) or {"likes": {}, "bookmarks": {}}
+
+    def update_reactions(self, username: str, fn):
+        return self.mutate('reactions', username, fn)
+
+    # ---------- 预问诊推送 ----------
+    def list_pushes(self) -> List[dict]:
+        return [doc for _key, doc in self.items('pushes')]
+
+    def put_push(self, push: dict) -> None:
+        self.put('pushes', push['push_id'], push)
+
+    def update_push(self, push_id: str, fn):
+        return self.mutate('pushes', push_id, fn)
+
+    # ---------- 中医档案 ----------
+    def list_tcm_archives(self) -> List[dict]:
+        return [doc for _key, doc in self.items('tcm_archives')]
+
+    def get_tcm_archive(self, archive_id: str) -> Optional[dict]:
+        return self.get('tcm_archives', archive_id)
+
+    def put_tcm_archive(self, archive: dict) -> None:
+        self.put('tcm_archives', archive['id'], archive)
+
+    def update_tcm_archive(self, archive_id: str, fn):
+        return self.mutate('tcm_archives', archive_id, fn)
+
+    # ---------- 迁移 ----------
+    def copy_from(self, other: 'DataStore') -> Dict[str, int]:
+        """将另一个存储中的全部文档按原顺序复制到当前存储，返回各集合的文档数"""
+        counts = {}
+        for name, spec in COLLECTIONS.items():
+            count = 0
+            owners = other.owners(name) if spec.owned else [None]
+            for owner in owners:
+                for key, doc in other.items(name, owner=owner):
+                    self.put(name, key, doc, owner=owner)
+                    count += 1
+            counts[name] = count
+        return counts
+
+
+class JsonFileStore(DataStore):
+    """JSON 文件后端：与历史数据格式完全兼容。
+    读取走 json_cache，只复制被返回的文档；写入采用写时复制：
+    仅浅拷贝外层容器、深拷贝目标文档后修改，再整体替换缓存，
+    其他线程手里的旧快照不受影响。
+    同一文件的写操作经 WriteBatcher 合并，在文件锁内一次读-改-写并 fsync 落盘。
+    """
+
+    backend = 'json'
+
+    def __init__(self, data_dir: str, coalesce_window: Optional[float] = None):
+        self.data_dir = data_dir
+        if coalesce_window is None:
+            coalesce_window = float(os.getenv('JSON_WRITE_COALESCE_MS') or 2) / 1000.0
+        # 以文件为单位加锁与合并写入：未分片的集合为集合名，分片集合为 "集合名.分片号"
+        self._file_locks = {}
+        self._batchers = {}
+        for name, spec in COLLECTIONS.items():
+            for shard in range(spec.shards):
+                file_id = self._file_id(name, shard)
+                self._file_locks[file_id] = FileLock(self._path(spec, shard))
+                self._batchers[file_id] = WriteBatcher(
+                    lambda batch, _name=name, _shard=shard: self._flush(_name, batch, shard=_shard),
+                    coalesce_window,
+                )
+        # (collection, owner) -> (容器对象, {key: 下标})，容器对象变化即重建
+        self._key_index = {}
+        self._lineage = {}
+        self._ensure_files()
+
+    def _ensure_files(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        for name, spec in COLLECTIONS.items():
+            if spec.shards > 1:
+                continue  # 分片文件在首次写入时创建
+            path = self._path(spec)
+            with self._file_locks[name]:
+                if not os.path.exists(path):
+                    save_json_file(path, spec.empty_file(), fsync=True)
+
+    @staticmethod
+    def _file_id(collection: str, shard: int) -> str:
+        return collection if COLLECTIONS[collection].shards == 1 else f"{collection}.{shard:02d}"
+
+    def _path(self, spec: CollectionSpec, shard: int = 0) -> str:
+        return os.path.join(self.data_dir, spec.shard_filename(shard))
+
+    @staticmethod
+    def _signature(path: str):
+        try:
+            return JsonFileCache._signature(path)
+        except FileNotFoundError:
+            return None
+
+    def version(self, collection, key=None):
+        spec = COLLECTIONS[collection]
+        if spec.shards == 1:
+            return self._signature(self._path(spec))
+        if key is not None:
+            return self._signature(self._path(spec, spec.shard_of(key)))
+        return tuple(self._signature(self._path(spec, shard)) for shard in range(spec.shards))
+
+    def _load(self, spec: CollectionSpec, shard: int = 0):
+        path = self._path(spec, shard)
+        if spec.shards > 1 and not os.path.exists(path):
+            return spec.empty_file()
+        return json_cache.get(path)
+
+    @staticmethod
+    def _empty_node(spec: CollectionSpec):
+        return {} if (spec.owned or spec.key_field is None) else []
+
+    def _container(self, spec: CollectionSpec, data, owner: Optional[str]):
+        """返回承载文档的容器（只读）：users 为 dict，其余为 list"""
+        node = data if spec.root is None else (data.get(spec.root) or self._empty_node(spec))
+        if spec.owned:
+            node = node.get(owner) or []
+        return node
+
+    def _read(self, collection: str, shard: int = 0):
+        spec = COLLECTIONS[collection]
+        return spec, self._load(spec, shard)
+
+    def _index_of(self, collection: str, owner: Optional[str], container: list, key: str) -> Optional[int]:
+        spec = COLLECTIONS[collection]
+        cached = self._key_index.get((collection, owner))
+        if cached is None or cached[0] is not container:
+            cached = (container, {doc.get(spec.key_field): i for i, doc in enumerate(container)})
+            self._key_index[(collection, owner)] = cached
+        return cached[1].get(key)
+
+    def _carry_index(self, collection: str, owner: Optional[str], old: list, new: list):
+        """容器被复制（下标不变）时沿用已建好的主键索引"""
+        cached = self._key_index.get((collection, owner))
+        if cached is not None and cached[0] is old:
+            self._key_index[(collection, owner)] = (new, dict(cached[1]))
+
+    def items(self, collection, owner=None):
+        spec = COLLECTIONS[collection]
+        result = []
+        for shard in range(spec.shards):
+            container = self._container(spec, self._load(spec, shard), owner)
+            if spec.key_field is None:
+                result.extend((key, _clone(doc)) for key, doc in container.items())
+            else:
+                result.extend((doc.get(spec.key_field), _clone(doc)) for doc in container)
+        return result
+
+    def owners(self, collection):
+        spec, data = self._read(collection)
+        if not spec.owned:
+            return []
+        return list((data.get(spec.root) or {}).keys())
+
+    def get(self, collection, key, owner=None):
+        spec = COLLECTIONS[collection]
+        spec, data = self._read(collection, spec.shard_of(key))
+        container = self._container(spec, data, owner)
+        if spec.key_field is None:
+            doc = container.get(key)
+        else:
+            idx = self._index_of(collection, owner, container, key)
+            doc = container[idx] if idx is not None else None
+        return _clone(doc) if doc is not None else None
+
+    def put(self, collection, key, doc, owner=None):
+        self.mutate(collection, key, lambda _old: doc, owner=owner)
+
+    def delete(self, collection, key, owner=None):
+        deleted = self.mutate(collection, key, lambda old: DELETE if old is not None else None, owner=owner)
+        return deleted is DELETE
+
+    def mutate(self, collection, key, fn, owner=None):
+        file_id = self._file_id(collection, COLLECTIONS[collection].shard_of(key))
+        return self._batchers[file_id].submit(_PendingMutation(key, fn, owner))
+
+    def mutate_many(self, collection, fns, owner=None):
+        """每个文件一次写入；分片集合只保证单个分片内的原子性"""
+        spec = COLLECTIONS[collection]
+        ops = [_PendingMutation(key, fn, owner) for key, fn in fns.items()]
+        by_shard: Dict[int, List[_PendingMutation]] = {}
+        for op in ops:
+            by_shard.setdefault(spec.shard_of(op.key), []).append(op)
+        for shard, batch in sorted(by_shard.items()):
+            self._flush(collection, batch, atomic=True, shard=shard)
+        for op in ops:
+            if op.error is not None:
+                raise op.error
+        return {op.key: op.result for op in ops}
+
+    def write_stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"batches": b.batches, "mutations": b.mutations} for name, b in self._batchers.items()}
+
+    def _flush(self, collection: str, batch: List[_PendingMutation], atomic: bool = False, shard: int = 0) -> None:
+        """在文件锁内依次应用一批修改，最多一次 fsync 落盘；
+        atomic 为 True 时任一修改出错则整批不落盘"""
+        spec = COLLECTIONS[collection]
+        path = self._path(spec, shard)
+        with self._file_locks[self._file_id(collection, shard)]:
+            before = self._signature(path)
+            data = self._load(spec, shard)
+            new_data = self._apply_batch(collection, spec, data, batch)
+            if new_data is None:
+                return
+            if atomic and any(op.error is not None for op in batch):
+                for op in batch:
+                    op.result = None
+                return
+            try:
+                save_json_file(path, new_data, fsync=True)
+            except Exception as e:
+                self._key_index = {}
+                for op in batch:
+                    if op.error is None and op.result is not None:
+                        op.result, op.error = None, e
+                return
+            json_cache.prime(path, new_data)
+            if spec.shards == 1:  # 分片集合的版本由多个文件组成，不记录
+                self._record_write(collection, before, self._signature(path))
+
+    def _apply_batch(self, collection, spec, data, batch):
+        new_data = None
+        copied = {}  # owner -> 本批次已复制的容器
+        for op in batch:
+            try:
+                current = self._container(spec, data if new_data is None else new_data, op.owner)
+                if spec.key_field is None:
+                    idx = None
+                    old = current.get(op.key)
+                else:
+                    idx = self._index_of(collection, op.owner, current, op.key)
+                    old = current[idx] if idx is not None else None
+                new = op.fn(_clone(old) if old is not None else None)
+                if new is None or (new is DELETE and old is None):
+                    continue
+                if new_data is None:
+                    new_data = list(data) if spec.root is None else dict(data)
+                    if spec.root is not None:
+                        new_data[spec.root] = type(self._empty_node(spec))(data.get(spec.root) or self._empty_node(spec))
+                container = copied.get(op.owner)
+                if container is None:
+                    if spec.root is None:
+                        container = new_data
+                    elif spec.owned:
+                        container = list(new_data[spec.root].get(op.owner) or [])
+                        new_data[spec.root][op.owner] = container
+                    else:
+                        container = new_data[spec.root]
+                    if spec.key_field is not None:
+                        self._carry_index(collection, op.owner, current, container)
+                    copied[op.owner] = container
+                if new is DELETE:
+                    if spec.key_field is None:
+                        container.pop(op.key, None)
+                    else:
+                        container.pop(idx)
+                        self._key_index.pop((collection, op.owner), None)
+                else:
+                    # 调用方可能继续修改返回值，缓存中保存独立副本
+                    stored = _clone(new)
+                    if spec.key_field is None:
+                        container[op.key] = stored
+                    elif idx is None:
+                        container.append(stored)
+                        cached = self._key_index.get((collection, op.owner))
+                        if cached is not None and cached[0] is container:
+                            cached[1][op.key] = len(container) - 1
+                    else:
+                        container[idx] = stored
+                op.result = new
+            except Exception as e:
+                op.error = e
+        return new_data
+
+
+class SqliteStore(DataStore):
+    """SQLite 后端：所有集合存放在一张文档表中，按行读写。
+    每个线程持有独立连接；写操作使用 BEGIN IMMEDIATE 保证读-改-写原子性。
+    """
+
+    backend = 'sqlite'
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            collection TEXT NOT NULL,
+            owner TEXT NOT NULL DEFAULT '',
+            key TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            PRIMARY KEY (collection, owner, key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_order ON documents(collection, owner, seq);
+        CREATE INDEX IF NOT EXISTS idx_documents_seq ON documents(seq);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+        self._lineage = {}
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _owner(owner: Optional[str]) -> str:
+        return owner or ''
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self._conn().execute(
+            'INSERT INTO meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, value),
+        )
+
+    def is_empty(self) -> bool:
+        return self._conn().execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None
+
+    def items(self, collection, owner=None):
+        rows = self._conn().execute(
+            'SELECT key, body FROM documents WHERE collection = ? AND owner = ? ORDER BY seq',
+            (collection, self._owner(owner)),
+        ).fetchall()
+        return [(key, json.loads(body)) for key, body in rows]
+
+    def owners(self, collection):
+        rows = self._conn().execute(
+            'SELECT owner FROM documents WHERE collection = ? GROUP BY owner ORDER BY MIN(seq)',
+            (collection,),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def get(self, collection, key, owner=None):
+        row = self._conn().execute(
+            'SELECT body FROM documents WHERE collection = ? AND owner = ? AND key = ?',
+            (collection, self._owner(owner), key),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, conn, collection, key, doc, owner):
+        conn.execute(
+            'INSERT INTO documents(collection, owner, key, seq, body) '
+            'VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM documents), ?) '
+            'ON CONFLICT(collection, owner, key) DO UPDATE SET body = excluded.body',
+            (collection, self._owner(owner), key, json.dumps(doc, ensure_ascii=False)),
+        )
+
+    def version(self, collection, key=None):
+        return int(self.get_meta(f'rev:{collection}') or 0)
+
+    @staticmethod
+    def _bump(conn, collection) -> int:
+        """在写事务内递增集合修订号，返回新值"""
+        row = conn.execute(
+            'INSERT INTO meta(key, value) VALUES (?, 1) '
+            'ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1 RETURNING value',
+            (f'rev:{collection}',),
+        ).fetchone()
+        return int(row[0])
+
+    def _write(self, collection, fn):
+        """在 BEGIN IMMEDIATE 事务中执行 fn(conn)，有修改（返回真值）时递增修订号并记录为本进程的写入；
+        已处于外层事务（copy_from）时直接执行，由外层提交"""
+        conn = self._conn()
+        if conn.in_transaction:
+            result = fn(conn)
+            if result:
+                self._bump(conn, collection)
+            return result
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+            rev = self._bump(conn, collection) if result else None
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if rev is not None:
+            self._record_write(collection, rev - 1, rev)
+        return result
+
+    def put(self, collection, key, doc, owner=None):
+        self._write(collection, lambda conn: self._upsert(conn, collection, key, doc, owner) or True)
+
+    def delete(self, collection, key, owner=None):
+        return self._write(collection, lambda conn: conn.execute(
+            'DELETE FROM documents WHERE collection = ? AND owner = ? AND key = ?',
+            (collection, self._owner(owner), key),
+        ).rowcount > 0)
+
+    def _mutate_in_tx(self, conn, collection, key, fn, owner):
+        row = conn.execute(
+            'SELECT body FROM documents WHERE collection = ? AND owner = ? AND key = ?',
+            (collection, self._owner(owner), key),
+        ).fetchone()
+        old = json.loads(row[0]) if row else None
+        new = fn(old)
+        if new is DELETE:
+            if old is None:
+                return None
+            conn.execute(
+                'DELETE FROM documents WHERE collection = ? AND owner = ? AND key = ?',
+                (collection, self._owner(owner), key),
+            )
+        elif new is not None:
+            self._upsert(conn, collection, key, new, owner)
+        return new
+
+    def mutate(self, collection, key, fn, owner=None):
+        return self.mutate_many(collection, {key: fn}, owner=owner)[key]
+
+    def mutate_many(self, collection, fns, owner=None):
+        results = {}
+
+        def apply(conn):
+            results.update((key, self._mutate_in_tx(conn, collection, key, fn, owner)) for key, fn in fns.items())
+            return any(result is not None for result in results.values())
+
+        self._write(collection, apply)
+        return results
+
+    def copy_from(self, other):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            counts = DataStore.copy_from(self, other)
+            conn.execute('COMMIT')
+            return counts
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def migrate_json_to_sqlite(data_dir: str, store: SqliteStore, force: bool = False) -> Optional[Dict[str, int]]:
+    """一次性将 data_dir 下的JSON数据导入 SQLite；已迁移过且未指定 force 时跳过"""
+    if not force and (store.get_meta('migrated_from_json') or not store.is_empty()):
+        return None
+    counts = store.copy_from(JsonFileStore(data_dir))
+    store.set_meta('migrated_from_json', json.dumps(counts))
+    logger.info(f"JSON数据已迁移至SQLite: {counts}")
+    return counts
+
+
+def migrate_post_reactions(store: DataStore) -> Optional[Dict[str, int]]:
+    """将帖子内的 likes/bookmarks 用户列表迁移为帖子上的 like_count/bookmark_count 计数
+    与按用户的 reactions 索引；没有旧格式帖子时返回 None。
+    先写 reactions 再改帖子，中途失败重跑不会重复计数。"""
+    legacy = [p for p in store.list_posts() if 'likes' in p or 'bookmarks' in p]
+    if not legacy:
+        return None
+    migrated_at = datetime.utcnow().isoformat()
+    per_user: Dict[str, Dict[str, dict]] = {}
+    for post in legacy:
+        for field in ('likes', 'bookmarks'):
+            for username in post.get(field) or []:
+                entry = per_user.setdefault(username, {"likes": {}, "bookmarks": {}})
+                entry[field][post['id']] = migrated_at
+
+    def merge(extra):
+        def apply(doc):
+            doc = doc or {"likes": {}, "bookmarks": {}}
+            for field in ('likes', 'bookmarks'):
+                for post_id, ts in extra[field].items():
+                    doc.setdefault(field, {}).setdefault(post_id, ts)
+            return doc
+        return apply
+
+    def strip(post):
+        if post is None:
+            return None
+        for field, counter in (('likes', 'like_count'), ('bookmarks', 'bookmark_count')):
+            if field in post:
+                post[counter] = post.get(counter, 0) + len(set(post.pop(field) or []))
+            post.setdefault(counter, 0)
+        return post
+
+    store.mutate_many('reactions', {username: merge(extra) for username, extra in per_user.items()})
+    store.mutate_many('posts', {post['id']: strip for post in legacy})
+    counts = {"posts": len(legacy), "users": len(per_user)}
+    logger.info(f"帖子点赞/收藏已迁移为计数与用户索引: {counts}")
+    return counts
+
+
+def migrate_post_comments(store: DataStore) -> Optional[Dict[str, int]]:
+    """将帖子内嵌的 comments 列表迁移到独立的 comments 集合，
+    帖子上只保留 comment_count 与最新几条评论的 comment_preview；
+    没有旧格式帖子时返回 None。按评论 id 去重合并，中途失败重跑不会重复。"""
+    legacy = [p for p in store.list_posts() if 'comments' in p]
+    if not legacy:
+        return None
+
+    def merge(extra):
+        def apply(doc):
+            doc = doc or []
+            seen = {c.get('id') for c in doc}
+            doc.extend(c for c in extra if isinstance(c, dict) and c.get('id') not in seen)
+            doc.sort(key=lambda c: (c.get('created_at') or '', c.get('id') or ''))
+            return doc
+        return apply
+
+    merged = store.mutate_many('comments', {p['id']: merge(p.get('comments') or []) for p in legacy})
+
+    def strip(post):
+        if post is None:
+            return None
+        comments = merged.get(post['id']) or []
+        post.pop('comments', None)
+        post['comment_count'] = len(comments)
+        post['comment_preview'] = comments[-COMMENT_PREVIEW_SIZE:]
+        return post
+
+    store.mutate_many('posts', {post['id']: strip for post in legacy})
+    counts = {"posts": len(legacy), "comments": sum(len(v or []) for v in merged.values())}
+    logger.info(f"帖子评论已迁移至独立存储: {counts}")
+    return counts
+
+
+def create_store(data_dir: str, backend: Optional[str] = None) -> DataStore:
+    """按 STORAGE_BACKEND 环境变量创建存储（json / sqlite），默认 json"""
+    backend = (backend or os.getenv('STORAGE_BACKEND') or 'json').lower()
+    if backend == 'sqlite':
+        db_path = os.getenv('SQLITE_DB_PATH') or os.path.join(data_dir, 'medical.db')
+        store = SqliteStore(db_path)
+        migrate_json_to_sqlite(data_dir, store)
+        return store
+    return JsonFileStore(data_dir)
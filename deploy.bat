@@ -39,7 +39,7 @@ echo ✅ 目录结构已创建
 
 echo.
 echo [4/6] 检查并初始化数据文件...
-python -c "import os; import json; data_dir='data'; os.makedirs(data_dir, exist_ok=True); files={'users.json':[],'records.json':[],'community.json':[],'pre_consultation_pushes.json':[],'medications.json':[],'medication_intake_records.json':[],'medication_reminders.json':[],'tcm_archives.json':[]}; [open(os.path.join(data_dir,f),'w',encoding='utf-8').write(json.dumps(v,ensure_ascii=False,indent=2)) if not os.path.exists(os.path.join(data_dir,f)) else None for f,v in files.items()]" 2>nul
+python -c "import os; import json; data_dir='data'; os.makedirs(data_dir, exist_ok=True); files={'users.json':[],'records.json':[],'community.json':[],'pre_consultation_pushes.json':[],'medications.json':[],'medication_reminders.json':[],'tcm_archives.json':[]}; [open(os.path.join(data_dir,f),'w',encoding='utf-8').write(json.dumps(v,ensure_ascii=False,indent=2)) if not os.path.exists(os.path.join(data_dir,f)) else None for f,v in files.items()]" 2>nul
 echo ✅ 数据文件已初始化
 
 echo.
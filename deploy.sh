@@ -46,7 +46,6 @@ files = {
     'community.json': [],
     'pre_consultation_pushes.json': [],
     'medications.json': [],
-    'medication_intake_records.json': [],
     'medication_reminders.json': [],
     'tcm_archives.json': []
 }
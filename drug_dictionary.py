@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+药名词典：药名规范化与输入联想
+- 规范化：手动录入、照片识别、知识检索得到的药名（"芬必得布洛芬缓释胶囊 0.3g"、"盐酸二甲双胍片"）
+  映射到通用名，用药记录据此保存 generic_name，缓存、相互作用查询和统计按通用名归并
+- 联想：按名称前缀、全拼前缀（buluofen）、拼音首字母前缀（blf）查找，
+  所有键放在一个有序数组中二分查找，10 万条词典单次查询也在 1 毫秒以内
+词典来源依次为药物相互作用知识库（drug_interactions.json）与 DRUG_DICTIONARY_PATH 指定的文件，
+同一别名以先加载的为准。文件格式：
+- .json：与 drug_interactions.json 相同的 {"drugs": {通用名: {"aliases": [...]}}}
+- 其他：每行 "通用名,别名1,别名2"（逗号或制表符分隔），# 开头为注释
+未安装 pypinyin 时不建立拼音键，仅支持名称前缀联想。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from llm_cache import normalize_query
+from drug_interactions import DEFAULT_KNOWLEDGE_PATH, candidate_keys, normalize_drug_name, resolve_key
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 可选依赖
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+# 单次联想最多扫描的键数（同一前缀下的重复条目会被跳过）
+_MAX_SCAN = 2000
+# find() 在文本中查找药名的最短长度：两个字的别名（"安定"、"可定"）常与普通词语重合，只做整体匹配
+_MIN_FIND_LEN = 3
+
+
+class _Snapshot(NamedTuple):
+    names: List[str]          # 条目序号 -> 通用名
+    exact: Dict[str, int]     # normalize_drug_name(别名) -> 条目序号
+    keys: List[str]           # 有序的联想键
+    entries: List[int]        # 与 keys 对应的条目序号
+    surfaces: List[str]       # 与 keys 对应的原始别名
+    longest: int              # exact 中最长键的长度
+
+
+def _syllables(text: str, memo: Dict[str, str]) -> Optional[List[str]]:
+    """逐字取拼音（按字缓存，比整词调用 lazy_pinyin 快一个数量级），连续的非汉字保留为一段；不含汉字时返回 None"""
+    syllables, run, has_cjk = [], '', False
+    for ch in text:
+        syllable = memo.get(ch)
+        if syllable is None:
+            syllable = memo[ch] = lazy_pinyin(ch)[0] if '一' <= ch <= '鿿' else ''
+        if syllable:
+            has_cjk = True
+            if run:
+                syllables.append(run)
+                run = ''
+            syllables.append(syllable)
+        else:
+            run += ch
+    if run:
+        syllables.append(run)
+    return syllables if has_cjk else None
+
+
+class DrugDictionary:
+    """药名规范化与前缀/拼音联想；load() 整体替换快照，查询无需加锁"""
+
+    def __init__(self, sources: Iterable[str] = (DEFAULT_KNOWLEDGE_PATH,)):
+        self.sources = [path for path in sources if path]
+        self._snapshot = _Snapshot([], {}, [], [], [], 0)
+        self._lock = threading.Lock()
+        self.load_ms = 0.0
+        self.load()
+
+    # ---------- 加载 ----------
+    def load(self) -> None:
+        start = time.perf_counter()
+        aliases: Dict[str, List[str]] = {}
+        for path in self.sources:
+            try:
+                self._read(path, aliases)
+            except Exception as e:
+                logger.error(f"加载药名词典失败 {path}: {e}")
+        snapshot = self._build(aliases)
+        with self._lock:
+            self._snapshot = snapshot
+            self.load_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"药名词典已加载: {len(snapshot.names)} 种药品, {len(snapshot.keys)} 个联想键, "
+                    f"耗时 {self.load_ms:.0f} ms")
+
+    @staticmethod
+    def _read(path: str, aliases: Dict[str, List[str]]) -> None:
+        if path.endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for generic, entry in (data.get('drugs') or {}).items():
+                aliases.setdefault(generic, []).extend((entry or {}).get('aliases') or [])
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                names = [n.strip() for n in line.replace('\t', ',').split(',') if n.strip()]
+                if names:
+                    aliases.setdefault(names[0], []).extend(names[1:])
+
+    @staticmethod
+    def _build(aliases: Dict[str, List[str]]) -> _Snapshot:
+        names = list(aliases)
+        exact: Dict[str, int] = {}
+        pairs = {}  # (联想键, 条目序号) -> 原始别名
+        memo: Dict[str, str] = {}
+        for entry, generic in enumerate(names):
+            for surface in [generic] + aliases[generic]:
+                key = normalize_drug_name(surface)
+                if key:
+                    exact.setdefault(key, entry)
+                prefix_key = normalize_query(surface)
+                if not prefix_key:
+                    continue
+                candidates = [prefix_key]
+                syllables = _syllables(prefix_key, memo) if lazy_pinyin is not None else None
+                if syllables:
+                    candidates += [''.join(syllables), ''.join(s[:1] for s in syllables)]
+                for candidate in candidates:
+                    pairs.setdefault((candidate, entry), surface)
+        ordered = sorted(pairs.items(), key=lambda item: item[0][0])  # 只按键排序，同键条目保持加载顺序
+        return _Snapshot(names, exact,
+                         [key for (key, _), _ in ordered],
+                         [entry for (_, entry), _ in ordered],
+                         [surface for _, surface in ordered],
+                         max(map(len, exact), default=0))
+
+    # ---------- 查询 ----------
+    def canonical(self, name: str) -> Optional[str]:
+        """药名 -> 通用名；词典中没有时返回 None"""
+        snapshot = self._snapshot
+
+        def lookup(key: str) -> Optional[str]:
+            entry = snapshot.exact.get(key)
+            return None if entry is None else snapshot.names[entry]
+
+        for key in candidate_keys(name):
+            generic = resolve_key(key, lookup)
+            if generic:
+                return generic
+        return None
+
+    def find(self, text: str) -> Optional[str]:
+        """文本中出现的药名（通用名或别名，取最长的一个）-> 通用名，如 "布洛芬的用法" -> 布洛芬；没有时返回 None"""
+        snapshot = self._snapshot
+        text = normalize_query(text or '')
+        for size in range(min(snapshot.longest, len(text)), _MIN_FIND_LEN - 1, -1):
+            for i in range(len(text) - size + 1):
+                entry = snapshot.exact.get(text[i:i + size])
+                if entry is not None:
+                    return snapshot.names[entry]
+        return None
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        """前缀联想：名称、全拼或拼音首字母前缀匹配，返回 [{name: 通用名, matched: 命中的别名}]"""
+        prefix = normalize_query(query or '')
+        if not prefix or limit <= 0:
+            return []
+        snapshot = self._snapshot
+        keys = snapshot.keys
+        results, seen = [], set()
+        i = bisect_left(keys, prefix)
+        end = min(len(keys), i + _MAX_SCAN)
+        while i < end and len(results) < limit and keys[i].startswith(prefix):
+            entry = snapshot.entries[i]
+            if entry not in seen:
+                seen.add(entry)
+                results.append({"name": snapshot.names[entry], "matched": snapshot.surfaces[i]})
+            i += 1
+        return results
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {"drugs": len(snapshot.names), "keys": len(snapshot.keys), "pinyin": lazy_pinyin is not None,
+                "load_ms": round(self.load_ms, 1)}
+
+
+def create_drug_dictionary() -> DrugDictionary:
+    """按环境变量创建：DRUG_DICTIONARY_PATH 为追加的词典文件（多个用逗号分隔）"""
+    extra = [p.strip() for p in (os.getenv('DRUG_DICTIONARY_PATH') or '').split(',') if p.strip()]
+    return DrugDictionary([DEFAULT_KNOWLEDGE_PATH] + extra)
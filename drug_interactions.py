@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地药物相互作用知识库
+用药 AI 分析（/api/medications/ai-analyze）先查本地知识库，只把知识库未覆盖的药品组合交给大模型：
+- 药名归一化：去掉规格（100mg）、剂型（缓释胶囊、肠溶片……）、盐基（盐酸、钠……）后，
+  按通用名/别名/商品名表映射到通用名，"芬必得布洛芬缓释胶囊 0.3g" 与 "布洛芬" 视为同一药品
+- 成对相互作用表：键为无序的 (通用名 | class:分类) 对，分类条目（如 class:NSAID）覆盖该类全部药品
+- 表中有条目的组合直接由知识库回答；其余组合（含两种药品都已收录但表中没有条目的）列入 uncovered，
+  仍须交给大模型分析——表不完整，没有条目不代表没有相互作用
+知识库为仓库中的 drug_interactions.json，可直接增补条目。
+"""
+
+import os
+import re
+import json
+import logging
+from itertools import combinations
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llm_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KNOWLEDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'drug_interactions.json')
+
+# 剂型后缀（按长度降序匹配）
+_DOSAGE_FORMS = sorted([
+    '缓释胶囊', '缓释片', '控释片', '肠溶胶囊', '肠溶片', '分散片', '咀嚼片', '泡腾片', '口崩片', '软胶囊',
+    '胶囊', '片', '颗粒', '颗粒剂', '干混悬剂', '混悬液', '口服液', '口服溶液', '溶液', '糖浆', '滴丸',
+    '注射液', '注射剂', '粉针', '滴眼液', '喷雾剂', '气雾剂', '乳膏', '软膏', '凝胶', '贴剂', '栓',
+    '丸', '散', '膏', '剂', 'tablets', 'tablet', 'capsules', 'capsule',
+], key=len, reverse=True)
+# 盐基前缀/后缀：去掉后能识别时才采用
+_SALT_PREFIXES = ('硫酸氢', '盐酸', '硫酸', '磷酸', '马来酸', '富马酸', '酒石酸', '琥珀酸', '苯磺酸', '甲磺酸',
+                  '枸橼酸', '草酸', '乳酸')
+_SALT_SUFFIXES = ('钠', '钾', '钙', '镁')
+_STRENGTH_RE = re.compile(r'\d+(?:\.\d+)?(?:mg|g|ml|ug|μg|iu|万单位|单位|%|毫克|克|毫升|粒|片|袋|支|盒|丸)?(?:[/x×*]\d*\S?)?')
+_BRACKETS_RE = re.compile(r'[（(\[【](.*?)[)）\]】]')
+# 末尾连续的剂型后缀（如 "缓释胶囊"、"片剂"）；至少保留首字，避免整名被当作剂型去掉
+_DOSAGE_FORM_RE = re.compile(r'(?<=.)(?:' + '|'.join(map(re.escape, _DOSAGE_FORMS)) + r')+$')
+
+SEVERITY_ORDER = {'高': 0, '中': 1, '低': 2}
+
+
+def normalize_drug_name(name: str) -> str:
+    """药名的比较键：NFKC、小写、去空白标点、去规格与剂型后缀（不做别名映射）"""
+    text = normalize_query(_BRACKETS_RE.sub('', name or ''))
+    text = _STRENGTH_RE.sub('', text)
+    return _DOSAGE_FORM_RE.sub('', text)
+
+
+def candidate_keys(name: str) -> List[str]:
+    """药名的候选比较键：整体名称及括号内名称（"布洛芬缓释胶囊（芬必得）" 中的商品名）"""
+    keys = [normalize_drug_name(name)] + [normalize_drug_name(inner) for inner in _BRACKETS_RE.findall(name or '')]
+    return [key for key in keys if key]
+
+
+def salt_variants(key: str) -> List[str]:
+    """归一化药名去掉盐基前缀/后缀后的候选（如 "盐酸二甲双胍" -> "二甲双胍"）"""
+    variants = [key[len(prefix):] for prefix in _SALT_PREFIXES if key.startswith(prefix) and len(key) > len(prefix)]
+    variants += [key[:-len(suffix)] for suffix in _SALT_SUFFIXES if key.endswith(suffix) and len(key) > len(suffix)]
+    return variants
+
+
+def resolve_key(key: str, lookup: Callable[[str], Optional[str]]) -> Optional[str]:
+    """归一化药名 -> 通用名：依次尝试别名表、去盐基，以及 "商品名+通用名" 连写（两部分须指向同一通用名）。
+    不做一般的子串匹配：复方制剂（如 "氨氯地平贝那普利"）按子串只会识别出其中一种成分"""
+    def exact(text: str) -> Optional[str]:
+        found = lookup(text)
+        if found:
+            return found
+        for base in salt_variants(text):
+            found = lookup(base)
+            if found:
+                return found
+        return None
+
+    generic = exact(key)
+    if generic:
+        return generic
+    for i in range(2, len(key) - 1):
+        generic = lookup(key[:i])
+        if generic and exact(key[i:]) == generic:
+            return generic
+    return None
+
+
+class InteractionIndex:
+    """药名归一化 + 成对相互作用查询"""
+
+    def __init__(self, path: str = DEFAULT_KNOWLEDGE_PATH):
+        self.path = path
+        self.classes: Dict[str, str] = {}
+        self.drugs: Dict[str, dict] = {}           # 通用名 -> 条目
+        self._aliases: Dict[str, str] = {}         # 归一化别名 -> 通用名
+        self._pairs: Dict[Tuple[str, str], dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"加载药物相互作用知识库失败 {self.path}: {e}")
+            data = {}
+        self.classes = data.get('classes') or {}
+        self.drugs = data.get('drugs') or {}
+        self._aliases = {}
+        for generic, entry in self.drugs.items():
+            for alias in [generic] + list(entry.get('aliases') or []):
+                key = normalize_drug_name(alias)
+                if key:
+                    self._aliases.setdefault(key, generic)
+        self._pairs = {}
+        for item in data.get('interactions') or []:
+            a, b = item.get('a'), item.get('b')
+            if a and b:
+                self._pairs[self._pair_key(a, b)] = item
+        logger.info(f"药物相互作用知识库已加载: {len(self.drugs)} 种药品, {len(self._pairs)} 条相互作用")
+
+    @staticmethod
+    def _pair_key(a: str, b: str) -> Tuple[str, str]:
+        return (a, b) if a <= b else (b, a)
+
+    # ---------- 归一化 ----------
+    def resolve(self, name: str) -> Optional[str]:
+        """药名 -> 已收录的通用名；无法识别时返回 None"""
+        for key in candidate_keys(name):
+            generic = resolve_key(key, self._aliases.get)
+            if generic:
+                return generic
+        return None
+
+    def _terms(self, generic: str) -> List[str]:
+        return [generic] + [f"class:{c}" for c in self.drugs.get(generic, {}).get('classes') or []]
+
+    def lookup(self, generic_a: str, generic_b: str) -> Optional[dict]:
+        """两种已收录药品之间最严重的一条相互作用"""
+        found = [self._pairs[self._pair_key(a, b)]
+                 for a in self._terms(generic_a) for b in self._terms(generic_b)
+                 if self._pair_key(a, b) in self._pairs]
+        if not found:
+            return None
+        return min(found, key=lambda item: SEVERITY_ORDER.get(item.get('severity'), 3))
+
+    # ---------- 分析 ----------
+    def analyze(self, medications: List[dict]) -> dict:
+        """按知识库分析用药方案，返回
+        {interactions, warnings, suggestions, resolved: {药名: 通用名}, unknown: [未收录药名],
+         uncovered: [[药名, 药名], ...] 知识库中没有条目、需交给大模型的组合}，
+        interactions / warnings 的字段与 AI 分析结果一致（drug1, drug2, severity, description / type, severity, description）"""
+        resolved: Dict[str, str] = {}
+        unknown: List[str] = []
+        by_generic: Dict[str, List[str]] = {}
+        for med in medications:
+            name = (med.get('name') or '').strip()
+            if not name or name in resolved or name in unknown:
+                continue
+            generic = self.resolve(name)
+            if generic:
+                resolved[name] = generic
+                by_generic.setdefault(generic, []).append(name)
+            else:
+                unknown.append(name)
+
+        interactions, warnings, suggestions = [], [], []
+        uncovered: List[List[str]] = []
+        for generic, names in by_generic.items():
+            if len(names) > 1:
+                warnings.append({"type": "重复用药", "severity": "高",
+                                 "description": f"{'、'.join(names)} 均为{generic}，请勿重复服用"})
+            if self.drugs[generic].get('warning'):
+                warnings.append({"type": f"{generic}用药注意", "severity": "中",
+                                 "description": self.drugs[generic]['warning']})
+        for (a, names_a), (b, names_b) in combinations(by_generic.items(), 2):
+            item = self.lookup(a, b)
+            if item is None:
+                uncovered.append(sorted((names_a[0], names_b[0])))
+                continue
+            interactions.append({"drug1": names_a[0], "drug2": names_b[0], "severity": item.get('severity', '中'),
+                                 "description": item.get('description', ''), "source": "knowledge_base"})
+            if item.get('suggestion') and item['suggestion'] not in suggestions:
+                suggestions.append(item['suggestion'])
+        known_names = [names[0] for names in by_generic.values()]
+        for i, name in enumerate(unknown):
+            uncovered.extend(sorted((name, other)) for other in known_names + unknown[i + 1:])
+        interactions.sort(key=lambda x: SEVERITY_ORDER.get(x['severity'], 3))
+        uncovered.sort()
+        return {"interactions": interactions, "warnings": warnings, "suggestions": suggestions,
+                "resolved": resolved, "unknown": unknown, "uncovered": uncovered}
+
+    def stats(self) -> dict:
+        return {"drugs": len(self.drugs), "aliases": len(self._aliases), "interactions": len(self._pairs)}
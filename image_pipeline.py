@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片预处理
+发送给视觉模型（qwen-vl-max）之前统一处理图片，避免把手机原图（数 MB）整张 base64 上传：
+- 解码 data URL / 文件 / 字节，按 EXIF 方向摆正
+- 长边缩放到 IMAGE_MAX_EDGE（默认 1280 像素），重新压缩为 JPEG（IMAGE_JPEG_QUALITY，默认 85）
+- 以原始字节的 sha256 作为内容哈希，同一张图片的预处理结果按哈希缓存（LRU）
+预处理结果是确定的，同一张图片得到相同的 data URL，调用方可据此命中识别结果缓存。
+未安装 Pillow 时跳过缩放与重新压缩，原图直接透传（仍计算内容哈希）。
+"""
+
+import io
+import os
+import base64
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import NamedTuple, Union
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 可选依赖
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedImage(NamedTuple):
+    data_url: str
+    content_hash: str     # 原始字节的 sha256
+    width: int            # 处理后尺寸（未安装 Pillow 时为 0）
+    height: int
+    original_bytes: int
+    prepared_bytes: int
+
+
+def decode_data_url(data_url: str) -> bytes:
+    """data:image/...;base64,XXX 或纯 base64 -> 字节"""
+    text = (data_url or '').strip()
+    if text.startswith('data:') and ',' in text:
+        text = text.split(',', 1)[1]
+    return base64.b64decode(text)
+
+
+def _guess_mime(raw: bytes) -> str:
+    if raw.startswith(b'\x89PNG'):
+        return 'image/png'
+    if raw[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if raw[:4] == b'RIFF' and raw[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class ImagePreprocessor:
+    """图片预处理与按内容哈希的结果缓存；线程安全"""
+
+    def __init__(self, max_edge: int = 1280, quality: int = 85, cache_entries: int = 64):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()  # content_hash -> PreparedImage
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, source: Union[str, bytes]) -> PreparedImage:
+        """source 为 data URL / base64 字符串或图片字节"""
+        raw = decode_data_url(source) if isinstance(source, str) else bytes(source)
+        content_hash = hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            cached = self._cache.get(content_hash)
+            if cached is not None:
+                self._cache.move_to_end(content_hash)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        prepared = self._process(raw, content_hash)
+        with self._lock:
+            self._cache[content_hash] = prepared
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return prepared
+
+    def prepare_file(self, path: str) -> PreparedImage:
+        with open(path, 'rb') as f:
+            return self.prepare(f.read())
+
+    def _process(self, raw: bytes, content_hash: str) -> PreparedImage:
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(raw)) as img:
+                    original_size = img.size
+                    orientation = img.getexif().get(0x0112, 1)
+                    # JPEG 直接按 1/2、1/4、1/8 缩小解码（不小于目标尺寸），省去全尺寸解码
+                    img.draft('RGB', (self.max_edge, self.max_edge))
+                    img = ImageOps.exif_transpose(img)
+                    if img.mode in ('RGBA', 'LA', 'P'):
+                        img = img.convert('RGBA')
+                        background = Image.new('RGB', img.size, (255, 255, 255))
+                        background.paste(img, mask=img.split()[-1])
+                        img = background
+                    elif img.mode != 'RGB':
+                        img = img.convert('RGB')
+                    img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+                    out = io.BytesIO()
+                    img.save(out, format='JPEG', quality=self.quality, optimize=True)
+                    data = out.getvalue()
+                    width, height = img.size
+                # 无需旋转/缩放的小 JPEG 重新压缩后可能反而变大，此时保留原图
+                untouched = orientation == 1 and (width, height) == original_size and _guess_mime(raw) == 'image/jpeg'
+                if untouched and len(raw) <= len(data):
+                    data = raw
+                return self._result(data, 'image/jpeg', content_hash, width, height, len(raw))
+            except Exception as e:
+                logger.warning(f"图片预处理失败，使用原图: {e}")
+        return self._result(raw, _guess_mime(raw), content_hash, 0, 0, len(raw))
+
+    @staticmethod
+    def _result(data: bytes, mime: str, content_hash: str, width: int, height: int,
+                original_bytes: int) -> PreparedImage:
+        data_url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        return PreparedImage(data_url, content_hash, width, height, original_bytes, len(data))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pillow": Image is not None, "max_edge": self.max_edge, "quality": self.quality,
+                    "cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+def create_image_preprocessor() -> ImagePreprocessor:
+    """按环境变量创建：IMAGE_MAX_EDGE（像素）、IMAGE_JPEG_QUALITY、IMAGE_CACHE_ENTRIES"""
+    return ImagePreprocessor(
+        max_edge=int(os.getenv('IMAGE_MAX_EDGE') or 1280),
+        quality=int(os.getenv('IMAGE_JPEG_QUALITY') or 85),
+        cache_entries=int(os.getenv('IMAGE_CACHE_ENTRIES') or 64),
+    )
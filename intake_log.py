@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药记录时序日志
+按用户、按月分段的只追加日志，替代整表读写的 medication_intake_records.json：
+- 目录结构：<data_dir>/intake_log/<用户名(URL编码)>/<YYYY-MM>.jsonl，每行一条记录
+- 记一次服药只向所在月份的分段追加一行，不重写任何已有数据
+- 每个分段在内存中按 (taken_at, 行号) 有序保存，文件签名不变时复用；
+  时间范围查询先按月份二分选出分段，再在分段内二分定位，代价 O(log n + 命中数)
+- 补录（taken_at 早于已有记录）、重复 id、写入中断留下的残行会让分段变为"待整理"，
+  compact() 将其按时间重写；历史月份在加载时自动整理
+taken_at 不以 YYYY-MM 开头的记录放入 other 分段，查询时线性过滤。
+"""
+
+import os
+import re
+import sys
+import json
+import threading
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from data_store import FileLock
+
+logger = logging.getLogger(__name__)
+
+_MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+OTHER_SEGMENT = 'other'
+
+
+def segment_of(taken_at: str) -> str:
+    month = (taken_at or '')[:7]
+    return month if _MONTH_RE.match(month) else OTHER_SEGMENT
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class _Segment:
+    """单个月份分段的内存索引：keys 与 records 一一对应，按 (taken_at, 行号) 升序"""
+
+    __slots__ = ('signature', 'keys', 'records', 'ids', 'dirty', 'next_seq')
+
+    def __init__(self, signature):
+        self.signature = signature
+        self.keys: List[Tuple[str, int]] = []
+        self.records: List[dict] = []
+        self.ids = set()
+        self.dirty = False  # 存在乱序/重复/残行，需要 compact
+        self.next_seq = 0
+
+    def add(self, record: dict) -> None:
+        record_id = record.get('id')
+        if record_id in self.ids:
+            self.dirty = True
+            return
+        self.ids.add(record_id)
+        key = (record.get('taken_at') or '', self.next_seq)
+        self.next_seq += 1
+        if self.keys and key < self.keys[-1]:
+            self.dirty = True
+            i = bisect_left(self.keys, key)
+            self.keys.insert(i, key)
+            self.records.insert(i, record)
+        else:
+            self.keys.append(key)
+            self.records.append(record)
+
+    def range(self, start: Optional[str], end: Optional[str]) -> List[dict]:
+        lo = bisect_left(self.keys, (start, -1)) if start else 0
+        hi = bisect_right(self.keys, (end, sys.maxsize)) if end else len(self.keys)
+        return self.records[lo:hi]
+
+
+class IntakeLog:
+    """按用户/月份分段的服药记录日志"""
+
+    def __init__(self, data_dir: str, fsync: bool = False):
+        self.root = os.path.join(data_dir, 'intake_log')
+        self.fsync = fsync
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._file_locks: Dict[str, FileLock] = {}
+        self._segments: Dict[Tuple[str, str], _Segment] = {}
+        self._months: Dict[str, Tuple[object, List[str]]] = {}  # 用户 -> (目录签名, 有序分段名)
+
+    # ---------- 路径与锁 ----------
+    def _user_dir(self, username: str) -> str:
+        return os.path.join(self.root, quote(username, safe=''))
+
+    def _segment_path(self, username: str, segment: str) -> str:
+        return os.path.join(self._user_dir(username), f"{segment}.jsonl")
+
+    def _file_lock(self, username: str) -> FileLock:
+        with self._lock:
+            lock = self._file_locks.get(username)
+            if lock is None:
+                lock = self._file_locks[username] = FileLock(self._user_dir(username))
+            return lock
+
+    # ---------- 写入 ----------
+    def append(self, username: str, record: dict) -> None:
+        self.append_many(username, [record])
+
+    def append_many(self, username: str, records: Iterable[dict], skip_existing: bool = False) -> List[dict]:
+        """批量追加：同一分段的记录合并为一次写入，返回实际写入的记录；
+        skip_existing 时在文件锁内跳过所在分段中 id 已存在的记录（重试幂等）"""
+        grouped: Dict[str, List[dict]] = {}
+        for record in records:
+            grouped.setdefault(segment_of(record.get('taken_at')), []).append(record)
+        if not grouped:
+            return []
+        os.makedirs(self._user_dir(username), exist_ok=True)
+        written = []
+        with self._file_lock(username):
+            for segment, batch in grouped.items():
+                if skip_existing:
+                    existing = self._segment(username, segment).ids
+                    batch = [r for r in batch if r.get('id') not in existing]
+                    if not batch:
+                        continue
+                written.extend(batch)
+                path = self._segment_path(username, segment)
+                payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in batch)
+                before = _file_signature(path)
+                if before is not None and before[1] > 0 and not self._ends_with_newline(path):
+                    payload = '\n' + payload  # 上次写入中断，残行单独成行，不影响本次记录
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(payload)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                with self._lock:
+                    cached = self._segments.get((username, segment))
+                    if cached is not None and cached.signature == before:
+                        for record in batch:
+                            cached.add(dict(record))
+                        cached.signature = _file_signature(path)
+                    else:
+                        self._segments.pop((username, segment), None)
+        return written
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    # ---------- 读取 ----------
+    def _segment_names(self, username: str) -> List[str]:
+        user_dir = self._user_dir(username)
+        signature = _file_signature(user_dir)
+        if signature is None:
+            return []
+        with self._lock:
+            cached = self._months.get(username)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        names = sorted(name[:-6] for name in os.listdir(user_dir) if name.endswith('.jsonl'))
+        with self._lock:
+            self._months[username] = (signature, names)
+        return names
+
+    def _segment(self, username: str, segment: str) -> _Segment:
+        path = self._segment_path(username, segment)
+        signature = _file_signature(path)
+        with self._lock:
+            cached = self._segments.get((username, segment))
+            if cached is not None and cached.signature == signature:
+                return cached
+        loaded = self._load(path, signature)
+        if loaded.dirty and segment != datetime.now().strftime('%Y-%m'):
+            # 历史月份不再频繁追加，加载时顺便整理，之后按顺序读取即可
+            loaded = self._compact_segment(username, segment) or loaded
+        with self._lock:
+            self._segments[(username, segment)] = loaded
+        return loaded
+
+    @staticmethod
+    def _load(path: str, signature) -> _Segment:
+        segment = _Segment(signature)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        segment.dirty = True  # 写入中断留下的残行
+                        continue
+                    if isinstance(record, dict):
+                        segment.add(record)
+        except FileNotFoundError:
+            pass
+        return segment
+
+    def version(self, username: str) -> tuple:
+        """用户全部分段的文件签名；追加、补录、整理都会改变返回值"""
+        user_dir = self._user_dir(username)
+        return (_file_signature(user_dir),) + tuple(
+            (name, _file_signature(self._segment_path(username, name))) for name in self._segment_names(username))
+
+    def query(self, username: str, start: Optional[str] = None, end: Optional[str] = None,
+              newest_first: bool = True, where: Optional[Dict[str, str]] = None) -> List[dict]:
+        """返回 start <= taken_at <= end（字符串比较，与旧实现一致）的记录副本；
+        where 为 {字段: 取值} 的等值筛选（取值为 None 的条件忽略），在复制前完成"""
+        names = self._segment_names(username)
+        months = [n for n in names if n != OTHER_SEGMENT]
+        lo = bisect_left(months, start[:7]) if start else 0
+        hi = bisect_right(months, end[:7]) if end else len(months)
+        result = []
+        for month in months[lo:hi]:
+            result.extend(self._segment(username, month).range(start, end))
+        if OTHER_SEGMENT in names:
+            extra = [r for r in self._segment(username, OTHER_SEGMENT).records
+                     if (not start or (r.get('taken_at') or '') >= start)
+                     and (not end or (r.get('taken_at') or '') <= end)]
+            if extra:
+                result.extend(extra)
+                result.sort(key=lambda r: r.get('taken_at') or '')
+        conditions = [(k, v) for k, v in (where or {}).items() if v is not None]
+        if conditions:
+            result = [r for r in result if all(r.get(k) == v for k, v in conditions)]
+        if newest_first:
+            result.reverse()
+        return [dict(r) for r in result]
+
+    # ---------- 整理 ----------
+    def compact(self, username: Optional[str] = None) -> int:
+        """按时间顺序重写待整理的分段（去重、丢弃残行），返回重写的分段数"""
+        if username is None:
+            users = [n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n))]
+            return sum(self.compact(unquote(n)) for n in users)
+        count = 0
+        for segment in self._segment_names(username):
+            if self._segment(username, segment).dirty and self._compact_segment(username, segment):
+                count += 1
+        return count
+
+    def _compact_segment(self, username: str, segment: str) -> Optional[_Segment]:
+        path = self._segment_path(username, segment)
+        with self._file_lock(username):
+            loaded = self._load(path, _file_signature(path))
+            if not loaded.dirty:
+                return loaded
+            records = loaded.records  # 加载时已按时间排序并去重
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            compacted = _Segment(_file_signature(path))
+            for record in records:
+                compacted.add(record)
+            with self._lock:
+                self._segments[(username, segment)] = compacted
+            logger.info(f"服药记录分段已整理: {username}/{segment} ({len(records)} 条)")
+            return compacted
+
+    # ---------- 旧数据迁移 ----------
+    def import_legacy(self, legacy_path: str) -> Optional[Dict[str, int]]:
+        """导入旧的 medication_intake_records.json 并将其重命名为 .migrated；
+        无旧文件时返回 None。重复导入的记录按 id 去重。"""
+        if not os.path.exists(legacy_path):
+            return None
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"读取旧服药记录失败 {legacy_path}: {e}")
+            return None
+        legacy = (data.get('records') if isinstance(data, dict) else None) or {}
+        if not legacy:
+            return None
+        total = 0
+        for username, records in legacy.items():
+            records = [r for r in records or [] if isinstance(r, dict)]
+            self.append_many(username, records)
+            total += len(records)
+        backup = legacy_path + '.migrated'
+        if os.path.exists(backup):
+            backup = f"{backup}.{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        os.replace(legacy_path, backup)
+        counts = {"users": len(legacy), "records": total}
+        logger.info(f"服药记录已迁移至分段日志: {counts}")
+        return counts
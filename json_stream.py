@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式 JSON 增量解析
+大模型流式输出 JSON 时，逐段 feed() 文本，每当一个"条目"的 JSON 值闭合就立即返回，不必等整段输出结束：
+- 根为数组：每个元素是一个条目，键为 None（如药品识别返回的 [{...}, {...}]）
+- 根为对象：数组属性的每个元素各是一个条目，键为属性名（如 interactions 中的每一项）；
+  其余属性整体是一个条目（如 summary）
+根值之前的文字与 ```json 代码块标记、根值之后的内容均忽略。根值只认对象或数组，
+且 { 之后须为 " 或 }，[ 之后须为 {、[、" 或 ]（忽略空白），"结果[共2种]如下" 这类文字中的括号不会被当作根值。
+JsonStringStream 则逐字输出指定字符串字段的内容（如问诊总结 summary_html），不必等字符串闭合。
+"""
+
+import re
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = ' \t\r\n'
+# 根值起始符号之后允许出现的第一个非空白字符
+_ROOT_NEXT = {'{': '"}', '[': '{["]'}
+
+
+class JsonStreamParser:
+    """按字符扫描的增量解析器；只维护容器栈与当前条目的起始位置，已扫描过的文本随即丢弃"""
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._stack: List[dict] = []    # {'kind': '{' | '[', 'key': 当前属性名, 'expect_key': bool}
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._in_literal = False
+        self._capture: Optional[Tuple[int, int, Optional[str]]] = None  # (起始位置, 栈深度, 键)
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Any]]:
+        """追加一段文本，返回本段内闭合的 [(键, 值)]"""
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        items = []
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self._in_string:
+                self._scan_string(ch, items)
+            elif not self._stack:
+                if ch in '{[':
+                    root = self._root_at(text)
+                    if root is None:
+                        break  # 还看不到下一个字符，等待后续文本
+                    if root:
+                        self._stack.append({'kind': ch, 'key': None, 'expect_key': ch == '{'})
+            else:
+                self._scan(ch, items)
+            self._pos += 1
+        self._compact()
+        return items
+
+    def _root_at(self, text: str) -> Optional[bool]:
+        """当前位置的 { / [ 是否为根值的开始；其后只有空白时返回 None"""
+        for ch in text[self._pos + 1:]:
+            if ch not in _WHITESPACE:
+                return ch in _ROOT_NEXT[text[self._pos]]
+        return None
+
+    # ---------- 扫描 ----------
+    def _scan_string(self, ch: str, items: list) -> None:
+        if self._escape:
+            self._escape = False
+        elif ch == '\\':
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._key_start is not None:
+                self._stack[-1]['key'] = self._loads(self._key_start, self._pos + 1)
+                self._key_start = None
+            elif self._capture and self._capture[1] == len(self._stack):
+                self._emit(self._pos + 1, items)
+
+    def _scan(self, ch: str, items: list) -> None:
+        top = self._stack[-1]
+        if self._in_literal:
+            if ch not in _WHITESPACE and ch not in ',]}':
+                return
+            self._in_literal = False
+            if self._capture and self._capture[1] == len(self._stack):
+                self._emit(self._pos, items)
+        if ch in _WHITESPACE:
+            return
+        if ch == ',':
+            if top['kind'] == '{':
+                top['expect_key'] = True
+        elif ch == ':':
+            top['expect_key'] = False
+        elif ch in '}]':
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+            elif self._capture and self._capture[1] == len(self._stack):
+                self._emit(self._pos + 1, items)
+        elif ch == '"' and top['kind'] == '{' and top['expect_key']:
+            self._in_string = True
+            self._key_start = self._pos
+        else:
+            # 一个值开始
+            self._start_value()
+            if ch in '{[':
+                self._stack.append({'kind': ch, 'key': None, 'expect_key': ch == '{'})
+            elif ch == '"':
+                self._in_string = True
+            else:
+                self._in_literal = True
+
+    def _start_value(self) -> None:
+        if self._capture is not None:
+            return
+        depth = len(self._stack)
+        top = self._stack[-1]
+        if depth == 1 and top['kind'] == '[':
+            self._capture = (self._pos, depth, None)
+        elif depth == 1 and self._text[self._pos] != '[':
+            self._capture = (self._pos, depth, top['key'])
+        elif depth == 2 and top['kind'] == '[' and self._stack[0]['kind'] == '{':
+            self._capture = (self._pos, depth, self._stack[0]['key'])
+
+    def _emit(self, end: int, items: list) -> None:
+        start, _, key = self._capture
+        self._capture = None
+        try:
+            items.append((key, json.loads(self._text[start:end])))
+        except ValueError:
+            pass
+
+    def _loads(self, start: int, end: int):
+        try:
+            return json.loads(self._text[start:end])
+        except ValueError:
+            return None
+
+    def _compact(self) -> None:
+        """丢弃已扫描且不再需要的文本"""
+        keep = min(p for p in (self._capture[0] if self._capture else None, self._key_start, self._pos)
+                   if p is not None)
+        if keep:
+            self._text = self._text[keep:]
+            self._pos -= keep
+            if self._key_start is not None:
+                self._key_start -= keep
+            if self._capture:
+                self._capture = (self._capture[0] - keep,) + self._capture[1:]
+
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JsonStringStream:
+    """逐段 feed() 文本，返回指定字段（任意层级，按键名匹配）字符串值中新解码出的部分 [(键, 文本)]"""
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self._key_re = re.compile(r'"(' + '|'.join(map(re.escape, fields)) + r')"\s*:\s*"')
+        self._text = ''
+        self._field: Optional[str] = None  # 正在输出的字段；None 表示在查找下一个字段
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        self._text += chunk
+        pieces = []
+        while True:
+            if self._field is None:
+                match = self._key_re.search(self._text)
+                if match is None:
+                    # 保留可能是半个键名的结尾
+                    self._text = self._text[-64:]
+                    return pieces
+                self._field, self._text = match.group(1), self._text[match.end():]
+            value, closed = self._decode()
+            if value:
+                pieces.append((self._field, value))
+            if not closed:
+                return pieces
+            self._field = None
+
+    def _decode(self) -> Tuple[str, bool]:
+        """解码到字符串结束或文本末尾（不完整的转义留待下次），返回 (文本, 是否已闭合)"""
+        text, out, i = self._text, [], 0
+        while i < len(text):
+            ch = text[i]
+            if ch == '"':
+                self._text = text[i + 1:]
+                return ''.join(out), True
+            if ch != '\\':
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(text):
+                break
+            if text[i + 1] == 'u':
+                # \uXXXX；代理对（高位 D800-DBFF）须与下一段一起解码
+                size = 12 if text[i + 2:i + 4].lower() in ('d8', 'd9', 'da', 'db') else 6
+                if i + size > len(text):
+                    break
+                try:
+                    out.append(json.loads(f'"{text[i:i + size]}"'))
+                except ValueError:
+                    pass
+                i += size
+            else:
+                out.append(_ESCAPES.get(text[i + 1], text[i + 1]))
+                i += 2
+        self._text = text[i:]
+        return ''.join(out), False
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用准入控制
+所有上游请求先在此取得所调模型的并发名额，突发流量在网关内排队而不是一起打到服务商触发限流：
+- 每个模型一个自适应并发上限（AIMD）：请求成功时加性增长（每轮约 +1），
+  遇到限流（429/503）或超时时乘性收缩（×backoff，冷却期内只收缩一次）
+- 优先级：critical（急诊评估、病历生成）> high > normal > low（翻译等后台任务）；
+  有名额空出时总是先放行优先级最高、等待最久的请求
+- 有界队列 + 按截止时间丢弃：预计排队加执行时间超出请求剩余预算时立即拒绝；
+  队列已满时新请求挤掉优先级更低的排队请求，否则自身被拒绝；排队超时同样拒绝。
+  低优先级请求因此快速失败，而不是排到预算耗尽才超时
+上游延迟与输出长度强相关，延迟梯度噪声太大，因此只以限流/超时作为拥塞信号。
+"""
+
+import time
+import heapq
+import itertools
+import threading
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"critical": 0, "high": 1, "normal": 2, "low": 3}
+
+
+class Overloaded(Exception):
+    """未取得并发名额（排队预计超时、队列已满、被更高优先级挤出或排队超时）"""
+
+
+class _Waiter:
+    __slots__ = ('rank', 'seq', 'event', 'granted', 'cancelled')
+
+    def __init__(self, rank: int, seq: int):
+        self.rank = rank
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False  # 超时离开或被挤出（堆中惰性删除）
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class _ModelState:
+    __slots__ = ('limit', 'inflight', 'waiters', 'queued', 'latency', 'last_decrease')
+
+    def __init__(self, limit: float, latency: float):
+        self.limit = limit
+        self.inflight = 0
+        self.waiters: List[_Waiter] = []
+        self.queued = 0
+        self.latency = latency  # 成功请求占用名额时长的指数滑动平均（秒）
+        self.last_decrease = 0.0
+
+
+class Permit:
+    """一个并发名额；请求结束时调用 release(结果)，结果为 ok / overload / error / cancelled"""
+
+    __slots__ = ('_controller', 'model', 'started', '_released')
+
+    def __init__(self, controller: 'AdmissionController', model: str):
+        self._controller = controller
+        self.model = model
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self, outcome: str = 'ok') -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self, outcome)
+
+
+class AdmissionController:
+    """按模型的自适应并发上限 + 优先级有界队列；线程安全"""
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 32, max_queue: int = 64,
+                 backoff: float = 0.7, cooldown: float = 2.0, initial_latency: float = 10.0):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.max_queue = max_queue
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.initial_latency = initial_latency
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "queued": 0, "shed_deadline": 0, "shed_queue_full": 0, "evicted": 0,
+                       "timeouts": 0, "decreases": 0}
+        self._by_priority = {name: {"admitted": 0, "shed": 0} for name in PRIORITIES}
+
+    def _model(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(float(min(self.initial_limit, self.max_limit)),
+                                                      self.initial_latency)
+        return state
+
+    def _shed(self, priority: str, counter: str, reason: str) -> Overloaded:
+        self._stats[counter] += 1
+        self._by_priority[priority]["shed"] += 1
+        return Overloaded(reason)
+
+    # ---------- 准入 ----------
+    def acquire(self, model: str, priority: str = 'normal', timeout: Optional[float] = None,
+                wait: bool = True) -> Permit:
+        """取得 model 的并发名额；timeout 为请求剩余预算（秒）。wait=False 时没有空闲名额立即拒绝。
+        未取得名额时抛出 Overloaded"""
+        priority = priority if priority in PRIORITIES else 'normal'
+        rank = PRIORITIES[priority]
+        with self._lock:
+            state = self._model(model)
+            ahead = sum(1 for w in state.waiters if not w.cancelled and w.rank <= rank)
+            if state.inflight < int(state.limit) and not ahead:
+                return self._grant(state, model, priority)
+            if not wait:
+                # 对冲等可选请求：放弃即可，不计入丢弃
+                raise Overloaded(f"{model} 无空闲名额")
+            # 前面的排队请求按当前上限分批执行，预计等待 + 自身执行超出剩余预算时不再排队
+            expected = (ahead // max(int(state.limit), 1) + 1) * state.latency
+            if timeout is not None and expected + state.latency > timeout:
+                raise self._shed(priority, "shed_deadline", f"{model} 预计排队加执行 {expected + state.latency:.1f}s，"
+                                                            f"超出剩余预算 {timeout:.1f}s")
+            if state.queued >= self.max_queue and not self._evict(state, rank):
+                raise self._shed(priority, "shed_queue_full", f"{model} 等待队列已满")
+            waiter = _Waiter(rank, next(self._seq))
+            heapq.heappush(state.waiters, waiter)
+            state.queued += 1
+            self._stats["queued"] += 1
+            # 须在剩余预算内留出执行时间
+            wait_for = None if timeout is None else max(timeout - state.latency, 0.0)
+        waiter.event.wait(wait_for)
+        with self._lock:
+            if waiter.granted:
+                return Permit(self, model)
+            if not waiter.cancelled:
+                waiter.cancelled = True
+                state.queued -= 1
+                self._stats["timeouts"] += 1
+                self._by_priority[priority]["shed"] += 1
+                raise Overloaded(f"{model} 排队超时")
+            raise self._shed(priority, "evicted", f"{model} 排队请求被更高优先级的请求挤出")
+
+    def _grant(self, state: _ModelState, model: str, priority: str) -> Permit:
+        """调用方需持有 self._lock"""
+        state.inflight += 1
+        self._stats["admitted"] += 1
+        self._by_priority[priority]["admitted"] += 1
+        return Permit(self, model)
+
+    def _evict(self, state: _ModelState, rank: int) -> bool:
+        """队列已满：挤掉优先级低于 rank 的排队请求中最晚到达的一个；调用方需持有 self._lock"""
+        candidates = [w for w in state.waiters if not w.cancelled and w.rank > rank]
+        if not candidates:
+            return False
+        victim = max(candidates)
+        victim.cancelled = True
+        state.queued -= 1
+        victim.event.set()
+        return True
+
+    def _dispatch(self, state: _ModelState) -> None:
+        """按优先级放行排队请求，直到名额用满；调用方需持有 self._lock"""
+        while state.waiters and state.inflight < int(state.limit):
+            waiter = heapq.heappop(state.waiters)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            state.queued -= 1
+            state.inflight += 1
+            self._stats["admitted"] += 1
+            self._by_priority[next(n for n, r in PRIORITIES.items() if r == waiter.rank)]["admitted"] += 1
+            waiter.event.set()
+
+    # ---------- 反馈 ----------
+    def _release(self, permit: Permit, outcome: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            state = self._model(permit.model)
+            state.inflight = max(state.inflight - 1, 0)
+            if outcome == 'ok':
+                state.latency = 0.8 * state.latency + 0.2 * (now - permit.started)
+                state.limit = min(self.max_limit, state.limit + 1.0 / state.limit)
+            elif outcome == 'overload' and now - state.last_decrease >= self.cooldown:
+                # 同一波限流只收缩一次，避免连续失败把上限压到底
+                state.limit = max(float(self.min_limit), state.limit * self.backoff)
+                state.last_decrease = now
+                self._stats["decreases"] += 1
+                logger.warning(f"模型 {permit.model} 触发限流/超时，并发上限降至 {int(state.limit)}")
+            self._dispatch(state)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "priorities": {name: dict(v) for name, v in self._by_priority.items()},
+                "models": {model: {"limit": int(s.limit), "inflight": s.inflight, "queued": s.queued,
+                                   "latency": round(s.latency, 2)} for model, s in self._models.items()},
+            }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用熔断
+每个 (模型, 传输方式) 一个熔断器，传输方式为 sync（同步请求）/ stream（SSE 流式）/ async（aiohttp）：
+- 滚动时间窗口内统计调用结果；调用数达到 min_calls 后，失败率或慢调用率超过阈值即熔断（open）
+- 熔断期间网关直接跳过该路径，改用回退模型，不再为已知故障的模型支付一次完整超时
+- 熔断 open_seconds 后进入半开（half_open），只放行一个试探请求：成功则恢复，
+  失败则重新熔断且等待时间加倍（不超过 max_open_seconds）
+只有上游故障计入失败（网络错误、超时、429、5xx）；请求本身的 4xx 与本地预算/准入拒绝不计入。
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    """单个 (模型, 传输方式) 的熔断器；线程安全"""
+
+    def __init__(self, window: float = 60.0, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call: float = 30.0, slow_rate: float = 0.8, open_seconds: float = 15.0,
+                 max_open_seconds: float = 120.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self._calls = deque()  # (时间, 是否成功, 是否慢调用)
+        self._lock = threading.Lock()
+        self._cooldown = open_seconds
+        self._reopen_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def allow(self) -> bool:
+        """是否放行一次调用；半开状态下放行即占用唯一的试探机会，未实际发出请求时须调用 abandon()"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._reopen_at:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def abandon(self) -> None:
+        """放弃已取得的试探机会（请求未发出或被调用方取消）"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok and latency < self.slow_call:
+                    self.state = CLOSED
+                    self._cooldown = self.open_seconds
+                    self._calls.clear()
+                else:
+                    self._trip(now, self._cooldown * 2)
+                return
+            if self.state == OPEN:
+                return  # 熔断前已发出的请求，结果不再影响状态
+            self._calls.append((now, ok, latency >= self.slow_call))
+            self._prune(now)
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if failures / total >= self.error_rate or slow / total >= self.slow_rate:
+                self._trip(now, self.open_seconds)
+
+    def _trip(self, now: float, cooldown: float) -> None:
+        """调用方需持有 self._lock"""
+        self.state = OPEN
+        self._cooldown = min(cooldown, self.max_open_seconds)
+        self._reopen_at = now + self._cooldown
+        self._calls.clear()
+        self.trips += 1
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            total = len(self._calls)
+            return {
+                "state": self.state,
+                "calls": total,
+                "error_rate": round(sum(1 for _, ok, _ in self._calls if not ok) / total, 2) if total else 0.0,
+                "slow_rate": round(sum(1 for _, _, slow in self._calls if slow) / total, 2) if total else 0.0,
+                "retry_in": round(max(self._reopen_at - now, 0.0), 1) if self.state == OPEN else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+class BreakerRegistry:
+    """按 (模型, 传输方式) 懒创建熔断器，参数共用"""
+
+    def __init__(self, enabled: bool = True, **options):
+        self.enabled = enabled
+        self.options = options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str, transport: str) -> Optional[CircuitBreaker]:
+        """未启用时返回 None"""
+        if not self.enabled:
+            return None
+        key = f"{model}/{transport}"
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(**self.options)
+            return breaker
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {"enabled": self.enabled, "breakers": {key: b.snapshot() for key, b in sorted(breakers.items())}}
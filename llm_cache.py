@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型响应缓存
+用于低温度、同输入同输出的确定性调用（知识搜索、指南查询、翻译、预问诊问题生成等）：
+- 精确键：sha256(model, messages, temperature, max_tokens)
+- 近似重复（可选）：调用方提供查询文本时，按归一化后的查询文本建键
+  （全角转半角、小写、去除空白与标点），"布洛芬？" 与 " 布洛芬 " 命中同一条缓存
+- 内存层为 LRU，按条目数与总字节数双重限制，条目带 TTL
+- 可选磁盘层（SQLite），重启后仍可命中
+- 按命名空间（接口）统计命中/未命中
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _DropTable(dict):
+    """str.translate 用的码位表：空白、标点、符号映射为 None，其余保持不变；按需填充"""
+
+    def __missing__(self, code: int):
+        ch = chr(code)
+        value = None if ch.isspace() or unicodedata.category(ch)[0] in 'PZS' else code
+        self[code] = value
+        return value
+
+
+_DROP_TABLE = _DropTable()
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询文本：NFKC、小写、去除空白与标点"""
+    return unicodedata.normalize('NFKC', text or '').lower().translate(_DROP_TABLE)
+
+
+class ResponseCache:
+    """带 TTL 的 LRU 响应缓存，可选 SQLite 磁盘层；线程安全"""
+
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 20000, near_duplicate: bool = False):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self.near_duplicate = near_duplicate
+        self._entries = OrderedDict()  # key -> (expires_at, size, (content, model_used))
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._puts = 0
+        self._local = threading.local()
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._conn().execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, expires_at REAL NOT NULL, content TEXT NOT NULL, model TEXT NOT NULL)'
+            )
+            self._conn().execute('CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires_at)')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def make_key(self, namespace: str, model: str, messages: list, temperature: float, max_tokens: int,
+                 query: Optional[str] = None) -> str:
+        if self.near_duplicate and query:
+            basis = {"ns": namespace, "model": model, "query": normalize_query(query),
+                     "temperature": temperature, "max_tokens": max_tokens}
+        else:
+            basis = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        raw = json.dumps(basis, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _count(self, namespace: str, field: str) -> None:
+        ns = self._stats.setdefault(namespace, {"hits": 0, "disk_hits": 0, "misses": 0})
+        ns[field] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._count(namespace, "hits")
+                    return entry[2]
+                self._drop(key)
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self._count(namespace, "misses")
+                return None
+            self._count(namespace, "disk_hits")
+            self._insert(key, value[1], value[0])
+        return value[0]
+
+    def put(self, namespace: str, key: str, content: str, model_used: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._insert(key, expires_at, (content, model_used))
+            self._puts += 1
+            prune = self._puts % 200 == 0
+        self._disk_put(key, expires_at, content, model_used, prune)
+
+    def _insert(self, key: str, expires_at: float, value: Tuple[str, str]) -> None:
+        size = len(value[0].encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[Tuple[str, str], float]]:
+        if not self.disk_path:
+            return None
+        try:
+            row = self._conn().execute(
+                'SELECT content, model, expires_at FROM responses WHERE key = ? AND expires_at > ?', (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存磁盘读取失败: {e}")
+            return None
+        return ((row[0], row[1]), row[2]) if row else None
+
+    def _disk_put(self, key: str, expires_at: float, content: str, model_used: str, prune: bool) -> None:
+        if not self.disk_path:
+            return
+        try:
+            conn = self._conn()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses(key, expires_at, content, model) VALUES (?, ?, ?, ?)',
+                (key, expires_at, content, model_used),
+            )
+            if prune:
+                conn.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),))
+                conn.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses '
+                    'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)', (self.disk_max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"LLM缓存磁盘写入失败: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_path:
+            self._conn().execute('DELETE FROM responses')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "near_duplicate": self.near_duplicate,
+                "disk": bool(self.disk_path),
+                "namespaces": {ns: dict(v) for ns, v in self._stats.items()},
+            }
+
+
+def create_response_cache(data_dir: str) -> ResponseCache:
+    """按环境变量创建响应缓存：
+    LLM_CACHE_TTL（秒）、LLM_CACHE_MAX_ENTRIES、LLM_CACHE_MAX_MB、
+    LLM_CACHE_DISK（1 启用磁盘层，路径为 LLM_CACHE_DB_PATH 或 data/llm_cache.db）、
+    LLM_CACHE_NEAR_DUP（1 启用按归一化查询文本的近似重复命中）
+    """
+    disk_path = None
+    if (os.getenv('LLM_CACHE_DISK') or '0') == '1':
+        disk_path = os.getenv('LLM_CACHE_DB_PATH') or os.path.join(data_dir, 'llm_cache.db')
+    return ResponseCache(
+        ttl=float(os.getenv('LLM_CACHE_TTL') or 86400),
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES') or 1000),
+        max_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB') or 32) * 1024 * 1024),
+        disk_path=disk_path,
+        near_duplicate=(os.getenv('LLM_CACHE_NEAR_DUP') or '0') == '1',
+    )
@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用网关
+统一封装 OpenAI 兼容的 /chat/completions 接口（DashScope compatible-mode）：
+- 共享 requests.Session + 连接池，keep-alive 复用 TLS 连接
+- 每次请求有一个整体时间预算（Deadline），各次尝试的超时取单次上限与剩余预算的较小值
+- 对冲回退：主模型在 hedge_delay 秒内未返回或已失败时，并行发起回退模型（默认 qwen-plus），
+  先成功者返回，不再串行等待
+- 流式 stream：SSE 逐段产出文本增量；尚未输出内容前失败时改用回退模型（流式请求不做对冲）
+- 准入控制（可选，见 llm_admission）：complete/stream 先按优先级取得模型并发名额；
+  名额紧张时不再发起对冲，排不上队的请求快速失败（LLMError，status=429）
+- 熔断（可选，见 llm_breaker）：按 (模型, 传输方式) 统计失败率与慢调用率，已熔断的路径直接跳过，
+  主模型故障期间请求直接走回退模型，不必先等主模型超时
+- asyncio 版本 acomplete：安装 aiohttp 时走异步连接池，否则在线程池中复用同步实现
+"""
+
+import json
+import time
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp  # 可选依赖：异步连接池
+except ImportError:
+    aiohttp = None
+
+from llm_admission import AdmissionController, Overloaded, Permit
+from llm_breaker import BreakerRegistry, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(RuntimeError):
+    """上游模型调用失败；status 为 HTTP 状态码（网络错误/超时为 None）"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class Deadline:
+    """一次请求的整体时间预算，所有尝试共享"""
+
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """单次尝试可用的超时：不超过 cap，也不超过剩余预算"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise LLMError("llm_deadline_exceeded")
+        return min(cap, remaining)
+
+
+def _alt_messages(messages: list) -> list:
+    """兼容另一种消息格式：content 统一为对象数组"""
+    alt = []
+    for m in messages:
+        c = m.get("content")
+        if isinstance(c, list):
+            alt.append(m)
+        else:
+            alt.append({"role": m.get("role", "user"), "content": [{"type": "text", "text": str(c)}]})
+    return alt
+
+
+def _extract_content(data: dict) -> str:
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        raise LLMError(f"llm_bad_response: {json.dumps(data, ensure_ascii=False)[:300]}")
+
+
+class LLMGateway:
+    """OpenAI 兼容接口的网关客户端，线程安全，进程内共享一个实例"""
+
+    def __init__(self, base_url: str, api_key: str, fallback_model: Optional[str] = "qwen-plus",
+                 budget: float = 90.0, attempt_timeout: float = 60.0, connect_timeout: float = 5.0,
+                 hedge_delay: float = 10.0, pool_size: int = 32,
+                 admission: Optional[AdmissionController] = None,
+                 breakers: Optional[BreakerRegistry] = None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.fallback_model = fallback_model
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self.connect_timeout = connect_timeout
+        self.hedge_delay = hedge_delay
+        self.pool_size = pool_size
+        self.admission = admission
+        self.breakers = breakers
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(self.headers)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='llm')
+        self._aio_session = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedged": 0, "hedge_skipped": 0, "circuit_skipped": 0, "fallback_used": 0,
+                       "failures": 0}
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        if self.admission is not None:
+            stats["admission"] = self.admission.stats()
+        return stats
+
+    # ---------- 准入 ----------
+    def _admit(self, model: str, priority: str, deadline: Deadline, wait: bool = True) -> Optional[Permit]:
+        """取得 model 的并发名额（未启用准入控制时返回 None）；排不上队时抛出 LLMError(status=429)"""
+        if self.admission is None:
+            return None
+        try:
+            return self.admission.acquire(model, priority, deadline.remaining(), wait=wait)
+        except Overloaded as e:
+            raise LLMError(f"llm_overloaded: {e}", status=429)
+
+    @staticmethod
+    def _settle(permit: Optional[Permit], error: Optional[BaseException]) -> None:
+        """归还名额并反馈结果：限流/过载/超时使并发上限收缩"""
+        if permit is None:
+            return
+        if error is None:
+            permit.release('ok')
+        elif isinstance(error, requests.Timeout) or (isinstance(error, LLMError) and (
+                error.status in (429, 503, 504) or str(error).startswith('llm_timeout'))):
+            permit.release('overload')
+        else:
+            permit.release('error')
+
+    # ---------- 熔断 ----------
+    def _breaker(self, model: str, transport: str) -> Optional[CircuitBreaker]:
+        return self.breakers.get(model, transport) if self.breakers is not None else None
+
+    def _circuit_open(self, breaker: Optional[CircuitBreaker], model: str) -> Optional[LLMError]:
+        """路径已熔断时返回对应错误（调用方跳过该候选），否则返回 None"""
+        if breaker is None or breaker.allow():
+            return None
+        self._count("circuit_skipped")
+        return LLMError(f"llm_circuit_open: {model}", status=503)
+
+    @staticmethod
+    def _is_upstream_failure(error: BaseException) -> bool:
+        """上游故障（计入熔断）：网络错误、超时、429、5xx、无法解析的响应"""
+        if isinstance(error, requests.RequestException):
+            return True
+        if not isinstance(error, LLMError) or str(error).startswith(('llm_deadline_exceeded', 'llm_overloaded')):
+            return False
+        return error.status is None or error.status == 429 or error.status >= 500
+
+    @classmethod
+    def _observe(cls, breaker: Optional[CircuitBreaker], started: float, error: Optional[BaseException],
+                 ended: Optional[float] = None) -> None:
+        """向熔断器反馈一次调用结果（延迟为 started 到 ended，默认到当前时间）；
+        请求自身的问题不计入，只释放可能占用的试探机会"""
+        if breaker is None:
+            return
+        if error is None or cls._is_upstream_failure(error):
+            breaker.record(error is None, (ended or time.monotonic()) - started)
+        else:
+            breaker.abandon()
+
+    @staticmethod
+    def build_payload(model: str, messages: list, temperature: float, max_tokens: int, **extra) -> dict:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        payload.update(extra)
+        return payload
+
+    def _candidates(self, model: str) -> List[str]:
+        """对冲候选：主模型 + 回退模型（与主模型相同时即为同模型的对冲请求）"""
+        return [model] + ([self.fallback_model] if self.fallback_model else [])
+
+    # ---------- 同步 ----------
+    def _post(self, payload: dict, deadline: Deadline) -> dict:
+        timeout = deadline.timeout(self.attempt_timeout)
+        try:
+            resp = self.session.post(self.url, json=payload,
+                                     timeout=(min(self.connect_timeout, timeout), timeout))
+        except requests.Timeout as e:
+            raise LLMError(f"llm_timeout: {e}")
+        except requests.RequestException as e:
+            raise LLMError(f"llm_request_failed: {e}")
+        if not resp.ok:
+            raise LLMError(f"qwen_api_{resp.status_code}: {resp.text[:300]}", status=resp.status_code)
+        return resp.json()
+
+    def _attempt(self, model: str, messages: list, temperature: float, max_tokens: int,
+                 deadline: Deadline) -> str:
+        payload = self.build_payload(model, messages, temperature, max_tokens)
+        try:
+            return _extract_content(self._post(payload, deadline))
+        except LLMError as e:
+            if e.status != 400:
+                raise
+            # 400 时尝试另一种消息格式
+            payload["messages"] = _alt_messages(messages)
+            try:
+                return _extract_content(self._post(payload, deadline))
+            except LLMError as e2:
+                raise LLMError(f"qwen_api_400_alt_failed: {e2} | orig: {e}", status=e2.status)
+
+    def complete(self, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 1500,
+                 budget: Optional[float] = None, priority: str = 'normal') -> Tuple[str, str]:
+        """聊天补全，返回 (文本内容, 实际使用模型)；全部失败或超出预算时抛出 LLMError。
+        priority 为准入优先级（critical / high / normal / low）"""
+        self._count("requests")
+        deadline = Deadline(budget or self.budget)
+        candidates = self._candidates(model)
+        pending = {}
+        live = {}  # future -> (名额, 熔断器, 发出时间)，结算时取出，保证每个请求只结算一次
+        launched = 0
+        last_error = None
+        won = False
+
+        def settle(future, error, abandoned=False) -> None:
+            entry = live.pop(future, None)
+            if entry is None:
+                return
+            permit, breaker, started = entry
+            if abandoned:
+                # 落选的对冲请求：立即归还名额与熔断试探机会，不作为拥塞或故障信号
+                if permit is not None:
+                    permit.release('cancelled')
+                if breaker is not None:
+                    breaker.abandon()
+                return
+            self._settle(permit, error)
+            self._observe(breaker, started, error)
+
+        def launch(wait_for_slot: bool) -> bool:
+            """发起下一个候选；对冲时（wait_for_slot=False）没有空闲名额则放弃本次对冲"""
+            nonlocal launched, last_error
+            used = candidates[launched]
+            breaker = self._breaker(used, 'sync')
+            error = self._circuit_open(breaker, used)
+            if error is not None:
+                # 已熔断：直接跳过该候选
+                launched += 1
+                last_error = error
+                return False
+            try:
+                permit = self._admit(used, priority, deadline, wait=wait_for_slot)
+            except LLMError as e:
+                if breaker is not None:
+                    breaker.abandon()
+                if wait_for_slot:
+                    launched += 1
+                    last_error = e
+                    logger.warning(f"LLM call rejected for {used}: {e}")
+                return False
+            future = self._executor.submit(self._attempt, used, messages, temperature, max_tokens, deadline)
+            live[future] = (permit, breaker, time.monotonic())
+            future.add_done_callback(lambda f: settle(f, None if f.cancelled() else f.exception(), f.cancelled()))
+            pending[future] = used
+            launched += 1
+            return True
+
+        while launched < len(candidates) and not pending:
+            launch(True)
+        try:
+            while pending:
+                # 还有候选未发出时，最多等待 hedge_delay 再对冲
+                wait_for = deadline.remaining()
+                if launched < len(candidates):
+                    wait_for = min(wait_for, self.hedge_delay)
+                done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    used = pending.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"LLM call failed for {used}: {e}")
+                        continue
+                    if launched > 1 and used != model:
+                        self._count("fallback_used")
+                    won = True
+                    return content, used
+                if deadline.expired:
+                    break
+                if pending:
+                    if launched < len(candidates):
+                        if launch(False):
+                            self._count("hedged")
+                        else:
+                            self._count("hedge_skipped")
+                else:
+                    # 已发出的都失败了：剩余候选排队等待名额
+                    while launched < len(candidates) and not pending:
+                        launch(True)
+        finally:
+            if won:
+                # 已有结果：未开始的落选请求直接取消，已发出的立即归还名额（执行线程在其 HTTP 请求返回后空出）；
+                # 超时放弃的请求仍按实际结果结算，作为拥塞信号
+                for future in pending:
+                    future.cancel()
+                    settle(future, None, abandoned=True)
+        self._count("failures")
+        if pending or last_error is None:
+            raise LLMError("llm_deadline_exceeded")
+        raise last_error
+
+    # ---------- 流式 ----------
+    def _open_stream(self, model: str, messages: list, temperature: float, max_tokens: int,
+                     deadline: Deadline) -> requests.Response:
+        payload = self.build_payload(model, messages, temperature, max_tokens, stream=True)
+        for attempt in (payload["messages"], _alt_messages(messages)):
+            payload["messages"] = attempt
+            timeout = deadline.timeout(self.attempt_timeout)
+            try:
+                resp = self.session.post(self.url, json=payload, stream=True,
+                                         timeout=(min(self.connect_timeout, timeout), timeout))
+            except requests.Timeout as e:
+                raise LLMError(f"llm_timeout: {e}")
+            except requests.RequestException as e:
+                raise LLMError(f"llm_request_failed: {e}")
+            if resp.ok:
+                resp.encoding = 'utf-8'  # text/event-stream 未声明 charset 时 requests 默认按 latin-1 解码
+                return resp
+            error = LLMError(f"qwen_api_{resp.status_code}: {resp.text[:300]}", status=resp.status_code)
+            resp.close()
+            # 400 时尝试另一种消息格式
+            if error.status != 400:
+                raise error
+        raise error
+
+    @staticmethod
+    def _iter_deltas(resp: requests.Response) -> Iterator[str]:
+        for raw in resp.iter_lines(decode_unicode=True):
+            if not raw or not raw.startswith('data:'):
+                continue
+            chunk = raw[5:].strip()
+            if chunk == '[DONE]':
+                return
+            try:
+                choice = (json.loads(chunk).get('choices') or [{}])[0]
+            except (ValueError, AttributeError):
+                continue
+            delta = (choice.get('delta') or {}).get('content') or (choice.get('message') or {}).get('content')
+            if delta:
+                yield delta
+
+    def stream(self, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 1500,
+               budget: Optional[float] = None, priority: str = 'normal') -> Iterator[Tuple[str, str]]:
+        """流式聊天补全，逐段产出 (文本增量, 实际使用模型)。
+        收到第一段内容前失败时依次改用回退模型；已开始输出后失败、全部失败或超出预算时抛出 LLMError。
+        每个候选在整个流式输出期间占用一个并发名额"""
+        self._count("requests")
+        deadline = Deadline(budget or self.budget)
+        last_error = None
+        for used in self._candidates(model):
+            breaker = self._breaker(used, 'stream')
+            error = self._circuit_open(breaker, used)
+            if error is not None:
+                last_error = error
+                continue
+            started = False
+            permit, outcome = None, 'cancelled'
+            opened_at = first_delta_at = time.monotonic()
+            try:
+                permit = self._admit(used, priority, deadline)
+                with self._open_stream(used, messages, temperature, max_tokens, deadline) as resp:
+                    for delta in self._iter_deltas(resp):
+                        if not started:
+                            started = True
+                            first_delta_at = time.monotonic()
+                        yield delta, used
+                        if deadline.expired:
+                            raise LLMError("llm_deadline_exceeded")
+                outcome = None
+            except (LLMError, requests.RequestException) as e:
+                outcome = e
+                error = e if isinstance(e, LLMError) else LLMError(f"llm_stream_failed: {e}")
+                if started or deadline.expired:
+                    self._count("failures")
+                    raise error
+                last_error = error
+                logger.warning(f"LLM stream failed for {used}: {e}")
+                continue
+            finally:
+                # 调用方提前关闭（客户端断开）时归还名额，不作为拥塞信号
+                if permit is not None:
+                    if outcome == 'cancelled':
+                        permit.release('cancelled')
+                    else:
+                        self._settle(permit, outcome)
+                # 每次调用只向熔断器反馈一次：成功（含已有输出后客户端断开）按首个增量的到达时间计延迟
+                if breaker is not None:
+                    if outcome == 'cancelled' and not started:
+                        breaker.abandon()
+                    else:
+                        failure = None if outcome == 'cancelled' else outcome
+                        self._observe(breaker, opened_at, failure,
+                                      ended=first_delta_at if started and failure is None else None)
+            if used != model:
+                self._count("fallback_used")
+            return
+        self._count("failures")
+        raise last_error or LLMError("llm_deadline_exceeded")
+
+    # ---------- asyncio ----------
+    async def _apost(self, payload: dict, deadline: Deadline) -> dict:
+        if aiohttp is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._post, payload, deadline)
+        timeout = deadline.timeout(self.attempt_timeout)
+        session = self._get_aio_session()
+        try:
+            async with session.post(self.url, json=payload, timeout=aiohttp.ClientTimeout(
+                    total=timeout, connect=min(self.connect_timeout, timeout))) as resp:
+                if resp.status >= 400:
+                    text = await resp.text()
+                    raise LLMError(f"qwen_api_{resp.status}: {text[:300]}", status=resp.status)
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"llm_request_failed: {e!r}")
+
+    def _get_aio_session(self):
+        """每个事件循环一个 aiohttp 会话（连接池随会话复用）"""
+        loop = asyncio.get_running_loop()
+        session = self._aio_session
+        if session is None or session.closed or getattr(session, '_gateway_loop', None) is not loop:
+            session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            )
+            session._gateway_loop = loop
+            self._aio_session = session
+        return session
+
+    async def _aattempt(self, model: str, messages: list, temperature: float, max_tokens: int,
+                        deadline: Deadline) -> str:
+        payload = self.build_payload(model, messages, temperature, max_tokens)
+        try:
+            return _extract_content(await self._apost(payload, deadline))
+        except LLMError as e:
+            if e.status != 400:
+                raise
+            payload["messages"] = _alt_messages(messages)
+            try:
+                return _extract_content(await self._apost(payload, deadline))
+            except LLMError as e2:
+                raise LLMError(f"qwen_api_400_alt_failed: {e2} | orig: {e}", status=e2.status)
+
+    async def _aobserved(self, model: str, messages: list, temperature: float, max_tokens: int,
+                         deadline: Deadline) -> str:
+        """_aattempt 并向 async 传输的熔断器反馈结果"""
+        breaker = self._breaker(model, 'async')
+        started = time.monotonic()
+        try:
+            content = await self._aattempt(model, messages, temperature, max_tokens, deadline)
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.abandon()
+            raise
+        except Exception as e:
+            self._observe(breaker, started, e)
+            raise
+        self._observe(breaker, started, None)
+        return content
+
+    async def acomplete(self, model: str, messages: list, temperature: float = 0.3, max_tokens: int = 1500,
+                        budget: Optional[float] = None) -> Tuple[str, str]:
+        """complete 的 asyncio 版本，对冲、熔断与预算规则相同（不经准入控制）"""
+        self._count("requests")
+        deadline = Deadline(budget or self.budget)
+        candidates = self._candidates(model)
+        pending = {}
+        launched = 0
+        last_error = None
+
+        def launch() -> bool:
+            """发起下一个未熔断的候选"""
+            nonlocal launched, last_error
+            while launched < len(candidates):
+                used = candidates[launched]
+                launched += 1
+                error = self._circuit_open(self._breaker(used, 'async'), used)
+                if error is not None:
+                    last_error = error
+                    continue
+                pending[asyncio.ensure_future(self._aobserved(used, messages, temperature,
+                                                              max_tokens, deadline))] = used
+                return True
+            return False
+
+        launch()
+        try:
+            while pending:
+                wait_for = deadline.remaining()
+                if launched < len(candidates):
+                    wait_for = min(wait_for, self.hedge_delay)
+                done, _ = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    used = pending.pop(task)
+                    try:
+                        content = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logger.warning(f"LLM call failed for {used}: {e}")
+                        continue
+                    if launched > 1 and used != model:
+                        self._count("fallback_used")
+                    return content, used
+                if deadline.expired:
+                    break
+                if launched < len(candidates):
+                    hedging = bool(pending)
+                    if launch() and hedging:
+                        self._count("hedged")
+        finally:
+            # 已有结果或超时后取消仍在进行的请求
+            for task in pending:
+                task.cancel()
+        self._count("failures")
+        if pending or last_error is None:
+            raise LLMError("llm_deadline_exceeded")
+        raise last_error
+
+    async def aclose(self) -> None:
+        if self._aio_session is not None and not self._aio_session.closed:
+            await self._aio_session.close()
+        self._aio_session = None
+
+    def close(self) -> None:
+        self.session.close()
+        self._executor.shutdown(wait=False)
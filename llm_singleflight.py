@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用合并（single-flight）
+同一提示词的请求同时到达时（热门知识/指南查询），只向上游发起一次调用，其余请求等待并共享结果：
+- 键与响应缓存相同（llm_cache.make_key），开启近似重复时按归一化查询文本合并
+- do()：非流式调用，跟随者等待领头调用返回，失败时抛出同一异常
+- stream()：流式调用由后台线程拉取上游增量写入共享缓冲，每个订阅者先回放已有增量再接收新增量；
+  订阅者断开不影响上游调用与其他订阅者
+- 流式与非流式调用共用同一张在途表，二者可以互相合并
+调用结束即移出在途表，之后的相同请求由响应缓存命中或重新调用。
+"""
+
+import threading
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次在途调用：按顺序累积的 (文本增量, 实际使用模型)，结束后 done=True"""
+
+    __slots__ = ('cond', 'chunks', 'done', 'error', 'followers')
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks: List[Tuple[str, str]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+    def add(self, chunk: Tuple[str, str]) -> None:
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def follow(self) -> Iterator[Tuple[str, str]]:
+        """从头回放并跟随增量，直到调用结束；调用失败时抛出其异常"""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.chunks) and not self.done:
+                    self.cond.wait()
+                batch, index = self.chunks[index:], len(self.chunks)
+                finished, error = self.done, self.error
+            yield from batch
+            if finished and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+    def result(self) -> Tuple[str, str]:
+        with self.cond:
+            while not self.done:
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            return ''.join(delta for delta, _ in self.chunks), (self.chunks[-1][1] if self.chunks else '')
+
+
+class SingleFlight:
+    """按键合并同时在途的相同调用；线程安全"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "stream_calls": 0, "stream_coalesced": 0, "max_followers": 0}
+
+    def _join(self, key: str, kind: str) -> Tuple[_Flight, bool]:
+        """返回 (在途调用, 是否为领头者)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self._stats[kind] += 1
+                return flight, True
+            flight.followers += 1
+            self._stats["coalesced" if kind == "calls" else "stream_coalesced"] += 1
+            self._stats["max_followers"] = max(self._stats["max_followers"], flight.followers)
+            return flight, False
+
+    def _finish(self, key: str, flight: _Flight, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+        if flight.followers:
+            logger.info(f"LLM调用合并: {flight.followers} 个相同请求共享一次上游调用")
+
+    def do(self, key: str, call: Callable[[], Tuple[str, str]]) -> Tuple[str, str]:
+        """执行 call() -> (文本, 实际使用模型)；相同键已在途时等待其结果"""
+        if not self.enabled:
+            return call()
+        flight, leader = self._join(key, "calls")
+        if not leader:
+            return flight.result()
+        try:
+            content, model_used = call()
+        except BaseException as e:
+            self._finish(key, flight, e)
+            raise
+        flight.add((content, model_used))
+        self._finish(key, flight)
+        return content, model_used
+
+    def stream(self, key: str, upstream: Callable[[], Iterable[Tuple[str, str]]]) -> Iterator[Tuple[str, str]]:
+        """流式版本：upstream() 产出 (文本增量, 实际使用模型)；相同键已在途时订阅其增量"""
+        if not self.enabled:
+            yield from upstream()
+            return
+        flight, leader = self._join(key, "stream_calls")
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, upstream), daemon=True).start()
+        yield from flight.follow()
+
+    def _pump(self, key: str, flight: _Flight, upstream: Callable[[], Iterable[Tuple[str, str]]]) -> None:
+        try:
+            for chunk in upstream():
+                flight.add(chunk)
+        except BaseException as e:  # 转交给所有订阅者
+            self._finish(key, flight, e)
+            return
+        self._finish(key, flight)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "enabled": self.enabled, "in_flight": len(self._flights)}
@@ -123,11 +123,8 @@ document.addEventListener('DOMContentLoaded', async function() {
         console.error('检查通知权限失败:', e);
     }
 
-    // 加载初始数据（确保顺序）
-    await loadMedications();
-    await loadIntakeRecords();
-    await loadReminders();
-    loadStats();
+    // 加载初始数据（一次请求取回用药、提醒、服药记录与统计）
+    await loadDashboard();
 
     // 设置当前日期时间
     const now = new Date();
@@ -256,10 +253,7 @@ function filterByRecord() {
     console.log('档案筛选：', currentRecordFilter);  // 调试信息
     
     // 重新加载所有数据以应用筛选
-    loadMedications();
-    loadIntakeRecords();
-    loadReminders();  // 也重新加载提醒
-    loadStats();
+    loadDashboard();
     
     // 提示用户当前筛选状态
     if (currentRecordFilter) {
@@ -273,6 +267,47 @@ function filterByRecord() {
     }
 }
 
+// ==================== 用药仪表盘 ====================
+
+// 一次请求取回当前档案的用药记录、提醒、服药记录与依从性统计（同一快照）；
+// 响应带 ETag，内容未变时浏览器重新验证只得到 304。失败时退回逐项加载
+async function loadDashboard() {
+    if (!currentRecordFilter) {
+        await loadMedications();
+        await loadIntakeRecords();
+        await loadReminders();
+        loadStats();
+        return;
+    }
+    try {
+        const url = `${API_BASE}/medications/dashboard?username=${currentUser}&record_id=${currentRecordFilter}&days=7`;
+        const response = await fetch(url);
+        const data = await response.json();
+        if (!data.success) throw new Error(data.message);
+
+        medications = data.medications;
+        renderMedications(medications);
+        updateMedicationSelectors();
+
+        intakeRecords = data.intake_records;
+        renderIntakeRecords(intakeRecords);
+
+        reminders = data.reminders;
+        renderReminders(reminders);
+        if (reminders.length > 0 && Notification.permission === 'granted') {
+            startReminderCheck();
+        }
+
+        renderStats(data.stats);
+    } catch (error) {
+        console.warn('加载用药仪表盘失败，改为逐项加载:', error);
+        await loadMedications();
+        await loadIntakeRecords();
+        await loadReminders();
+        loadStats();
+    }
+}
+
 // ==================== 用药记录管理 ====================
 
 async function loadMedications(status = null) {
@@ -473,6 +508,33 @@ function editMedication(medicationId) {
     }
 }
 
+// 药名输入联想：停止输入 200ms 后查询，只展示最后一次输入的结果
+let medicationSuggestTimer = null;
+let medicationSuggestSeq = 0;
+
+function suggestMedicationNames(text) {
+    clearTimeout(medicationSuggestTimer);
+    const query = (text || '').trim();
+    if (!query) return;
+    medicationSuggestTimer = setTimeout(async () => {
+        const seq = ++medicationSuggestSeq;
+        try {
+            const response = await fetch(`${API_BASE}/medications/autocomplete?q=${encodeURIComponent(query)}&limit=8`);
+            const data = await response.json();
+            if (seq !== medicationSuggestSeq || !data.success) return;
+            const list = document.getElementById('medication-name-suggestions');
+            list.innerHTML = '';
+            data.suggestions.forEach(item => {
+                const option = document.createElement('option');
+                option.value = item.matched === item.name ? item.name : `${item.matched}（${item.name}）`;
+                list.appendChild(option);
+            });
+        } catch (error) {
+            console.error('药名联想失败:', error);
+        }
+    }, 200);
+}
+
 async function addMedication(event) {
     event.preventDefault();
     
@@ -1034,6 +1096,30 @@ async function recordIntakeQuick(medicationId, medicationName) {
 
 // ==================== AI分析 ====================
 
+// 读取 POST 请求返回的 SSE 流（EventSource 只支持 GET），每条消息回调 onEvent(事件名, 数据)
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            const dataLines = [];
+            message.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
+
 async function performAIAnalysis() {
     const container = document.getElementById('analysis-result');
     container.innerHTML = '<div class="loading">正在进行AI分析</div>';
@@ -1052,7 +1138,8 @@ async function performAIAnalysis() {
             return;
         }
 
-        const response = await fetch(`${API_BASE}/medications/ai-analyze`, {
+        // 流式接口：知识库结果立即显示，AI 给出的每条相互作用/警告/建议到达即追加
+        const response = await fetch(`${API_BASE}/medications/ai-analyze/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -1063,14 +1150,29 @@ async function performAIAnalysis() {
             })
         });
 
-        const data = await response.json();
-
-        if (data.success) {
-            renderAIAnalysis(data.analysis);
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             showError('AI分析失败: ' + data.message);
             container.innerHTML = `<div class="empty-state"><p>分析失败: ${data.message}</p></div>`;
+            return;
         }
+
+        const partial = { summary: '正在分析中...', interactions: [], warnings: [], suggestions: [] };
+        const lists = { interaction: 'interactions', warning: 'warnings', suggestion: 'suggestions' };
+        await readEventStream(response, (event, data) => {
+            if (lists[event]) {
+                partial[lists[event]].push(data);
+                renderAIAnalysis(partial);
+            } else if (event === 'summary') {
+                partial.summary = data.summary;
+                renderAIAnalysis(partial);
+            } else if (event === 'done') {
+                renderAIAnalysis(data.analysis);
+            } else if (event === 'error') {
+                showError('AI分析失败: ' + data.message);
+                container.innerHTML = `<div class="empty-state"><p>分析失败: ${data.message}</p></div>`;
+            }
+        });
     } catch (error) {
         showError('网络错误: ' + error.message);
         container.innerHTML = `<div class="empty-state"><p>网络错误: ${error.message}</p></div>`;
@@ -1214,6 +1316,7 @@ function renderStats(stats) {
 // ==================== 通知权限管理 ====================
 
 let notificationCheckInterval = null;
+let reminderEventSource = null;
 
 function requestNotificationPermission() {
     if (!('Notification' in window)) {
@@ -1265,11 +1368,15 @@ function requestNotificationPermission() {
 }
 
 function startReminderCheck() {
-    // 清除旧的定时器
+    // 清除旧的定时器和推送连接
     if (notificationCheckInterval) {
         clearInterval(notificationCheckInterval);
         notificationCheckInterval = null;
     }
+    if (reminderEventSource) {
+        reminderEventSource.close();
+        reminderEventSource = null;
+    }
 
     // 如果没有提醒或未选择档案，不启动检查
     if (!reminders || reminders.length === 0 || !currentRecordFilter) {
@@ -1277,6 +1384,32 @@ function startReminderCheck() {
         return;
     }
 
+    // 优先接收服务端调度推送的到期提醒；不支持 SSE 或连接被关闭时退回本地每分钟检查
+    if (window.EventSource && currentUser) {
+        reminderEventSource = new EventSource(`${API_BASE}/medications/reminders/stream?username=${encodeURIComponent(currentUser)}`);
+        reminderEventSource.addEventListener('reminder', (e) => {
+            const event = JSON.parse(e.data);
+            const reminder = reminders.find(r => r.id === event.reminder_id);
+            if (!reminder) return; // 不属于当前档案
+            const lastRemindedKey = `last_reminded_${reminder.id}_${event.fire_at.slice(11, 16)}_${event.fire_at.slice(0, 10)}`;
+            if (localStorage.getItem(lastRemindedKey)) return;
+            sendMedicationNotification(reminder);
+            localStorage.setItem(lastRemindedKey, 'true');
+        });
+        reminderEventSource.onerror = () => {
+            if (reminderEventSource && reminderEventSource.readyState === EventSource.CLOSED) {
+                reminderEventSource = null;
+                startLocalReminderCheck();
+            }
+        };
+        console.log('已订阅服务端服药提醒推送');
+        return;
+    }
+
+    startLocalReminderCheck();
+}
+
+function startLocalReminderCheck() {
     console.log('启动服药提醒检查');
 
     // 立即检查一次（测试用）
@@ -1479,10 +1612,12 @@ function triggerPhotoUpload() {
     fileInput.click();
     
     fileInput.onchange = async function(e) {
-        const file = e.target.files[0];
-        if (file) {
-            await recognizeMedicationFromFile(file);
+        // 支持一次选择多张照片，后端并发识别后合并结果
+        const files = Array.from(e.target.files || []).slice(0, 6);
+        if (files.length > 0) {
+            await recognizeMedicationFromFile(files);
         }
+        fileInput.value = '';
     };
 }
 
@@ -1541,8 +1676,10 @@ async function captureMedicationPhoto() {
     }
 }
 
-// 识别药品（从文件）
-async function recognizeMedicationFromFile(file) {
+// 识别药品（从文件，可传入多张照片）
+async function recognizeMedicationFromFile(fileOrFiles) {
+    const files = Array.isArray(fileOrFiles) ? fileOrFiles : [fileOrFiles];
+    const file = files[0];
     try {
         // 显示加载状态
         const preview = document.getElementById('medication-preview');
@@ -1555,30 +1692,48 @@ async function recognizeMedicationFromFile(file) {
         reader.onload = function(e) {
             photoImg.src = e.target.result;
             preview.style.display = 'block';
-            statusDiv.innerHTML = '🔄 正在识别药品信息...';
+            statusDiv.innerHTML = files.length > 1
+                ? `🔄 正在识别 ${files.length} 张照片中的药品信息...`
+                : '🔄 正在识别药品信息...';
             listDiv.style.display = 'none';
         };
         reader.readAsDataURL(file);
         
         // 转换为Base64用于上传
-        const base64Data = await new Promise((resolve) => {
+        const images = await Promise.all(files.map(f => new Promise((resolve) => {
             const reader = new FileReader();
             reader.onload = () => resolve(reader.result);
-            reader.readAsDataURL(file);
-        });
+            reader.readAsDataURL(f);
+        })));
         
-        // 调用后端API识别药品
-        const response = await fetch(`${API_BASE}/medications/recognize-photo`, {
+        // 调用后端流式接口识别药品：每识别出一个药品立即显示，全部完成后以合并结果为准
+        const response = await fetch(`${API_BASE}/medications/recognize-photo/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                image: base64Data
+                images: images
             })
         });
         
-        const data = await response.json();
+        let data = null;
+        if (response.ok) {
+            recognizedMedications = [];
+            await readEventStream(response, (event, payload) => {
+                if (event === 'medication') {
+                    recognizedMedications.push(payload);
+                    statusDiv.innerHTML = `🔄 已识别 ${recognizedMedications.length} 个药品，继续识别中...`;
+                    displayRecognizedMedications(recognizedMedications);
+                    listDiv.style.display = 'block';
+                } else if (event === 'done') {
+                    data = payload;
+                }
+            });
+        } else {
+            data = await response.json();
+        }
+        data = data || { success: false, message: '识别中断' };
         
         if (data.success) {
             // 获取识别的药品列表
@@ -1743,55 +1898,48 @@ async function saveBatchMedications() {
         let failureCount = 0;
         const errors = [];
         
-        // 逐个保存药品
-        for (let i = 0; i < recognizedMedications.length; i++) {
-            const med = recognizedMedications[i];
-            try {
-                console.log(`保存药品 ${i + 1}:`, med.name);
-                
-                const saveData = {
-                    username: currentUser,  // 添加用户名
-                    medication: {
-                        name: med.name,
-                        dosage: med.dosage || '',
-                        frequency: med.frequency || '',
-                        duration: med.duration || '',
-                        category: med.category || '西药',
-                        notes: med.notes || '',
-                        record_id: currentRecordFilter
-                    }
-                };
-                
-                console.log('发送请求数据:', saveData);
-                
-                const response = await fetch(`${API_BASE}/medications`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(saveData)
-                });
-                
-                console.log(`药品 ${i + 1} 响应状态:`, response.status);
-                
-                const data = await response.json();
-                console.log(`药品 ${i + 1} 响应数据:`, data);
-                
-                if (data.success) {
-                    successCount++;
-                    console.log(`✅ 药品 ${i + 1} (${med.name}) 保存成功`);
-                } else {
-                    failureCount++;
-                    const errMsg = `${med.name}: ${data.message || '未知错误'}`;
-                    errors.push(errMsg);
-                    console.error(`❌ 药品 ${i + 1} 保存失败:`, data.message);
+        // 一次请求批量保存；每个药品带固定的幂等键，网络失败后重试不会重复创建
+        const operations = recognizedMedications.map(med => {
+            if (!med.idempotency_key) {
+                med.idempotency_key = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            }
+            return {
+                op: 'create',
+                idempotency_key: med.idempotency_key,
+                data: {
+                    name: med.name,
+                    dosage: med.dosage || '',
+                    frequency: med.frequency || '',
+                    duration: med.duration || '',
+                    category: med.category || '西药',
+                    notes: med.notes || '',
+                    record_id: currentRecordFilter
                 }
-            } catch (err) {
-                console.error(`❌ 保存药品 ${i + 1} 异常:`, err);
+            };
+        });
+        
+        const response = await fetch(`${API_BASE}/medications/batch`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ username: currentUser, operations })
+        });
+        const data = await response.json();
+        console.log('批量保存响应:', response.status, data);
+        
+        if (!data.results) {
+            throw new Error(data.message || '未知错误');
+        }
+        data.results.forEach(result => {
+            const med = recognizedMedications[result.index];
+            if (result.success) {
+                successCount++;
+            } else {
                 failureCount++;
-                errors.push(`${med.name}: ${err.message}`);
+                errors.push(`${med ? med.name : result.index + 1}: ${result.error || '未知错误'}`);
             }
-        }
+        });
         
         console.log('批量保存完成，成功:', successCount, '失败:', failureCount);
         
@@ -8,21 +8,237 @@
 import os
 import json
 import uuid
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+import hashlib
+import threading
+from datetime import datetime, time
+from typing import Callable, List, Dict, Optional, Tuple
 import logging
 
+from data_store import FileLock, json_cache, save_json_file
+from intake_log import IntakeLog
+from adherence import AdherenceRollup, parse_interval_days, reminder_times
+from reminder_scheduler import ReminderScheduler
+
 logger = logging.getLogger(__name__)
 
+# 批量接口单次最多的操作数
+MAX_BATCH_SIZE = 200
+# 仪表盘快照最多重试次数（构建期间数据文件被其他请求修改时重新读取）
+_DASHBOARD_ATTEMPTS = 3
+# 带幂等键的批量新建项按 (用户名, 幂等键) 生成固定ID
+_IDEMPOTENCY_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'medication-management/batch')
+
+
+class _OwnedIndex:
+    """{根键: {用户名: [条目]}} 数据文件的内存副本与二级索引
+    - 按用户保存 {条目ID: 条目}（保持文件中的顺序），按 ID 查找/修改/删除无需遍历
+    - 二级索引 (用户名, 字段, 取值) -> {条目ID}，按 record_id / status 等筛选只取命中的条目
+    文件签名 (mtime_ns, size, inode) 变化（如其他进程写入）时整体重建；
+    写入在文件锁内先改内存再整文件保存，保存失败时丢弃内存副本，下次访问从文件重新加载。
+    内存中的条目只读，修改时整体替换，对外只返回副本。
+    """
+
+    def __init__(self, path: str, root: str, fields: Tuple[str, ...]):
+        self.path = path
+        self.root = root
+        self.fields = fields
+        self.file_lock = FileLock(path)
+        self._lock = threading.RLock()
+        self._signature = None
+        self.reloads = 0  # 从文件重新加载的次数（首次加载或其他进程写入后），本进程的写入不计
+        self._users: Dict[str, Dict[str, dict]] = {}
+        self._index: Dict[Tuple[str, str, object], Dict[str, None]] = {}
+
+    @staticmethod
+    def _file_signature(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _refresh(self) -> None:
+        """调用方需持有 self._lock"""
+        signature = self._file_signature(self.path)
+        if signature is not None and signature == self._signature:
+            return
+        self._users, self._index, self._signature = {}, {}, None
+        try:
+            data = json_cache.get(self.path) if signature else {}  # 条目只读，可直接引用缓存对象
+        except Exception as e:
+            logger.error(f"加载文件失败 {self.path}: {e}")
+            return
+        for username, entries in ((data or {}).get(self.root) or {}).items():
+            user_entries = self._users.setdefault(username, {})
+            for entry in entries or []:
+                if isinstance(entry, dict) and entry.get('id'):
+                    user_entries[entry['id']] = entry
+                    self._link(username, entry)
+        self._signature = signature
+        self.reloads += 1
+
+    def _keys(self, username: str, entry: dict):
+        for field in self.fields:
+            value = entry.get(field)
+            yield (username, field, value if isinstance(value, (str, int, float, type(None))) else str(value))
+
+    def _link(self, username: str, entry: dict) -> None:
+        for key in self._keys(username, entry):
+            self._index.setdefault(key, {})[entry['id']] = None
+
+    def _unlink(self, username: str, entry: dict) -> None:
+        for key in self._keys(username, entry):
+            ids = self._index.get(key)
+            if ids is not None:
+                ids.pop(entry['id'], None)
+                if not ids:
+                    del self._index[key]
+
+    def _commit(self) -> bool:
+        """整文件保存；调用方需持有 file_lock 与 self._lock"""
+        try:
+            save_json_file(self.path, {self.root: {u: list(e.values()) for u, e in self._users.items()}})
+        except Exception as e:
+            logger.error(f"保存文件失败 {self.path}: {e}")
+            self._signature = None
+            return False
+        self._signature = self._file_signature(self.path)
+        return True
+
+    # ---------- 读取 ----------
+    def select(self, username: str, **filters) -> List[dict]:
+        """用户的条目副本；filters 为 {字段: 取值}（须为索引字段），取值为 None 的条件忽略"""
+        filters = {f: v for f, v in filters.items() if v is not None}
+        with self._lock:
+            self._refresh()
+            user_entries = self._users.get(username, {})
+            if not filters:
+                return [dict(e) for e in user_entries.values()]
+            hits = [self._index.get((username, f, v), {}) for f, v in filters.items()]
+            ids = min(hits, key=len)
+            return [dict(user_entries[i]) for i in ids
+                    if all(i in other for other in hits if other is not ids)]
+
+    def get(self, username: str, entry_id: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            entry = self._users.get(username, {}).get(entry_id)
+            return dict(entry) if entry is not None else None
+
+    def version(self):
+        """数据文件签名，文件内容变化时随之变化（用于判断快照是否一致、生成 ETag）"""
+        with self._lock:
+            self._refresh()
+            return self._signature
+
+    def all_users(self) -> Dict[str, List[dict]]:
+        """{用户名: [条目]}（共享只读对象）"""
+        return self.snapshot()[2]
+
+    def snapshot(self) -> Tuple[object, int, Dict[str, List[dict]]]:
+        """(文件签名, 重新加载次数, {用户名: [条目]})，三者取自同一时刻"""
+        with self._lock:
+            self._refresh()
+            return self._signature, self.reloads, {u: list(e.values()) for u, e in self._users.items()}
+
+    # ---------- 写入 ----------
+    def batch(self, username: str, operations: List[tuple]) -> Tuple[List[Tuple[str, Optional[dict]]], bool]:
+        """在一次加锁的读-改-写中依次执行多项操作，只保存一次文件
+        operations 的每项为 ('insert', 条目) / ('update', 条目ID, change) / ('delete', 条目ID)，
+        change(旧条目副本) 返回新条目。返回 ([(状态, 条目副本)], 是否保存成功)，状态为
+        created / updated / deleted / exists（insert 的 ID 已存在，视为重试）/ not_found；
+        单项 not_found 不影响其他项，没有任何修改时不写文件。"""
+        results = []
+        with self.file_lock, self._lock:
+            self._refresh()
+            user_entries = self._users.setdefault(username, {})
+            for op in operations:
+                kind, target = op[0], op[1]
+                if kind == 'insert':
+                    old = user_entries.get(target['id'])
+                    if old is not None:
+                        results.append(('exists', dict(old)))
+                        continue
+                    entry = dict(target)
+                    user_entries[entry['id']] = entry
+                    self._link(username, entry)
+                    results.append(('created', dict(entry)))
+                    continue
+                old = user_entries.get(target)
+                if old is None:
+                    results.append(('not_found', None))
+                elif kind == 'update':
+                    new = dict(op[2](dict(old)), id=target)
+                    user_entries[target] = new
+                    if list(self._keys(username, old)) != list(self._keys(username, new)):
+                        self._unlink(username, old)
+                        self._link(username, new)
+                    results.append(('updated', dict(new)))
+                else:
+                    del user_entries[target]
+                    self._unlink(username, old)
+                    results.append(('deleted', dict(old)))
+            if not user_entries:
+                self._users.pop(username, None)
+            changed = any(status not in ('exists', 'not_found') for status, _ in results)
+            return results, (self._commit() if changed else True)
+
+    def insert(self, username: str, entry: dict) -> bool:
+        return self.batch(username, [('insert', entry)])[1]
+
+    def update(self, username: str, entry_id: str,
+               change: Callable[[dict], dict]) -> Tuple[Optional[dict], bool]:
+        """以 change(旧条目副本) 的返回值替换条目，返回 (新条目副本, 是否保存成功)；条目不存在时为 (None, False)"""
+        [(status, entry)], saved = self.batch(username, [('update', entry_id, change)])
+        return entry, saved and status == 'updated'
+
+    def delete(self, username: str, entry_id: str) -> Tuple[bool, bool]:
+        """返回 (是否存在, 是否保存成功)"""
+        [(status, _)], saved = self.batch(username, [('delete', entry_id)])
+        return status == 'deleted', saved and status == 'deleted'
+
+
 class MedicationManager:
     """用药管理类"""
     
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', drug_dictionary=None):
         self.data_dir = data_dir
+        # 药名词典（drug_dictionary.DrugDictionary）：保存用药时把药名规范化为通用名 generic_name
+        self.drug_dictionary = drug_dictionary
         self.medications_file = os.path.join(data_dir, 'medications.json')
         self.reminders_file = os.path.join(data_dir, 'medication_reminders.json')
         self.intake_records_file = os.path.join(data_dir, 'medication_intake_records.json')
         self._ensure_files()
+        # 用药与提醒的内存索引：按 ID / 档案 / 状态 / 药品查找无需整表读取与遍历
+        self.medications = _OwnedIndex(self.medications_file, 'medications', ('record_id', 'status'))
+        self.reminders = _OwnedIndex(self.reminders_file, 'reminders', ('record_id', 'medication_id'))
+        # 服药记录为按用户/月份分段的只追加日志，旧的整表文件首次启动时导入
+        self.intake_log = IntakeLog(data_dir)
+        self.intake_log.import_legacy(self.intake_records_file)
+        # 依从性日汇总：服药时增量更新，计划变更前冻结历史应服次数
+        self.adherence = AdherenceRollup(
+            data_dir,
+            medications=lambda username: self.get_user_medications(username),
+            reminders=self.get_user_reminders,
+            intakes=lambda username, start: self.intake_log.query(username, start=start, newest_first=False),
+        )
+        # 提醒调度：启动时以全部提醒构建，提醒增删改时增量更新；后台线程由服务调用 scheduler.start() 启动。
+        # 多 worker 部署时每个进程各自调度，其他进程修改过提醒文件时由 _sync_scheduler 重建
+        self._scheduler_lock = threading.Lock()
+        self._scheduled_reloads = None
+        self.scheduler = ReminderScheduler(refresh=self._sync_scheduler)
+        self._sync_scheduler()
+    
+    def _sync_scheduler(self) -> bool:
+        """提醒文件被重新加载过（其他进程写入）时以全部提醒重建调度，返回是否重建"""
+        with self._scheduler_lock:
+            signature, reloads, users = self.reminders.snapshot()
+            if reloads == self._scheduled_reloads:
+                return False
+            self.scheduler.build(users)
+            # 构建期间本进程又写入了提醒时，增量更新可能被整体替换覆盖，下次再重建一次
+            self._scheduled_reloads = reloads if self.reminders.version() == signature else None
+            return True
     
     def _ensure_files(self):
         """确保数据文件存在"""
@@ -35,29 +251,14 @@ class MedicationManager:
         if not os.path.exists(self.reminders_file):
             with open(self.reminders_file, 'w', encoding='utf-8') as f:
                 json.dump({'reminders': {}}, f, ensure_ascii=False, indent=2)
-        
-        if not os.path.exists(self.intake_records_file):
-            with open(self.intake_records_file, 'w', encoding='utf-8') as f:
-                json.dump({'records': {}}, f, ensure_ascii=False, indent=2)
-    
-    def _load_json(self, file_path):
-        """加载JSON文件"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"加载文件失败 {file_path}: {e}")
-            return {}
+
     
-    def _save_json(self, file_path, data):
-        """保存JSON文件"""
+    def _freeze_adherence(self, username: str):
+        """用药/提醒计划即将变更：先按旧计划冻结截至昨天的应服次数"""
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return True
+            self.adherence.freeze(username)
         except Exception as e:
-            logger.error(f"保存文件失败 {file_path}: {e}")
-            return False
+            logger.warning(f"冻结依从性汇总失败: {e}")
     
     # ==================== 用药记录管理 ====================
     
@@ -82,36 +283,15 @@ class MedicationManager:
             包含medication_id的结果字典
         """
         try:
-            data = self._load_json(self.medications_file)
-            if 'medications' not in data:
-                data['medications'] = {}
-            
-            if username not in data['medications']:
-                data['medications'][username] = []
-            
-            medication_id = str(uuid.uuid4())
-            medication_record = {
-                'id': medication_id,
-                'name': medication_data.get('name', ''),
-                'dosage': medication_data.get('dosage', ''),
-                'frequency': medication_data.get('frequency', ''),
-                'duration': medication_data.get('duration', ''),
-                'start_date': medication_data.get('start_date', datetime.now().strftime('%Y-%m-%d')),
-                'end_date': medication_data.get('end_date', ''),
-                'notes': medication_data.get('notes', ''),
-                'category': medication_data.get('category', '西药'),
-                'prescribing_doctor': medication_data.get('prescribing_doctor', ''),
-                'side_effects': medication_data.get('side_effects', ''),
-                'record_id': medication_data.get('record_id', ''),  # 健康档案ID
-                'status': 'active',  # active, completed, stopped
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            data['medications'][username].append(medication_record)
-            
-            if self._save_json(self.medications_file, data):
-                return {'success': True, 'medication_id': medication_id, 'data': medication_record}
+            self._freeze_adherence(username)
+            medication_record = self._new_medication(self._with_generic_name(medication_data), str(uuid.uuid4()))
+            
+            if self.medications.insert(username, medication_record):
+                try:
+                    self.adherence.backfill_medication(username, medication_record)
+                except Exception as e:
+                    logger.warning(f"补记依从性汇总失败: {e}")
+                return {'success': True, 'medication_id': medication_record['id'], 'data': medication_record}
             else:
                 return {'success': False, 'error': '保存失败'}
         
@@ -119,23 +299,50 @@ class MedicationManager:
             logger.error(f"添加用药记录失败: {e}")
             return {'success': False, 'error': str(e)}
     
-    def get_user_medications(self, username: str, status: Optional[str] = None) -> List[Dict]:
+    @staticmethod
+    def _new_medication(medication_data: Dict, medication_id: str) -> Dict:
+        """按提交的用药信息生成完整的用药记录"""
+        return {
+            'id': medication_id,
+            'name': medication_data.get('name', ''),
+            'generic_name': medication_data.get('generic_name', ''),  # 规范化的通用名，词典未收录时为空
+            'dosage': medication_data.get('dosage', ''),
+            'frequency': medication_data.get('frequency', ''),
+            'duration': medication_data.get('duration', ''),
+            'start_date': medication_data.get('start_date', datetime.now().strftime('%Y-%m-%d')),
+            'end_date': medication_data.get('end_date', ''),
+            'notes': medication_data.get('notes', ''),
+            'category': medication_data.get('category', '西药'),
+            'prescribing_doctor': medication_data.get('prescribing_doctor', ''),
+            'side_effects': medication_data.get('side_effects', ''),
+            'record_id': medication_data.get('record_id', ''),  # 健康档案ID
+            'status': 'active',  # active, completed, stopped
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+    
+    def _with_generic_name(self, medication_data: Dict) -> Dict:
+        """提交的数据包含药名时按药名词典补上 generic_name"""
+        if self.drug_dictionary is None or 'name' not in medication_data:
+            return medication_data
+        generic_name = self.drug_dictionary.canonical(medication_data.get('name') or '') or ''
+        return {**medication_data, 'generic_name': generic_name}
+    
+    def get_user_medications(self, username: str, status: Optional[str] = None,
+                             record_id: Optional[str] = None) -> List[Dict]:
         """
         获取用户的用药记录
         
         Args:
             username: 用户名
             status: 状态筛选（active/completed/stopped）
+            record_id: 健康档案ID筛选
         
         Returns:
             用药记录列表
         """
         try:
-            data = self._load_json(self.medications_file)
-            medications = data.get('medications', {}).get(username, [])
-            
-            if status:
-                medications = [m for m in medications if m.get('status') == status]
+            medications = self.medications.select(username, status=status or None, record_id=record_id or None)
             
             # 按创建时间倒序排序
             medications.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -145,31 +352,28 @@ class MedicationManager:
             logger.error(f"获取用药记录失败: {e}")
             return []
     
+    def get_medication(self, username: str, medication_id: str) -> Optional[Dict]:
+        """按ID获取单条用药记录"""
+        return self.medications.get(username, medication_id)
+    
     def update_medication(self, username: str, medication_id: str, update_data: Dict) -> Dict:
         """更新用药记录"""
         try:
-            data = self._load_json(self.medications_file)
-            
-            if username not in data.get('medications', {}):
-                return {'success': False, 'error': '用户无用药记录'}
+            self._freeze_adherence(username)
+            update_data = self._with_generic_name(update_data)
             
-            medications = data['medications'][username]
-            for i, med in enumerate(medications):
-                if med['id'] == medication_id:
-                    # 更新字段
-                    for key, value in update_data.items():
-                        if key != 'id':  # 不允许修改ID
-                            med[key] = value
-                    
-                    med['updated_at'] = datetime.now().isoformat()
-                    medications[i] = med
-                    
-                    if self._save_json(self.medications_file, data):
-                        return {'success': True, 'data': med}
-                    else:
-                        return {'success': False, 'error': '保存失败'}
+            def apply(med):
+                # 更新字段（不允许修改ID）
+                med.update({k: v for k, v in update_data.items() if k != 'id'})
+                med['updated_at'] = datetime.now().isoformat()
+                return med
             
-            return {'success': False, 'error': '未找到该用药记录'}
+            med, saved = self.medications.update(username, medication_id, apply)
+            if med is None:
+                return {'success': False, 'error': '未找到该用药记录'}
+            if saved:
+                return {'success': True, 'data': med}
+            return {'success': False, 'error': '保存失败'}
         
         except Exception as e:
             logger.error(f"更新用药记录失败: {e}")
@@ -178,29 +382,55 @@ class MedicationManager:
     def delete_medication(self, username: str, medication_id: str) -> Dict:
         """删除用药记录"""
         try:
-            data = self._load_json(self.medications_file)
-            
-            if username not in data.get('medications', {}):
-                return {'success': False, 'error': '用户无用药记录'}
-            
-            medications = data['medications'][username]
-            original_count = len(medications)
-            medications = [m for m in medications if m['id'] != medication_id]
-            
-            if len(medications) == original_count:
+            self._freeze_adherence(username)
+            found, saved = self.medications.delete(username, medication_id)
+            if not found:
                 return {'success': False, 'error': '未找到该用药记录'}
-            
-            data['medications'][username] = medications
-            
-            if self._save_json(self.medications_file, data):
+            if saved:
                 return {'success': True}
-            else:
-                return {'success': False, 'error': '保存失败'}
+            return {'success': False, 'error': '保存失败'}
         
         except Exception as e:
             logger.error(f"删除用药记录失败: {e}")
             return {'success': False, 'error': str(e)}
     
+    def batch_medications(self, username: str, operations: List[Dict]) -> Dict:
+        """
+        批量新增/修改/删除用药记录，全部操作在一次加锁的读-改-写中完成，只保存一次文件
+        
+        Args:
+            username: 用户名
+            operations: 操作列表，每项为
+                - {"op": "create", "data": {...}, "idempotency_key": "..."}（幂等键可选）
+                - {"op": "update", "id": "...", "data": {...}}
+                - {"op": "delete", "id": "..."}
+        
+        Returns:
+            {'success': 是否全部成功, 'results': 逐项结果, 'succeeded': 成功数, 'failed': 失败数}；
+            带幂等键重试已创建的项时返回已有记录并标记 duplicate
+        """
+        try:
+            error = self._check_batch(operations)
+            if error:
+                return {'success': False, 'error': error}
+            self._freeze_adherence(username)
+            operations = [{**item, 'data': self._with_generic_name(item.get('data') or {})}
+                          if isinstance(item, dict) else item for item in operations]
+            results, changed = self._apply_batch(
+                self.medications, username, operations, self._new_medication,
+                validate=lambda data: None if data.get('name') else '缺少药品名称', touch=True)
+            created = [entry for status, entry in changed if status == 'created']
+            if created:
+                try:
+                    self.adherence.backfill_medications(username, created)
+                except Exception as e:
+                    logger.warning(f"补记依从性汇总失败: {e}")
+            return self._batch_summary(results)
+        
+        except Exception as e:
+            logger.error(f"批量处理用药记录失败: {e}")
+            return {'success': False, 'error': str(e)}
+    
     # ==================== 服药提醒管理 ====================
     
     def add_reminder(self, username: str, reminder_data: Dict) -> Dict:
@@ -220,40 +450,15 @@ class MedicationManager:
                 - record_id: 健康档案ID
         """
         try:
-            data = self._load_json(self.reminders_file)
-            if 'reminders' not in data:
-                data['reminders'] = {}
-            
-            if username not in data['reminders']:
-                data['reminders'][username] = []
-            
-            reminder_id = str(uuid.uuid4())
-            
-            # 支持新的times数组格式，兼容旧的time字段
-            times = reminder_data.get('times')
-            if not times:
-                # 兼容旧格式：如果没有times，从time获取
-                time_val = reminder_data.get('time', '08:00')
-                times = [time_val] if time_val else ['08:00']
-            
-            reminder = {
-                'id': reminder_id,
-                'medication_id': reminder_data.get('medication_id', ''),
-                'medication_name': reminder_data.get('medication_name', ''),
-                'times': times,  # 使用times数组
-                'reminder_type': reminder_data.get('reminder_type', 'daily'),  # 新增：提醒类型
-                'interval_days': reminder_data.get('interval_days'),  # 新增：间隔天数
-                'custom_schedule': reminder_data.get('custom_schedule'),  # 新增：自定义日程
-                'enabled': reminder_data.get('enabled', True),
-                'record_id': reminder_data.get('record_id', ''),  # 健康档案ID
-                'created_at': datetime.now().isoformat(),
-                'last_reminded': None
-            }
-            
-            data['reminders'][username].append(reminder)
-            
-            if self._save_json(self.reminders_file, data):
-                return {'success': True, 'reminder_id': reminder_id, 'data': reminder}
+            error = self._check_reminder(reminder_data)
+            if error:
+                return {'success': False, 'error': error}
+            self._freeze_adherence(username)
+            reminder = self._new_reminder(reminder_data, str(uuid.uuid4()))
+            
+            if self.reminders.insert(username, reminder):
+                self.scheduler.upsert(username, reminder)
+                return {'success': True, 'reminder_id': reminder['id'], 'data': reminder}
             else:
                 return {'success': False, 'error': '保存失败'}
         
@@ -261,11 +466,43 @@ class MedicationManager:
             logger.error(f"添加提醒失败: {e}")
             return {'success': False, 'error': str(e)}
     
-    def get_user_reminders(self, username: str) -> List[Dict]:
-        """获取用户的提醒列表"""
+    @staticmethod
+    def _check_reminder(reminder_data: Dict) -> Optional[str]:
+        """提醒保存前的校验，通过时返回 None"""
+        value = reminder_data.get('interval_days')
+        if value not in (None, '') and parse_interval_days(value) is None:
+            return '间隔天数须为正整数'
+        return None
+    
+    @staticmethod
+    def _new_reminder(reminder_data: Dict, reminder_id: str) -> Dict:
+        """按提交的提醒信息生成完整的提醒"""
+        # 支持新的times数组格式，兼容旧的time字段
+        times = reminder_data.get('times')
+        if not times:
+            # 兼容旧格式：如果没有times，从time获取
+            time_val = reminder_data.get('time', '08:00')
+            times = [time_val] if time_val else ['08:00']
+        
+        return {
+            'id': reminder_id,
+            'medication_id': reminder_data.get('medication_id', ''),
+            'medication_name': reminder_data.get('medication_name', ''),
+            'times': times,  # 使用times数组
+            'reminder_type': reminder_data.get('reminder_type', 'daily'),  # 新增：提醒类型
+            'interval_days': reminder_data.get('interval_days'),  # 新增：间隔天数
+            'custom_schedule': reminder_data.get('custom_schedule'),  # 新增：自定义日程
+            'enabled': reminder_data.get('enabled', True),
+            'record_id': reminder_data.get('record_id', ''),  # 健康档案ID
+            'created_at': datetime.now().isoformat(),
+            'last_reminded': None
+        }
+    
+    def get_user_reminders(self, username: str, record_id: Optional[str] = None,
+                           medication_id: Optional[str] = None) -> List[Dict]:
+        """获取用户的提醒列表，可按健康档案ID / 用药ID筛选"""
         try:
-            data = self._load_json(self.reminders_file)
-            return data.get('reminders', {}).get(username, [])
+            return self.reminders.select(username, record_id=record_id or None, medication_id=medication_id or None)
         except Exception as e:
             logger.error(f"获取提醒列表失败: {e}")
             return []
@@ -273,26 +510,22 @@ class MedicationManager:
     def update_reminder(self, username: str, reminder_id: str, update_data: Dict) -> Dict:
         """更新提醒"""
         try:
-            data = self._load_json(self.reminders_file)
+            error = self._check_reminder(update_data)
+            if error:
+                return {'success': False, 'error': error}
+            self._freeze_adherence(username)
             
-            if username not in data.get('reminders', {}):
-                return {'success': False, 'error': '用户无提醒记录'}
+            def apply(reminder):
+                reminder.update({k: v for k, v in update_data.items() if k != 'id'})
+                return reminder
             
-            reminders = data['reminders'][username]
-            for i, reminder in enumerate(reminders):
-                if reminder['id'] == reminder_id:
-                    for key, value in update_data.items():
-                        if key != 'id':
-                            reminder[key] = value
-                    
-                    reminders[i] = reminder
-                    
-                    if self._save_json(self.reminders_file, data):
-                        return {'success': True, 'data': reminder}
-                    else:
-                        return {'success': False, 'error': '保存失败'}
-            
-            return {'success': False, 'error': '未找到该提醒'}
+            reminder, saved = self.reminders.update(username, reminder_id, apply)
+            if reminder is None:
+                return {'success': False, 'error': '未找到该提醒'}
+            if saved:
+                self.scheduler.upsert(username, reminder)
+                return {'success': True, 'data': reminder}
+            return {'success': False, 'error': '保存失败'}
         
         except Exception as e:
             logger.error(f"更新提醒失败: {e}")
@@ -301,29 +534,50 @@ class MedicationManager:
     def delete_reminder(self, username: str, reminder_id: str) -> Dict:
         """删除提醒"""
         try:
-            data = self._load_json(self.reminders_file)
-            
-            if username not in data.get('reminders', {}):
-                return {'success': False, 'error': '用户无提醒记录'}
-            
-            reminders = data['reminders'][username]
-            original_count = len(reminders)
-            reminders = [r for r in reminders if r['id'] != reminder_id]
-            
-            if len(reminders) == original_count:
+            self._freeze_adherence(username)
+            found, saved = self.reminders.delete(username, reminder_id)
+            if not found:
                 return {'success': False, 'error': '未找到该提醒'}
-            
-            data['reminders'][username] = reminders
-            
-            if self._save_json(self.reminders_file, data):
+            if saved:
+                self.scheduler.remove(username, reminder_id)
                 return {'success': True}
-            else:
-                return {'success': False, 'error': '保存失败'}
+            return {'success': False, 'error': '保存失败'}
         
         except Exception as e:
             logger.error(f"删除提醒失败: {e}")
             return {'success': False, 'error': str(e)}
     
+    def batch_reminders(self, username: str, operations: List[Dict]) -> Dict:
+        """
+        批量新增/修改/删除服药提醒，只保存一次文件；操作格式与返回值同 batch_medications。
+        新增提醒关联了 medication_id 时，record_id 取自该用药记录。
+        """
+        try:
+            error = self._check_batch(operations)
+            if error:
+                return {'success': False, 'error': error}
+            self._freeze_adherence(username)
+            
+            def build(data, reminder_id):
+                med = self.get_medication(username, data.get('medication_id')) if data.get('medication_id') else None
+                if med:
+                    data = dict(data, record_id=med.get('record_id', ''))
+                return self._new_reminder(data, reminder_id)
+            
+            results, changed = self._apply_batch(self.reminders, username, operations, build,
+                                                 validate=self._check_reminder,
+                                                 validate_update=self._check_reminder)
+            for status, reminder in changed:
+                if status == 'deleted':
+                    self.scheduler.remove(username, reminder['id'])
+                else:
+                    self.scheduler.upsert(username, reminder)
+            return self._batch_summary(results)
+        
+        except Exception as e:
+            logger.error(f"批量处理提醒失败: {e}")
+            return {'success': False, 'error': str(e)}
+    
     # ==================== 服药记录管理 ====================
     
     def record_intake(self, username: str, intake_data: Dict) -> Dict:
@@ -342,39 +596,80 @@ class MedicationManager:
                 - record_name: 健康档案名称
         """
         try:
-            data = self._load_json(self.intake_records_file)
-            if 'records' not in data:
-                data['records'] = {}
-            
-            if username not in data['records']:
-                data['records'][username] = []
-            
-            record_id = str(uuid.uuid4())
-            record = {
-                'id': record_id,
-                'medication_id': intake_data.get('medication_id', ''),
-                'medication_name': intake_data.get('medication_name', ''),
-                'taken_at': intake_data.get('taken_at', datetime.now().isoformat()),
-                'dosage': intake_data.get('dosage', ''),
-                'notes': intake_data.get('notes', ''),
-                'record_id': intake_data.get('record_id', ''),  # 健康档案ID
-                'record_name': intake_data.get('record_name', ''),  # 健康档案名称
-                'created_at': datetime.now().isoformat()
-            }
-            
-            data['records'][username].append(record)
-            
-            if self._save_json(self.intake_records_file, data):
-                return {'success': True, 'record_id': record_id, 'data': record}
-            else:
-                return {'success': False, 'error': '保存失败'}
+            record = self._new_intake(intake_data, str(uuid.uuid4()))
+            
+            self.intake_log.append(username, record)
+            try:
+                self.adherence.record_intake(username, record)
+            except Exception as e:
+                logger.warning(f"更新依从性汇总失败: {e}")
+            return {'success': True, 'record_id': record['id'], 'data': record}
         
         except Exception as e:
             logger.error(f"记录服药失败: {e}")
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def _new_intake(intake_data: Dict, intake_id: str) -> Dict:
+        """按提交的服药信息生成完整的服药记录"""
+        return {
+            'id': intake_id,
+            'medication_id': intake_data.get('medication_id', ''),
+            'medication_name': intake_data.get('medication_name', ''),
+            'taken_at': intake_data.get('taken_at', datetime.now().isoformat()),
+            'dosage': intake_data.get('dosage', ''),
+            'notes': intake_data.get('notes', ''),
+            'record_id': intake_data.get('record_id', ''),  # 健康档案ID
+            'record_name': intake_data.get('record_name', ''),  # 健康档案名称
+            'created_at': datetime.now().isoformat()
+        }
+    
+    def batch_record_intake(self, username: str, operations: List[Dict]) -> Dict:
+        """
+        批量记录服药：同一月份的记录合并为一次日志追加，依从性汇总只更新一次。
+        服药日志只追加，仅支持 {"op": "create", "data": {...}, "idempotency_key": "..."}；
+        带幂等键重试时已写入的记录不会重复追加。返回值同 batch_medications。
+        """
+        try:
+            error = self._check_batch(operations)
+            if error:
+                return {'success': False, 'error': error}
+            results: List[Optional[Dict]] = [None] * len(operations)
+            records, positions = [], []
+            for i, item in enumerate(operations):
+                item = item if isinstance(item, dict) else {}
+                if item.get('op') != 'create':
+                    results[i] = {'index': i, 'op': item.get('op'), 'success': False,
+                                  'error': '服药记录只支持新增'}
+                    continue
+                records.append(self._new_intake(item.get('data') or {}, self._batch_entry_id(username, item)))
+                positions.append(i)
+            
+            unique: Dict[str, Dict] = {}
+            for record in records:
+                unique.setdefault(record['id'], record)  # 同一批次内重复的幂等键只记一次
+            written = self.intake_log.append_many(username, list(unique.values()), skip_existing=True)
+            fresh = {r['id'] for r in written}
+            for i, record in zip(positions, records):
+                first = unique[record['id']]
+                result = {'index': i, 'op': 'create', 'success': True, 'id': record['id'], 'data': first}
+                if record['id'] not in fresh or first is not record:
+                    result['duplicate'] = True
+                results[i] = result
+            
+            try:
+                self.adherence.record_intakes(username, written)
+            except Exception as e:
+                logger.warning(f"更新依从性汇总失败: {e}")
+            return self._batch_summary(results)
+        
+        except Exception as e:
+            logger.error(f"批量记录服药失败: {e}")
+            return {'success': False, 'error': str(e)}
+    
     def get_intake_records(self, username: str, medication_id: Optional[str] = None, 
-                          start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          record_id: Optional[str] = None) -> List[Dict]:
         """
         获取服药记录
         
@@ -383,79 +678,173 @@ class MedicationManager:
             medication_id: 用药ID（可选）
             start_date: 开始日期（可选）
             end_date: 结束日期（可选）
+            record_id: 健康档案ID（可选）
         """
         try:
-            data = self._load_json(self.intake_records_file)
-            records = data.get('records', {}).get(username, [])
-            
-            # 按用药ID筛选
-            if medication_id:
-                records = [r for r in records if r.get('medication_id') == medication_id]
-            
-            # 按日期筛选
-            if start_date:
-                records = [r for r in records if r.get('taken_at', '') >= start_date]
-            if end_date:
-                records = [r for r in records if r.get('taken_at', '') <= end_date]
-            
-            # 按时间倒序排序
-            records.sort(key=lambda x: x.get('taken_at', ''), reverse=True)
-            
-            return records
+            # 日志按 taken_at 有序，日期范围直接二分定位，结果已按时间倒序；
+            # 用药/档案筛选在日志内完成，只复制命中的记录
+            return self.intake_log.query(username, start=start_date, end=end_date,
+                                         where={'medication_id': medication_id or None, 'record_id': record_id or None})
         except Exception as e:
             logger.error(f"获取服药记录失败: {e}")
             return []
     
-    def get_adherence_stats(self, username: str, days: int = 7) -> Dict:
+    def get_adherence_stats(self, username: str, days: int = 7, record_id: Optional[str] = None,
+                            now: Optional[datetime] = None) -> Dict:
         """
         获取用药依从性统计
         
         Args:
             username: 用户名
-            days: 统计天数
+            days: 统计天数（最近 days 个自然日，含今天）
+            record_id: 健康档案ID（可选，只统计该档案的用药）
+            now: 统计时刻（可选，默认当前时间；今天只计该时刻前的提醒）
         
         Returns:
             统计数据
         """
         try:
             # 获取活跃的用药记录
-            medications = self.get_user_medications(username, status='active')
-            
-            # 获取最近的服药记录
-            start_date = (datetime.now() - timedelta(days=days)).isoformat()
-            intake_records = self.get_intake_records(username, start_date=start_date)
-            
-            # 计算统计数据
-            total_medications = len(medications)
-            total_doses_expected = 0
-            total_doses_taken = len(intake_records)
-            
-            # 简单估算：假设每个药物每天3次
-            for med in medications:
-                freq = med.get('frequency', '')
-                if '3' in freq:
-                    total_doses_expected += days * 3
-                elif '2' in freq:
-                    total_doses_expected += days * 2
-                else:
-                    total_doses_expected += days
+            medications = self.medications.select(username, status='active', record_id=record_id or None)
             
-            adherence_rate = (total_doses_taken / total_doses_expected * 100) if total_doses_expected > 0 else 0
-            
-            return {
-                'success': True,
-                'total_medications': total_medications,
-                'total_doses_expected': total_doses_expected,
-                'total_doses_taken': total_doses_taken,
-                'adherence_rate': round(adherence_rate, 2),
-                'days': days,
-                'period': {
-                    'start': start_date,
-                    'end': datetime.now().isoformat()
-                }
-            }
+            # 应服/实服次数来自日汇总，只需累加 days 天
+            stats = self.adherence.stats(username, days, record_id=record_id, now=now)
+            return {'success': True, 'total_medications': len(medications), **stats}
         
         except Exception as e:
             logger.error(f"获取依从性统计失败: {e}")
             return {'success': False, 'error': str(e)}
-
+    
+    # ==================== 仪表盘 ====================
+    
+    def _dashboard_version(self, username: str, record_id: Optional[str], days: int, now: datetime) -> Tuple[str, datetime]:
+        """仪表盘内容的版本号与统计时刻
+        内容只取决于四个数据文件与"今天已到的最后一个提醒时间"：统计时刻取该提醒时间（今天尚无提醒到时为 0 点），
+        同一版本号的仪表盘内容完全相同，可直接作为 ETag"""
+        passed = [t for reminder in self.reminders.select(username) if reminder.get('enabled', True)
+                  for t in reminder_times(reminder) if t <= now.strftime('%H:%M')]
+        try:
+            as_of = datetime.combine(now.date(), time.fromisoformat(max(passed))) if passed else \
+                datetime.combine(now.date(), time())
+        except ValueError:
+            as_of = now.replace(second=0, microsecond=0)
+        key = (username, record_id, days, as_of.isoformat(), self.medications.version(), self.reminders.version(),
+               self.intake_log.version(username), self.adherence.version(username))
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest(), as_of
+    
+    def dashboard_version(self, username: str, record_id: Optional[str] = None, days: int = 7) -> str:
+        """不构建内容、只计算版本号（用于 If-None-Match 比较）"""
+        return self._dashboard_version(username, record_id or None, days, datetime.now())[0]
+    
+    def get_dashboard(self, username: str, record_id: Optional[str] = None, days: int = 7) -> Dict:
+        """
+        用药页面所需的全部数据：用药记录、提醒、服药记录与依从性统计
+        
+        各部分取自同一快照：构建前后的版本号一致才返回，否则（期间有写入）重新构建。
+        
+        Returns:
+            {'success', 'version'（无法取得一致快照时为 None）, 'medications', 'reminders', 'intake_records', 'stats'}
+        """
+        record_id = record_id or None
+        try:
+            for _ in range(_DASHBOARD_ATTEMPTS):
+                now = datetime.now()
+                version, as_of = self._dashboard_version(username, record_id, days, now)
+                dashboard = {
+                    'success': True,
+                    'version': version,
+                    'medications': self.get_user_medications(username, record_id=record_id),
+                    'reminders': self.get_user_reminders(username, record_id=record_id),
+                    'intake_records': self.get_intake_records(username, record_id=record_id),
+                    'stats': self.get_adherence_stats(username, days, record_id=record_id, now=as_of),
+                }
+                if self._dashboard_version(username, record_id, days, now)[0] == version:
+                    return dashboard
+            # 持续有写入时返回最后一次构建的结果，但不给版本号（不可缓存）
+            dashboard['version'] = None
+            return dashboard
+        except Exception as e:
+            logger.error(f"获取用药仪表盘失败: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    # ==================== 批量操作 ====================
+    
+    @staticmethod
+    def _check_batch(operations) -> Optional[str]:
+        if not isinstance(operations, list) or not operations:
+            return '缺少操作列表'
+        if len(operations) > MAX_BATCH_SIZE:
+            return f'单次最多 {MAX_BATCH_SIZE} 项操作'
+        return None
+    
+    @staticmethod
+    def _batch_entry_id(username: str, item: Dict) -> str:
+        """带幂等键的新建项使用固定ID，重试时命中已创建的条目而不会重复创建"""
+        key = item.get('idempotency_key')
+        if key:
+            return str(uuid.uuid5(_IDEMPOTENCY_NAMESPACE, f"{username}\n{key}"))
+        return str(uuid.uuid4())
+    
+    def _apply_batch(self, index: _OwnedIndex, username: str, operations: List[Dict],
+                     build: Callable[[Dict, str], Dict], validate: Callable[[Dict], Optional[str]],
+                     touch: bool = False, validate_update: Optional[Callable[[Dict], Optional[str]]] = None
+                     ) -> Tuple[List[Dict], List[Tuple[str, Dict]]]:
+        """校验并执行批量操作，返回 (逐项结果, 实际生效的 [(状态, 条目)])；
+        validate 校验新建数据，validate_update 校验修改的字段（可选）"""
+        results: List[Optional[Dict]] = [None] * len(operations)
+        ops, positions = [], []
+        for i, item in enumerate(operations):
+            item = item if isinstance(item, dict) else {}
+            op, data = item.get('op'), item.get('data') or {}
+            error = None
+            if op == 'create':
+                error = validate(data)
+                if not error:
+                    ops.append(('insert', build(data, self._batch_entry_id(username, item))))
+            elif op in ('update', 'delete') and not item.get('id'):
+                error = '缺少ID'
+            elif op == 'update':
+                error = validate_update(data) if validate_update else None
+                changes = {k: v for k, v in data.items() if k != 'id'}
+                
+                def change(entry, changes=changes):
+                    entry.update(changes)
+                    if touch:
+                        entry['updated_at'] = datetime.now().isoformat()
+                    return entry
+                
+                if not error:
+                    ops.append(('update', item['id'], change))
+            elif op == 'delete':
+                ops.append(('delete', item['id']))
+            else:
+                error = f'不支持的操作: {op}'
+            if error:
+                results[i] = {'index': i, 'op': op, 'success': False, 'error': error}
+            else:
+                positions.append(i)
+        
+        statuses, saved = index.batch(username, ops) if ops else ([], True)
+        changed = []
+        for i, (status, entry) in zip(positions, statuses):
+            result = {'index': i, 'op': operations[i]['op']}
+            if status == 'not_found':
+                result.update(success=False, error='未找到该记录')
+            elif not saved:
+                result.update(success=False, error='保存失败')
+            else:
+                result.update(success=True, id=entry['id'])
+                if status == 'exists':
+                    result['duplicate'] = True
+                if status != 'deleted':
+                    result['data'] = entry
+                if status != 'exists':
+                    changed.append((status, entry))
+            results[i] = result
+        return results, changed
+    
+    @staticmethod
+    def _batch_summary(results: List[Dict]) -> Dict:
+        failed = sum(1 for r in results if not r['success'])
+        return {'success': failed == 0, 'results': results,
+                'succeeded': len(results) - failed, 'failed': failed}
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON → SQLite 数据迁移脚本
+将 data/ 下的 users/records/community/预问诊推送/中医档案 JSON 数据一次性导入 SQLite。
+迁移后以 STORAGE_BACKEND=sqlite 启动后端即可使用新存储。
+"""
+
+import os
+import sys
+
+from data_store import SqliteStore, migrate_json_to_sqlite
+
+# 设置输出编码
+if sys.platform == 'win32':
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
+
+def main():
+    data_dir = os.getenv('DATA_DIR') or 'data'
+    db_path = os.getenv('SQLITE_DB_PATH') or os.path.join(data_dir, 'medical.db')
+    force = '--force' in sys.argv
+
+    if not os.path.isdir(data_dir):
+        print(f"[错误] 数据目录不存在: {data_dir}")
+        return
+
+    store = SqliteStore(db_path)
+    counts = migrate_json_to_sqlite(data_dir, store, force=force)
+    if counts is None:
+        print(f"[跳过] {db_path} 已包含数据或已迁移过，如需重新导入请加 --force")
+        return
+
+    print("="*60)
+    print("迁移完成！")
+    for name, count in counts.items():
+        print(f"   - {name}: {count}")
+    print(f"   数据库: {db_path}")
+    print("="*60)
+    print("\n提示：设置环境变量 STORAGE_BACKEND=sqlite 后重启后端生效")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示词注册表
+MedicalAIService 的静态系统提示词在模块加载时注册一次，调用时直接复用：
+- 模板文本固定、逐字节不变且总是第一条消息，变化的内容只放在其后的用户消息中，
+  上游的前缀缓存（DashScope 隐式缓存）因此可以命中，减少上游重复处理的 token 与首字延迟
+- 注册时用本地分词估算计算模板 token 数（见 count_tokens）
+- max_tokens 按输入规模与期望输出动态选择：base + per_input × 输入 token 数 + per_item × 条目数，
+  限制在 [floor, cap] 之间，并按 64 取整，使相近输入得到相同预算（不影响响应缓存与调用合并的命中）
+"""
+
+import re
+import math
+import threading
+from typing import Dict
+
+# 中日韩统一表意文字与全角标点
+_CJK_RE = re.compile('[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_ROUND_TO = 64
+
+
+def count_tokens(text: str) -> int:
+    """估算 Qwen 分词后的 token 数：汉字约 0.75 个 token，其余字符约 3.5 个一组（偏保守）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * 0.75 + (len(text) - cjk) / 3.5)
+
+
+class PromptTemplate:
+    """一个静态系统提示词及其输出预算规则"""
+
+    __slots__ = ('name', 'text', 'tokens', 'base', 'per_input', 'per_item', 'floor', 'cap')
+
+    def __init__(self, name: str, text: str, base: int, cap: int, per_input: float = 0.0,
+                 per_item: int = 0, floor: int = 256):
+        self.name = name
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.base = base
+        self.per_input = per_input
+        self.per_item = per_item
+        self.floor = min(floor, cap)
+        self.cap = cap
+
+    def max_tokens(self, *inputs: str, items: int = 0) -> int:
+        """按输入文本（用户消息、病历、对话历史等）与条目数（如方案个数）选择 max_tokens"""
+        input_tokens = sum(count_tokens(text) for text in inputs if text)
+        budget = self.base + self.per_input * input_tokens + self.per_item * items
+        budget = math.ceil(budget / _ROUND_TO) * _ROUND_TO
+        return max(self.floor, min(self.cap, budget))
+
+
+class PromptRegistry:
+    """按名称登记的提示词模板，并统计每次选择的输出预算"""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def register(self, name: str, text: str, **budget) -> PromptTemplate:
+        template = PromptTemplate(name, text, **budget)
+        self._templates[name] = template
+        self._stats[name] = {"calls": 0, "max_tokens_total": 0}
+        return template
+
+    def __getitem__(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def budget(self, name: str, *inputs: str, items: int = 0) -> int:
+        """templates[name].max_tokens(...)，同时计入统计"""
+        max_tokens = self._templates[name].max_tokens(*inputs, items=items)
+        with self._lock:
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats["max_tokens_total"] += max_tokens
+        return max_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "prompt_tokens": template.tokens,
+                    "cap": template.cap,
+                    "calls": self._stats[name]["calls"],
+                    "avg_max_tokens": (round(self._stats[name]["max_tokens_total"] / self._stats[name]["calls"])
+                                       if self._stats[name]["calls"] else 0),
+                }
+                for name, template in self._templates.items()
+            }
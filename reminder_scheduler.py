@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药提醒调度
+在服务端计算所有用户提醒的下一次触发时间，客户端无需轮询提醒列表自行判断：
+- 全部提醒的下一次触发时间放在一个最小堆中，后台线程只弹出已到期的条目，
+  触发后计算下一次时间重新入堆，每次唤醒的代价为 O(到期数 × log N)，与提醒总数无关
+- 新增/修改/删除提醒时增量更新：为提醒分配新版本号后入堆，旧条目出堆时按版本号丢弃（惰性删除）；
+  过期条目过多时按当前版本重建堆
+- due(username, minutes)：某用户未来 N 分钟内的提醒，只计算该用户自己的提醒
+- subscribe/unsubscribe：按用户订阅到期事件，供 SSE 推送
+- refresh：多 worker 部署时每个进程各自调度全部提醒、只推送给连到本进程的订阅者；
+  后台线程每次唤醒（至多间隔 REFRESH_SECONDS）与 due() 前调用，由调用方在其他进程修改过提醒时重建
+提醒生效规则与依从性统计共用 adherence.is_scheduled_on。
+"""
+
+import heapq
+import queue
+import logging
+import threading
+from functools import lru_cache
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from adherence import interval_days, is_scheduled_on, reminder_times
+
+logger = logging.getLogger(__name__)
+
+# 单个提醒向后查找下一次触发的最大天数（间隔提醒取间隔天数 + 1）
+MAX_LOOKAHEAD_DAYS = 400
+# 设置了 refresh 时后台线程的最长睡眠时间，其他进程新增的提醒最迟在该间隔后排期
+REFRESH_SECONDS = 5.0
+
+
+@lru_cache(maxsize=4096)
+def _parse_times(values: Tuple[str, ...]) -> Tuple[dtime, ...]:
+    """["08:00", "20:00"] -> 去重排序后的 time 元组；提醒时间组合高度重复，按取值缓存"""
+    parsed = set()
+    for value in values:
+        try:
+            hour, minute = str(value).split(':')[:2]
+            parsed.add(dtime(int(hour), int(minute)))
+        except (TypeError, ValueError):
+            continue
+    return tuple(sorted(parsed))
+
+
+def next_fire(reminder: dict, after: datetime) -> Optional[datetime]:
+    """提醒在 after 之后（不含）的下一次触发时间；已停用或没有有效时间时返回 None"""
+    if not reminder.get('enabled', True):
+        return None
+    times = _parse_times(tuple(reminder_times(reminder)))
+    if not times:
+        return None
+    lookahead = 8
+    if (reminder.get('reminder_type') or 'daily') == 'interval':
+        lookahead = min(interval_days(reminder) + 1, MAX_LOOKAHEAD_DAYS)
+    day = after.date()
+    for _ in range(lookahead):
+        if is_scheduled_on(reminder, day):
+            for t in times:
+                fire_at = datetime.combine(day, t)
+                if fire_at > after:
+                    return fire_at
+        day += timedelta(days=1)
+    return None
+
+
+class ReminderScheduler:
+    """全部用户提醒的到期调度"""
+
+    def __init__(self, refresh: Optional[Callable[[], object]] = None):
+        self._refresh = refresh
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, str, str]] = []  # (触发时间戳, 版本号, 用户名, 提醒ID)
+        self._reminders: Dict[str, Dict[str, dict]] = {}  # 用户名 -> {提醒ID: 提醒}
+        self._versions: Dict[Tuple[str, str], int] = {}  # (用户名, 提醒ID) -> 当前版本号
+        self._seq = 0
+        self._subscribers: Dict[str, List[queue.Queue]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._popped_through: Optional[datetime] = None  # 上一次 pop_due 处理到的时间
+        self.fired = 0
+
+    # ---------- 构建与增量更新 ----------
+    def build(self, reminders_by_user: Dict[str, Iterable[dict]], now: Optional[datetime] = None) -> int:
+        """以全部提醒重建调度（启动时与 refresh 发现其他进程修改时调用），返回已排期的提醒数；
+        运行中重建时从上一次 pop_due 处理到的时间起排期，两者之间到期的提醒不会漏发"""
+        now = now or self._popped_through or datetime.now()
+        heap, reminders, versions = [], {}, {}
+        seq = self._seq
+        for username, items in reminders_by_user.items():
+            user_reminders = reminders.setdefault(username, {})
+            for reminder in items or []:
+                reminder_id = reminder.get('id')
+                if not reminder_id:
+                    continue
+                try:
+                    fire_at = next_fire(reminder, now)
+                except Exception as e:  # 单个提醒数据异常不影响其余提醒的调度
+                    logger.warning(f"跳过无法排期的提醒 {username}/{reminder_id}: {e}")
+                    continue
+                user_reminders[reminder_id] = reminder
+                if fire_at is not None:
+                    seq += 1
+                    versions[(username, reminder_id)] = seq
+                    heap.append((fire_at.timestamp(), seq, username, reminder_id))
+        heapq.heapify(heap)
+        with self._cond:
+            self._heap, self._reminders, self._versions, self._seq = heap, reminders, versions, seq
+            self._cond.notify()
+        return len(heap)
+
+    def upsert(self, username: str, reminder: dict, now: Optional[datetime] = None) -> Optional[datetime]:
+        """新增或修改提醒后调用，返回下一次触发时间"""
+        reminder_id = reminder.get('id')
+        fire_at = next_fire(reminder, now or datetime.now())
+        with self._cond:
+            self._reminders.setdefault(username, {})[reminder_id] = reminder
+            self._schedule(username, reminder_id, fire_at)
+            self._cond.notify()
+        return fire_at
+
+    def remove(self, username: str, reminder_id: str) -> None:
+        with self._cond:
+            self._reminders.get(username, {}).pop(reminder_id, None)
+            self._versions.pop((username, reminder_id), None)
+
+    def _schedule(self, username: str, reminder_id: str, fire_at: Optional[datetime]) -> None:
+        """调用方需持有 self._cond"""
+        if fire_at is None:
+            self._versions.pop((username, reminder_id), None)
+            return
+        self._seq += 1
+        self._versions[(username, reminder_id)] = self._seq
+        heapq.heappush(self._heap, (fire_at.timestamp(), self._seq, username, reminder_id))
+        if len(self._heap) > 2 * len(self._versions) + 1024:
+            self._heap = [entry for entry in self._heap if self._versions.get((entry[2], entry[3])) == entry[1]]
+            heapq.heapify(self._heap)
+
+    # ---------- 查询 ----------
+    def due(self, username: str, minutes: int = 60, now: Optional[datetime] = None) -> List[dict]:
+        """某用户在 [now, now + minutes] 内的提醒，按时间升序"""
+        now = now or datetime.now()
+        end = now + timedelta(minutes=minutes)
+        if self._refresh is not None:
+            self._refresh()
+        with self._cond:
+            reminders = list(self._reminders.get(username, {}).values())
+        events = []
+        for reminder in reminders:
+            fire_at = next_fire(reminder, now - timedelta(minutes=1))
+            while fire_at is not None and fire_at <= end:
+                if fire_at >= now.replace(second=0, microsecond=0):
+                    events.append(self._event(username, reminder, fire_at))
+                fire_at = next_fire(reminder, fire_at)
+        events.sort(key=lambda e: e['fire_at'])
+        return events
+
+    def next_fire_at(self) -> Optional[float]:
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"scheduled": len(self._versions), "heap": len(self._heap), "fired": self.fired,
+                    "subscribers": sum(len(v) for v in self._subscribers.values())}
+
+    @staticmethod
+    def _event(username: str, reminder: dict, fire_at: datetime) -> dict:
+        return {
+            "username": username,
+            "reminder_id": reminder.get('id'),
+            "medication_id": reminder.get('medication_id', ''),
+            "medication_name": reminder.get('medication_name', ''),
+            "record_id": reminder.get('record_id', ''),
+            "fire_at": fire_at.isoformat(timespec='minutes'),
+        }
+
+    # ---------- 到期处理 ----------
+    def pop_due(self, now: Optional[datetime] = None) -> List[dict]:
+        """弹出所有已到期的提醒并排入下一次，返回到期事件"""
+        now = now or datetime.now()
+        limit = now.timestamp()
+        events = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= limit:
+                ts, version, username, reminder_id = heapq.heappop(self._heap)
+                if self._versions.get((username, reminder_id)) != version:
+                    continue  # 已修改或删除
+                reminder = self._reminders.get(username, {}).get(reminder_id)
+                if reminder is None:
+                    continue
+                fire_at = datetime.fromtimestamp(ts)
+                events.append(self._event(username, reminder, fire_at))
+                # 停机等原因错过的多次触发只补发最近一分钟内的，不逐次补发
+                self._schedule(username, reminder_id,
+                               next_fire(reminder, max(fire_at, now - timedelta(minutes=1))))
+            self.fired += len(events)
+            self._popped_through = now
+        return events
+
+    def subscribe(self, username: str, maxsize: int = 100) -> queue.Queue:
+        q = queue.Queue(maxsize=maxsize)
+        with self._cond:
+            self._subscribers.setdefault(username, []).append(q)
+        return q
+
+    def unsubscribe(self, username: str, q: queue.Queue) -> None:
+        with self._cond:
+            subs = self._subscribers.get(username, [])
+            if q in subs:
+                subs.remove(q)
+            if not subs:
+                self._subscribers.pop(username, None)
+
+    def _publish(self, events: List[dict]) -> None:
+        for event in events:
+            with self._cond:
+                subs = list(self._subscribers.get(event['username'], []))
+            for q in subs:
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    logger.warning(f"提醒订阅队列已满，丢弃事件: {event['username']}")
+
+    def start(self) -> None:
+        """启动后台调度线程（幂等）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                head = self._heap[0][0] if self._heap else None
+                # 睡到堆顶到期（最长 60 秒，兼顾系统时间调整；设置了 refresh 时最长 REFRESH_SECONDS），
+                # 有更早的提醒入堆时被唤醒
+                longest = 60.0 if self._refresh is None else REFRESH_SECONDS
+                timeout = longest if head is None else min(max(head - datetime.now().timestamp(), 0.0), longest)
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+            try:
+                if self._refresh is not None:
+                    self._refresh()
+                self._publish(self.pop_due())
+            except Exception as e:
+                logger.error(f"提醒调度异常: {e}")
@@ -1934,7 +1934,7 @@ async function callTCMPulseAnalysis() {
 // 病情交流社区
 // ================================
 
-let _community = { offset: 0, limit: 10, loading: false, hasMore: true, currentTag: '', currentSearch: '' };
+let _community = { offset: 0, cursor: '', limit: 10, loading: false, hasMore: true, currentTag: '', currentSearch: '' };
 let _communityImages = []; // {url, name}
 let _communityTags = [];
 
@@ -1952,9 +1952,11 @@ function initializeCommunity() {
         const delBtn = e.target.closest('[data-action="delete"]');
         const shareBtn = e.target.closest('[data-action="share"]');
         const bookmarkBtn = e.target.closest('[data-action="bookmark"]');
+        const moreCommentsBtn = e.target.closest('[data-action="more-comments"]');
 
+        if (moreCommentsBtn) { await reloadComments(moreCommentsBtn.getAttribute('data-post'), true); return; }
         if (likeBtn) { await togglePostLike(likeBtn.getAttribute('data-post')); return; }
-        if (commentToggle) { toggleCommentsBox(commentToggle.getAttribute('data-post')); return; }
+        if (commentToggle) { await toggleCommentsBox(commentToggle.getAttribute('data-post')); return; }
         if (replyBtn) { openReplyInput(replyBtn.getAttribute('data-post'), replyBtn.getAttribute('data-comment')); return; }
         if (shareBtn) { await sharePost(shareBtn.getAttribute('data-post')); return; }
         if (bookmarkBtn) { await bookmarkPost(bookmarkBtn.getAttribute('data-post')); return; }
@@ -2171,7 +2173,7 @@ async function loadCommunityPosts(reset) {
     const loadMoreBtn = document.getElementById('community-load-more');
     const statusEl = document.getElementById('community-search-status');
     if (!feed) return;
-    if (reset) { _community.offset = 0; _community.hasMore = true; feed.innerHTML = ''; }
+    if (reset) { _community.offset = 0; _community.cursor = ''; _community.hasMore = true; feed.innerHTML = ''; }
     if (!_community.hasMore) return;
     _community.loading = true;
     
@@ -2182,11 +2184,13 @@ async function loadCommunityPosts(reset) {
         const tagParam = _community.currentTag ? `&tag=${encodeURIComponent(_community.currentTag)}` : '';
         const searchParam = _community.currentSearch ? `&search=${encodeURIComponent(_community.currentSearch)}` : '';
         const filterParam = _community.currentFilter && _community.currentFilter !== 'all' ? `&filter=${encodeURIComponent(_community.currentFilter)}` : '';
-        const res = await fetch(`http://localhost:5000/api/community/posts?offset=${_community.offset}&limit=${_community.limit}${tagParam}${searchParam}${filterParam}`);
+        const pageParam = _community.cursor ? `cursor=${encodeURIComponent(_community.cursor)}` : `offset=${_community.offset}`;
+        const res = await fetch(`http://localhost:5000/api/community/posts?${pageParam}&limit=${_community.limit}${tagParam}${searchParam}${filterParam}`);
         const data = await res.json();
         if (!res.ok || data.error) throw new Error(data.message || '加载失败');
         renderCommunityPosts(data.items || [], !reset);
         _community.offset += (data.items || []).length;
+        _community.cursor = data.next_cursor || '';
         _community.hasMore = !!data.has_more;
         if (loadMoreBtn) loadMoreBtn.style.display = _community.hasMore ? 'inline-flex' : 'none';
         
@@ -2308,7 +2312,7 @@ function isAdminUI() {
 
 function renderCommunityPostCard(p) {
     const likes = p.like_count || 0;
-    const comments = p.comments || [];
+    const commentCount = p.comment_count || 0;
     const time = (p.created_at || '').replace('T', ' ').slice(0, 19);
     const author = p.author || '匿名用户';
     const isLiked = p.liked || false;
@@ -2345,7 +2349,7 @@ function renderCommunityPostCard(p) {
             </div>
             <div class="post-action" data-action="toggle-comments" data-post="${p.id}">
                 <i class="fas fa-comment-dots"></i>
-                <span class="post-action-count">${comments.length}</span>
+                <span class="post-action-count">${commentCount}</span>
             </div>
             <div class="post-action" data-action="share" data-post="${p.id}">
                 <i class="fas fa-share"></i>
@@ -2357,7 +2361,7 @@ function renderCommunityPostCard(p) {
             </div>
             ${adminHtml}
         </div>
-        <div class="community-comments" id="comments-box-${p.id}" style="display:none;">${renderCommentsThread(p.id, comments)}
+        <div class="community-comments" id="comments-box-${p.id}" style="display:none;">${renderCommentsThread(p.id, [])}
             <div class="community-comment-input"><textarea rows="2" placeholder="写下你的评论..." data-input="comment"></textarea><button class="btn btn-primary" data-action="send-comment" data-post="${p.id}">发送</button></div>
         </div>
     </div>`;
@@ -3104,7 +3108,12 @@ document.addEventListener('DOMContentLoaded', function() {
         try {
             if (window.MedicalAI && await window.MedicalAI.ensureConnected()) {
                 const kind = kindSel ? kindSel.value : 'auto';
-                const res = await window.MedicalAI.knowledgeSearch(q, kind);
+                // 流式预览：边生成边显示，结束后以完整结果替换
+                let preview = '';
+                const res = await window.MedicalAI.knowledgeSearch(q, kind, (text) => {
+                    preview += text;
+                    if (resultBox) resultBox.textContent = preview;
+                });
                 if (res && res.success) {
                     if (resultBox) resultBox.innerHTML = res.result;
                 } else {
@@ -4720,11 +4729,13 @@ function renderCommentsThread(postId, comments) {
     return `<div class="community-comment-list">${renderList(null)}</div>`;
 }
 
-function toggleCommentsBox(postId) {
+async function toggleCommentsBox(postId) {
     const box = document.getElementById(`comments-box-${postId}`);
     if (!box) return;
     const visible = box.style.display !== 'none';
     box.style.display = visible ? 'none' : 'block';
+    // 评论不随帖子流返回，首次展开时再分页加载
+    if (!visible && !_commentPages[postId]) await reloadComments(postId);
 }
 
 function openReplyInput(postId, parentCommentId) {
@@ -4737,17 +4748,31 @@ function openReplyInput(postId, parentCommentId) {
     input.placeholder = `回复评论...`;
 }
 
-async function reloadComments(postId) {
+// 已加载的评论：postId -> { items, cursor, hasMore }
+const _commentPages = {};
+
+async function reloadComments(postId, more = false) {
     try {
-        const res = await fetch(`http://localhost:5000/api/community/posts/${postId}/comments`);
+        const state = (more && _commentPages[postId]) || { items: [], cursor: null, hasMore: false };
+        const params = new URLSearchParams({ limit: '50' });
+        if (more && state.cursor) params.set('cursor', state.cursor);
+        const res = await fetch(`http://localhost:5000/api/community/posts/${postId}/comments?${params.toString()}`);
         const data = await res.json();
         if (!res.ok || data.error) throw new Error(data.message || '加载失败');
+        state.items = state.items.concat(data.items || []);
+        state.cursor = data.next_cursor || null;
+        state.hasMore = !!data.has_more;
+        _commentPages[postId] = state;
         const box = document.getElementById(`comments-box-${postId}`);
         if (box) {
-            const listHtml = renderCommentsThread(postId, data.items || []);
+            box.querySelector('[data-action="more-comments"]')?.remove();
+            const listHtml = renderCommentsThread(postId, state.items)
+                + (state.hasMore ? `<button class="btn btn-text" data-action="more-comments" data-post="${postId}">加载更多评论</button>` : '');
             const listWrapper = box.querySelector('.community-comment-list') || box.querySelector('.community-comments-empty');
             if (listWrapper) listWrapper.outerHTML = listHtml;
             else box.insertAdjacentHTML('afterbegin', listHtml);
+            const countSpan = document.querySelector(`#post-${postId} [data-action="toggle-comments"] .post-action-count`);
+            if (countSpan && typeof data.total === 'number') countSpan.textContent = data.total;
         }
     } catch (e) { showNotification('加载评论失败: ' + e.message, 'error'); }
 }
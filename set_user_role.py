@@ -5,31 +5,26 @@
 可以将指定用户设置为医生或患者
 """
 
-import json
 import os
 import sys
 
+from data_store import create_store
+
 # 设置输出编码
 if sys.platform == 'win32':
     import codecs
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
     sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 
+DATA_DIR = os.getenv('DATA_DIR') or 'data'
+
 def load_users():
-    """加载用户数据"""
-    users_file = os.path.join('data', 'users.json')
-    if not os.path.exists(users_file):
-        print(f"[错误] 用户文件不存在: {users_file}")
+    """加载用户数据（与后端使用同一存储后端，见 STORAGE_BACKEND）"""
+    if not os.path.isdir(DATA_DIR):
+        print(f"[错误] 数据目录不存在: {DATA_DIR}")
         return None
     
-    with open(users_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def save_users(users_data):
-    """保存用户数据"""
-    users_file = os.path.join('data', 'users.json')
-    with open(users_file, 'w', encoding='utf-8') as f:
-        json.dump(users_data, f, ensure_ascii=False, indent=2)
+    return {"users": create_store(DATA_DIR).list_users()}
 
 def list_users(users_data):
     """列出所有用户及其角色"""
@@ -62,9 +57,14 @@ def set_role(username, role):
         return False
     
     old_role = users[username].get('role', 'user')
-    users[username]['role'] = role
-    
-    save_users(users_data)
+
+    def apply(user):
+        if user is None:
+            return None
+        user['role'] = role
+        return user
+
+    create_store(DATA_DIR).update_user(username, apply)
     
     role_text = '医生' if role == 'doctor' else '患者'
     old_role_text = '医生' if old_role == 'doctor' else '患者'
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用药依从性日汇总测试脚本
+验证提醒生效规则、首次访问时的回填、已过去日期的冻结（修改计划不影响历史）、
+跨日后按当前计划冻结新的一天，以及补记开始日期早于今天的新药品
+"""
+
+import sys
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+from adherence import AdherenceRollup, is_scheduled_on, interval_days, parse_daily_frequency
+from data_store import load_json_file, save_json_file
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    print_separator("测试1：提醒生效规则")
+    created = date(2025, 3, 3)  # 周一
+    interval = {'reminder_type': 'interval', 'interval_days': 3, 'created_at': '2025-03-03T09:00:00', 'times': ['08:00']}
+    days = [d for d in range(10) if is_scheduled_on(interval, created + timedelta(days=d))]
+    results.append(check("间隔提醒每 3 天一次", days == [0, 3, 6, 9], str(days)))
+    results.append(check("创建之前不生效", not is_scheduled_on(interval, created - timedelta(days=3))))
+    custom = {'reminder_type': 'custom', 'custom_schedule': ['周一', '周五'], 'times': ['08:00']}
+    days = [d for d in range(7) if is_scheduled_on(custom, created + timedelta(days=d))]
+    results.append(check("自定义星期", days == [0, 4], str(days)))
+    results.append(check("停用的提醒不生效", not is_scheduled_on(dict(custom, enabled=False), created)))
+    results.append(check("无效的间隔天数按 1 天", [interval_days({'interval_days': v}) for v in ('2.5', 'abc', None, 0, '4')]
+                         == [1, 1, 1, 1, 4]))
+    results.append(check("解析每日次数", [parse_daily_frequency(f) for f in ('每日3次', '一天两次', 'bid', '')] == [3, 2, 2, 1]))
+
+    print_separator("测试2：回填与冻结")
+    today = date.today()
+    now = datetime.combine(today, datetime.max.time())
+    medications = [{'id': 'm1', 'frequency': '每日2次', 'start_date': (today - timedelta(days=30)).isoformat()}]
+    reminders = []
+    intakes = [{'medication_id': 'm1', 'taken_at': f"{(today - timedelta(days=d)).isoformat()}T08:00:00"}
+               for d in range(7)]
+    rollup = AdherenceRollup(tempfile.mkdtemp(prefix='adherence_'), lambda u: medications, lambda u: reminders,
+                             lambda u, start: [r for r in intakes if r['taken_at'] >= start])
+    stats = rollup.stats('张三', days=7, now=now)
+    results.append(check("首次访问由服药日志与当前计划回填", stats['total_doses_expected'] == 14
+                         and stats['total_doses_taken'] == 7 and stats['adherence_rate'] == 50.0, str(stats)))
+
+    rollup.freeze('张三')
+    medications[0] = dict(medications[0], frequency='每日3次')
+    stats = rollup.stats('张三', days=7, now=now)
+    results.append(check("修改计划后历史日期不变，当天按新计划", stats['total_doses_expected'] == 6 * 2 + 3, str(stats)))
+    reminders.append({'medication_id': 'm1', 'times': ['08:00', '20:00'], 'created_at': '2020-01-01T00:00:00'})
+    stats = rollup.stats('张三', days=1, now=datetime.combine(today, datetime.min.time()).replace(hour=12))
+    results.append(check("当天只计已到时间的提醒", stats['total_doses_expected'] == 1, str(stats)))
+
+    print_separator("测试3：跨日冻结")
+    path = rollup._path('张三')
+    data = load_json_file(path, mutable=True)
+    for d in (1, 2):
+        data['days'].pop((today - timedelta(days=d)).isoformat(), None)
+    data['materialized_through'] = (today - timedelta(days=3)).isoformat()
+    save_json_file(path, data)  # 模拟服务停了两天
+    rollup.stats('张三', days=7, now=now)
+    data = load_json_file(path)
+    frozen = [data['days'].get((today - timedelta(days=d)).isoformat(), {}).get('m1|', {}).get('e') for d in (3, 2, 1)]
+    results.append(check("错过的日期按当前计划冻结", frozen == [2, 2, 2]
+                         and data['materialized_through'] == (today - timedelta(days=1)).isoformat(), str(frozen)))
+
+    print_separator("测试4：补记过去开始的新药品")
+    new_med = {'id': 'm2', 'frequency': '每日1次', 'record_id': 'r1', 'start_date': (today - timedelta(days=3)).isoformat()}
+    medications.append(new_med)
+    rollup.backfill_medications('张三', [new_med])
+    data = load_json_file(path)
+    backfilled = sorted(d for d, cells in data['days'].items() if cells.get('m2|r1', {}).get('e'))
+    expected_days = [(today - timedelta(days=d)).isoformat() for d in (3, 2, 1)]
+    results.append(check("开始日期至昨天的应服次数已补记", backfilled == expected_days, str(backfilled)))
+    stats = rollup.stats('张三', days=7, record_id='r1', now=now)
+    results.append(check("按健康档案统计", stats['total_doses_expected'] == 4 and stats['total_doses_taken'] == 0, str(stats)))
+    results.append(check("汇总文件位于 adherence 目录", os.path.dirname(path).endswith('adherence')))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
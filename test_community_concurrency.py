@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+社区并发写入压力测试脚本
+多个用户并发点赞/取消点赞、评论同一帖子，检查最终计数没有丢失更新
+"""
+
+import sys
+import uuid
+import requests
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+API_BASE = 'http://localhost:5000/api'
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def register_users(num_users):
+    """注册测试用户，返回 session 列表"""
+    prefix = uuid.uuid4().hex[:6]
+    sessions = []
+    for i in range(num_users):
+        response = requests.post(
+            f"{API_BASE}/auth/register",
+            json={"username": f"conc_{prefix}_{i}", "password": "123456"}
+        )
+        sessions.append(response.json()['session_id'])
+    return sessions
+
+def test_concurrent_likes(sessions, post_id, toggles_per_user):
+    """每个用户并发切换点赞 toggles_per_user 次"""
+    print_separator("测试1：并发点赞/取消点赞")
+
+    def worker(session_id):
+        http = requests.Session()
+        for _ in range(toggles_per_user):
+            http.post(f"{API_BASE}/community/posts/{post_id}/like",
+                      headers={"X-Session-Id": session_id})
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(worker, sessions))
+
+    expected = len(sessions) if toggles_per_user % 2 else 0
+    post = _get_post(post_id)
+    like_count = post.get('like_count', len(post.get('likes', [])))
+    print(f"切换总次数: {len(sessions) * toggles_per_user}")
+    print(f"期望点赞数: {expected}，实际点赞数: {like_count}")
+    if like_count == expected:
+        print("✅ 点赞计数一致！")
+        return True
+    print("❌ 点赞计数不一致（存在丢失更新）！")
+    return False
+
+def test_concurrent_comments(sessions, post_id):
+    """每个用户并发发表 3 条评论"""
+    print_separator("测试2：并发评论")
+
+    def worker(session_id):
+        http = requests.Session()
+        for i in range(3):
+            http.post(f"{API_BASE}/community/posts/{post_id}/comments",
+                      json={"content": f"并发评论 {i}"},
+                      headers={"X-Session-Id": session_id})
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(worker, sessions))
+
+    expected = len(sessions) * 3
+    response = requests.get(f"{API_BASE}/community/posts/{post_id}/comments", params={"limit": 200})
+    comment_count = len(response.json().get('items', []))
+    print(f"期望评论数: {expected}，实际评论数: {comment_count}")
+    if comment_count == expected:
+        print("✅ 评论数一致！")
+        return True
+    print("❌ 评论数不一致（存在丢失更新）！")
+    return False
+
+def _get_post(post_id):
+    response = requests.get(f"{API_BASE}/community/posts", params={"limit": 50})
+    for item in response.json().get('items', []):
+        if item.get('id') == post_id:
+            return item
+    return {}
+
+def main(num_users=50, toggles_per_user=41):
+    """主测试函数"""
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*15 + "社区并发写入压力测试" + " "*13 + "║")
+    print("╚" + "="*58 + "╝")
+    print(f"\n并发用户数: {num_users}，每人切换次数: {toggles_per_user}")
+    print(f"API地址: {API_BASE}")
+    print(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    try:
+        sessions = register_users(num_users)
+        response = requests.post(
+            f"{API_BASE}/community/posts",
+            json={"content": "并发测试帖子", "tags": ["并发测试"]},
+            headers={"X-Session-Id": sessions[0]}
+        )
+        post_id = response.json()['id']
+
+        ok = test_concurrent_likes(sessions, post_id, toggles_per_user)
+        ok = test_concurrent_comments(sessions, post_id) and ok
+
+        print_separator("测试完成")
+        print("✅ 所有检查通过！" if ok else "❌ 存在不一致，请检查存储层写入逻辑")
+
+    except requests.exceptions.ConnectionError:
+        print("\n❌ 错误: 无法连接到服务器")
+        print("请确保后端服务已启动: python backend_server.py")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 41)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药记录时序日志测试脚本
+验证跨月份的时间范围查询、补录/重复/残行导致的待整理分段、compact() 与历史月份加载时的自动整理
+"""
+
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime
+
+from intake_log import IntakeLog, OTHER_SEGMENT
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def record(record_id, taken_at, medication_id='m1'):
+    return {'id': record_id, 'medication_id': medication_id, 'taken_at': taken_at}
+
+
+def ids(records):
+    return [r['id'] for r in records]
+
+
+def file_ids(log, username, segment):
+    with open(log._segment_path(username, segment), 'r', encoding='utf-8') as f:
+        return [json.loads(line)['id'] for line in f if line.strip()]
+
+
+def main():
+    results = []
+    data_dir = tempfile.mkdtemp(prefix='intake_log_')
+    log = IntakeLog(data_dir)
+
+    print_separator("测试1：跨月份范围查询")
+    log.append_many('张三', [
+        record('a', '2025-01-30T08:00:00'), record('b', '2025-01-31T20:00:00'),
+        record('c', '2025-02-01T08:00:00'), record('d', '2025-02-28T23:59:00'),
+        record('e', '2025-03-01T00:00:00', medication_id='m2'), record('x', '未知时间'),
+    ])
+    results.append(check("按月份分段", log._segment_names('张三') == ['2025-01', '2025-02', '2025-03', OTHER_SEGMENT],
+                         str(log._segment_names('张三'))))
+    hits = log.query('张三', start='2025-01-31', end='2025-02-28T23:59:59', newest_first=False)
+    results.append(check("跨月查询包含两端月份内的记录", ids(hits) == ['b', 'c', 'd'], str(ids(hits))))
+    hits = log.query('张三', start='2025-02-15', end='2025-12-31')
+    results.append(check("默认按时间倒序", ids(hits) == ['e', 'd'], str(ids(hits))))
+    hits = log.query('张三', newest_first=False)
+    results.append(check("不限时间时包含 other 分段", ids(hits) == ['a', 'b', 'c', 'd', 'e', 'x'], str(ids(hits))))
+    hits = log.query('张三', start='2025-01-01', where={'medication_id': 'm2', 'record_id': None})
+    results.append(check("等值筛选（None 条件忽略）", ids(hits) == ['e'], str(ids(hits))))
+    hits = log.query('张三', end='2025-01-31T23:59:59', newest_first=False)
+    results.append(check("只有结束时间", ids(hits) == ['a', 'b'], str(ids(hits))))
+
+    print_separator("测试2：补录与重复导致分段待整理")
+    month = datetime.now().strftime('%Y-%m')
+    log.append_many('李四', [record('p2', f'{month}-02T08:00:00'), record('p3', f'{month}-03T08:00:00')])
+    log.append('李四', record('p1', f'{month}-01T08:00:00'))  # 补录：早于已有记录
+    log.append('李四', record('p2', f'{month}-02T08:00:00'))  # 重复 id
+    segment = log._segment('李四', month)
+    results.append(check("补录后查询仍按时间排序", ids(log.query('李四', newest_first=False)) == ['p1', 'p2', 'p3']))
+    results.append(check("当月分段标记为待整理、加载时不自动整理", segment.dirty
+                         and file_ids(log, '李四', month) == ['p2', 'p3', 'p1', 'p2']))
+    written = log.append_many('李四', [record('p3', f'{month}-03T08:00:00'), record('p4', f'{month}-04T08:00:00')],
+                              skip_existing=True)
+    results.append(check("skip_existing 跳过已存在的记录", ids(written) == ['p4'], str(ids(written))))
+    results.append(check("compact() 重写待整理分段", log.compact('李四') == 1
+                         and file_ids(log, '李四', month) == ['p1', 'p2', 'p3', 'p4'], str(file_ids(log, '李四', month))))
+    results.append(check("整理后不再待整理", not log._segment('李四', month).dirty and log.compact() == 0))
+
+    print_separator("测试3：历史月份与残行")
+    log.append('王五', record('h2', '2024-06-20T08:00:00'))
+    log.append('王五', record('h1', '2024-06-10T08:00:00'))
+    path = log._segment_path('王五', '2024-06')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"id": "broken", "taken_at": "2024-06-')  # 写入中断留下的残行
+    log.append('王五', record('h3', '2024-06-30T08:00:00'))
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    results.append(check("残行之后的追加另起一行", len(lines) == 4 and json.loads(lines[-1])['id'] == 'h3'))
+    fresh = IntakeLog(data_dir)  # 新进程：从文件加载
+    hits = fresh.query('王五', newest_first=False)
+    results.append(check("历史月份加载时自动整理", ids(hits) == ['h1', 'h2', 'h3']
+                         and file_ids(fresh, '王五', '2024-06') == ['h1', 'h2', 'h3'], str(file_ids(fresh, '王五', '2024-06'))))
+    version = fresh.version('王五')
+    fresh.append('王五', record('h4', '2024-07-01T08:00:00'))
+    results.append(check("追加后版本变化，新月份可查询", fresh.version('王五') != version
+                         and ids(fresh.query('王五', start='2024-06-30')) == ['h4', 'h3']))
+    results.append(check("其他实例读取到最新追加", ids(log.query('王五', start='2024-07')) == ['h4']))
+
+    print_separator("测试4：旧数据迁移")
+    legacy = os.path.join(data_dir, 'medication_intake_records.json')
+    with open(legacy, 'w', encoding='utf-8') as f:
+        json.dump({'records': {'赵六': [record('l1', '2025-05-01T08:00:00'), record('l2', '2025-04-01T08:00:00')]}}, f)
+    counts = log.import_legacy(legacy)
+    results.append(check("导入旧文件并重命名", counts == {'users': 1, 'records': 2}
+                         and os.path.exists(legacy + '.migrated') and not os.path.exists(legacy), str(counts)))
+    results.append(check("导入的记录可查询", ids(log.query('赵六')) == ['l1', 'l2']))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
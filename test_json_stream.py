@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式 JSON 增量解析测试脚本
+以真实形态的大模型输出（前后带说明文字、```json 代码块、转义与代理对、容器边界处的字面量）为样本，
+在每一个可能的位置切成两段、以及逐字符 feed()，检查输出的条目与 json.loads 的结果一致
+"""
+
+import sys
+import json
+
+from json_stream import JsonStreamParser, JsonStringStream
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+ANALYSIS = {
+    "summary": "华法林与布洛芬合用出血风险高，需\"立即\"咨询医生；{注意} [复查] INR\\PT",
+    "interactions": [
+        {"drug1": "华法林", "drug2": "布洛芬", "severity": "高",
+         "description": "NSAID 抑制血小板聚集，合用增加出血风险 ⚠️"},
+        {"drug1": "奥美拉唑", "drug2": "氯吡格雷", "severity": "中", "description": "CYP2C19 抑制\n降低疗效"},
+    ],
+    "warnings": [],
+    "suggestions": ["定期复查凝血功能 😀", "如有黑便立即就医"],
+    "confidence": 0.85,
+    "need_followup": True,
+    "extra": None,
+    "meta": {"source": "ai", "levels": [1, 2, 3]},
+}
+
+RECOGNITION = [
+    {"name": "布洛芬缓释胶囊", "specification": "0.3g×24粒", "confidence": 0.92, "otc": True},
+    {"name": "阿莫西林胶囊", "specification": None, "confidence": 1, "otc": False},
+    ["嵌套", 1, -2.5e3, True, False, None],
+    "纯文本条目 \\ \"引号\"",
+    0,
+    False,
+]
+
+SAMPLES = [
+    ("带代码块的用药分析（带缩进）",
+     "好的，以下是分析结果：\n```json\n" + json.dumps(ANALYSIS, ensure_ascii=False, indent=2) + "\n```\n以上仅供参考。",
+     ANALYSIS),
+    ("紧凑输出且含 \\u 转义与代理对",
+     json.dumps(ANALYSIS, ensure_ascii=True, separators=(',', ':')),
+     ANALYSIS),
+    ("根为数组，字面量紧贴容器边界",
+     "```json\n" + json.dumps(RECOGNITION, ensure_ascii=False, separators=(',', ':')) + "\n```",
+     RECOGNITION),
+    ("根值之前的文字中含有 [ 与 {",
+     "根据图片识别结果[共2种药品]，另见{说明}：\n" + json.dumps(RECOGNITION, ensure_ascii=False),
+     RECOGNITION),
+    ("根为对象，之前的文字中含有 [ ]",
+     "分析如下 [仅供参考] ：" + json.dumps(ANALYSIS, ensure_ascii=False) + " [完]",
+     ANALYSIS),
+]
+
+
+def expected_items(value):
+    """JsonStreamParser 对一个根值应输出的全部条目"""
+    if isinstance(value, list):
+        return [(None, item) for item in value]
+    items = []
+    for key, item in value.items():
+        if isinstance(item, list):
+            items.extend((key, element) for element in item)
+        else:
+            items.append((key, item))
+    return items
+
+
+def feed_all(stream, chunks):
+    out = []
+    for chunk in chunks:
+        out.extend(stream.feed(chunk))
+    return out
+
+
+def splits(text):
+    """在每个位置切成两段，再加上逐字符输入"""
+    for i in range(len(text) + 1):
+        yield f"在第 {i} 个字符处切分", [text[:i], text[i:]]
+    yield "逐字符输入", list(text)
+
+
+def main():
+    results = []
+
+    print_separator("测试1：JsonStreamParser 在任意切分位置与 json.loads 一致")
+    for name, text, value in SAMPLES:
+        expected = expected_items(value)
+        failure = next((how for how, chunks in splits(text)
+                        if feed_all(JsonStreamParser(), chunks) != expected), None)
+        results.append(check(name, failure is None, failure or f"{len(expected)} 个条目"))
+
+    print_separator("测试2：JsonStreamParser 边界情况")
+    parser = JsonStreamParser()
+    items = parser.feed('{"a": 1, "b": [] } {"c": 2}')
+    results.append(check("空数组不输出条目，根值结束后忽略后续内容", items == [('a', 1)] and parser.done, str(items)))
+    parser = JsonStreamParser()
+    items = parser.feed('无法识别图片中的药品。')
+    results.append(check("没有根值时不输出条目", items == [] and not parser.done))
+
+    print_separator("测试3：JsonStringStream 在任意切分位置与 json.loads 一致")
+    doc = {"title": "问诊总结", "report": {"summary_html": "<p>患者\"头痛\"3天\\n</p>\n<ul><li>😀 é</li></ul>"},
+           "advice": "多喝水"}
+    for label, ensure_ascii in (("原样输出", False), ("\\u 转义与代理对", True)):
+        text = "```json\n" + json.dumps(doc, ensure_ascii=ensure_ascii) + "\n```"
+        failure = None
+        for how, chunks in splits(text):
+            pieces = feed_all(JsonStringStream(('summary_html', 'advice')), chunks)
+            joined = {}
+            for key, piece in pieces:
+                joined[key] = joined.get(key, '') + piece
+            if joined != {'summary_html': doc['report']['summary_html'], 'advice': doc['advice']}:
+                failure = how
+                break
+        results.append(check(label, failure is None, failure or ''))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
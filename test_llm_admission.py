@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用准入控制测试脚本
+验证并发上限、按优先级放行、按截止时间快速拒绝、队满挤出低优先级、限流时收缩上限，
+以及网关对冲在名额不足时跳过
+"""
+
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_admission import AdmissionController, Overloaded
+from llm_gateway import LLMGateway, LLMError
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    print_separator("测试1：并发上限与优先级放行")
+    controller = AdmissionController(initial_limit=2, max_limit=2, initial_latency=0.1)
+    held = [controller.acquire('qwen-max') for _ in range(2)]
+    order = []
+
+    def queued(priority):
+        permit = controller.acquire('qwen-max', priority, timeout=10)
+        order.append(priority)
+        permit.release('ok')
+
+    threads = []
+    for priority in ('low', 'normal', 'critical'):
+        t = threading.Thread(target=queued, args=(priority,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)
+    results.append(check("名额用满后请求排队", controller.stats()['models']['qwen-max']['queued'] == 3))
+    held[0].release('ok')
+    for t in threads:
+        t.join(timeout=5)
+    held[1].release('ok')
+    results.append(check("按优先级放行", order == ['critical', 'normal', 'low'], str(order)))
+
+    print_separator("测试2：按截止时间快速拒绝")
+    controller = AdmissionController(initial_limit=1, max_limit=1, initial_latency=2.0)
+    permit = controller.acquire('qwen-max')
+    started = time.monotonic()
+    try:
+        controller.acquire('qwen-max', 'low', timeout=3)
+        results.append(check("预计超时的请求立即拒绝", False))
+    except Overloaded as e:
+        results.append(check("预计超时的请求立即拒绝", time.monotonic() - started < 0.1, str(e)))
+    try:
+        controller.acquire('qwen-max', wait=False)
+        results.append(check("对冲请求无空闲名额时不等待", False))
+    except Overloaded:
+        results.append(check("对冲请求无空闲名额时不等待", True))
+    permit.release('ok')
+
+    print_separator("测试3：队满挤出低优先级")
+    controller = AdmissionController(initial_limit=1, max_limit=1, max_queue=1, initial_latency=0.1)
+    permit = controller.acquire('qwen-max')
+    outcome = {}
+
+    def low():
+        try:
+            controller.acquire('qwen-max', 'low', timeout=10)
+            outcome['low'] = 'admitted'
+        except Overloaded as e:
+            outcome['low'] = str(e)
+
+    t = threading.Thread(target=low)
+    t.start()
+    time.sleep(0.05)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        critical = pool.submit(controller.acquire, 'qwen-max', 'critical', 10)
+        t.join(timeout=5)
+        results.append(check("低优先级排队请求被挤出", '挤出' in outcome.get('low', ''), outcome.get('low', '')))
+        try:
+            controller.acquire('qwen-max', 'normal', timeout=10)
+            results.append(check("队满且无更低优先级时拒绝", False))
+        except Overloaded:
+            results.append(check("队满且无更低优先级时拒绝", True))
+        permit.release('ok')
+        critical.result(timeout=5).release('ok')
+    results.append(check("统计", controller.stats()['evicted'] == 1, str(controller.stats())))
+
+    print_separator("测试4：AIMD")
+    controller = AdmissionController(initial_limit=10, max_limit=20, cooldown=60)
+    for _ in range(3):
+        controller.acquire('qwen-max').release('overload')
+    limit = controller.stats()['models']['qwen-max']['limit']
+    results.append(check("限流时乘性收缩（冷却期内只收缩一次）", limit == 7, f"上限 {limit}"))
+    for _ in range(30):
+        controller.acquire('qwen-max').release('ok')
+    limit = controller.stats()['models']['qwen-max']['limit']
+    results.append(check("成功时加性增长", 9 <= limit <= 12, f"上限 {limit}"))
+
+    print_separator("测试5：网关集成")
+    gateway = LLMGateway('http://127.0.0.1:9', 'test', hedge_delay=0.1,
+                         admission=AdmissionController(initial_limit=1, max_limit=1, initial_latency=0.1))
+    calls = []
+
+    def fake_attempt(model, messages, temperature, max_tokens, deadline):
+        calls.append(model)
+        time.sleep(0.3)
+        if model == 'qwen-max' and len(calls) == 1:
+            raise LLMError('qwen_api_429: rate limited', status=429)
+        return f'{model} 回答'
+
+    gateway._attempt = fake_attempt
+    gateway.fallback_model = 'qwen-max'  # 回退与主模型共用同一名额
+    try:
+        content, used = gateway.complete('qwen-max', [{"role": "user", "content": "你好"}])
+        results.append(check("名额不足时跳过对冲，失败后重试", content == 'qwen-max 回答' and len(calls) == 2,
+                             str(gateway.stats())))
+    except LLMError as e:
+        results.append(check("名额不足时跳过对冲，失败后重试", False, str(e)))
+    stats = gateway.stats()
+    results.append(check("对冲跳过计数", stats['hedge_skipped'] >= 1 and stats['hedged'] == 0, str(stats)))
+    results.append(check("名额全部归还", stats['admission']['models']['qwen-max']['inflight'] == 0))
+    gateway.close()
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
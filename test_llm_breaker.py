@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用熔断测试脚本
+验证按失败率/慢调用率熔断、半开试探与恢复、试探失败后等待加倍，
+以及网关在主模型熔断期间直接使用回退模型
+"""
+
+import sys
+import time
+
+from llm_breaker import BreakerRegistry, CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from llm_gateway import LLMGateway, LLMError
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    print_separator("测试1：熔断与恢复")
+    breaker = CircuitBreaker(min_calls=4, error_rate=0.5, open_seconds=0.2)
+    breaker.record(True, 1.0)
+    breaker.record(False, 1.0)
+    breaker.record(True, 1.0)
+    results.append(check("调用数不足时不熔断", breaker.state == CLOSED))
+    breaker.record(False, 1.0)
+    results.append(check("失败率达到阈值时熔断", breaker.state == OPEN, str(breaker.snapshot())))
+    results.append(check("熔断期间拒绝调用", not breaker.allow()))
+    time.sleep(0.25)
+    results.append(check("等待后放行一个试探请求", breaker.allow() and breaker.state == HALF_OPEN))
+    results.append(check("试探期间拒绝其他请求", not breaker.allow()))
+    breaker.record(False, 1.0)
+    snapshot = breaker.snapshot()
+    results.append(check("试探失败重新熔断且等待加倍", snapshot['state'] == OPEN and snapshot['retry_in'] > 0.3,
+                         str(snapshot)))
+    time.sleep(0.45)
+    breaker.allow()
+    breaker.record(True, 1.0)
+    results.append(check("试探成功后恢复", breaker.state == CLOSED))
+
+    breaker = CircuitBreaker(min_calls=2, slow_call=0.5, open_seconds=60)
+    breaker.record(True, 2.0)
+    breaker.record(True, 3.0)
+    results.append(check("慢调用率过高时熔断", breaker.state == OPEN))
+
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0)
+    breaker.record(False, 1.0)
+    breaker.allow()
+    breaker.abandon()
+    results.append(check("放弃试探后可再次试探", breaker.allow()))
+
+    print_separator("测试2：网关按熔断状态路由")
+    gateway = LLMGateway('http://127.0.0.1:9', 'test', hedge_delay=5,
+                         breakers=BreakerRegistry(min_calls=2, open_seconds=60))
+    calls = []
+
+    def fake_attempt(model, messages, temperature, max_tokens, deadline):
+        calls.append(model)
+        if model == 'qwen-vl-max':
+            time.sleep(0.2)
+            raise LLMError('qwen_api_503: unavailable', status=503)
+        return f'{model} 回答'
+
+    gateway._attempt = fake_attempt
+    messages = [{"role": "user", "content": "你好"}]
+    for _ in range(2):
+        gateway.complete('qwen-vl-max', messages)
+    time.sleep(0.05)  # 等待失败结果反馈给熔断器
+    calls.clear()
+    started = time.monotonic()
+    content, used = gateway.complete('qwen-vl-max', messages)
+    elapsed = time.monotonic() - started
+    results.append(check("主模型熔断后直接使用回退模型", used == 'qwen-plus' and calls == ['qwen-plus'],
+                         f"{calls}，耗时 {elapsed:.2f}s"))
+    state = gateway.breakers.snapshot()['breakers']
+    results.append(check("按 (模型, 传输方式) 记录状态", state['qwen-vl-max/sync']['state'] == OPEN
+                         and state['qwen-plus/sync']['state'] == CLOSED, str(state)))
+
+    def broken_request(model, messages, temperature, max_tokens, deadline):
+        raise LLMError('qwen_api_400: bad request', status=400)
+
+    gateway._attempt = broken_request
+    before = gateway.breakers.snapshot()['breakers']['qwen-plus/sync']['calls']
+    for _ in range(3):
+        try:
+            gateway.complete('qwen-plus', messages)
+        except LLMError:
+            pass
+    state = gateway.breakers.snapshot()['breakers']['qwen-plus/sync']
+    results.append(check("请求自身错误不计入熔断", state['state'] == CLOSED and state['calls'] == before, str(state)))
+
+    gateway.fallback_model = None
+    try:
+        gateway.complete('qwen-vl-max', messages)
+        results.append(check("无可用路径时快速失败", False))
+    except LLMError as e:
+        results.append(check("无可用路径时快速失败", str(e).startswith('llm_circuit_open'), str(e)))
+    print(f"网关统计: {gateway.stats()}")
+    gateway.close()
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型响应缓存测试脚本
+验证精确键/近似重复命中、LRU 淘汰、TTL 过期与磁盘层持久化
+"""
+
+import sys
+import os
+import time
+import tempfile
+
+from llm_cache import ResponseCache, normalize_query
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def messages_for(query):
+    return [{"role": "system", "content": "你是一位专业的药品师"}, {"role": "user", "content": f"请介绍{query}"}]
+
+
+def main():
+    results = []
+
+    print_separator("测试1：精确键")
+    cache = ResponseCache()
+    key = cache.make_key('knowledge_search', 'qwen-plus', messages_for('布洛芬'), 0.2, 1200)
+    results.append(check("首次未命中", cache.get('knowledge_search', key) is None))
+    cache.put('knowledge_search', key, '布洛芬说明', 'qwen-plus')
+    results.append(check("再次命中", cache.get('knowledge_search', key) == ('布洛芬说明', 'qwen-plus')))
+    other = cache.make_key('knowledge_search', 'qwen-plus', messages_for('布洛芬'), 0.3, 1200)
+    results.append(check("温度不同不命中", other != key))
+
+    print_separator("测试2：近似重复")
+    near = ResponseCache(near_duplicate=True)
+    k1 = near.make_key('knowledge_search', 'qwen-plus', messages_for('布洛芬'), 0.2, 1200, query='布洛芬')
+    k2 = near.make_key('knowledge_search', 'qwen-plus', messages_for(' 布洛芬？'), 0.2, 1200, query=' 布洛芬？')
+    results.append(check("归一化后同键", k1 == k2, normalize_query(' 布洛芬？')))
+    k3 = near.make_key('translate', 'qwen-plus', messages_for('布洛芬'), 0.2, 1200, query='布洛芬')
+    results.append(check("不同接口不同键", k1 != k3))
+
+    print_separator("测试3：LRU 与 TTL")
+    lru = ResponseCache(max_entries=2, ttl=0.2)
+    for name in ('a', 'b'):
+        lru.put('t', name, name, 'm')
+    lru.get('t', 'a')
+    lru.put('t', 'c', 'c', 'm')
+    results.append(check("淘汰最久未使用", lru.get('t', 'b') is None and lru.get('t', 'a') is not None))
+    time.sleep(0.25)
+    results.append(check("过期后未命中", lru.get('t', 'a') is None))
+
+    print_separator("测试4：磁盘层")
+    disk_path = os.path.join(tempfile.mkdtemp(prefix='llm_cache_'), 'llm_cache.db')
+    ResponseCache(disk_path=disk_path).put('t', 'k', '磁盘内容', 'm')
+    reopened = ResponseCache(disk_path=disk_path)
+    results.append(check("重启后从磁盘命中", reopened.get('t', 'k') == ('磁盘内容', 'm')))
+    results.append(check("命中统计", reopened.stats()['namespaces']['t']['disk_hits'] == 1, str(reopened.stats())))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型网关测试脚本
+在本地启动一个 OpenAI 兼容的模拟服务（/chat/completions），
+验证连接复用、对冲回退、整体超时预算、400 兼容格式重试以及 asyncio 版本
+"""
+
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_gateway import LLMGateway, LLMError
+
+# 模型名 -> 模拟行为：(延迟秒数, HTTP状态码)
+MOCK_MODELS = {
+    'mock-fast': (0.0, 200),
+    'mock-slow': (3.0, 200),
+    'mock-error': (0.0, 500),
+    'mock-hang': (10.0, 200),
+}
+CLIENT_PORTS = set()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+
+    def do_POST(self):
+        CLIENT_PORTS.add(self.client_address[1])
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        model = body.get('model')
+        if model == 'mock-400':
+            # 仅接受 content 为对象数组的消息格式
+            ok = all(isinstance(m.get('content'), list) for m in body.get('messages', []))
+            delay, status = (0.0, 200 if ok else 400)
+        else:
+            delay, status = MOCK_MODELS.get(model, (0.0, 404))
+        time.sleep(delay)
+        if status == 200:
+            data = {"choices": [{"message": {"role": "assistant", "content": f"reply from {model}"}}]}
+        else:
+            data = {"error": {"message": f"mock status {status}"}}
+        raw = json.dumps(data).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+        except OSError:
+            pass  # 客户端已超时断开
+
+    def log_message(self, format, *args):
+        pass
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    messages = [{"role": "user", "content": "你好"}]
+
+    gateway = LLMGateway(base_url, 'sk-test', fallback_model='mock-fast',
+                         budget=2.0, attempt_timeout=2.0, hedge_delay=0.3)
+    results = []
+
+    print_separator("测试1：连接复用")
+    CLIENT_PORTS.clear()
+    single = LLMGateway(base_url, 'sk-test', fallback_model=None)
+    for _ in range(20):
+        single.complete('mock-fast', messages)
+    results.append(check("20 次顺序调用复用连接", len(CLIENT_PORTS) == 1, f"使用了 {len(CLIENT_PORTS)} 个连接"))
+
+    print_separator("测试2：主模型慢时对冲回退")
+    start = time.monotonic()
+    content, used = gateway.complete('mock-slow', messages)
+    elapsed = time.monotonic() - start
+    results.append(check("回退模型先返回", used == 'mock-fast' and elapsed < 1.0,
+                         f"{used} 用时 {elapsed:.2f}s（主模型需 3s）"))
+
+    print_separator("测试3：主模型报错立即回退")
+    start = time.monotonic()
+    content, used = gateway.complete('mock-error', messages)
+    elapsed = time.monotonic() - start
+    results.append(check("无需等待对冲延迟", used == 'mock-fast' and elapsed < 0.3,
+                         f"{used} 用时 {elapsed:.2f}s"))
+
+    print_separator("测试4：整体超时预算")
+    hang = LLMGateway(base_url, 'sk-test', fallback_model='mock-hang',
+                      budget=1.0, attempt_timeout=5.0, hedge_delay=0.2)
+    start = time.monotonic()
+    try:
+        hang.complete('mock-hang', messages)
+        results.append(check("超出预算时抛出异常", False))
+    except LLMError as e:
+        elapsed = time.monotonic() - start
+        results.append(check("超出预算时抛出异常", elapsed < 1.5, f"{e} 用时 {elapsed:.2f}s"))
+
+    print_separator("测试5：400 时改用对象数组格式重试")
+    content, used = single.complete('mock-400', messages)
+    results.append(check("兼容格式重试成功", content == 'reply from mock-400', content))
+
+    print_separator("测试6：asyncio 版本")
+
+    async def run_async():
+        replies = await asyncio.gather(*[gateway.acomplete('mock-fast', messages) for _ in range(10)])
+        hedged = await gateway.acomplete('mock-slow', messages)
+        await gateway.aclose()
+        return replies, hedged
+
+    start = time.monotonic()
+    replies, hedged = asyncio.run(run_async())
+    elapsed = time.monotonic() - start
+    results.append(check("并发调用与对冲", len(replies) == 10 and hedged[1] == 'mock-fast' and elapsed < 1.5,
+                         f"用时 {elapsed:.2f}s"))
+
+    print_separator("测试完成")
+    print(f"网关统计: {gateway.stats()}")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    server.shutdown()
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用合并测试脚本
+验证相同键的并发调用只请求一次上游、流式订阅者回放与跟随增量、失败传递给所有等待者
+"""
+
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_singleflight import SingleFlight
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    print_separator("测试1：非流式调用合并")
+    flight = SingleFlight()
+    upstream = []
+
+    def slow_call():
+        upstream.append(1)
+        time.sleep(0.3)
+        return '布洛芬说明', 'qwen-plus'
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        answers = list(pool.map(lambda _: flight.do('k', slow_call), range(20)))
+    results.append(check("20 个并发请求只调用一次上游", len(upstream) == 1, f"上游调用 {len(upstream)} 次"))
+    results.append(check("所有请求得到相同结果", all(a == ('布洛芬说明', 'qwen-plus') for a in answers)))
+    results.append(check("合并计数", flight.stats()['coalesced'] == 19, str(flight.stats())))
+    flight.do('k', slow_call)
+    results.append(check("结束后再次请求重新调用", len(upstream) == 2 and flight.stats()['in_flight'] == 0))
+
+    print_separator("测试2：流式订阅")
+    flight = SingleFlight()
+    pulls = []
+
+    def upstream_stream():
+        pulls.append(1)
+        for i in range(10):
+            time.sleep(0.03)
+            yield f"段{i}", 'qwen-plus'
+
+    outputs = [None] * 4
+
+    def consume(index):
+        time.sleep(index * 0.08)  # 后到的订阅者需回放已生成的增量
+        outputs[index] = ''.join(delta for delta, _ in flight.stream('s', upstream_stream))
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = ''.join(f"段{i}" for i in range(10))
+    results.append(check("只拉取一次上游流", len(pulls) == 1, f"{len(pulls)} 次"))
+    results.append(check("每个订阅者得到完整输出", all(o == expected for o in outputs)))
+
+    # 订阅者中途断开不影响其他订阅者
+    gen = flight.stream('s2', upstream_stream)
+    next(gen)
+    late = ThreadPoolExecutor(max_workers=1).submit(lambda: ''.join(d for d, _ in flight.stream('s2', upstream_stream)))
+    time.sleep(0.05)
+    gen.close()
+    results.append(check("领头订阅者断开后其他订阅者仍完整", late.result(timeout=5) == expected))
+
+    # 非流式调用可合并到在途的流
+    background = ThreadPoolExecutor(max_workers=1).submit(lambda: list(flight.stream('s3', upstream_stream)))
+    time.sleep(0.05)
+    joined = flight.do('s3', slow_call)
+    background.result(timeout=5)
+    results.append(check("非流式请求共享在途流的完整结果", joined == (expected, 'qwen-plus')))
+
+    print_separator("测试3：失败传递")
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError('upstream down')
+
+    def attempt(_):
+        try:
+            flight.do('f', failing)
+        except RuntimeError as e:
+            return str(e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        errors = list(pool.map(attempt, range(5)))
+    results.append(check("所有等待者收到同一异常", errors == ['upstream down'] * 5))
+
+    def broken_stream():
+        yield '开头', 'qwen-plus'
+        raise RuntimeError('stream broken')
+
+    try:
+        list(flight.stream('b', broken_stream))
+        results.append(check("流式失败抛出异常", False))
+    except RuntimeError as e:
+        results.append(check("流式失败抛出异常", str(e) == 'stream broken'))
+
+    disabled = SingleFlight(enabled=False)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        upstream.clear()
+        list(pool.map(lambda _: disabled.do('k', slow_call), range(3)))
+    results.append(check("关闭后不合并", len(upstream) == 3))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
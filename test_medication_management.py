@@ -221,6 +221,39 @@ def test_ai_analyze():
     else:
         print(f"❌ AI分析失败: {data.get('message', '未知错误')}")
 
+def test_batch_medications():
+    """测试批量保存用药（部分失败与幂等重试）"""
+    print_separator("测试7：批量保存用药")
+    
+    key = f"batch-{datetime.now().timestamp()}"
+    operations = [
+        {"op": "create", "idempotency_key": f"{key}-1", "data": {"name": "布洛芬缓释胶囊", "frequency": "每日2次"}},
+        {"op": "create", "idempotency_key": f"{key}-2", "data": {"name": "维生素C片", "frequency": "每日1次"}},
+        {"op": "create", "data": {"name": ""}},
+    ]
+    
+    response = requests.post(f"{API_BASE}/medications/batch",
+                             json={"username": TEST_USER, "operations": operations})
+    data = response.json()
+    print(f"状态码: {response.status_code}")
+    print(f"成功: {data.get('succeeded')}，失败: {data.get('failed')}")
+    
+    # 重试同一批次：带幂等键的项返回已创建的记录，不会重复新增
+    retry = requests.post(f"{API_BASE}/medications/batch",
+                          json={"username": TEST_USER, "operations": operations[:2]}).json()
+    ids = [r.get('id') for r in data.get('results', [])[:2]]
+    
+    if (response.status_code == 207 and data.get('succeeded') == 2
+            and [r.get('id') for r in retry.get('results', [])] == ids
+            and all(r.get('duplicate') for r in retry.get('results', []))):
+        print("✅ 批量保存与幂等重试正确！")
+    else:
+        print("❌ 批量保存结果异常！")
+    
+    # 清理
+    requests.post(f"{API_BASE}/medications/batch",
+                  json={"username": TEST_USER, "operations": [{"op": "delete", "id": i} for i in ids if i]})
+
 def main():
     """主测试函数"""
     print("\n")
@@ -252,6 +285,9 @@ def main():
         # 测试6：AI分析
         test_ai_analyze()
         
+        # 测试7：批量保存
+        test_batch_medications()
+        
         # 总结
         print_separator("测试完成")
         print("✅ 所有测试已完成！")
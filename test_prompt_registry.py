@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示词注册表测试脚本
+验证 token 估算、max_tokens 随输入增长并限制在上下限之间、按 64 取整与统计
+"""
+
+import sys
+
+from prompt_registry import PromptRegistry, count_tokens
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def main():
+    results = []
+
+    print_separator("测试1：token 估算")
+    chinese = count_tokens("患者头痛三天，伴恶心呕吐")
+    english = count_tokens("headache for three days")
+    results.append(check("汉字约 0.75 token/字", 8 <= chinese <= 10, str(chinese)))
+    results.append(check("英文约 3.5 字符/token", 6 <= english <= 8, str(english)))
+    results.append(check("空文本为 0", count_tokens('') == 0))
+
+    print_separator("测试2：输出预算")
+    prompts = PromptRegistry()
+    emr = prompts.register('emr', "你是一名临床医生助手。", base=1200, per_input=1.2, cap=2500)
+    plans = prompts.register('plans', "生成治疗方案。", base=300, per_item=550, floor=1200, cap=2500)
+    short = emr.max_tokens("胃痛2天")
+    long = emr.max_tokens("胃痛伴恶心，" * 300)
+    results.append(check("短输入使用基础预算", short == 1216, str(short)))
+    results.append(check("长输入预算增长但不超过上限", long == 2500, str(long)))
+    results.append(check("按 64 取整", short % 64 == 0 and emr.max_tokens("胃痛2天。") == short))
+    results.append(check("按条目数计算", plans.max_tokens(items=3) == 1984 and plans.max_tokens(items=1) == 1200,
+                         f"{plans.max_tokens(items=3)} / {plans.max_tokens(items=1)}"))
+
+    print_separator("测试3：统计")
+    results.append(check("注册时计算模板 token 数", emr.tokens == count_tokens("你是一名临床医生助手。")))
+    prompts.budget('emr', "胃痛2天")
+    prompts.budget('emr', "胃痛伴恶心，" * 300)
+    stats = prompts.stats()
+    results.append(check("统计", stats['emr']['calls'] == 2 and stats['emr']['avg_max_tokens'] == 1858
+                         and stats['plans']['calls'] == 0, str(stats)))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)
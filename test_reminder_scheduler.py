@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服药提醒调度测试脚本
+验证间隔/自定义提醒的下一次触发时间、到期弹出后重新入堆、错过触发窗口后只补发一次，
+以及修改/删除提醒的惰性删除、无法排期的提醒不影响构建，和其他进程修改提醒后的重建
+"""
+
+import sys
+import tempfile
+from datetime import datetime
+
+from medication_management import MedicationManager
+from reminder_scheduler import ReminderScheduler, next_fire
+
+
+def print_separator(title):
+    """打印分隔线"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def check(name, ok, detail=''):
+    print(f"{'✅' if ok else '❌'} {name}{('：' + detail) if detail else ''}")
+    return ok
+
+
+def reminder(reminder_id, **fields):
+    return dict({'id': reminder_id, 'medication_name': '布洛芬', 'times': ['08:00', '20:00'],
+                 'created_at': '2025-03-03T07:00:00'}, **fields)
+
+
+def main():
+    results = []
+
+    print_separator("测试1：下一次触发时间")
+    daily = reminder('d')
+    results.append(check("每日提醒取当天下一个时间", next_fire(daily, datetime(2025, 3, 5, 9, 0)) == datetime(2025, 3, 5, 20, 0)))
+    results.append(check("当天时间已过取次日", next_fire(daily, datetime(2025, 3, 5, 20, 0)) == datetime(2025, 3, 6, 8, 0)))
+    interval = reminder('i', reminder_type='interval', interval_days=3, times=['08:00'])
+    results.append(check("间隔提醒跳过非生效日", next_fire(interval, datetime(2025, 3, 3, 9, 0)) == datetime(2025, 3, 6, 8, 0),
+                         str(next_fire(interval, datetime(2025, 3, 3, 9, 0)))))
+    far = reminder('f', reminder_type='interval', interval_days=30, times=['08:00'])
+    results.append(check("长间隔提醒", next_fire(far, datetime(2025, 3, 3, 9, 0)) == datetime(2025, 4, 2, 8, 0)))
+    custom = reminder('c', reminder_type='custom', custom_schedule=['周三'], times=['21:30', '07:15'])
+    results.append(check("自定义星期（2025-03-05 为周三）", next_fire(custom, datetime(2025, 3, 3, 9, 0)) == datetime(2025, 3, 5, 7, 15)
+                         and next_fire(custom, datetime(2025, 3, 5, 21, 30)) == datetime(2025, 3, 12, 7, 15)))
+    results.append(check("创建前不触发", next_fire(daily, datetime(2025, 3, 1, 9, 0)) == datetime(2025, 3, 3, 8, 0)))
+    results.append(check("停用或没有有效时间返回 None", next_fire(dict(daily, enabled=False), datetime(2025, 3, 5)) is None
+                         and next_fire(reminder('x', times=['25:99', 'abc']), datetime(2025, 3, 5)) is None))
+    results.append(check("无效的间隔天数按每天", next_fire(dict(interval, interval_days='2.5'), datetime(2025, 3, 3, 9, 0))
+                         == datetime(2025, 3, 4, 8, 0)))
+
+    print_separator("测试2：到期弹出与重新入堆")
+    scheduler = ReminderScheduler()
+    now = datetime(2025, 3, 5, 7, 0)
+    count = scheduler.build({'张三': [daily, custom], '李四': [interval, reminder('bad', reminder_type='custom', custom_schedule=5)]},
+                            now=now)
+    results.append(check("无法排期的提醒被跳过，其余照常构建", count == 3 and scheduler.stats()['scheduled'] == 3, str(count)))
+    results.append(check("未到期时不弹出", scheduler.pop_due(now) == []))
+    events = scheduler.pop_due(datetime(2025, 3, 5, 8, 0))
+    results.append(check("到期弹出", sorted((e['reminder_id'], e['fire_at']) for e in events)
+                         == [('c', '2025-03-05T07:15'), ('d', '2025-03-05T08:00')], str(events)))
+    results.append(check("触发后排入下一次", scheduler.next_fire_at() == datetime(2025, 3, 5, 20, 0).timestamp()))
+
+    print_separator("测试3：错过触发窗口")
+    events = scheduler.pop_due(datetime(2025, 3, 8, 9, 0))  # 停机约三天
+    fired = sorted((e['reminder_id'], e['fire_at']) for e in events)
+    results.append(check("每个提醒只补发最早错过的一次", fired == [('c', '2025-03-05T21:30'), ('d', '2025-03-05T20:00'),
+                                                        ('i', '2025-03-06T08:00')], str(fired)))
+    heap = sorted((datetime.fromtimestamp(ts), rid) for ts, _, _, rid in scheduler._heap)
+    results.append(check("之后从当前时间起重新排期", heap == [(datetime(2025, 3, 8, 20, 0), 'd'), (datetime(2025, 3, 9, 8, 0), 'i'),
+                                                    (datetime(2025, 3, 12, 7, 15), 'c')], str(heap)))
+    results.append(check("触发计数", scheduler.stats()['fired'] == 5, str(scheduler.stats())))
+
+    print_separator("测试4：修改与删除")
+    scheduler.upsert('张三', dict(daily, times=['08:30']), now=datetime(2025, 3, 8, 9, 0))
+    scheduler.remove('李四', 'i')
+    events = scheduler.pop_due(datetime(2025, 3, 9, 9, 0))
+    fired = sorted((e['reminder_id'], e['fire_at']) for e in events)
+    results.append(check("旧版本与已删除提醒不再触发", fired == [('d', '2025-03-09T08:30')], str(fired)))
+    due = scheduler.due('张三', minutes=24 * 60, now=datetime(2025, 3, 11, 9, 0))
+    upcoming = [(e['reminder_id'], e['fire_at']) for e in due]
+    results.append(check("due() 按时间列出用户未来的提醒", upcoming == [('c', '2025-03-12T07:15'), ('d', '2025-03-12T08:30')],
+                         str(upcoming)))
+    queue = scheduler.subscribe('张三')
+    scheduler._publish([{'username': '张三', 'reminder_id': 'd'}, {'username': '李四', 'reminder_id': 'x'}])
+    results.append(check("按用户推送订阅", queue.qsize() == 1 and queue.get_nowait()['reminder_id'] == 'd'))
+    scheduler.unsubscribe('张三', queue)
+    results.append(check("取消订阅", scheduler.stats()['subscribers'] == 0))
+
+    print_separator("测试5：其他进程修改提醒")
+    data_dir = tempfile.mkdtemp(prefix='reminders_')
+    worker_a, worker_b = MedicationManager(data_dir), MedicationManager(data_dir)  # 模拟两个 worker
+    added = worker_a.add_reminder('张三', {'medication_name': '布洛芬', 'times': ['08:00']})
+    results.append(check("本进程的写入不触发重建", not worker_a._sync_scheduler()))
+    results.append(check("另一进程新增的提醒被排期", [e['reminder_id'] for e in worker_b.scheduler.due('张三', minutes=24 * 60)]
+                         == [added['reminder_id']]))
+    worker_b.delete_reminder('张三', added['reminder_id'])
+    results.append(check("另一进程删除的提醒不再排期", worker_a.scheduler.due('张三', minutes=24 * 60) == []
+                         and worker_a.scheduler.stats()['scheduled'] == 0))
+
+    print_separator("测试完成")
+    print("✅ 所有检查通过！" if all(results) else "❌ 存在失败项")
+    return all(results)
+
+
+if __name__ == '__main__':
+    if not main():
+        sys.exit(1)